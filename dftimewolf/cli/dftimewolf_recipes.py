@@ -14,6 +14,7 @@ from typing import Any, Optional, cast
 from dftimewolf import config
 from dftimewolf.lib import errors
 from dftimewolf.lib import logging_utils
+from dftimewolf.lib import module as dftw_module
 from dftimewolf.lib import opentelemetry
 from dftimewolf.lib import resources
 from dftimewolf.lib import spanner_telemetry
@@ -35,6 +36,7 @@ MODULES = {
   'AzureCollector': 'dftimewolf.lib.collectors.azure',
   'AzureLogsCollector': 'dftimewolf.lib.collectors.azure_logging',
   'BigQueryCollector': 'dftimewolf.lib.collectors.bigquery',
+  'CloudObjectDownloader': 'dftimewolf.lib.processors.cloud_object_download',
   'DataFrameToDiskExporter': 'dftimewolf.lib.exporters.df_to_filesystem',
   'FilesystemCollector': 'dftimewolf.lib.collectors.filesystem',
   'GCEDiskCopy': 'dftimewolf.lib.collectors.gce_disk_copy',
@@ -50,16 +52,19 @@ MODULES = {
   'GoogleDriveCollector': 'dftimewolf.lib.collectors.gdrive',
   'GoogleDriveExporter': 'dftimewolf.lib.exporters.gdrive',
   'LocalFilesystemCopy': 'dftimewolf.lib.exporters.local_filesystem',
+  'IOCMatchProcessor': 'dftimewolf.lib.processors.ioc_match',
   'LocalPlasoProcessor': 'dftimewolf.lib.processors.localplaso',
   'LocalYaraCollector': 'dftimewolf.lib.collectors.yara',
   'S3ToGCSCopy': 'dftimewolf.lib.exporters.s3_to_gcs',
   'SSHMultiplexer': 'dftimewolf.lib.preflights.ssh_multiplexer',
   'TimesketchExporter': 'dftimewolf.lib.exporters.timesketch',
   'TimesketchSearchEventCollector': 'dftimewolf.lib.collectors.timesketch',
+  'VMPoolRelease': 'dftimewolf.lib.processors.vm_pool_release',
   'VTCollector' : 'dftimewolf.lib.collectors.virustotal',
   'OpenRelikProcessor': 'dftimewolf.lib.processors.openrelik',
   'WorkspaceAuditCollector': 'dftimewolf.lib.collectors.workspace_audit',
   'WorkspaceAuditTimesketch': 'dftimewolf.lib.processors.workspace_audit_timesketch',
+  'YaraScanProcessor': 'dftimewolf.lib.processors.yara_scan',
   'YetiYaraCollector': 'dftimewolf.lib.collectors.yara'
 }
 
@@ -377,7 +382,16 @@ class DFTimewolfTool(object):
 
 
 def SignalHandler(*unused_argvs: Any) -> None:
-  """Catches Ctrl + C to exit cleanly."""
+  """Catches Ctrl + C to exit cleanly.
+
+  Modules running until cancelled are asked to stop first, so that they can
+  store what they collected; a second Ctrl + C bails.
+  """
+  if dftw_module.RequestStop():
+    sys.stderr.write(
+        "\nCtrl^C caught, stopping modules running until cancelled. "
+        "Press Ctrl^C again to bail.\n")
+    return
   sys.stderr.write("\nCtrl^C caught, bailing...\n")
 
   sys.exit(1)
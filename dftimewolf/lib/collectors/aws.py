@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 """Creates an analysis VM and copies AWS volumes to it for analysis."""
 
-from typing import Optional, Callable
+import math
+from concurrent import futures
+from typing import Any, Optional, Callable
 
 from libcloudforensics.providers.aws import forensics as aws_forensics
 from libcloudforensics.providers.aws.internal import account as aws_account
@@ -13,9 +15,17 @@ from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
 from dftimewolf.lib import cache
 from dftimewolf.lib import spanner_telemetry as telemetry
+from dftimewolf.lib import vm_pool
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# See https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/device_naming.html
+DEVICE_SUFFIXES = 'fghijklmnop'
+
+# Maximum number of volumes copied at the same time.
+MAX_CONCURRENT_COPIES = 8
+
+
 class AWSCollector(module.BaseModule):
   """Amazon Web Services (AWS) Collector.
 
@@ -36,8 +46,11 @@ class AWSCollector(module.BaseModule):
     analysis_zone (str): The AWS zone in which to create the VM.
     analysis_vm (AWSInstance): Analysis VM to which the volume copy will be
         attached.
-    device_names (list[str]): A list of available device names to be
-        used by AWS to attach volumes to the analysis VM.
+    analysis_vms (list[AWSInstance]): All analysis VMs. Volumes are sharded
+        across additional analysis VMs when there are more volumes than
+        device names available on a single VM.
+    device_suffixes (dict[str, list[str]]): Device name suffixes still
+        available on each analysis VM, keyed by instance ID.
   """
 
   _ANALYSIS_VM_CONTAINER_ATTRIBUTE_NAME = 'Analysis VM'
@@ -73,31 +86,170 @@ class AWSCollector(module.BaseModule):
     self.analysis_profile_name = str()
     self.analysis_zone = str()
     self.analysis_vm: ec2.AWSInstance
-    # See https://docs.aws.amazon.com/AWSEC2/latest/UserGuide/device_naming.html
-    self.device_suffixes = list('fghijklmnop')
+    self.analysis_vms: list[ec2.AWSInstance] = []
+    self.device_suffixes: dict[str, list[str]] = {}
+    self._analysis_vm_options: dict[str, Any] = {}
+    self._vm_pool: Optional[vm_pool.VMPool] = None
 
   def Process(self) -> None:
-    """Copies a volume and attaches it to the analysis VM."""
-    for volume in self._FindVolumesToCopy():
-      print(f'Volume copy of {volume.volume_id:s} started...')
-      new_volume = aws_forensics.CreateVolumeCopy(
-          self.remote_zone,
-          dst_zone=self.analysis_zone,
-          volume_id=volume.volume_id,
-          src_profile=self.remote_profile_name,
-          dst_profile=self.analysis_profile_name)
+    """Copies volumes in parallel and attaches them to the analysis VMs."""
+    self._CopyVolumes()
+
+  def _CopyVolumes(self) -> None:
+    """Copies volumes in parallel and attaches them to the analysis VMs."""
+    volumes = self._FindVolumesToCopy()
+    if not volumes:
+      return
 
+    with futures.ThreadPoolExecutor(
+        max_workers=min(MAX_CONCURRENT_COPIES, len(volumes))) as executor:
       if self.analysis_vm is not None:
-        self.analysis_vm.AttachVolume(
-            new_volume, self._FindNextAvailableDeviceName())
-        print('Volume {0:s} successfully copied to {1:s}'.format(
-            volume.volume_id, new_volume.volume_id))
+        self._StartAdditionalAnalysisVms(len(volumes), executor)
+        placements = [
+            (analysis_vm, self._FindNextAvailableDeviceName(analysis_vm))
+            for analysis_vm in self._ShardVolumes(len(volumes))]
+      else:
+        placements = [(None, '')] * len(volumes)
+
+      copy_futures = [
+          executor.submit(self._CopyVolume, volume, analysis_vm, device_name)
+          for volume, (analysis_vm, device_name) in zip(volumes, placements)]
+      # Every copy is waited for, so that the successful copies are output
+      # even if some of the others failed.
+      failures = []
+      for volume, future, (analysis_vm, _) in zip(
+          volumes, copy_futures, placements):
+        try:
+          new_volume = future.result()
+        except Exception as exception:  # pylint: disable=broad-except
+          failures.append(f'{volume.volume_id:s}: {exception!s}')
+          continue
+        if analysis_vm is not None:
+          self.StoreContainer(containers.ForensicsVM(
+              name=str(analysis_vm.name),
+              evidence_disk=new_volume,
+              platform='aws'))
+
+    if failures:
+      self.ModuleError(
+          f'{len(failures):d} of {len(volumes):d} volume copies failed: '
+          f'{"; ".join(failures)}', critical=True)
+
+  def _CopyVolume(self,
+                  volume: ebs.AWSVolume,
+                  analysis_vm: Optional[ec2.AWSInstance],
+                  device_name: str) -> ebs.AWSVolume:
+    """Copies a volume and attaches the copy to an analysis VM.
+
+    Args:
+      volume: The volume to copy.
+      analysis_vm: Optional. The analysis VM to attach the copy to.
+      device_name: The device name to attach the copy as.
+
+    Returns:
+      The volume copy.
+    """
+    print(f'Volume copy of {volume.volume_id:s} started...')
+    new_volume: ebs.AWSVolume = aws_forensics.CreateVolumeCopy(
+        self.remote_zone,
+        dst_zone=self.analysis_zone,
+        volume_id=volume.volume_id,
+        src_profile=self.remote_profile_name,
+        dst_profile=self.analysis_profile_name)
+
+    if analysis_vm is not None:
+      analysis_vm.AttachVolume(new_volume, device_name)
+      print('Volume {0:s} successfully copied to {1:s}'.format(
+          volume.volume_id, new_volume.volume_id))
+    return new_volume
+
+  def _StartAdditionalAnalysisVms(
+      self, volume_count: int, executor: futures.Executor) -> None:
+    """Starts the analysis VMs needed to attach all volume copies.
+
+    Each analysis VM can attach as many volumes as there are device name
+    suffixes. Additional VMs are started in parallel and named after the
+    first analysis VM with an increasing numerical suffix.
+
+    Args:
+      volume_count: The number of volumes to attach.
+      executor: The executor to start the analysis VMs with.
+    """
+    vm_count = math.ceil(volume_count / len(DEVICE_SUFFIXES))
+    names = [
+        f'aws-forensics-vm-{self.incident_id:s}-{index:d}'
+        for index in range(len(self.analysis_vms), vm_count)]
+    if not names:
+      return
+
+    self.logger.info(
+        f'{volume_count:d} volumes to attach, starting {len(names):d} '
+        'additional analysis VMs')
+    start_futures = [
+        executor.submit(self._StartAnalysisVm, name) for name in names]
+    failures = []
+    for name, future in zip(names, start_futures):
+      try:
+        analysis_vm = future.result()
+      except Exception as exception:  # pylint: disable=broad-except
+        failures.append(f'{name:s}: {exception!s}')
+        continue
+      self.logger.info(f'Additional analysis VM will be: {analysis_vm.name:s}')
+      self.StoreContainer(
+          containers.TicketAttribute(
+              name=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_NAME,
+              type_=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_TYPE,
+              value=analysis_vm.name))
+      self._AddAnalysisVm(analysis_vm)
+
+    if failures:
+      self.ModuleError(
+          f'Unable to start {len(failures):d} additional analysis VMs: '
+          f'{"; ".join(failures)}', critical=True)
+
+  def _StartAnalysisVm(self, name: str) -> ec2.AWSInstance:
+    """Starts an analysis VM, or leases one from the analysis VM pool.
 
-        container = containers.ForensicsVM(
-            name=str(self.analysis_vm.name),
-            evidence_disk=new_volume,
-            platform='aws')
-        self.StoreContainer(container)
+    Args:
+      name: Name of the analysis VM to start. Pooled VMs keep their name.
+
+    Returns:
+      The analysis VM.
+    """
+    if self._vm_pool:
+      analysis_vm: ec2.AWSInstance = self._vm_pool.Lease(
+          self.incident_id).instance
+      return analysis_vm
+    analysis_vm, _ = aws_forensics.StartAnalysisVm(
+        name,
+        self.analysis_zone,
+        **self._analysis_vm_options)
+    return analysis_vm
+
+  def _ShardVolumes(self, volume_count: int) -> list[ec2.AWSInstance]:
+    """Assigns each volume to an analysis VM with free device names.
+
+    Args:
+      volume_count: The number of volumes to assign.
+
+    Returns:
+      The analysis VM of each volume, filling up VMs in order.
+    """
+    assignments: list[ec2.AWSInstance] = []
+    for analysis_vm in self.analysis_vms:
+      free = len(self.device_suffixes[analysis_vm.instance_id])
+      assignments.extend(
+          [analysis_vm] * min(free, volume_count - len(assignments)))
+    return assignments
+
+  def _AddAnalysisVm(self, analysis_vm: ec2.AWSInstance) -> None:
+    """Registers an analysis VM volumes can be attached to.
+
+    Args:
+      analysis_vm: The analysis VM.
+    """
+    self.analysis_vms.append(analysis_vm)
+    self.device_suffixes[analysis_vm.instance_id] = list(DEVICE_SUFFIXES)
 
   # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(self,
@@ -111,7 +263,9 @@ class AWSCollector(module.BaseModule):
             analysis_zone: Optional[str]=None,
             boot_volume_size: int=50,
             cpu_cores: int=16,
-            ami: None=None) -> None:
+            ami: None=None,
+            vm_pool_size: int=0,
+            vm_pool_lock_bucket: Optional[str]=None) -> None:
     """Sets up an Amazon web Services (AWS) collector.
 
     This method creates and starts an analysis VM in the AWS account and
@@ -153,6 +307,12 @@ class AWSCollector(module.BaseModule):
       ami (str): Optional. The Amazon Machine Image ID to use to create the
           analysis VM. If not specified, will default to selecting Ubuntu 18.04
           TLS.
+      vm_pool_size (int): Optional. If set, lease the analysis VMs from a
+          warm pool of reusable analysis VMs. The pool is replenished by the
+          vm_pool_release recipe. Default is 0, which starts a dedicated
+          analysis VM.
+      vm_pool_lock_bucket (str): Optional. S3 bucket holding the lock objects
+          that serialize leases of the pool VMs. Required with vm_pool_size.
     """
 
     if not (remote_instance_id or volume_ids):
@@ -179,6 +339,35 @@ class AWSCollector(module.BaseModule):
     self.analysis_zone = analysis_zone or remote_zone
     self.analysis_profile_name = analysis_profile_name or remote_profile_name
 
+    self._analysis_vm_options = {
+        'boot_volume_size': boot_volume_size,
+        'ami': ami,
+        'cpu_cores': cpu_cores,
+        'dst_profile': self.analysis_profile_name,
+    }
+    self.analysis_vms = []
+    self.device_suffixes = {}
+
+    if vm_pool_size:
+      if not vm_pool_lock_bucket:
+        self.ModuleError(
+            'vm_pool_lock_bucket is required to lease analysis VMs from a '
+            'pool', critical=True)
+      self._vm_pool = vm_pool.VMPool(
+          vm_pool.AWSPoolBackend(
+              self.analysis_zone, self.analysis_profile_name,
+              str(vm_pool_lock_bucket), boot_volume_size, cpu_cores, ami),
+          int(vm_pool_size))
+      self.analysis_vm = self._StartAnalysisVm('')
+      print(f'Your analysis VM will be: {self.analysis_vm.name:s}')
+      self.StoreContainer(
+          containers.TicketAttribute(
+              name=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_NAME,
+              type_=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_TYPE,
+              value=str(self.analysis_vm.name)))
+      self._AddAnalysisVm(self.analysis_vm)
+      return
+
     analysis_vm_name = f'aws-forensics-vm-{self.incident_id:s}'
     print(f'Your analysis VM will be: {analysis_vm_name:s}')
     self.StoreContainer(
@@ -194,6 +383,8 @@ class AWSCollector(module.BaseModule):
         cpu_cores=cpu_cores,
         dst_profile=self.analysis_profile_name,
     )
+    if self.analysis_vm is not None:
+      self._AddAnalysisVm(self.analysis_vm)
 
   def _GetVolumesFromIds(self, volume_ids: list[str]) -> list[ebs.AWSVolume]:
     """Gets volumes from an account by volume IDs.
@@ -260,16 +451,20 @@ class AWSCollector(module.BaseModule):
 
     return volumes_to_copy
 
-  def _FindNextAvailableDeviceName(self) -> str:
-    """Determine the next available device name to attach volumes to the VM.
+  def _FindNextAvailableDeviceName(
+      self, analysis_vm: ec2.AWSInstance) -> str:
+    """Determine the next available device name to attach volumes to a VM.
 
     AWS recommends using device names that are within /dev/sd[f-p][1-6].
 
+    Args:
+      analysis_vm (AWSInstance): The analysis VM to attach a volume to.
+
     Returns:
       str: A device name, or an empty string if a name could not be obtained.
     """
     try:
-      next_available = self.device_suffixes.pop(0)
+      next_available = self.device_suffixes[analysis_vm.instance_id].pop(0)
     except IndexError as exception:
       self.ModuleError('Error: there are no more device names available '
                        'for this VM. Consider copying less volumes! '
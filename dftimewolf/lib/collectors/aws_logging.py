@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 """Reads logs from an AWS account"""
 
+import datetime
+import gzip
 import json
+import os
 import tempfile
-import datetime
-from typing import Any, Optional, Callable
+import threading
+from concurrent import futures
+from typing import Any, Optional, Callable, Iterator
 
 from boto3 import session as boto3_session
 from botocore import exceptions as boto_exceptions
 
+from dftimewolf.lib import high_water_marks
 from dftimewolf.lib import module
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
@@ -17,6 +22,74 @@ from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# CloudTrail delivers gzipped JSON objects to S3 under a date partitioned key
+# layout: <prefix>/AWSLogs/<account>/CloudTrail/<region>/YYYY/MM/DD/<object>.
+_CLOUDTRAIL_KEY_PREFIX = '{prefix}AWSLogs/{account_id}/CloudTrail/{region}/'
+# Maximum number of CloudTrail objects downloaded simultaneously.
+_S3_MAX_WORKERS = 16
+# Default lookback when reading from S3, matching the LookupEvents API.
+_DEFAULT_LOOKBACK = datetime.timedelta(days=90)
+# CloudTrail can deliver events some minutes after they happen, so incremental
+# runs start this long before the previous high-water mark.
+_INCREMENTAL_LOOKBACK = datetime.timedelta(minutes=15)
+
+
+def _GetUserName(record: dict[str, Any]) -> list[str]:
+  """Returns the user names a CloudTrail record can be looked up with."""
+  identity = record.get('userIdentity') or {}
+  issuer = (identity.get('sessionContext') or {}).get('sessionIssuer') or {}
+  return [name for name in (identity.get('userName'), issuer.get('userName'))
+          if name]
+
+
+# Maps LookupEvents attribute keys to the CloudTrail record values they match,
+# so that a query_filter can be applied locally to records read from S3.
+_RECORD_ATTRIBUTES: dict[str, Callable[[dict[str, Any]], list[str]]] = {
+    'AccessKeyId': lambda r: [
+        (r.get('userIdentity') or {}).get('accessKeyId', '')],
+    'EventId': lambda r: [r.get('eventID', '')],
+    'EventName': lambda r: [r.get('eventName', '')],
+    'EventSource': lambda r: [r.get('eventSource', '')],
+    'ReadOnly': lambda r: [str(r.get('readOnly', '')).lower()],
+    'ResourceName': lambda r: [
+        res.get('ARN', '') for res in r.get('resources') or []],
+    'ResourceType': lambda r: [
+        res.get('type', '') for res in r.get('resources') or []],
+    'Username': _GetUserName,
+}
+
+
+def _ToLookupEvent(record: dict[str, Any]) -> dict[str, Any]:
+  """Converts a CloudTrail record to the event format of LookupEvents.
+
+  Records read from S3 are written in the same format as the events returned
+  by the LookupEvents API, which is the format Plaso parses.
+
+  Args:
+    record: The CloudTrail record.
+
+  Returns:
+    The LookupEvents event of the record.
+  """
+  identity = record.get('userIdentity') or {}
+  user_names = _GetUserName(record)
+  return {
+      'EventId': record.get('eventID', ''),
+      'EventName': record.get('eventName', ''),
+      'ReadOnly': str(record.get('readOnly', '')).lower(),
+      'AccessKeyId': identity.get('accessKeyId', ''),
+      'EventTime': _AsUTC(datetime.datetime.fromisoformat(
+          record['eventTime'].replace('Z', '+00:00'))),
+      'EventSource': record.get('eventSource', ''),
+      'Username': user_names[0] if user_names else '',
+      'Resources': [
+          {'ResourceType': resource.get('type', ''),
+           'ResourceName': resource.get('ARN', '')}
+          for resource in record.get('resources') or []],
+      'CloudTrailEvent': json.dumps(record),
+  }
+
+
 class AWSLogsCollector(module.BaseModule):
   """Collector for Amazon Web Services (AWS) logs."""
 
@@ -38,16 +111,32 @@ class AWSLogsCollector(module.BaseModule):
     self._start_time: Optional[datetime.datetime] = None
     self._end_time: Optional[datetime.datetime] = None
     self._region = str()
+    self._trail_bucket: Optional[str] = None
+    self._trail_prefix = str()
+    self._account_id: Optional[str] = None
+    self._trail_regions: list[str] = []
+    self._incremental = False
+    self._tracker: Optional[high_water_marks.HighWaterMarkTracker] = None
 
-  # pylint: disable=arguments-differ
+  # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(self,
             region: str,
             profile_name: Optional[str]=None,
             query_filter: Optional[str]=None,
             start_time: Optional[datetime.datetime]=None,
-            end_time: Optional[datetime.datetime]=None) -> None:
+            end_time: Optional[datetime.datetime]=None,
+            trail_bucket: Optional[str]=None,
+            trail_prefix: Optional[str]=None,
+            account_id: Optional[str]=None,
+            trail_regions: Optional[str]=None,
+            incremental: bool=False) -> None:
     """Sets up an AWS logs collector
 
+    If trail_bucket is set, the collector reads the CloudTrail log objects
+    delivered to that bucket directly instead of using the LookupEvents API.
+    This is much faster for large time ranges, as it is not bound by the API
+    quotas.
+
     Args:
       region: An AWS region name.
       profile_name: Optional. The profile name to collect logs with.
@@ -55,12 +144,38 @@ class AWSLogsCollector(module.BaseModule):
         'key,value'
       start_time: Optional. The start time for the query.
       end_time: Optional. The end time for the query.
+      trail_bucket: Optional. The S3 bucket the trail delivers logs to.
+      trail_prefix: Optional. The S3 key prefix configured for the trail.
+      account_id: Optional. The AWS account ID to read trail logs for. Defaults
+        to the account of the current credentials.
+      trail_regions: Optional. Comma-separated list of regions to read trail
+        logs for. Defaults to region.
+      incremental: Optional. If True, only collect the events that are newer
+        than the ones collected by the previous incremental run with the same
+        scope and query filter.
     """
     self._region = region
     self._profile_name = profile_name
     self._query_filter = query_filter
     self._start_time = start_time
     self._end_time = end_time
+    self._trail_bucket = trail_bucket
+    self._account_id = account_id
+    self._trail_regions = (
+        trail_regions.split(',') if trail_regions else [region])
+    self._incremental = incremental
+
+    self._trail_prefix = (trail_prefix or '').strip('/')
+    if self._trail_prefix:
+      self._trail_prefix += '/'
+
+    if self._trail_bucket and self._query_filter:
+      key = self._query_filter.split(',')[0]
+      if key not in _RECORD_ATTRIBUTES:
+        self.ModuleError(
+            f'Unsupported query filter key {key} for trail bucket collection, '
+            f'must be one of {", ".join(sorted(_RECORD_ATTRIBUTES))}',
+            critical=True)
 
   def Process(self) -> None:
     """Copies logs from an AWS account."""
@@ -70,6 +185,54 @@ class AWSLogsCollector(module.BaseModule):
     output_path = output_file.name
     self.logger.info(f"Downloading logs to {output_path:s}")
 
+    session = self._GetSession()
+
+    store = high_water_marks.HighWaterMarkStore()
+    scope = self._GetScope()
+    if self._incremental:
+      previous = store.Get(
+          self.__class__.__name__, scope, self._query_filter or '')
+      self._tracker = high_water_marks.HighWaterMarkTracker(
+          previous, _INCREMENTAL_LOOKBACK)
+      if previous:
+        since = previous.timestamp - _INCREMENTAL_LOOKBACK
+        if not self._start_time or _AsUTC(self._start_time) < since:
+          self.logger.info(f'Collecting events since {since.isoformat()}')
+          self._start_time = since
+
+    if self._trail_bucket:
+      event_count = self._CollectFromTrailBucket(session, output_file)
+    else:
+      event_count = self._CollectFromLookupEvents(session, output_file)
+
+    self.logger.info(f'Downloaded logs to {output_path}')
+    output_file.close()
+
+    if self._tracker:
+      if self._tracker.current:
+        store.Set(self.__class__.__name__, scope, self._query_filter or '',
+                  self._tracker.current)
+      if not event_count:
+        self.PublishMessage(f'No new events for {scope}')
+        os.remove(output_path)
+        return
+
+    logs_report = containers.File('AWSLogsCollector result', output_path)
+    self.StoreContainer(logs_report)
+
+  def _GetScope(self) -> str:
+    """Returns the scope used to key incremental collection state."""
+    if self._trail_bucket:
+      return (f's3://{self._trail_bucket}/{self._trail_prefix}'
+              f'{self._account_id}:{",".join(self._trail_regions)}')
+    return self._region
+
+  def _GetSession(self) -> boto3_session.Session:
+    """Creates a boto3 session and checks that credentials are usable.
+
+    Returns:
+      The boto3 session to create clients from.
+    """
     if self._profile_name:
       try:
         session = boto3_session.Session(profile_name=self._profile_name)
@@ -81,13 +244,29 @@ class AWSLogsCollector(module.BaseModule):
 
     try:
       sts_client = session.client('sts')
-      sts_client.get_caller_identity()
+      identity = sts_client.get_caller_identity()
     except (boto_exceptions.NoRegionError,
             boto_exceptions.NoCredentialsError) as exception:
       self.ModuleError('No profile found or credentials not properly '
           'configured. See https://docs.aws.amazon.com/cli/latest/userguide/cli-configure-profiles.html')  # pylint: disable=line-too-long
       self.ModuleError(str(exception), critical=True)
 
+    if self._trail_bucket and not self._account_id:
+      self._account_id = identity['Account']
+
+    return session
+
+  def _CollectFromLookupEvents(
+      self, session: boto3_session.Session, output_file: Any) -> int:
+    """Writes the events returned by the CloudTrail LookupEvents API.
+
+    Args:
+      session: The boto3 session to create the CloudTrail client from.
+      output_file: The file object to write JSONL events to.
+
+    Returns:
+      The number of events written.
+    """
     cloudtrail_client = session.client('cloudtrail', region_name=self._region)
 
     request_params: dict[str, Any] = {}
@@ -100,11 +279,16 @@ class AWSLogsCollector(module.BaseModule):
     if self._end_time:
       request_params['EndTime'] = self._end_time
 
+    event_count = 0
     while True:
       try:
         results = cloudtrail_client.lookup_events(**request_params)
         events = results.get('Events', [])
         for event in events:
+          if self._tracker and not self._tracker.Add(
+              event['EventTime'], event['EventId']):
+            continue
+          event_count += 1
           # Set the default serializer to str() to account for datetime objects.
           event_string = json.dumps(event, default=str)
           output_file.write(event_string)
@@ -119,11 +303,148 @@ class AWSLogsCollector(module.BaseModule):
           'are correct https://docs.aws.amazon.com/awscloudtrail/latest/APIReference/API_LookupEvents.html')  # pylint: disable=line-too-long
         self.ModuleError(str(exception), critical=True)
 
-    self.logger.info(f'Downloaded logs to {output_path}')
-    output_file.close()
+    return event_count
 
-    logs_report = containers.File('AWSLogsCollector result', output_path)
-    self.StoreContainer(logs_report)
+  def _CollectFromTrailBucket(
+      self, session: boto3_session.Session, output_file: Any) -> int:
+    """Writes the events stored in a CloudTrail S3 bucket.
+
+    Objects are downloaded and decompressed concurrently, and their records
+    are filtered locally and appended to the output as each object completes.
+
+    Args:
+      session: The boto3 session to create the S3 client from.
+      output_file: The file object to write JSONL events to.
+
+    Returns:
+      The number of events written.
+    """
+    s3_client = session.client('s3')
+
+    end_time = _AsUTC(self._end_time or datetime.datetime.now(
+        datetime.timezone.utc))
+    start_time = _AsUTC(self._start_time or end_time - _DEFAULT_LOOKBACK)
+
+    write_lock = threading.Lock()
+    record_count = 0
+
+    def _ProcessObject(key: str) -> None:
+      nonlocal record_count
+      events = [_ToLookupEvent(record) for record in
+                self._ReadTrailObject(s3_client, key)
+                if self._RecordMatches(record, start_time, end_time)]
+      with write_lock:
+        lines = [json.dumps(event, default=str) for event in events
+                 if not self._tracker or self._tracker.Add(
+                     event['EventTime'], event['EventId'])]
+        if not lines:
+          return
+        output_file.write('\n'.join(lines))
+        output_file.write('\n')
+        record_count += len(lines)
+
+    try:
+      with futures.ThreadPoolExecutor(max_workers=_S3_MAX_WORKERS) as executor:
+        futures_ = [
+            executor.submit(_ProcessObject, key) for key in
+            self._ListTrailObjects(s3_client, start_time, end_time)]
+        for future in futures.as_completed(futures_):
+          future.result()
+    except boto_exceptions.ClientError as exception:
+      self.ModuleError(
+          f'Could not read trail logs from bucket {self._trail_bucket}')
+      self.ModuleError(str(exception), critical=True)
+
+    self.logger.info(f'Read {record_count:d} events from {self._trail_bucket}')
+    return record_count
+
+  def _ListTrailObjects(self,
+                        s3_client: Any,
+                        start_time: datetime.datetime,
+                        end_time: datetime.datetime
+                        ) -> Iterator[str]:
+    """Lists the trail objects that can hold events in the time range.
+
+    Args:
+      s3_client: The boto3 S3 client.
+      start_time: The start of the time range, in UTC.
+      end_time: The end of the time range, in UTC.
+
+    Yields:
+      The object keys.
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    # Objects are delivered a few minutes after the events they contain, so
+    # include the day after the end of the range.
+    last_day = (end_time + datetime.timedelta(days=1)).date()
+    for region in self._trail_regions:
+      region_prefix = _CLOUDTRAIL_KEY_PREFIX.format(
+          prefix=self._trail_prefix, account_id=self._account_id,
+          region=region)
+      day = start_time.date()
+      while day <= last_day:
+        prefix = f'{region_prefix}{day:%Y/%m/%d}/'
+        for page in paginator.paginate(
+            Bucket=self._trail_bucket, Prefix=prefix):
+          for s3_object in page.get('Contents', []):
+            yield s3_object['Key']
+        day += datetime.timedelta(days=1)
+
+  def _ReadTrailObject(
+      self, s3_client: Any, key: str) -> list[dict[str, Any]]:
+    """Downloads and decompresses a single CloudTrail object.
+
+    Args:
+      s3_client: The boto3 S3 client.
+      key: The object key.
+
+    Returns:
+      The CloudTrail records contained in the object.
+    """
+    data = s3_client.get_object(
+        Bucket=self._trail_bucket, Key=key)['Body'].read()
+    if not data:
+      return []
+    if key.endswith('.gz'):
+      data = gzip.decompress(data)
+    records: list[dict[str, Any]] = json.loads(data).get('Records', [])
+    return records
+
+  def _RecordMatches(self,
+                     record: dict[str, Any],
+                     start_time: datetime.datetime,
+                     end_time: datetime.datetime) -> bool:
+    """Checks a CloudTrail record against the time range and query filter.
+
+    Args:
+      record: The CloudTrail record.
+      start_time: The start of the time range, in UTC.
+      end_time: The end of the time range, in UTC.
+
+    Returns:
+      True if the record should be collected.
+    """
+    event_time = record.get('eventTime')
+    if not event_time:
+      return False
+    timestamp = _AsUTC(
+        datetime.datetime.fromisoformat(event_time.replace('Z', '+00:00')))
+    if not start_time <= timestamp <= end_time:
+      return False
+
+    if self._query_filter:
+      key, value = self._query_filter.split(',')
+      if key == 'ReadOnly':
+        value = value.lower()
+      return value in _RECORD_ATTRIBUTES[key](record)
+    return True
+
+
+def _AsUTC(timestamp: datetime.datetime) -> datetime.datetime:
+  """Returns a timezone aware timestamp, assuming UTC for naive ones."""
+  if timestamp.tzinfo is None:
+    return timestamp.replace(tzinfo=datetime.timezone.utc)
+  return timestamp.astimezone(datetime.timezone.utc)
 
 
 modules_manager.ModulesManager.RegisterModule(AWSLogsCollector)
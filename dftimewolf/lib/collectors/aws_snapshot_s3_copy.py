@@ -4,10 +4,12 @@
 import time
 from typing import Any, Optional, Type, Callable
 import boto3
+import botocore
 
 from libcloudforensics.providers.aws import forensics
 from libcloudforensics.providers.aws.internal import account
 from libcloudforensics.errors import ResourceCreationError
+from dftimewolf.lib import ebs_direct
 from dftimewolf.lib import module
 from dftimewolf.lib.containers import containers, interface
 from dftimewolf.lib.modules import manager as modules_manager
@@ -41,6 +43,11 @@ class AWSSnapshotS3CopyCollector(module.ThreadAwareModule):
   Snapshot list can be passed in via SetUp parameters, or from an
   AWSAttributeContainer from a previous module.
 
+  By default, snapshots are copied by an instance that reads the volume
+  created from each snapshot. With use_ebs_direct, the snapshot blocks are read
+  with the EBS direct APIs and streamed to S3 instead, which needs no
+  instance and skips the unallocated blocks.
+
   Attributes:
     snapshots: The snapshots to copy.
     bucket: The destination S3 bucket.
@@ -63,6 +70,8 @@ class AWSSnapshotS3CopyCollector(module.ThreadAwareModule):
     self.subnet: Any = None
     self.ec2: Any = None
     self.s3: Any = None
+    self.ebs: Any = None
+    self.ebs_direct = False
     self.iam_details: Any = None
     self.aws_account: account.AWSAccount
     self.bucket_exists: bool = False
@@ -72,7 +81,8 @@ class AWSSnapshotS3CopyCollector(module.ThreadAwareModule):
             snapshots: Optional[str] = '',
             bucket: str='',
             region: str='',
-            subnet: Optional[str]=None) -> None:
+            subnet: Optional[str]=None,
+            use_ebs_direct: bool=False) -> None:
     """Sets up the AWSVolumeToS3 collector.
 
     Args:
@@ -81,12 +91,17 @@ class AWSSnapshotS3CopyCollector(module.ThreadAwareModule):
       region (str): The AWS region the snapshots are in.
       subnet (str): The subnet to use for the copy instance. Required if there
         is no default subnet.
+      use_ebs_direct (bool): Read the snapshots with the EBS direct APIs instead
+        of copying them from an instance.
     """
     self.bucket = bucket
     self.region = region
     self.subnet = subnet
     self.ec2 = boto3.client('ec2', region_name=self.region)
     self.s3 = boto3.client('s3', region_name=self.region)
+    self.ebs_direct = bool(use_ebs_direct)
+    if self.ebs_direct:
+      self.ebs = boto3.client('ebs', region_name=self.region)
     self.aws_account = account.AWSAccount(
           self._PickAvailabilityZone(self.subnet))
 
@@ -116,6 +131,9 @@ class AWSSnapshotS3CopyCollector(module.ThreadAwareModule):
           'Could not find the snapshots ids to copy.',
           critical=True)
 
+    if self.ebs_direct:
+      return
+
     # Create the IAM pieces
     self.iam_details = forensics.CopyEBSSnapshotToS3SetUp(
         self.aws_account, INSTANCE_PROFILE_NAME)
@@ -124,6 +142,9 @@ class AWSSnapshotS3CopyCollector(module.ThreadAwareModule):
 
   def Process(self, container: containers.AWSSnapshot) -> None:  # pyrefly: ignore=[bad-override]
     """Perform the copy of the snapshot to S3."""
+    if self.ebs_direct:
+      self._CopySnapshotDirect(container)
+      return
 
     # Aws accounts have thread safety issues. Create a unique one per thread
     aws_account = account.AWSAccount(self._PickAvailabilityZone(self.subnet))
@@ -141,8 +162,41 @@ class AWSSnapshotS3CopyCollector(module.ThreadAwareModule):
       self.ModuleError(
           f'Exception during copy operation: {exception!s}', critical=True)
 
+  def _CopySnapshotDirect(self, snapshot: containers.AWSSnapshot) -> None:
+    """Streams a snapshot to S3 with the EBS direct APIs.
+
+    The image is written to the same path as with the instance based copy,
+    along with its SHA-256 hash.
+
+    Args:
+      snapshot: The snapshot to copy.
+    """
+    bucket = self.bucket.removeprefix('s3://')
+    image_key = f'{snapshot.id}/image.bin'
+    reader = ebs_direct.SnapshotBlockReader(self.ebs, snapshot.id)
+    try:
+      reader.ListBlocks()
+      self.logger.info(
+          f'Copying {len(reader.blocks):d} allocated blocks of '
+          f'{snapshot.id:s} to s3://{bucket:s}/{image_key:s}')
+      sha256 = reader.UploadToS3(self.s3, bucket, image_key)
+      self.s3.put_object(
+          Bucket=bucket,
+          Key=f'{image_key}.sha256',
+          Body=f'{sha256}  image.bin\n'.encode())
+    except (botocore.exceptions.ClientError, ValueError) as exception:
+      self.ModuleError(
+          f'Exception during copy operation: {exception!s}', critical=True)
+
+    self.StoreContainer(
+        containers.AWSS3Object(f's3://{bucket:s}/{image_key:s}'))
+    self.StoreContainer(
+        containers.AWSS3Object(f's3://{bucket:s}/{image_key:s}.sha256'))
+
   def PostProcess(self) -> None:
     """Clean up afterwards."""
+    if self.ebs_direct:
+      return
     forensics.CopyEBSSnapshotToS3TearDown(
         self.aws_account, INSTANCE_PROFILE_NAME, self.iam_details)
 
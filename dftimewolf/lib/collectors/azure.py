@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 """Creates an analysis VM and copies Azure disks to it for analysis."""
 
-from typing import Optional, Callable
+import math
+import threading
+from concurrent import futures
+from typing import Any, Optional, Callable
 
 from libcloudforensics.providers.azure import forensics as az_forensics
 from libcloudforensics.providers.azure.internal import account
@@ -12,9 +15,15 @@ from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
 from dftimewolf.lib import cache
 from dftimewolf.lib import spanner_telemetry as telemetry
+from dftimewolf.lib import vm_pool
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# Data disks an analysis VM can attach per CPU core. Azure general purpose
+# VM sizes allow two data disks per vCPU.
+DATA_DISKS_PER_CPU_CORE = 2
+
+
 class AzureCollector(module.BaseModule):
   """Microsoft Azure Collector.
 
@@ -37,6 +46,13 @@ class AzureCollector(module.BaseModule):
         which to create the VM.
     analysis_vm (AZVirtualMachine): Analysis VM to which the disk copy will be
         attached.
+    analysis_vms (list[AZVirtualMachine]): All analysis VMs. Disks are
+        spread over additional analysis VMs when there are more disks than a
+        single VM can attach.
+    max_concurrent_copies (int): Maximum number of disks copied at the same
+        time.
+    max_disks_per_vm (int): Maximum number of data disks attached to each
+        analysis VM.
   """
 
   _ANALYSIS_VM_CONTAINER_ATTRIBUTE_NAME = 'Analysis VM'
@@ -72,26 +88,152 @@ class AzureCollector(module.BaseModule):
     self.analysis_region = str()
     self.analysis_resource_group_name = str()
     self.analysis_vm: compute.AZComputeVirtualMachine
+    self.analysis_vms: list[compute.AZComputeVirtualMachine] = []
+    self.max_concurrent_copies = 1
+    self.max_disks_per_vm = 1
+    self._analysis_vm_options: dict[str, Any] = {}
+    # Attaching a disk updates the VM model, which Azure does not allow to
+    # happen concurrently on the same VM.
+    self._attach_locks: dict[str, threading.Lock] = {}
+    self._vm_pool: Optional[vm_pool.VMPool] = None
 
   def Process(self) -> None:
-    """Copies a disk to the analysis account."""
-    for disk in self._FindDisksToCopy():
-      self.logger.info(f'Disk copy of {disk.name:s} started...')
-      new_disk = az_forensics.CreateDiskCopy(
-          self.analysis_resource_group_name,
-          disk_name=disk.name,
-          region=self.analysis_region,
-          src_profile=self.remote_profile_name,
-          dst_profile=self.analysis_profile_name
-      )
-      self.PublishMessage(
-          f'Disk {disk.name} successfully copied to {new_disk.name}')
-      self.analysis_vm.AttachDisk(new_disk)
-      container = containers.ForensicsVM(
-          name=self.analysis_vm.name,
-          evidence_disk=new_disk,
-          platform='azure')
-      self.StoreContainer(container)
+    """Copies disks in parallel to the analysis account."""
+    self._CopyDisks()
+
+  def _CopyDisks(self) -> None:
+    """Copies disks in parallel to the analysis account."""
+    disks = self._FindDisksToCopy()
+    if not disks:
+      return
+
+    with futures.ThreadPoolExecutor(
+        max_workers=min(self.max_concurrent_copies, len(disks))) as executor:
+      self._StartAdditionalAnalysisVms(len(disks), executor)
+      analysis_vms = [
+          self.analysis_vms[index // self.max_disks_per_vm]
+          for index in range(len(disks))]
+      copy_futures = [
+          executor.submit(self._CopyDisk, disk, analysis_vm)
+          for disk, analysis_vm in zip(disks, analysis_vms)]
+      # Every copy is waited for, so that the successful copies are output
+      # even if some of the others failed.
+      failures = []
+      for disk, future, analysis_vm in zip(disks, copy_futures, analysis_vms):
+        try:
+          new_disk = future.result()
+        except Exception as exception:  # pylint: disable=broad-except
+          failures.append(f'{disk.name:s}: {exception!s}')
+          continue
+        container = containers.ForensicsVM(
+            name=analysis_vm.name,
+            evidence_disk=new_disk,
+            platform='azure')
+        self.StoreContainer(container)
+
+    if failures:
+      self.ModuleError(
+          f'{len(failures):d} of {len(disks):d} disk copies failed: '
+          f'{"; ".join(failures)}', critical=True)
+
+  def _CopyDisk(
+      self,
+      disk: compute.AZComputeDisk,
+      analysis_vm: compute.AZComputeVirtualMachine) -> compute.AZComputeDisk:
+    """Copies a disk and attaches the copy to an analysis VM.
+
+    Args:
+      disk: The disk to copy.
+      analysis_vm: The analysis VM to attach the copy to.
+
+    Returns:
+      The disk copy.
+    """
+    self.logger.info(f'Disk copy of {disk.name:s} started...')
+    new_disk: compute.AZComputeDisk = az_forensics.CreateDiskCopy(
+        self.analysis_resource_group_name,
+        disk_name=disk.name,
+        region=self.analysis_region,
+        src_profile=self.remote_profile_name,
+        dst_profile=self.analysis_profile_name
+    )
+    self.PublishMessage(
+        f'Disk {disk.name} successfully copied to {new_disk.name}')
+    with self._attach_locks[analysis_vm.name]:
+      analysis_vm.AttachDisk(new_disk)
+    return new_disk
+
+  def _StartAdditionalAnalysisVms(
+      self, disk_count: int, executor: futures.Executor) -> None:
+    """Starts the analysis VMs needed to attach all disk copies.
+
+    Additional VMs are started in parallel and named after the first analysis
+    VM with an increasing numerical suffix.
+
+    Args:
+      disk_count: The number of disks to attach.
+      executor: The executor to start the analysis VMs with.
+    """
+    vm_count = math.ceil(disk_count / self.max_disks_per_vm)
+    names = [
+        f'azure-forensics-vm-{self.incident_id:s}-{index:d}'
+        for index in range(len(self.analysis_vms), vm_count)]
+    if not names:
+      return
+
+    self.logger.info(
+        f'{disk_count:d} disks to attach, starting {len(names):d} additional '
+        'analysis VMs')
+    start_futures = [
+        executor.submit(self._StartAnalysisVm, name) for name in names]
+    failures = []
+    for name, future in zip(names, start_futures):
+      try:
+        analysis_vm = future.result()
+      except Exception as exception:  # pylint: disable=broad-except
+        failures.append(f'{name:s}: {exception!s}')
+        continue
+      self.logger.info(f'Additional analysis VM will be: {analysis_vm.name:s}')
+      self.StoreContainer(
+          containers.TicketAttribute(
+              name=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_NAME,
+              type_=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_TYPE,
+              value=analysis_vm.name))
+      self._AddAnalysisVm(analysis_vm)
+
+    if failures:
+      self.ModuleError(
+          f'Unable to start {len(failures):d} additional analysis VMs: '
+          f'{"; ".join(failures)}', critical=True)
+
+  def _StartAnalysisVm(self, name: str) -> compute.AZComputeVirtualMachine:
+    """Starts an analysis VM, or leases one from the analysis VM pool.
+
+    Args:
+      name: Name of the analysis VM to start. Pooled VMs keep their name.
+
+    Returns:
+      The analysis VM.
+    """
+    if self._vm_pool:
+      analysis_vm: compute.AZComputeVirtualMachine = self._vm_pool.Lease(
+          self.incident_id).instance
+      return analysis_vm
+    analysis_vm, _ = az_forensics.StartAnalysisVm(
+        self.analysis_resource_group_name,
+        name,
+        **self._analysis_vm_options)
+    return analysis_vm
+
+  def _AddAnalysisVm(
+      self, analysis_vm: compute.AZComputeVirtualMachine) -> None:
+    """Registers an analysis VM disks can be attached to.
+
+    Args:
+      analysis_vm: The analysis VM.
+    """
+    self.analysis_vms.append(analysis_vm)
+    self._attach_locks[analysis_vm.name] = threading.Lock()
 
   # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(self,
@@ -106,7 +248,10 @@ class AzureCollector(module.BaseModule):
             analysis_region: str='',
             boot_disk_size: int=50,
             cpu_cores: int=4,
-            memory_in_mb: int=8192) -> None:
+            memory_in_mb: int=8192,
+            max_concurrent_copies: int=4,
+            max_disks_per_vm: Optional[int]=None,
+            vm_pool_size: int=0) -> None:
     """Sets up a Microsoft Azure collector.
 
     This method creates and starts an analysis VM in the analysis account and
@@ -145,6 +290,16 @@ class AzureCollector(module.BaseModule):
           analysis VM. Default is 4.
       memory_in_mb (int): Optional. The amount of memory in mb to use for the
           analysis VM. Default is 8Gb.
+      max_concurrent_copies (int): Optional. The maximum number of disks to
+          copy at the same time. Default is 4.
+      max_disks_per_vm (int): Optional. The maximum number of data disks to
+          attach to each analysis VM. Additional analysis VMs are started if
+          there are more disks to copy. Defaults to two per CPU core, the
+          limit of general purpose VM sizes.
+      vm_pool_size (int): Optional. If set, lease the analysis VMs from a
+          warm pool of reusable analysis VMs. The pool is replenished by the
+          vm_pool_release recipe. Default is 0, which starts a dedicated
+          analysis VM.
     """
     if not (remote_instance_name or disk_names):
       self.ModuleError(
@@ -176,6 +331,36 @@ class AzureCollector(module.BaseModule):
     self.all_disks = all_disks
     self.analysis_region = analysis_region
     self.analysis_profile_name = analysis_profile_name or remote_profile_name
+    self.max_concurrent_copies = max(1, int(max_concurrent_copies))
+    self.max_disks_per_vm = max(
+        1, int(max_disks_per_vm or DATA_DISKS_PER_CPU_CORE * cpu_cores))
+    self._analysis_vm_options = {
+        'boot_disk_size': boot_disk_size,
+        'ssh_public_key': ssh_public_key,
+        'cpu_cores': cpu_cores,
+        'memory_in_mb': memory_in_mb,
+        'region': self.analysis_region,
+        'dst_profile': self.analysis_profile_name,
+    }
+    self.analysis_vms = []
+    self._attach_locks = {}
+
+    if vm_pool_size:
+      self._vm_pool = vm_pool.VMPool(
+          vm_pool.AzurePoolBackend(
+              self.analysis_resource_group_name, self.analysis_region,
+              self.analysis_profile_name, ssh_public_key, boot_disk_size,
+              cpu_cores, memory_in_mb),
+          int(vm_pool_size))
+      self.analysis_vm = self._StartAnalysisVm('')
+      print(f'Your analysis VM will be: {self.analysis_vm.name:s}')
+      self.StoreContainer(
+          containers.TicketAttribute(
+              name=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_NAME,
+              type_=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_TYPE,
+              value=self.analysis_vm.name))
+      self._AddAnalysisVm(self.analysis_vm)
+      return
 
     analysis_vm_name = f'azure-forensics-vm-{self.incident_id:s}'
     print(f'Your analysis VM will be: {analysis_vm_name:s}')
@@ -194,6 +379,7 @@ class AzureCollector(module.BaseModule):
         region=self.analysis_region,
         dst_profile=self.analysis_profile_name,
     )
+    self._AddAnalysisVm(self.analysis_vm)
 
   def _GetDisksFromNames(self,
                          disk_names: list[str]) -> list[compute.AZComputeDisk]:
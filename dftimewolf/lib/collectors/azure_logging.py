@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
-"""Reads logs from an Azure subscription."""
+"""Reads logs from Azure subscriptions."""
+import datetime
 import json
+import os
+import re
+import shutil
 import tempfile
-from typing import Optional, Callable
+from concurrent import futures
+from typing import Any, Iterator, Optional, Callable
 
+import ratelimit
 from azure.mgmt import monitor as az_monitor
 from azure.core import exceptions as az_exceptions
 
@@ -18,8 +24,44 @@ from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# Matches the time range clauses of an activity log filter expression.
+_START_TIME_REGEX = re.compile(r"eventTimestamp\s+ge\s+'([^']+)'")
+_END_TIME_REGEX = re.compile(r"eventTimestamp\s+le\s+'([^']+)'")
+
+# Default duration of the time windows collected in parallel.
+DEFAULT_WINDOW_HOURS = 24
+
+# Maximum number of time windows collected simultaneously.
+MAX_WORKERS = 8
+
+# Number of activity log requests allowed per period, across all windows and
+# subscriptions.
+CALL_LIMIT = 10
+
+# Ratelimit period.
+ONE_SECOND = 1
+
+
+@ratelimit.sleep_and_retry
+@ratelimit.limits(calls=CALL_LIMIT, period=ONE_SECOND)
+def _FetchPage(pages: Iterator[Iterator[Any]]) -> Optional[Iterator[Any]]:
+  """Fetches the next page of activity log results under the rate limit.
+
+  Args:
+    pages: An activity log page iterator.
+
+  Returns:
+    The next page of results, or None if there are no more pages.
+  """
+  return next(pages, None)
+
+
 class AzureLogsCollector(module.BaseModule):
-  """Collector for Azure Activity logs."""
+  """Collector for Azure Activity logs.
+
+  The time range in the filter expression is split into windows, which are
+  collected concurrently for every subscription under a shared rate limit.
+  """
 
   def __init__(self,
                name: str,
@@ -34,46 +76,59 @@ class AzureLogsCollector(module.BaseModule):
                      telemetry_=telemetry_,
                      publish_message_callback=publish_message_callback)
     self._filter_expression = ''
-    self._subscription_id = ''
+    self._subscription_ids: list[str] = []
     self._profile_name: Optional[str] = ''
+    self._window_size = datetime.timedelta(hours=DEFAULT_WINDOW_HOURS)
 
   # pylint: disable=arguments-differ
   def SetUp(self,
             subscription_id: str,
             filter_expression: str,
-            profile_name: Optional[str]=None) -> None:
+            profile_name: Optional[str]=None,
+            window_hours: Optional[int]=None) -> None:
     """Sets up an Azure logs collector.
 
     Args:
-      subscription_id (str): name of the subscription_id to fetch logs from.
+      subscription_id (str): comma-separated list of subscription IDs to fetch
+          logs from.
       filter_expression (str): Azure logs filter expression.
       profile_name (str): a profile name to use for finding credentials.
+      window_hours (int): duration, in hours, of the time windows the filter
+          expression's time range is split into.
     """
-    self._subscription_id = subscription_id
+    self._subscription_ids = [
+        s.strip() for s in subscription_id.split(',') if s.strip()]
     self._filter_expression = filter_expression
     self._profile_name = profile_name
+    if window_hours:
+      self._window_size = datetime.timedelta(hours=int(window_hours))
 
   def Process(self) -> None:
-    """Copies logs from an Azure subscription."""
-
-    output_file = tempfile.NamedTemporaryFile(
-        mode='w', delete=False, encoding='utf-8', suffix='.jsonl')
-    output_path = output_file.name
-    self.logger.info(f"Downloading logs to {output_path:s}")
-
+    """Copies logs from Azure subscriptions."""
     try:
       _, credentials = lcf_common.GetCredentials(
           profile_name=self._profile_name)
-      monitoring_client = az_monitor.MonitorManagementClient(
-          credentials, self._subscription_id)
-      activity_logs_client = monitoring_client.activity_logs
+      # Clients are shared by all the windows of a subscription.
+      monitoring_clients = {
+          subscription_id: az_monitor.MonitorManagementClient(
+              credentials, subscription_id)
+          for subscription_id in self._subscription_ids}
 
-      results = activity_logs_client.list(filter=self._filter_expression)
+      windows = self._SplitFilterExpression()
+      self.logger.info(
+          f'Collecting {len(windows):d} time windows for '
+          f'{len(self._subscription_ids):d} subscription(s)')
 
-      for result_entry in results:
-        log_dict = result_entry.as_dict()
-        output_file.write(json.dumps(log_dict))
-        output_file.write('\n')
+      shards: dict[str, list[futures.Future[str]]] = {}
+      with futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for subscription_id, client in monitoring_clients.items():
+          shards[subscription_id] = [
+              executor.submit(
+                  self._CollectWindow, client, filter_expression, after)
+              for filter_expression, after in windows]
+
+      for subscription_id, shard_paths in self._GetShardPaths(shards).items():
+        self._StoreSubscriptionLogs(subscription_id, shard_paths)
     except (lcf_errors.CredentialsConfigurationError,
             FileNotFoundError) as exception:
       self.ModuleError('Ensure credentials are properly configured as expected '
@@ -100,11 +155,150 @@ class AzureLogsCollector(module.BaseModule):
             'Resource not found, ensure that subscription_id is correct.')
       self.ModuleError(str(exception), critical=True)
 
-    self.logger.info('Downloaded logs to {output_path}')
-    output_file.close()
+  def _SplitFilterExpression(
+      self) -> list[tuple[str, Optional[datetime.datetime]]]:
+    """Splits the filter expression's time range into windows.
+
+    The filter only supports inclusive bounds, so consecutive windows share
+    their boundary. Events at the start of a window are collected with the
+    previous window, and are skipped in the later one.
+
+    Returns:
+      A list of filter expressions, one for each time window, with the time
+      at which events must be skipped in that window or None. If the filter
+      expression does not have a start time, it is returned unchanged.
+    """
+    start_match = _START_TIME_REGEX.search(self._filter_expression)
+    if not start_match:
+      return [(self._filter_expression, None)]
+
+    end_match = _END_TIME_REGEX.search(self._filter_expression)
+    try:
+      start_time = _ParseTimestamp(start_match.group(1))
+      if end_match:
+        end_time = _ParseTimestamp(end_match.group(1))
+    except ValueError:
+      self.logger.warning(
+          'Could not parse the filter expression time range, collecting it '
+          'as a single window')
+      return [(self._filter_expression, None)]
+
+    base_expression = self._filter_expression
+    if not end_match:
+      end_time = datetime.datetime.now(datetime.timezone.utc)
+      base_expression += f" and eventTimestamp le '{end_time.isoformat()}'"
+
+    windows: list[tuple[str, Optional[datetime.datetime]]] = []
+    window_start = start_time
+    while window_start < end_time:
+      window_end = min(window_start + self._window_size, end_time)
+      expression = _START_TIME_REGEX.sub(
+          f"eventTimestamp ge '{window_start.isoformat()}'", base_expression)
+      expression = _END_TIME_REGEX.sub(
+          f"eventTimestamp le '{window_end.isoformat()}'", expression)
+      windows.append((expression, window_start if windows else None))
+      window_start = window_end
+    return windows or [(self._filter_expression, None)]
+
+  def _GetShardPaths(
+      self, shards: dict[str, list[futures.Future[str]]]
+  ) -> dict[str, list[str]]:
+    """Returns the shard file paths of every subscription.
+
+    If a window could not be collected, the shard files of the other windows
+    are removed and the window's exception is raised.
+
+    Args:
+      shards: The finished window collections, by subscription.
+
+    Returns:
+      The shard file paths, in time window order, by subscription.
+    """
+    shard_futures = [
+        future for futures_ in shards.values() for future in futures_]
+    exceptions = [
+        future.exception() for future in shard_futures
+        if future.exception()]
+    if exceptions:
+      for future in shard_futures:
+        if not future.exception():
+          os.remove(future.result())
+      raise exceptions[0]
+    return {
+        subscription_id: [future.result() for future in futures_]
+        for subscription_id, futures_ in shards.items()}
 
-    logs_report = containers.File('AzureLogsCollector result', output_path)
+  def _CollectWindow(
+      self,
+      monitoring_client: az_monitor.MonitorManagementClient,
+      filter_expression: str,
+      skipped_time: Optional[datetime.datetime] = None) -> str:
+    """Writes the activity logs for a single time window to a shard file.
+
+    Args:
+      monitoring_client: The monitor client for the subscription.
+      filter_expression: The filter expression for the time window.
+      skipped_time: Time of the events already collected with the previous
+          window, if any.
+
+    Returns:
+      The path to the shard file.
+    """
+    with tempfile.NamedTemporaryFile(
+        mode='w', delete=False, encoding='utf-8', suffix='.jsonl'
+        ) as output_file:
+      try:
+        pages = monitoring_client.activity_logs.list(
+            filter=filter_expression).by_page()
+        page = _FetchPage(pages)
+        while page is not None:
+          lines = [
+              json.dumps(entry.as_dict()) for entry in page
+              if not skipped_time or
+              getattr(entry, 'event_timestamp', None) != skipped_time]
+          if lines:
+            output_file.write('\n'.join(lines))
+            output_file.write('\n')
+          page = _FetchPage(pages)
+      except Exception:
+        output_file.close()
+        os.remove(output_file.name)
+        raise
+      return output_file.name
+
+  def _StoreSubscriptionLogs(
+      self, subscription_id: str, shard_paths: list[str]) -> None:
+    """Concatenates the window shards of a subscription and stores them.
+
+    Args:
+      subscription_id: The subscription the shards were collected from.
+      shard_paths: Paths to the shard files, in time window order.
+    """
+    if len(shard_paths) == 1:
+      output_path = shard_paths[0]
+    else:
+      with tempfile.NamedTemporaryFile(
+          mode='wb', delete=False, suffix='.jsonl') as output_file:
+        output_path = output_file.name
+        for shard_path in shard_paths:
+          with open(shard_path, 'rb') as shard_file:
+            shutil.copyfileobj(shard_file, output_file)
+          os.remove(shard_path)
+
+    self.logger.info(
+        f'Downloaded logs for subscription {subscription_id} to {output_path}')
+    logs_report = containers.File(
+        'AzureLogsCollector result', output_path,
+        description=f'Activity logs for subscription {subscription_id}')
     self.StoreContainer(logs_report)
 
 
+def _ParseTimestamp(timestamp: str) -> datetime.datetime:
+  """Parses a filter expression timestamp, assuming UTC for naive ones."""
+  parsed = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+  if parsed.tzinfo is None:
+    parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+  return parsed
+
+
 modules_manager.ModulesManager.RegisterModule(AzureLogsCollector)
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 """Reads logs from a BigQuery table."""
-from typing import Callable, Type
+import json
+import tempfile
+import threading
+from typing import Any, Callable, Optional, Type
 
 from google.auth import exceptions as google_auth_exceptions
 from google.cloud import bigquery
@@ -14,6 +17,24 @@ from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 from dftimewolf.lib import utils
 
+try:
+  from google.cloud import bigquery_storage  # pylint: disable=ungrouped-imports
+  import pyarrow
+  from pyarrow import parquet
+  HAS_BQ_STORAGE = True
+except ImportError:
+  HAS_BQ_STORAGE = False
+
+
+OUTPUT_FORMATS = ('jsonl', 'parquet')
+
+
+def _JsonDefault(value: Any) -> str:
+  """Serializes values that are not natively JSON serializable."""
+  if hasattr(value, 'isoformat'):
+    return str(value.isoformat())
+  return str(value)
+
 
 class BigQueryCollector(module.ThreadAwareModule):
   """Collector for BigQuery."""
@@ -32,13 +53,22 @@ class BigQueryCollector(module.ThreadAwareModule):
                      publish_message_callback=publish_message_callback)
 
     self._project_name: str = ''
+    self._streaming = False
+    self._output_format = 'jsonl'
+    self._max_stream_count: Optional[int] = None
+    self._client_lock = threading.Lock()
+    self._bq_client: Optional[bigquery.Client] = None
+    self._bqstorage_client: Any = None
 
   # pylint: disable=arguments-differ
   def SetUp(self,
             project_name: str,
             query: str,
             description: str,
-            pandas_output: bool) -> None:
+            pandas_output: bool,
+            streaming: bool = False,
+            output_format: Optional[str] = None,
+            max_stream_count: Optional[int] = None) -> None:
     """Sets up a BigQuery collector.
 
     Args:
@@ -47,8 +77,33 @@ class BigQueryCollector(module.ThreadAwareModule):
       description (str): A description of the query.
       pandas_output (bool): True if the results should be kept in a pandas DF in
           memory, False if they should be written to disk.
+      streaming (bool): True if results written to disk should be streamed
+          with the BigQuery Storage Read API, in Arrow record batches, instead
+          of being loaded in memory.
+      output_format (str): Format of the streamed results, one of 'jsonl' or
+          'parquet'. Defaults to 'jsonl'.
+      max_stream_count (int): Maximum number of parallel read streams when
+          streaming. Defaults to letting BigQuery decide.
     """
     self._project_name = project_name
+    self._streaming = bool(streaming)
+    self._output_format = output_format or 'jsonl'
+    self._max_stream_count = max_stream_count
+    if self._output_format not in OUTPUT_FORMATS:
+      self.ModuleError(
+          f'Unsupported output format {self._output_format}, expected one of '
+          f'{", ".join(OUTPUT_FORMATS)}', critical=True)
+    if self._output_format != 'jsonl' and not self._streaming:
+      self.ModuleError(
+          f'The {self._output_format} output format requires streaming',
+          critical=True)
+    if self._streaming and not HAS_BQ_STORAGE:
+      self.ModuleError(
+          'google-cloud-bigquery-storage and pyarrow are required to stream '
+          'BigQuery results, install them with '
+          '`poetry install --with bigquerystorage` or '
+          '`pip install google-cloud-bigquery-storage pyarrow`',
+          critical=True)
     if query:
       self.StoreContainer(containers.BigQueryQuery(
           query, description, pandas_output))
@@ -56,6 +111,94 @@ class BigQueryCollector(module.ThreadAwareModule):
   def PreProcess(self) -> None:
     """Empty PreProcess."""
 
+  def _GetClients(self) -> tuple[bigquery.Client, Any]:
+    """Returns the BigQuery clients, shared by all threads of the module.
+
+    Returns:
+      A tuple of the BigQuery client and, when streaming, the BigQuery Storage
+      Read client.
+    """
+    with self._client_lock:
+      if self._bq_client is None:
+        if self._project_name:
+          self._bq_client = bigquery.Client(project=self._project_name)
+        else:
+          self._bq_client = bigquery.Client()
+      if self._streaming and self._bqstorage_client is None:
+        self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+    return self._bq_client, self._bqstorage_client
+
+  def _StreamResults(self,
+                     query_job: bigquery.QueryJob,
+                     bqstorage_client: Any) -> str:
+    """Streams the results of a query to a file, one record batch at a time.
+
+    Args:
+      query_job: The query job to read results from.
+      bqstorage_client: The BigQuery Storage Read client.
+
+    Returns:
+      The path of the output file.
+    """
+    batches = query_job.result().to_arrow_iterable(
+        bqstorage_client=bqstorage_client,
+        max_stream_count=self._max_stream_count)
+
+    row_count = 0
+    with tempfile.NamedTemporaryFile(
+        mode='wb', delete=False, suffix=f'.{self._output_format}'
+        ) as output_file:
+      if self._output_format == 'parquet':
+        writer = None
+        for batch in batches:
+          if writer is None:
+            writer = parquet.ParquetWriter(output_file, batch.schema)
+          writer.write_batch(batch)
+          row_count += batch.num_rows
+        if writer is None:
+          parquet.write_table(pyarrow.table({}), output_file)
+        else:
+          writer.close()
+      else:
+        for batch in batches:
+          output_file.write(''.join(
+              json.dumps(row, default=_JsonDefault) + '\n'
+              for row in batch.to_pylist()).encode('utf-8'))
+          row_count += batch.num_rows
+
+    self.logger.info(f'Query returned {row_count} rows')
+    return output_file.name
+
+  def _SelectColumns(self,
+                     bq_client: bigquery.Client,
+                     query: str,
+                     required_columns: set[str]) -> str:
+    """Restricts a query to the columns used downstream.
+
+    Downstream modules may declare columns that the query does not return, so
+    the query result schema is fetched with a dry run and only the known
+    columns are selected.
+
+    Args:
+      bq_client: The BigQuery client.
+      query: The query to restrict.
+      required_columns: The columns used downstream.
+
+    Returns:
+      The restricted query, or the query itself if none of the columns used
+      downstream are returned by the query.
+    """
+    dry_run = bq_client.query(
+        query, job_config=bigquery.QueryJobConfig(
+            dry_run=True, use_query_cache=False))
+    known_columns = {field.name for field in dry_run.schema or []}
+    selected_columns = sorted(required_columns & known_columns)
+    if not selected_columns:
+      return query
+    columns = ', '.join(f'`{column}`' for column in selected_columns)
+    self.logger.info(f'Only selecting columns used downstream: {columns}')
+    return f'SELECT {columns} FROM ({query.strip().rstrip(";")})'
+
   def Process(self, container: containers.BigQueryQuery) -> None:  # pyrefly: ignore=[bad-override]
     """Collects data from BigQuery.
 
@@ -64,18 +207,26 @@ class BigQueryCollector(module.ThreadAwareModule):
     """
 
     try:
-      if self._project_name:
-        bq_client = bigquery.Client(project=self._project_name)
-      else:
-        bq_client = bigquery.Client()
-      df = bq_client.query(container.query).to_dataframe()
-      self.logger.info('Query returned %d rows', df.shape[0])
+      bq_client, bqstorage_client = self._GetClients()
+      query = container.query
+      required_columns = self.GetRequiredColumns()
+      if required_columns:
+        query = self._SelectColumns(bq_client, query, required_columns)
+      query_job = bq_client.query(query)
 
       out_container: containers.DataFrame | containers.File
-      if container.pandas_output:
+      if self._streaming and not container.pandas_output:
+        filename = self._StreamResults(query_job, bqstorage_client)
+        out_container = containers.File(name=container.description, path=filename)
+        self.logger.info(f'Downloaded logs to {filename}')
+      elif container.pandas_output:
+        df = query_job.to_dataframe()
+        self.logger.info('Query returned %d rows', df.shape[0])
         out_container = containers.DataFrame(
             df, container.description, container.description)
       else:
+        df = query_job.to_dataframe()
+        self.logger.info('Query returned %d rows', df.shape[0])
         filename = utils.WriteDataFrameToJsonl(df)
         out_container = containers.File(name=container.description, path=filename)
         self.logger.info(f'Downloaded logs to {filename}')
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 """Collects artifacts from the local file system."""
 
+import hashlib
+import json
+import mmap
+import multiprocessing
 import os
-from typing import Callable
+import tempfile
+import zlib
+from concurrent import futures
+from typing import Any, Callable
 
 from dftimewolf.lib import module
 from dftimewolf.lib.containers import containers
@@ -12,9 +19,82 @@ from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# Number of bytes of a memory-mapped file hashed at a time.
+HASH_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Number of files sent to a hashing worker process at a time.
+HASH_CHUNK_SIZE = 16
+
+# Maximum number of threads walking input directories.
+MAX_WALK_WORKERS = 8
+
+
+def _HashFile(path: str) -> dict[str, Any]:
+  """Computes the size, SHA-256 and CRC32 digests of a file.
+
+  Args:
+    path: Path to the file to hash.
+
+  Returns:
+    A dict with the path, size and digests of the file, or with an error
+    message if the file could not be read.
+  """
+  sha256 = hashlib.sha256()
+  crc32 = 0
+  try:
+    with open(path, 'rb') as hashed_file:
+      size = os.fstat(hashed_file.fileno()).st_size
+      if size:
+        with mmap.mmap(
+            hashed_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+          view = memoryview(data)
+          try:
+            for offset in range(0, size, HASH_BLOCK_SIZE):
+              block = view[offset:offset + HASH_BLOCK_SIZE]
+              sha256.update(block)
+              crc32 = zlib.crc32(block, crc32)
+              block.release()
+          finally:
+            view.release()
+  except (OSError, ValueError) as exception:
+    return {'path': path, 'error': str(exception)}
+  return {
+      'path': path,
+      'size': size,
+      'sha256': sha256.hexdigest(),
+      'crc32': f'{crc32:08x}',
+  }
+
+
+def _WalkPath(path: str) -> list[str]:
+  """Lists the files under a path.
+
+  Args:
+    path: Path to a file or directory.
+
+  Returns:
+    The path itself if it is not a directory, otherwise the sorted paths of
+    the regular files under it.
+  """
+  if not os.path.isdir(path):
+    return [path]
+  paths = []
+  for directory, _, filenames in os.walk(path):
+    for filename in filenames:
+      file_path = os.path.join(directory, filename)
+      if os.path.isfile(file_path):
+        paths.append(file_path)
+  return sorted(paths)
+
+
 class FilesystemCollector(module.BaseModule):
   """Local file system collector.
 
+  If hashing is enabled, files are hashed across a pool of processes. The
+  size and digests of each input are attached to its container's metadata, a
+  manifest of every hashed file is written to disk, and duplicate input files
+  are only output once.
+
   input: None, takes input from parameters only.
   output: A list of existing file paths.
   """
@@ -40,29 +120,129 @@ class FilesystemCollector(module.BaseModule):
                      telemetry_=telemetry_,
                      publish_message_callback=publish_message_callback)
     self._paths: list[str] = []
+    self._hash_files = False
 
-  def SetUp(self, paths: str) -> None:  # pylint: disable=arguments-differ
+  # pylint: disable=arguments-differ
+  def SetUp(self, paths: str, hash_files: bool = False) -> None:
     """Sets up the paths to collect.
 
     Args:
       paths (str): Comma-separated paths to collect.
+      hash_files (bool): True to hash the collected files, write a manifest of
+          them and only output duplicate files once.
     """
     self._paths = [path.strip() for path in paths.split(',')]
+    self._hash_files = bool(hash_files)
+
+  def _HashPaths(
+      self, paths: list[str]) -> dict[str, list[dict[str, Any]]]:
+    """Walks and hashes the files under the given paths.
+
+    Args:
+      paths: Paths to existing files or directories.
+
+    Returns:
+      The hashes of the files under each path, keyed by path.
+    """
+    with futures.ThreadPoolExecutor(
+        max_workers=min(MAX_WALK_WORKERS, len(paths))) as executor:
+      walked = dict(zip(paths, executor.map(_WalkPath, paths)))
+
+    file_paths = sorted({
+        file_path for path_files in walked.values()
+        for file_path in path_files})
+    self.logger.info(f'Hashing {len(file_paths)} files')
+    hashes: dict[str, dict[str, Any]] = {}
+    if file_paths:
+      with futures.ProcessPoolExecutor(
+          max_workers=min(os.cpu_count() or 1, len(file_paths)),
+          mp_context=multiprocessing.get_context('spawn')) as executor:
+        for result in executor.map(
+            _HashFile, file_paths, chunksize=HASH_CHUNK_SIZE):
+          if result.get('error'):
+            self.logger.warning(
+                f'Unable to hash {result["path"]}: {result["error"]}')
+          hashes[result['path']] = result
+
+    return {
+        path: [hashes[file_path] for file_path in path_files]
+        for path, path_files in walked.items()}
+
+  def _WriteManifest(
+      self, path_hashes: dict[str, list[dict[str, Any]]]) -> str:
+    """Writes a JSONL manifest of the hashed files.
+
+    Each line describes a file, the input path it was found under and, if
+    the same content was seen before, the path of the first copy.
+
+    Args:
+      path_hashes: The hashes of the files under each input path.
+
+    Returns:
+      The path to the manifest.
+    """
+    first_seen: dict[str, str] = {}
+    with tempfile.NamedTemporaryFile(
+        mode='w', delete=False, encoding='utf-8', prefix='manifest_',
+        suffix='.jsonl') as manifest_file:
+      for path, file_hashes in path_hashes.items():
+        for file_hash in file_hashes:
+          entry = dict(file_hash, input=path)
+          sha256 = file_hash.get('sha256')
+          if sha256:
+            first_path = first_seen.setdefault(sha256, file_hash['path'])
+            if first_path != file_hash['path']:
+              entry['duplicate_of'] = first_path
+          manifest_file.write(json.dumps(entry))
+          manifest_file.write('\n')
+    return manifest_file.name
 
   def Process(self) -> None:
     """Collects paths from the local file system."""
-    file_containers = []
+    paths = []
     for path in self._paths:
       if os.path.exists(path):
-        container = containers.File(os.path.basename(path), path)
-        file_containers.append(container)
+        paths.append(path)
       else:
         self.logger.warning(f'Path {path:s} does not exist')
-    if not file_containers:
+    if not paths:
       self.ModuleError(
           message='No valid paths collected, bailing',
           critical=True)
-    for container in file_containers:
+
+    if not self._hash_files:
+      for path in paths:
+        self.StoreContainer(containers.File(os.path.basename(path), path))
+      return
+
+    path_hashes = self._HashPaths(paths)
+    manifest_path = self._WriteManifest(path_hashes)
+    self.logger.info(f'Wrote manifest of collected files to {manifest_path}')
+
+    file_containers: dict[str, containers.File] = {}
+    for path, file_hashes in path_hashes.items():
+      metadata: dict[str, Any] = {'manifest': manifest_path}
+      if os.path.isdir(path):
+        metadata['file_count'] = len(file_hashes)
+        metadata['size'] = sum(
+            file_hash.get('size', 0) for file_hash in file_hashes)
+      elif not file_hashes[0].get('error'):
+        file_hash = file_hashes[0]
+        metadata.update(
+            size=file_hash['size'], sha256=file_hash['sha256'],
+            crc32=file_hash['crc32'])
+        duplicate = file_containers.get(file_hash['sha256'])
+        if duplicate:
+          self.logger.info(
+              f'Skipping {path}, identical to {duplicate.path}')
+          duplicate.metadata.setdefault('duplicates', []).append(path)
+          continue
+
+      container = containers.File(os.path.basename(path), path)
+      container.metadata.update(metadata)
+      file_containers[metadata.get('sha256', path)] = container
+
+    for container in file_containers.values():
       self.StoreContainer(container)
 
 
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 """Copies GCE Disks across projects."""
 
+import collections
+import contextlib
+import itertools
+import re
+import threading
 from typing import Optional, Type, Callable
 
 from googleapiclient.errors import HttpError
 from libcloudforensics import errors as lcf_errors
 from libcloudforensics.providers.gcp import forensics as gcp_forensics
+from libcloudforensics.providers.gcp.internal import common as gcp_common
 from libcloudforensics.providers.gcp.internal import project as gcp_project
 
 from dftimewolf.lib import module
@@ -16,6 +22,21 @@ from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# Maximum number of disks copied at the same time from a single zone.
+MAX_CONCURRENT_COPIES_PER_ZONE = 8
+
+# Maximum number of disks copied at the same time from a single region, to
+# stay within the per-region Compute Engine API rate limits.
+MAX_CONCURRENT_COPIES_PER_REGION = 24
+
+# Maximum number of disks copied at the same time when their zone is unknown,
+# for example regional disks or disks that exist in several zones.
+MAX_CONCURRENT_COPIES_UNKNOWN_ZONE = 15
+
+# Maximum number of instance or disk names in a single aggregatedList filter.
+INSTANCE_FILTER_BATCH_SIZE = 50
+
+
 class GCEDiskCopy(module.ThreadAwareModule):
   """Google Compute Engine Disk collector.
 
@@ -32,6 +53,8 @@ class GCEDiskCopy(module.ThreadAwareModule):
         instances when requested by stop_instances.
     failed_disks (list[str]): List of disks that failed.
     at_least_one_success (bool): True if at least one disk copy succeeded.
+    zone_disk_counts (dict[str, int]): Number of disks to copy per source
+        zone, used to size the copy thread pool.
   """
 
   def __init__(self,
@@ -68,6 +91,10 @@ class GCEDiskCopy(module.ThreadAwareModule):
     self.warned = False
     self.failed_disks: list[str] = []
     self.at_least_one_success = False
+    self.zone_disk_counts: collections.Counter[str] = collections.Counter()
+    self._snapshot_headroom: Optional[int] = None
+    self._zone_semaphores: dict[str, threading.Semaphore] = {}
+    self._region_semaphores: dict[str, threading.Semaphore] = {}
 
   # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(self,
@@ -163,30 +190,38 @@ class GCEDiskCopy(module.ThreadAwareModule):
     Process uses GCEDisk containers, so we create those containers and store
     them in the state.
     """
-    at_least_one_instance = False
+    disk_containers: list[containers.GCEDisk] = []
     try:
       # Disks from the csv list passed in
+      disk_zones: dict[str, str] = {}
+      if self.disk_names and not self.source_zone:
+        disk_zones = self._ListDiskZones(self.disk_names)
       for d in self.disk_names:
         c = containers.GCEDisk(d, self.source_project.project_id)
         c.metadata['SOURCE_MACHINE'] = 'UNKNOWN_MACHINE'
-        self.StoreContainer(c, for_self_only=True)
+        if disk_zones.get(d):
+          c.metadata['SOURCE_ZONE'] = disk_zones[d]
+        disk_containers.append(c)
 
       # Disks from the instances passed in
-      for i in self.remote_instance_names:
-        try:
-          for d in self._GetDisksFromInstance(i, self.all_disks):
+      if self.remote_instance_names:
+        instance_disks = self._ListInstanceDisks(
+            self.remote_instance_names, self.all_disks)
+        for i in self.remote_instance_names:
+          if i not in instance_disks:
+            message=(f'Instance "{i}" in {self.source_project.project_id} not '
+                  'found or insufficient permissions')
+            self.PublishMessage(message, is_error=True)
+            continue
+          for d, zone in instance_disks[i]:
             c = containers.GCEDisk(d, self.source_project.project_id)
             c.metadata['SOURCE_MACHINE'] = i
-            self.StoreContainer(c, for_self_only=True)
-            at_least_one_instance = True
-
-        except lcf_errors.ResourceNotFoundError:
-          message=(f'Instance "{i}" in {self.source_project.project_id} not '
-                'found or insufficient permissions')
-          self.PublishMessage(message, is_error=True)
-      if self.remote_instance_names and not at_least_one_instance:
-        self.ModuleError('No instances found with disks to copy.',
-                         critical=True)
+            if zone:
+              c.metadata['SOURCE_ZONE'] = zone
+            disk_containers.append(c)
+        if not instance_disks:
+          self.ModuleError('No instances found with disks to copy.',
+                           critical=True)
     except HttpError as exception:
       if exception.resp.status == 403:
         self.ModuleError(
@@ -194,6 +229,173 @@ class GCEDiskCopy(module.ThreadAwareModule):
             critical=True)
       self.ModuleError(str(exception), critical=True)
 
+    self._ScheduleCopies(disk_containers)
+
+  def _ListInstanceDisks(
+      self,
+      instance_names: list[str],
+      all_disks: bool) -> dict[str, list[tuple[str, str]]]:
+    """Gets the disks of several instances across all zones.
+
+    Instances are looked up with instances.aggregatedList, filtered on the
+    instance names, so that the disks of many instances are resolved in a
+    few requests rather than one request per instance.
+
+    Args:
+      instance_names: Names of the instances to get the disks from.
+      all_disks: If set, get all disks attached to the instances. If False,
+          get only the instances' boot disks.
+
+    Returns:
+      The names and zones of the disks of each instance that was found, keyed
+      by instance name. The zone is empty for regional disks.
+    """
+    instances_client = self.source_project.compute.GceApi().instances()  # pylint: disable=no-member
+    instance_disks: dict[str, list[tuple[str, str]]] = {}
+    names = sorted(set(instance_names))
+    for index in range(0, len(names), INSTANCE_FILTER_BATCH_SIZE):
+      batch = names[index:index + INSTANCE_FILTER_BATCH_SIZE]
+      responses = gcp_common.ExecuteRequest(
+          instances_client, 'aggregatedList', {
+              'project': self.source_project.project_id,
+              'filter': 'name eq "({0:s})"'.format(
+                  '|'.join(re.escape(name) for name in batch)),
+          })
+      for response in responses:
+        for scope in response.get('items', {}).values():
+          for instance in scope.get('instances', []):
+            if instance['name'] not in batch:
+              continue
+            if (self.source_zone and
+                instance['zone'].rsplit('/', 1)[-1] != self.source_zone):
+              continue
+            instance_disks[instance['name']] = [
+                self._ParseDiskSource(disk['source'])
+                for disk in instance.get('disks', [])
+                if all_disks or disk.get('boot')]
+    return instance_disks
+
+  def _ListDiskZones(self, disk_names: list[str]) -> dict[str, str]:
+    """Gets the zones of several disks.
+
+    Disks are looked up with disks.aggregatedList, filtered on the disk names,
+    so that the zones of many disks are resolved in a few requests.
+
+    Args:
+      disk_names: Names of the disks to get the zones of.
+
+    Returns:
+      The zone of each disk, keyed by disk name. Regional disks, disks that
+      were not found and disk names found in several zones are left out.
+    """
+    disks_client = self.source_project.compute.GceApi().disks()  # pylint: disable=no-member
+    disk_zones: dict[str, set[str]] = collections.defaultdict(set)
+    names = sorted(set(disk_names))
+    for index in range(0, len(names), INSTANCE_FILTER_BATCH_SIZE):
+      batch = names[index:index + INSTANCE_FILTER_BATCH_SIZE]
+      responses = gcp_common.ExecuteRequest(
+          disks_client, 'aggregatedList', {
+              'project': self.source_project.project_id,
+              'filter': 'name eq "({0:s})"'.format(
+                  '|'.join(re.escape(name) for name in batch)),
+          })
+      for response in responses:
+        for scope in response.get('items', {}).values():
+          for disk in scope.get('disks', []):
+            if disk['name'] in batch:
+              disk_zones[disk['name']].add(
+                  disk.get('zone', '').rsplit('/', 1)[-1])
+    return {
+        name: zones.pop() for name, zones in disk_zones.items()
+        if len(zones) == 1}
+
+  @staticmethod
+  def _ParseDiskSource(source: str) -> tuple[str, str]:
+    """Parses the name and zone of a disk from its resource URL.
+
+    Args:
+      source: The disk resource URL.
+
+    Returns:
+      The name and zone of the disk. The zone is empty for regional disks.
+    """
+    parts = source.split('/')
+    zone = ''
+    if 'zones' in parts:
+      zone = parts[parts.index('zones') + 1]
+    return parts[-1], zone
+
+  def _GetSnapshotHeadroom(self) -> Optional[int]:
+    """Gets the number of snapshots the source project can still create.
+
+    Returns:
+      The remaining snapshot quota, or None if it could not be determined.
+    """
+    try:
+      quotas = self.source_project.compute.GetProjectMetadata().get(
+          'quotas', [])
+    except (HttpError, lcf_errors.LCFError) as exception:
+      self.logger.debug(f'Unable to get project quotas: {exception!s}')
+      return None
+    for quota in quotas:
+      if quota.get('metric') == 'SNAPSHOTS':
+        return max(0, int(quota['limit'] - quota.get('usage', 0)))
+    return None
+
+  def _ScheduleCopies(self, disk_containers: list[containers.GCEDisk]) -> None:
+    """Groups the disks to copy by source zone and stores them for Process.
+
+    Disks are stored round-robin across zones, so that the copy threads are
+    spread over zones rather than queueing behind one zone's limit.
+
+    Args:
+      disk_containers: The containers of the disks to copy.
+    """
+    by_zone: dict[str, list[containers.GCEDisk]] = collections.defaultdict(
+        list)
+    for c in disk_containers:
+      by_zone[self._GetSourceZone(c)].append(c)
+
+    self.zone_disk_counts = collections.Counter(
+        {zone: len(disks) for zone, disks in by_zone.items()})
+    self._zone_semaphores = {
+        zone: threading.Semaphore(MAX_CONCURRENT_COPIES_PER_ZONE)
+        for zone in by_zone if zone}
+    self._region_semaphores = {
+        self._GetRegion(zone): threading.Semaphore(
+            MAX_CONCURRENT_COPIES_PER_REGION)
+        for zone in by_zone if zone}
+    self._snapshot_headroom = self._GetSnapshotHeadroom()
+
+    for c in itertools.chain.from_iterable(
+        itertools.zip_longest(*by_zone.values())):
+      if c is not None:
+        self.StoreContainer(c, for_self_only=True)
+
+  def _GetSourceZone(self, container: containers.GCEDisk) -> str:
+    """Gets the zone of a disk to copy.
+
+    Args:
+      container: The disk container.
+
+    Returns:
+      The zone the disk was discovered in, or the configured source zone.
+    """
+    zone: str = container.metadata.get('SOURCE_ZONE') or self.source_zone
+    return zone or ''
+
+  @staticmethod
+  def _GetRegion(zone: str) -> str:
+    """Gets the region of a zone.
+
+    Args:
+      zone: The zone name, for example us-central1-a.
+
+    Returns:
+      The region name, for example us-central1.
+    """
+    return zone.rsplit('-', 1)[0]
+
   def Process(self, container: containers.GCEDisk) -> None:  # pyrefly: ignore=[bad-override]
     """Copies a disk to the destination project.
 
@@ -202,6 +404,36 @@ class GCEDiskCopy(module.ThreadAwareModule):
     """
     if container.project != self.source_project.project_id:
       self.logger.debug(f"Skipping {container.name} not in source project")
+    zone = self._GetSourceZone(container)
+    with self._AcquireCopySlot(zone):
+      self._CopyDisk(container, zone)
+
+  def _AcquireCopySlot(self, zone: str) -> contextlib.ExitStack:
+    """Returns a context manager limiting concurrent copies from a zone.
+
+    Args:
+      zone: The source zone of the disk to copy.
+
+    Returns:
+      A context manager holding the region and zone copy slots. Copies from
+      an unknown zone are only limited by the thread pool size.
+    """
+    stack = contextlib.ExitStack()
+    if not zone:
+      return stack
+    for semaphore in (self._region_semaphores.get(self._GetRegion(zone)),
+                      self._zone_semaphores.get(zone)):
+      if semaphore is not None:
+        stack.enter_context(semaphore)
+    return stack
+
+  def _CopyDisk(self, container: containers.GCEDisk, zone: str) -> None:
+    """Copies a disk to the destination project.
+
+    Args:
+      container: GCEDisk container referencing the disk to copy.
+      zone: The zone of the disk to copy.
+    """
     self.logger.info(f'Disk copy of {container.name} started...')
 
     try:
@@ -210,7 +442,7 @@ class GCEDiskCopy(module.ThreadAwareModule):
           self.destination_project.project_id,
           self.destination_project.default_zone,
           disk_name=container.name,
-          src_zone=self.source_zone)
+          src_zone=zone or None)
       if self._gcp_label:
         new_disk.AddLabels(self._gcp_label)
       self.at_least_one_success = True
@@ -279,36 +511,29 @@ class GCEDiskCopy(module.ThreadAwareModule):
         self.ModuleError(str(exception), critical=False)
       self.logger.info(f'Quarantined instance {i}')
 
-  def _GetDisksFromInstance(
-      self,
-      instance_name: str,
-      all_disks: bool) -> list[str]:
-    """Gets disks to copy based on an instance name.
-
-    Args:
-      instance_name (str): Name of the instance to get the disks from.
-      all_disks (bool): If set, get all disks attached to the instance. If
-          False, get only the instance's boot disk.
-
-    Returns:
-      list[str]: List of disk names to copy.
-    """
-    try:
-      remote_instance = self.source_project.compute.GetInstance(
-          instance_name, zone=self.source_zone)
-
-      if all_disks:
-        return [d.name for d in list(remote_instance.ListDisks().values())]
-      return [remote_instance.GetBootDisk().name]
-    except RuntimeError as exception:
-      self.ModuleError(str(exception), critical=True)
-      return []  # Unreachable, needed for linting.
-
   def GetThreadOnContainerType(self) -> Type[interface.AttributeContainer]:
     return containers.GCEDisk
 
   def GetThreadPoolSize(self) -> int:
-    return 15  # Arbitrary
+    """Sizes the copy thread pool from the disks to copy and their zones.
+
+    Returns:
+      The number of copies that can run at the same time given the per-zone
+      and per-region limits and the remaining snapshot quota.
+    """
+    region_slots: collections.Counter[str] = collections.Counter()
+    for zone, count in self.zone_disk_counts.items():
+      if zone:
+        region_slots[self._GetRegion(zone)] += min(
+            count, MAX_CONCURRENT_COPIES_PER_ZONE)
+    pool_size = sum(
+        min(slots, MAX_CONCURRENT_COPIES_PER_REGION)
+        for slots in region_slots.values())
+    pool_size += min(
+        self.zone_disk_counts.get('', 0), MAX_CONCURRENT_COPIES_UNKNOWN_ZONE)
+    if self._snapshot_headroom is not None:
+      pool_size = min(pool_size, self._snapshot_headroom)
+    return max(1, pool_size)
 
 
 modules_manager.ModulesManager.RegisterModule(GCEDiskCopy)
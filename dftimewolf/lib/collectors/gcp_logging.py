@@ -2,7 +2,9 @@
 """Reads logs from a GCP cloud project."""
 import datetime
 import json
+import os
 import tempfile
+import threading
 import time
 from typing import Any, Optional, Tuple, Callable
 
@@ -12,6 +14,7 @@ from google.cloud import logging
 from google.cloud.logging_v2 import entries
 from googleapiclient.errors import HttpError
 
+from dftimewolf.lib import high_water_marks
 from dftimewolf.lib import module
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
@@ -32,6 +35,17 @@ def _CustomToAPIRepr(self: entries.ProtobufEntry) -> dict[str, Any]:
 
 entries.ProtobufEntry.to_api_repr = _CustomToAPIRepr
 
+# Follow mode defaults.
+DEFAULT_ROTATE_SECONDS = 30
+DEFAULT_ROTATE_ENTRIES = 10000
+FOLLOW_POLL_SECONDS = 5
+# Entries can be ingested some time after their timestamp, so each poll looks
+# back this far and drops the entries it has already seen.
+FOLLOW_LATENESS = datetime.timedelta(seconds=60)
+# Likewise, incremental runs start this long before the previous high-water
+# mark, and drop the entries the previous runs already collected.
+INCREMENTAL_LOOKBACK = datetime.timedelta(minutes=15)
+
 
 class GCPLogsCollector(module.BaseModule):
   """Collector for Google Cloud Platform logs."""
@@ -54,6 +68,16 @@ class GCPLogsCollector(module.BaseModule):
     self._delay = 0
     self.start_time: Optional[datetime.datetime] = None
     self.end_time: Optional[datetime.datetime] = None
+    self._incremental = False
+    self._filter_template = ''
+    self._tracker: Optional[high_water_marks.HighWaterMarkTracker] = None
+    self._event_count = 0
+    self._follow = False
+    self._rotate_seconds = DEFAULT_ROTATE_SECONDS
+    self._rotate_entries = DEFAULT_ROTATE_ENTRIES
+    self._stop_following = threading.Event()
+    self._max_follow_seconds: Optional[int] = None
+    self._fields: Optional[set[str]] = None
 
   def OutputFile(self) -> Tuple[Any, str]:
     """Generate an output file name and path"""
@@ -63,6 +87,21 @@ class GCPLogsCollector(module.BaseModule):
     self.logger.info(f"Downloading logs to {output_path}")
     return output_file, output_path
 
+  def _WriteEntry(self, output_file: Any, log_dictionary: dict[str, Any]) -> None:
+    """Writes a log entry to a JSONL file.
+
+    Args:
+      output_file: The output file.
+      log_dictionary: The log entry, pruned to the fields used downstream if
+          they are known.
+    """
+    if self._fields:
+      log_dictionary = {
+          key: value for key, value in log_dictionary.items()
+          if key in self._fields}
+    output_file.write(json.dumps(log_dictionary))
+    output_file.write('\n')
+
   def SetupLoggingClient(self) -> Any:
     """Sets up a GCP Logging Client
 
@@ -113,8 +152,11 @@ class GCPLogsCollector(module.BaseModule):
         page = next(pages)
         for entry in page:
           log_dictionary = entry.to_api_repr()
-          output_file.write(json.dumps(log_dictionary))
-          output_file.write('\n')
+          if self._tracker and not self._tracker.Add(
+              log_dictionary['timestamp'], log_dictionary.get('insertId', '')):
+            continue
+          self._event_count += 1
+          self._WriteEntry(output_file, log_dictionary)
       except google_api_exceptions.TooManyRequests as exception:
         self.logger.warning("Hit quota limit requesting GCP logs.")
         self.logger.debug(f"exception: {exception}")
@@ -138,6 +180,10 @@ class GCPLogsCollector(module.BaseModule):
           self.logger.debug(f"Restarting query with an API request rate \
             of 1 per {self._delay}s")
           output_file, output_path = self.OutputFile()
+          self._event_count = 0
+          if self._tracker:
+            self._tracker = high_water_marks.HighWaterMarkTracker(
+                self._tracker.previous, INCREMENTAL_LOOKBACK)
         else:
           self.logger.warning(
             "Exponential backoff was not enabled, so query has exited."
@@ -150,7 +196,7 @@ class GCPLogsCollector(module.BaseModule):
 
     return output_path
 
-  # pylint: disable=arguments-differ
+  # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(
       self,
       project_name: str,
@@ -159,6 +205,11 @@ class GCPLogsCollector(module.BaseModule):
       delay: str,
       start_time: datetime.datetime,
       end_time: datetime.datetime,
+      incremental: bool = False,
+      follow: bool = False,
+      rotate_seconds: Optional[int] = None,
+      rotate_entries: Optional[int] = None,
+      max_follow_seconds: Optional[int] = None,
   ) -> None:
     """Sets up a a GCP logs collector.
 
@@ -173,8 +224,25 @@ class GCPLogsCollector(module.BaseModule):
         <START_TIME> in the queries.
       end_time: end time of the query. This will be used to replace <END_TIME>
         in the queries.
+      incremental: if True, only collect the entries that are newer than the
+        ones collected by the previous incremental run for the same project and
+        filter expression.
+      follow: if True, keep polling for new entries until cancelled with
+        Ctrl+C, and emit them in small rotated files as they arrive.
+      rotate_seconds: in follow mode, maximum number of seconds to buffer
+        entries for before emitting a file.
+      rotate_entries: in follow mode, maximum number of entries per file.
+      max_follow_seconds: in follow mode, number of seconds after which to
+        stop following. Follows until cancelled if not set.
     """
     self._project_name = project_name
+    self._incremental = incremental
+    self._follow = follow
+    self._rotate_seconds = int(rotate_seconds or DEFAULT_ROTATE_SECONDS)
+    self._rotate_entries = int(rotate_entries or DEFAULT_ROTATE_ENTRIES)
+    self._max_follow_seconds = (
+        int(max_follow_seconds) if max_follow_seconds else None)
+    self._filter_template = filter_expression
     self._backoff = backoff
     self._delay = int(delay)
 
@@ -198,15 +266,171 @@ class GCPLogsCollector(module.BaseModule):
 
     self._filter_expression = filter_expression
 
-  def Process(self) -> None:
-    """Copies logs from a cloud project."""
+  def _EmitRotatedFile(self,
+                       output_file: Any,
+                       output_path: str,
+                       first_timestamp: datetime.datetime,
+                       store: high_water_marks.HighWaterMarkStore) -> None:
+    """Closes a follow mode output file and stores it in a container.
+
+    Args:
+      output_file: The output file object.
+      output_path: The output file path.
+      first_timestamp: Time of the first entry in the file, used to name it.
+      store: The high-water mark store, used in incremental mode.
+    """
+    output_file.close()
+    self.logger.info(
+        f'Emitting {self._event_count} new entries from {output_path}')
+    name = (f'gcp_logs_{self._project_name}_'
+            f'{first_timestamp.strftime("%Y%m%dT%H%M%S")}')
+    container = containers.File(
+        name, output_path, description=self._filter_expression)
+    # The rotated files are parts of the same stream, and are uploaded to a
+    # single Timesketch timeline.
+    container.metadata['TIMESKETCH_TIMELINE'] = (
+        f'gcp_logs_{self._project_name}')
+    self.StoreContainer(container)
+    if self._incremental and self._tracker and self._tracker.current:
+      store.Set(self.__class__.__name__, self._project_name,
+                self._filter_template, self._tracker.current)
+
+  def _Follow(self,
+              logging_client: Any,
+              store: high_water_marks.HighWaterMarkStore) -> None:
+    """Polls for new log entries until cancelled or max_follow_seconds.
+
+    Entries are written to rotated files, which are stored in File containers
+    every rotate_seconds or rotate_entries entries, whichever comes first, so
+    that modules streaming File containers can process them right away. The
+    last file is stored when following stops.
 
+    Args:
+      logging_client: A GCP Cloud Logging client.
+      store: The high-water mark store, used in incremental mode.
+    """
+    since = datetime.datetime.now(tz=datetime.timezone.utc)
+    if self.start_time:
+      since = high_water_marks.ParseTimestamp(self.start_time)
+    seen: dict[str, datetime.datetime] = {}
+    # The first poll of an incremental collection covers the whole lookback
+    # window of the previous high-water mark.
+    lateness = FOLLOW_LATENESS
+    if self._tracker and self._tracker.previous:
+      since = self._tracker.previous.timestamp
+      seen = dict(self._tracker.previous.event_ids)
+      lateness = INCREMENTAL_LOOKBACK
+    self.PublishMessage(
+        f'Following logs for {self._project_name} since {since.isoformat()}, '
+        'press Ctrl+C to stop')
+
+    deadline = None
+    if self._max_follow_seconds:
+      deadline = time.monotonic() + self._max_follow_seconds
     output_file, output_path = self.OutputFile()
+    first_timestamp: Optional[datetime.datetime] = None
+    rotation_started = time.monotonic()
+    self._event_count = 0
+    module.RegisterStopEvent(self._stop_following)
+    try:
+      while True:
+        filter_expression = (
+            f'({self._filter_expression}) AND '
+            f'timestamp >= "{(since - lateness).isoformat()}"')
+        lateness = FOLLOW_LATENESS
+        try:
+          for entry in logging_client.list_entries(
+              order_by=logging.ASCENDING,
+              filter_=filter_expression,
+              page_size=1000):
+            log_dictionary = entry.to_api_repr()
+            insert_id = log_dictionary.get('insertId', '')
+            if insert_id in seen:
+              continue
+            timestamp = high_water_marks.ParseTimestamp(
+                log_dictionary['timestamp'])
+            seen[insert_id] = timestamp
+            since = max(since, timestamp)
+            if self._tracker:
+              self._tracker.Add(timestamp, insert_id)
+
+            if not self._event_count:
+              first_timestamp = timestamp
+              rotation_started = time.monotonic()
+            self._WriteEntry(output_file, log_dictionary)
+            self._event_count += 1
+            if self._event_count >= self._rotate_entries and first_timestamp:
+              self._EmitRotatedFile(
+                  output_file, output_path, first_timestamp, store)
+              output_file, output_path = self.OutputFile()
+              self._event_count = 0
+        except google_api_exceptions.TooManyRequests as exception:
+          self.logger.warning(
+              f'Hit quota limit following GCP logs, pausing: {exception!s}')
+          self._stop_following.wait(60)
+
+        if (self._event_count and first_timestamp and
+            time.monotonic() - rotation_started >= self._rotate_seconds):
+          self._EmitRotatedFile(output_file, output_path, first_timestamp, store)
+          output_file, output_path = self.OutputFile()
+          self._event_count = 0
+
+        seen = {
+            insert_id: timestamp for insert_id, timestamp in seen.items()
+            if timestamp >= since - FOLLOW_LATENESS}
+        wait_seconds: float = FOLLOW_POLL_SECONDS
+        if deadline is not None:
+          wait_seconds = min(wait_seconds, deadline - time.monotonic())
+          if wait_seconds <= 0:
+            self.logger.info(
+                f'Stopping after following logs for '
+                f'{self._max_follow_seconds:d} seconds')
+            break
+        if self._stop_following.wait(wait_seconds):
+          break
+    finally:
+      module.UnregisterStopEvent(self._stop_following)
+      # Also store the entries buffered when following is interrupted.
+      if self._event_count and first_timestamp:
+        self._EmitRotatedFile(output_file, output_path, first_timestamp, store)
+      else:
+        output_file.close()
+        os.remove(output_path)
 
+  def Process(self) -> None:
+    """Copies logs from a cloud project."""
+
+    self._fields = self.GetRequiredColumns()
+    if self._fields:
+      self.logger.info(
+          f'Only keeping fields used downstream: {", ".join(sorted(self._fields))}')
+
+    # The incremental time clause is not part of the container name.
+    container_name = self._filter_expression
+    store = high_water_marks.HighWaterMarkStore()
+    if self._incremental:
+      previous = store.Get(
+          self.__class__.__name__, self._project_name, self._filter_template)
+      self._tracker = high_water_marks.HighWaterMarkTracker(
+          previous, INCREMENTAL_LOOKBACK)
+      if previous and not self._follow:
+        since = previous.timestamp - INCREMENTAL_LOOKBACK
+        self.logger.info(f'Collecting entries since {since.isoformat()}')
+        self._filter_expression = (
+            f'({self._filter_expression}) AND '
+            f'timestamp >= "{since.isoformat()}"')
+
+    output_file, output_path = None, ''
     try:
       # Set up a logging client
       logging_client = self.SetupLoggingClient()
 
+      if self._follow:
+        self._Follow(logging_client, store)
+        return
+
+      output_file, output_path = self.OutputFile()
+
       # Get a generator of query results
       pages = self.ListPages(logging_client)
 
@@ -239,10 +463,21 @@ class GCPLogsCollector(module.BaseModule):
             'GCP resource not found. Maybe a typo in the project name?')
       self.ModuleError(str(exception), critical=True)
 
+    if not output_file:
+      return
     self.logger.info(f'Downloaded logs to {output_path}')
     output_file.close()
 
-    logs_report = containers.File(self._filter_expression, output_path)
+    if self._tracker:
+      if self._tracker.current:
+        store.Set(self.__class__.__name__, self._project_name,
+                  self._filter_template, self._tracker.current)
+      if not self._event_count:
+        self.PublishMessage(f'No new entries for {self._project_name}')
+        os.remove(output_path)
+        return
+
+    logs_report = containers.File(container_name, output_path)
     self.StoreContainer(logs_report)
 
 
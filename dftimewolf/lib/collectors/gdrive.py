@@ -5,17 +5,22 @@
   files from a specified folder or by Drive file IDs.
 """
 
+import hashlib
 import os.path
 import tempfile
+import threading
 from typing import Any, Callable
 
 from concurrent import futures
 from google.auth import exceptions as googleauth_exceptions
 from google.oauth2 import credentials as oauth_credentials
 from google.auth import external_account_authorized_user
+import google_auth_httplib2
 from googleapiclient import discovery
 from googleapiclient import errors as googleapi_errors
+from googleapiclient.http import DEFAULT_CHUNK_SIZE
 from googleapiclient.http import MediaIoBaseDownload
+import httplib2
 
 from dftimewolf.lib import auth
 from dftimewolf.lib import module
@@ -26,51 +31,80 @@ from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# Maximum number of folders listed concurrently when crawling a folder tree.
+MAX_LIST_WORKERS = 8
+# Maximum number of requests in a Drive API batch request.
+MAX_BATCH_SIZE = 100
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Drive file metadata fields needed to download and verify files.
+FILE_FIELDS = "id, name, mimeType, md5Checksum, size"
+
+
 def ListDriveFolder(
     drive_resource: Any,
     folder_id: str,
     fields: str,
     recursive: bool = False,
+    max_workers: int = 1,
+    get_http: Callable[[], Any] | None = None,
+    file_callback: Callable[[dict[str, Any]], None] | None = None,
 ) -> list[dict[str, Any]]:
   """Lists files in a Google Drive folder.
 
+  Subfolders are listed breadth-first as soon as they are discovered, up to
+  max_workers folders at a time.
+
   Args:
-    drive_resource (Credentials): Google Drive API resource.
+    drive_resource (Resource): Google Drive API resource.
     folder_id (str): ID of the folder to list files from.
     fields (str): Fields to return in the response.
     recursive (bool): Whether to list files recursively from subfolders.
+    max_workers (int): Maximum number of folders to list concurrently.
+    get_http (Callable | None): Returns the HTTP object to execute requests
+        with in the calling thread. Required if max_workers is more than 1, as
+        HTTP objects are not thread-safe.
+    file_callback (Callable | None): Called with each file as soon as it is
+        listed, from the calling thread.
 
   Returns:
     list[dict[str, Any]]: List of files in the folder.
   """
-  files: list[dict[str, Any]] = []
-  page_token = None
-  query = f"'{folder_id}' in parents and trashed = false"
-  while True:
-    response = (
-        drive_resource.files()
-        .list(
-            q=query,
-            spaces="drive",
-            fields=fields,
-            pageToken=page_token,
-        )
-        .execute()
-    )
 
-    for file in response.get("files", []):
-      files.append(file)  # pyrefly: ignore=[bad-argument-type]
-      if (
-          recursive
-          and file.get("mimeType") == "application/vnd.google-apps.folder"
-      ):
-        files.extend(
-            ListDriveFolder(drive_resource, file.get("id", ""), fields, recursive)
-        )
+  def _ListFolder(parent_id: str) -> list[dict[str, Any]]:
+    """Lists the direct children of a single folder."""
+    children: list[dict[str, Any]] = []
+    page_token = None
+    query = f"'{parent_id}' in parents and trashed = false"
+    while True:
+      response = (
+          drive_resource.files()
+          .list(
+              q=query,
+              spaces="drive",
+              fields=fields,
+              pageSize=1000,
+              pageToken=page_token,
+          )
+          .execute(http=get_http() if get_http else None)
+      )
+      children.extend(response.get("files", []))
+      page_token = response.get("nextPageToken", None)
+      if page_token is None:
+        return children
 
-    page_token = response.get("nextPageToken", None)
-    if page_token is None:
-      break
+  files: list[dict[str, Any]] = []
+  with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+    pending = {executor.submit(_ListFolder, folder_id)}
+    while pending:
+      done, pending = futures.wait(
+          pending, return_when=futures.FIRST_COMPLETED)
+      for future in done:
+        for file in future.result():
+          files.append(file)
+          if file_callback:
+            file_callback(file)
+          if recursive and file.get("mimeType") == FOLDER_MIME_TYPE:
+            pending.add(executor.submit(_ListFolder, file.get("id", "")))
   return files
 
 
@@ -101,9 +135,11 @@ class GoogleDriveCollector(module.BaseModule):
     self._folder_id: str = ""
     self._output_directory: str = ""
     self._recursive: bool = False
-    self._fields: str = "nextPageToken, files"
+    self._fields: str = f"nextPageToken, files({FILE_FIELDS})"
     self._max_download_workers: int = 1
     self._overwrite_existing: bool = False
+    self._chunk_size: int = DEFAULT_CHUNK_SIZE
+    self._thread_local = threading.local()
 
   # pylint: disable=arguments-differ
   def SetUp(
@@ -114,6 +150,7 @@ class GoogleDriveCollector(module.BaseModule):
       max_download_workers: int,
       output_directory: str | None = None,
       overwrite_existing: bool = False,
+      chunk_size_mb: int | None = None,
   ) -> None:
     """Sets up the Google Drive Collector module.
 
@@ -127,7 +164,11 @@ class GoogleDriveCollector(module.BaseModule):
           downloading files.
       output_directory (str | None): Directory to save downloaded files.
           Defaults to a temporary directory.
-      overwrite_existing (bool): Whether to overwrite existing files.
+      overwrite_existing (bool): Whether to overwrite existing files. If
+          False, existing files that match the Drive checksum are skipped and
+          partial downloads are resumed.
+      chunk_size_mb (int | None): Size of the chunks to download files in, in
+          MiB. Defaults to the Google API client default.
 
     Raises:
       ModuleError: If neither folder_id nor drive_ids are specified, or if
@@ -139,6 +180,10 @@ class GoogleDriveCollector(module.BaseModule):
       )
     self._max_download_workers = int(max_download_workers)
     self._overwrite_existing = overwrite_existing
+    if chunk_size_mb:
+      if int(chunk_size_mb) < 1:
+        self.ModuleError("chunk_size_mb must be at least 1.", critical=True)
+      self._chunk_size = int(chunk_size_mb) * 1024 * 1024
 
     if not folder_id and not drive_ids:
       self.ModuleError(
@@ -162,8 +207,9 @@ class GoogleDriveCollector(module.BaseModule):
               critical=True,
           )
         if os.listdir(output_directory):
-          self.ModuleError(
-              f"{output_directory} exists but is not empty.", critical=True
+          self.logger.info(
+              f"{output_directory} is not empty, existing files will be "
+              "verified against Drive checksums."
           )
       else:
         os.makedirs(output_directory)
@@ -205,7 +251,7 @@ class GoogleDriveCollector(module.BaseModule):
         continue
 
       drive_name = drive_file.get("name")
-      if drive_file.get("mimeType") == "application/vnd.google-apps.folder":
+      if drive_file.get("mimeType") == FOLDER_MIME_TYPE:
         self.logger.info(f"Skipping folder: {drive_name} ({drive_id})")
         continue
       if drive_file.get("mimeType", "").startswith(
@@ -226,43 +272,112 @@ class GoogleDriveCollector(module.BaseModule):
       )
     return drive_ids_and_names
 
+  def _GetHttp(self) -> google_auth_httplib2.AuthorizedHttp:
+    """Returns an authorized HTTP object for the calling thread.
+
+    The Drive resource is shared by all threads, but httplib2 connections are
+    not thread-safe, so each thread executes requests with its own.
+    """
+    http = getattr(self._thread_local, "http", None)
+    if http is None:
+      http = google_auth_httplib2.AuthorizedHttp(
+          self._credentials, http=httplib2.Http())
+      self._thread_local.http = http
+    return http
+
+  def _GetDriveResource(self) -> Any:
+    """Returns a Google Drive API resource for the calling thread.
+
+    Resources are built once per download thread, and each one has its own
+    HTTP connection.
+    """
+    drive_resource = getattr(self._thread_local, "drive_resource", None)
+    if drive_resource is None:
+      drive_resource = discovery.build(
+          "drive", "v3", credentials=self._credentials
+      )
+      self._thread_local.drive_resource = drive_resource
+    return drive_resource
+
+  def _GetDriveFiles(self, drive_resource: Any) -> list[dict[str, Any]]:
+    """Fetches the metadata of the requested Drive IDs in batch requests.
+
+    Args:
+      drive_resource: Google Drive API resource.
+
+    Returns:
+      The metadata of the Drive files, in the order they were requested.
+    """
+    drive_files: dict[str, dict[str, Any]] = {}
+
+    def _Callback(request_id: str, response: dict[str, Any],
+                  exception: googleapi_errors.HttpError | None) -> None:
+      if exception:
+        self.ModuleError(
+            f"Failed to get metadata for drive ID {request_id}: {exception}",
+            critical=False,
+        )
+        return
+      drive_files[request_id] = response
+
+    for index in range(0, len(self._drive_ids), MAX_BATCH_SIZE):
+      batch = drive_resource.new_batch_http_request(callback=_Callback)
+      for drive_id in self._drive_ids[index:index + MAX_BATCH_SIZE]:
+        batch.add(
+            drive_resource.files().get(fileId=drive_id, fields=FILE_FIELDS),
+            request_id=drive_id,
+        )
+      batch.execute(http=self._GetHttp())
+
+    return [
+        drive_files[drive_id]
+        for drive_id in self._drive_ids
+        if drive_id in drive_files
+    ]
+
   def Process(self) -> None:
-    """Downloads the Drive Files or Folder to File containers."""
+    """Downloads the Drive Files or Folder to File containers.
+
+    Files are submitted for download as soon as they are discovered, so that
+    downloads start while the folder tree is still being listed.
+    """
     drive_resource = discovery.build(
         "drive", "v3", credentials=self._credentials
     )
-    drive_files: list[dict[str, Any]] = []
-    if self._drive_ids:
-      drive_files.extend(
-          [  # pyrefly: ignore=[bad-argument-type]
-              drive_resource.files().get(fileId=drive_id).execute()  # pyrefly: ignore=[missing-attribute]
-              for drive_id in self._drive_ids
-          ]
-      )
-
-    if self._folder_id:
-      drive_files.extend(
-          ListDriveFolder(
-              drive_resource,
-              folder_id=self._folder_id,
-              fields=self._fields,
-              recursive=self._recursive,
-          )
-      )
-
-    drive_ids_and_names = self._FilterDriveFiles(drive_files)
 
     with futures.ThreadPoolExecutor(
         max_workers=self._max_download_workers
     ) as executor:
-      future_to_drive_id_path = {
-          executor.submit(
+      future_to_drive_id_path: dict[futures.Future[bool], tuple[str, str]] = {}
+
+      def _SubmitDownloads(drive_files: list[dict[str, Any]]) -> None:
+        drive_files_by_id = {
+            drive_file.get("id"): drive_file for drive_file in drive_files}
+        for drive_id, output_path in self._FilterDriveFiles(drive_files):
+          drive_file = drive_files_by_id[drive_id]
+          future = executor.submit(
               self._DownloadFile,
               drive_id,
               output_path,
-          ): (drive_id, output_path)
-          for drive_id, output_path in drive_ids_and_names
-      }
+              drive_file.get("md5Checksum"),
+              drive_file.get("size"),
+          )
+          future_to_drive_id_path[future] = (drive_id, output_path)
+
+      if self._drive_ids:
+        _SubmitDownloads(self._GetDriveFiles(drive_resource))
+
+      if self._folder_id:
+        ListDriveFolder(
+            drive_resource,
+            folder_id=self._folder_id,
+            fields=self._fields,
+            recursive=self._recursive,
+            max_workers=MAX_LIST_WORKERS,
+            get_http=self._GetHttp,
+            file_callback=lambda drive_file: _SubmitDownloads([drive_file]),
+        )
+
       for future in futures.as_completed(future_to_drive_id_path):
         drive_id, output_path = future_to_drive_id_path[future]
         try:
@@ -277,38 +392,133 @@ class GoogleDriveCollector(module.BaseModule):
               f"Download for {drive_id} generated an exception: {exc}"
           )
 
-  def _DownloadFile(self, drive_id: str, output_file: str) -> bool:
+  @staticmethod
+  def _HashFile(path: str) -> str:
+    """Returns the MD5 hex digest of a local file."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as local_file:
+      for block in iter(lambda: local_file.read(1024 * 1024), b""):
+        md5.update(block)
+    return md5.hexdigest()
+
+  def _DownloadFile(
+      self,
+      drive_id: str,
+      output_file: str,
+      md5_checksum: str | None = None,
+      size: str | None = None,
+  ) -> bool:
     """Downloads a file from Google Drive.
 
+    If the file already exists locally and overwrite_existing is not set, it is
+    skipped if it matches the Drive checksum, and the download is resumed if
+    it is shorter than the Drive file.
+
     Args:
         drive_id (str): ID of the file to download.
         output_file (str): Path to save the downloaded file.
+        md5_checksum (str | None): MD5 checksum of the file in Drive, if known.
+        size (str | None): Size of the file in Drive in bytes, if known.
 
     Returns:
         bool: True if the file was downloaded successfully, False otherwise.
     """
+    expected_size = int(size) if size is not None else None
+    offset = 0
     if os.path.exists(output_file) and not self._overwrite_existing:
+      if not md5_checksum or expected_size is None:
+        self.logger.warning(
+            f"File {output_file} already exists, not re-downloading."
+        )
+        return True
+
+      local_size = os.path.getsize(output_file)
+      if (local_size == expected_size and
+          self._HashFile(output_file) == md5_checksum):
+        self.logger.info(
+            f"File {output_file} matches the Drive checksum, skipping."
+        )
+        return True
+      if local_size < expected_size:
+        self.logger.info(
+            f"Resuming download of {drive_id} at byte {local_size}."
+        )
+        offset = local_size
+
+    self.logger.info(f"Downloading drive ID {drive_id} to {output_file}")
+    if not self._FetchFile(drive_id, output_file, offset, expected_size):
+      return False
+
+    if (offset and md5_checksum and
+        self._HashFile(output_file) != md5_checksum):
+      # The local part did not match the start of the Drive file.
       self.logger.warning(
-          f"File {output_file} already exists, not re-downloading."
+          f"Resumed download of {drive_id} does not match the Drive checksum, "
+          "downloading it again."
       )
-      return True
+      if not self._FetchFile(drive_id, output_file, 0, expected_size):
+        return False
 
-    self.logger.info(f"Downloading drive ID {drive_id} to {output_file}")
+    if md5_checksum and self._HashFile(output_file) != md5_checksum:
+      self.ModuleError(
+          f"Checksum mismatch for drive ID {drive_id}, removing {output_file}",
+          critical=False,
+      )
+      os.remove(output_file)
+      return False
+    return True
+
+  def _FetchFile(
+      self,
+      drive_id: str,
+      output_file: str,
+      offset: int,
+      expected_size: int | None,
+  ) -> bool:
+    """Writes the content of a Drive file to a local file.
+
+    Args:
+        drive_id (str): ID of the file to download.
+        output_file (str): Path to save the downloaded file.
+        offset (int): Number of bytes already downloaded to output_file, the
+            download resumes after them.
+        expected_size (int | None): Size of the file in Drive in bytes, if
+            known. Required to resume a download.
+
+    Returns:
+        bool: True if the file was downloaded successfully, False otherwise.
+    """
     try:
-      with open(output_file, "wb") as out_file:
-        drive_resource = discovery.build(
-            "drive", "v3", credentials=self._credentials
-        )
-        request = drive_resource.files().get_media(fileId=drive_id)  # pyrefly: ignore=[missing-attribute]
-        downloader = MediaIoBaseDownload(out_file, request)
-        done = False
-        while not done:
-          status, done = downloader.next_chunk(num_retries=3)
-          self.logger.debug(
-              f"Downloading {drive_id}: {int(status.progress() * 100)}%."
+      with open(output_file, "ab" if offset else "wb") as out_file:
+        drive_resource = self._GetDriveResource()
+        if offset and expected_size is not None:
+          # MediaIoBaseDownload always starts from the first byte, so the rest
+          # of the file is read with ranged requests.
+          while offset < expected_size:
+            end = min(offset + self._chunk_size, expected_size) - 1
+            request = drive_resource.files().get_media(fileId=drive_id)  # pyrefly: ignore=[missing-attribute]
+            request.headers["Range"] = f"bytes={offset}-{end}"
+            content = request.execute(num_retries=3)
+            if not content:
+              break
+            out_file.write(content)
+            offset += len(content)
+            self.logger.debug(
+                f"Downloading {drive_id}: "
+                f"{int(offset * 100 / expected_size)}%."
+            )
+        else:
+          request = drive_resource.files().get_media(fileId=drive_id)  # pyrefly: ignore=[missing-attribute]
+          downloader = MediaIoBaseDownload(
+              out_file, request, chunksize=self._chunk_size
           )
+          done = False
+          while not done:
+            status, done = downloader.next_chunk(num_retries=3)
+            self.logger.debug(
+                f"Downloading {drive_id}: {int(status.progress() * 100)}%."
+            )
         out_file.flush()
-        return True
 
     except (
         googleapi_errors.HttpError,
@@ -320,6 +530,7 @@ class GoogleDriveCollector(module.BaseModule):
       if os.path.exists(output_file):
         os.remove(output_file)
       return False
+    return True
 
 
 modules_manager.ModulesManager.RegisterModule(GoogleDriveCollector)
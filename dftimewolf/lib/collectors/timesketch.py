@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 """Collects Timesketch events."""
 
+import collections
+import contextlib
+import dataclasses
 import datetime
+import json
+import os
 import tempfile
-from typing import Callable
+from concurrent import futures
+from typing import Any, Callable, Iterator, TextIO
 
 import pandas as pd
 from timesketch_api_client import client, search, sketch
@@ -16,18 +22,41 @@ from dftimewolf.lib.containers import manager as container_manager
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
 
-_VALID_OUTPUT_FORMATS = frozenset(["csv", "json", "jsonl", "pandas"])
+_VALID_OUTPUT_FORMATS = frozenset(["csv", "json", "jsonl", "pandas", "none"])
+
+_LABEL_NAMES = {"star": "__ts_star", "comment": "__ts_comment"}
+
+# Calendar intervals supported by date histograms, other intervals are fixed.
+_CALENDAR_INTERVALS = frozenset(["1m", "1h", "1d", "1w", "1M", "1q", "1y"])
+
+# Aggregation of the data types of the search results, always computed.
+_DATA_TYPES_AGGREGATION = "data_types"
+_DATA_TYPES_AGGREGATION_DSL = {"terms": {"field": "data_type", "size": 10000}}
+
+_INTERNAL_COLUMNS = ["__ts_timeline_id", "_id", "_index", "_source", "_type"]
+
+# Maximum number of events fetched by a single search slice. Larger slices
+# are split in two, so that only a bounded number of events is in memory.
+MAX_SLICE_EVENTS = 10000
+
+# Number of search slices counted or fetched concurrently.
+MAX_WORKERS = 4
+
+# Search slices are never split below this duration.
+MIN_SLICE_DURATION = datetime.timedelta(seconds=1)
 
 
 def GenerateTimerangeQuery(
   start_datetime: datetime.datetime | None,
   end_datetime: datetime.datetime | None,
+  end_inclusive: bool = True,
 ) -> str:
   """Returns a Timesketch query string for the given time range.
 
   Args:
     start_datetime: The start datetime.
     end_datetime: The end datetime.
+    end_inclusive: Whether events at the end datetime are in the range.
 
   Returns:
     A Timesketch query string for the given time range.
@@ -38,7 +67,89 @@ def GenerateTimerangeQuery(
     from_query = start_datetime.strftime("%Y-%m-%dT%H:%M:%S")
   if end_datetime:
     to_query = end_datetime.strftime("%Y-%m-%dT%H:%M:%S")
-  return f"datetime:[{from_query} TO {to_query}]"
+  return f"datetime:[{from_query} TO {to_query}{']' if end_inclusive else '}'}"
+
+
+def ParseAggregationSpec(spec: str) -> dict[str, Any]:
+  """Parses an aggregation specification into an OpenSearch aggregation.
+
+  Supported specifications are 'terms:<field>[:<size>]' and
+  'date_histogram:<field>[:<interval>]'.
+
+  Args:
+    spec: The aggregation specification.
+
+  Returns:
+    The OpenSearch aggregation.
+
+  Raises:
+    ValueError: if the specification is not valid.
+  """
+  kind, _, arguments = spec.partition(":")
+  field, _, option = arguments.partition(":")
+  if not field:
+    raise ValueError(f"Missing field in aggregation {spec}")
+  if kind == "terms":
+    return {"terms": {"field": field, "size": int(option or 100)}}
+  if kind == "date_histogram":
+    interval = option or "1d"
+    interval_type = (
+      "calendar_interval" if interval in _CALENDAR_INTERVALS
+      else "fixed_interval"
+    )
+    return {"date_histogram": {"field": field, interval_type: interval}}
+  raise ValueError(f"Unsupported aggregation type {kind} in {spec}")
+
+
+def _AsUTC(value: datetime.datetime) -> datetime.datetime:
+  """Converts a datetime to UTC, assuming naive datetimes are in UTC.
+
+  Args:
+    value: the datetime to convert.
+
+  Returns:
+    The timezone aware datetime, in UTC.
+  """
+  if value.tzinfo is None:
+    return value.replace(tzinfo=datetime.timezone.utc)
+  return value.astimezone(datetime.timezone.utc)
+
+
+@dataclasses.dataclass
+class SearchSlice:
+  """A part of a search, restricted to a time range and to indices.
+
+  Attributes:
+    start_datetime: The start datetime of the slice.
+    end_datetime: The end datetime of the slice.
+    indices: The indices to search, or None for all indices.
+    end_inclusive: Whether events at the end datetime are in the slice.
+    expected_size: The number of events in the slice, if known.
+  """
+
+  start_datetime: datetime.datetime | None
+  end_datetime: datetime.datetime | None
+  indices: list[int] | None = None
+  end_inclusive: bool = True
+  expected_size: int | None = None
+
+  def Split(self) -> tuple["SearchSlice", "SearchSlice"] | None:
+    """Splits the slice in two halves of its time range.
+
+    Returns:
+      The two halves, or None if the slice can not be split.
+    """
+    if not self.start_datetime or not self.end_datetime:
+      return None
+    duration = self.end_datetime - self.start_datetime
+    if duration < 2 * MIN_SLICE_DURATION:
+      return None
+    middle = self.start_datetime + duration / 2
+    middle = middle.replace(microsecond=0)
+    return (
+        SearchSlice(self.start_datetime, middle, self.indices, False),
+        SearchSlice(middle, self.end_datetime, self.indices,
+                    self.end_inclusive))
 
 
 class TimesketchSearchEventCollector(module.BaseModule):
@@ -59,6 +170,7 @@ class TimesketchSearchEventCollector(module.BaseModule):
     include_internal_columns: show Timesketch internal columns.
     sketch_id: the Timesketch sketch ID.
     sketch: the Timesketch sketch.
+    aggregations: the OpenSearch aggregations to run, by name.
   """
 
   def __init__(self,
@@ -86,6 +198,7 @@ class TimesketchSearchEventCollector(module.BaseModule):
     self.sketch_id: int = 0
     self.sketch: sketch.Sketch | None = None
     self.timesketch_api_client: client.TimesketchApi | None = None
+    self.aggregations: dict[str, dict[str, Any]] = {}
 
   # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(
@@ -105,6 +218,8 @@ class TimesketchSearchEventCollector(module.BaseModule):
     endpoint: str | None = None,
     username: str | None = None,
     password: str | None = None,
+    aggregations: str | None = None,
+    aggregation_dsl: str | None = None,
   ) -> None:
     """Sets up the TimesketchSearchEventCollector.
 
@@ -116,7 +231,8 @@ class TimesketchSearchEventCollector(module.BaseModule):
       end_datetime: the end datetime.
       indices: the comma-separated Timesketch indices.
       labels: the comma-separated Timesketch event labels.
-      output_format: the output format.  Defaults to 'pandas'.
+      output_format: the output format.  Defaults to 'pandas'.  'none' only
+          runs the aggregations, without downloading events.
       return_fields: the return fields.  Defaults to '*'.
       search_name: an optional name for the search.
       search_description: an optional description for the search.
@@ -130,6 +246,11 @@ class TimesketchSearchEventCollector(module.BaseModule):
           Optional when token_password is provided.
       username: Timesketch username. Optional when token_password is provided.
       password: Timesketch password. Optional when token_password is provided.
+      aggregations: comma-separated aggregations to run on the search
+          results, 'terms:<field>[:<size>]' or
+          'date_histogram:<field>[:<interval>]'.
+      aggregation_dsl: a JSON object of user-defined OpenSearch aggregations
+          to run on the search results, keyed by aggregation name.
     """
     self.timesketch_api_client = self._GetAPIClient(
       token_password, endpoint, username, password
@@ -162,6 +283,19 @@ class TimesketchSearchEventCollector(module.BaseModule):
     if search_description:
       self.search_description = search_description
 
+    self.aggregations = {_DATA_TYPES_AGGREGATION: _DATA_TYPES_AGGREGATION_DSL}
+    try:
+      for spec in (aggregations or "").split(","):
+        if spec.strip():
+          self.aggregations[spec.strip()] = ParseAggregationSpec(spec.strip())
+      if aggregation_dsl:
+        user_aggregations = json.loads(aggregation_dsl)
+        if not isinstance(user_aggregations, dict):
+          raise ValueError("aggregation_dsl is not a JSON object")
+        self.aggregations.update(user_aggregations)
+    except ValueError as exception:
+      self.ModuleError(f"Invalid aggregation: {exception!s}", critical=True)
+
   def _GetAPIClient(
     self,
     token_password: str | None = None,
@@ -207,7 +341,7 @@ class TimesketchSearchEventCollector(module.BaseModule):
     self.logger.warning(f"Adding sketch {sketch_obj} to cache")
     return sketch_obj
 
-  def _GetSearchResults(
+  def _BuildSearch(
     self,
     selected_sketch: sketch.Sketch,
     query_string: str,
@@ -216,11 +350,12 @@ class TimesketchSearchEventCollector(module.BaseModule):
     end_datetime: datetime.datetime | None = None,
     labels: list[str] | None = None,
     indices: list[int] | None = None,
-  ) -> pd.DataFrame:
-    """Get the Timesketch search results.
+    end_inclusive: bool = True,
+  ) -> search.Search:
+    """Builds a Timesketch search.
 
     Args:
-      sketch: the Timesketch sketch.
+      selected_sketch: the Timesketch sketch.
       query_string: the query string.
       return_fields: fields of the sketch to return in the results.
       start_datetime: Optional start datetime filter.
@@ -228,16 +363,19 @@ class TimesketchSearchEventCollector(module.BaseModule):
       labels: Filter labels. Can also filter on special labels 'star' and
         'comment'.
       indices: Optional indices to filter on.
+      end_inclusive: Whether events at the end datetime are included.
 
     Returns:
-      the results in a Pandas dataframe.
+      The Timesketch search.
     """
     search_obj = search.Search(selected_sketch)
     search_obj.return_fields = return_fields
     if indices:
       search_obj.indices = indices
 
-    date_query = GenerateTimerangeQuery(start_datetime, end_datetime)
+    date_query = GenerateTimerangeQuery(
+      start_datetime, end_datetime, end_inclusive
+    )
     search_obj.query_string = f"({query_string}) AND ({date_query})"
 
     for label in labels or []:
@@ -249,64 +387,312 @@ class TimesketchSearchEventCollector(module.BaseModule):
       else:
         label_chip.label = label
       search_obj.add_chip(label_chip)
+    return search_obj
+
+  def _GetSearchResults(
+    self,
+    selected_sketch: sketch.Sketch,
+    query_string: str,
+    return_fields: str,
+    start_datetime: datetime.datetime | None = None,
+    end_datetime: datetime.datetime | None = None,
+    labels: list[str] | None = None,
+    indices: list[int] | None = None,
+    end_inclusive: bool = True,
+    expected_size: int | None = None,
+  ) -> pd.DataFrame:
+    """Get the Timesketch search results.
+
+    Args:
+      sketch: the Timesketch sketch.
+      query_string: the query string.
+      return_fields: fields of the sketch to return in the results.
+      start_datetime: Optional start datetime filter.
+      end_datetime: Optional end datetime filter.
+      labels: Filter labels. Can also filter on special labels 'star' and
+        'comment'.
+      indices: Optional indices to filter on.
+      end_inclusive: Whether events at the end datetime are included.
+      expected_size: The number of matching events, if already known.
+
+    Returns:
+      the results in a Pandas dataframe.
+    """
+    search_obj = self._BuildSearch(
+      selected_sketch,
+      query_string,
+      return_fields,
+      start_datetime,
+      end_datetime,
+      labels,
+      indices,
+      end_inclusive,
+    )
 
     with opentelemetry.start_span('Timesketch.Search', {
         'sketch_id': selected_sketch.id,
         'query_string': search_obj.query_string,
         'return_fields': return_fields,
     }):
+      if expected_size is None:
+        expected_size = search_obj.expected_size
       # Timesketch API returns a max of 10000 results by default
-      if search_obj.expected_size > 10000:
-        search_obj.max_entries = search_obj.expected_size + 1
+      if expected_size > 10000:
+        search_obj.max_entries = expected_size + 1
 
       return search_obj.to_pandas()
 
-  def _OutputSearchResults(self, data_frame: pd.DataFrame) -> None:
-    """Stores the search results in a container or file.
+  def _CountEvents(self, search_slice: SearchSlice) -> int:
+    """Counts the events of a search slice.
 
     Args:
-      data_frame: the dataframe containing the Timesketch events.
+      search_slice: the search slice.
+
+    Returns:
+      The number of events matching the search in the slice.
+    """
+    assert self.sketch
+    search_obj = self._BuildSearch(
+      self.sketch,
+      self.query_string,
+      self.return_fields,
+      search_slice.start_datetime,
+      search_slice.end_datetime,
+      self.labels,
+      search_slice.indices,
+      search_slice.end_inclusive,
+    )
+    with opentelemetry.start_span('Timesketch.Count', {
+        'sketch_id': self.sketch.id,
+        'query_string': search_obj.query_string,
+    }):
+      return int(search_obj.expected_size)
+
+  def _GetTimeBounds(self, search_slice: SearchSlice) -> SearchSlice:
+    """Bounds the time range of a search slice by its first and last events.
+
+    Args:
+      search_slice: the search slice, with a missing start or end datetime.
+
+    Returns:
+      The search slice with a start and end datetime, unless there are no
+      matching events.
     """
-    if not self.include_internal_columns:
-      # Remove internal OpenSearch columns
-      data_frame = data_frame.drop(
-        columns=["__ts_timeline_id", "_id", "_index", "_source", "_type"],
-        errors="ignore",
+    assert self.sketch
+    bounds = []
+    for ascending in (True, False):
+      search_obj = self._BuildSearch(
+        self.sketch,
+        self.query_string,
+        "datetime",
+        search_slice.start_datetime,
+        search_slice.end_datetime,
+        self.labels,
+        search_slice.indices,
       )
+      if ascending:
+        search_obj.order_ascending()
+      else:
+        search_obj.order_descending()
+      search_obj.max_entries = 1
+      data_frame = search_obj.to_pandas()
+      if data_frame.empty or "datetime" not in data_frame:
+        return search_slice
+      timestamp = pd.Timestamp(data_frame["datetime"].iloc[0])
+      bounds.append(timestamp.to_pydatetime().replace(microsecond=0))
+
+    return SearchSlice(
+      _AsUTC(search_slice.start_datetime or bounds[0]),
+      _AsUTC(search_slice.end_datetime or bounds[1] + MIN_SLICE_DURATION),
+      search_slice.indices,
+    )
 
-    if self.output_format == "pandas":
-      self.StoreContainer(
-        containers.TimesketchEvents(
-          name=self.search_name,
-          description=self.search_description,
-          data_frame=data_frame,
-          query=self.query_string,
-          sketch_id=self.sketch_id,
+  def _PlanSlices(self, executor: futures.Executor) -> list[SearchSlice]:
+    """Splits the search into slices of at most MAX_SLICE_EVENTS events.
+
+    The search is sliced per index, then each slice is recursively split in
+    two halves of its time range until it is small enough.
+
+    Args:
+      executor: the executor counting slices concurrently.
+
+    Returns:
+      The non-empty search slices, in chronological order.
+    """
+    indices = self._GetTimelineIds()
+    slices = [
+      SearchSlice(self.start_datetime, self.end_datetime, [index])
+      for index in indices
+    ] or [SearchSlice(self.start_datetime, self.end_datetime)]
+    if not self.start_datetime or not self.end_datetime:
+      slices = list(executor.map(self._GetTimeBounds, slices))
+
+    planned = []
+    pending = {
+      executor.submit(self._CountEvents, search_slice): search_slice
+      for search_slice in slices
+    }
+    while pending:
+      done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+      for future in done:
+        search_slice = pending.pop(future)
+        search_slice.expected_size = future.result()
+        if not search_slice.expected_size:
+          continue
+        halves = None
+        if search_slice.expected_size > MAX_SLICE_EVENTS:
+          halves = search_slice.Split()
+        if not halves:
+          planned.append(search_slice)
+          continue
+        for half in halves:
+          pending[executor.submit(self._CountEvents, half)] = half
+
+    return sorted(planned, key=lambda search_slice: (
+      search_slice.start_datetime or datetime.datetime.min,
+      search_slice.indices or [],
+    ))
+
+  def _FetchSlices(
+    self, executor: futures.Executor, slices: list[SearchSlice]
+  ) -> Iterator[pd.DataFrame]:
+    """Fetches the events of search slices concurrently.
+
+    At most 2 * MAX_WORKERS slices are fetched or waiting to be consumed at
+    any time, which bounds memory usage.
+
+    Args:
+      executor: the executor fetching slices concurrently.
+      slices: the search slices.
+
+    Yields:
+      The events of each slice, in the order of the slices.
+    """
+    in_flight: collections.deque[futures.Future[pd.DataFrame]] = (
+      collections.deque()
+    )
+    for search_slice in slices:
+      in_flight.append(executor.submit(
+        self._GetSearchResults,
+        self.sketch,
+        self.query_string,
+        self.return_fields,
+        search_slice.start_datetime,
+        search_slice.end_datetime,
+        self.labels,
+        search_slice.indices,
+        search_slice.end_inclusive,
+        search_slice.expected_size,
+      ))
+      if len(in_flight) >= 2 * MAX_WORKERS:
+        yield in_flight.popleft().result()
+    while in_flight:
+      yield in_flight.popleft().result()
+
+  def _WriteSearchResults(
+    self,
+    data_frame: pd.DataFrame,
+    output_file: TextIO,
+    state: dict[str, Any],
+  ) -> None:
+    """Appends search results to an output file.
+
+    Args:
+      data_frame: the dataframe containing the Timesketch events.
+      output_file: the output file.
+      state: the output state, shared by successive calls for the same file.
+    """
+    if self.output_format == "csv":
+      if "columns" not in state:
+        state["columns"] = list(data_frame.columns)
+        data_frame.to_csv(output_file, index=False)
+      else:
+        data_frame.reindex(columns=state["columns"]).to_csv(
+          output_file, index=False, header=False
         )
-      )
+    elif self.output_format == "json":
+      records = str(data_frame.to_json(orient="records"))[1:-1]
+      if records:
+        output_file.write("," if state.get("written") else "[")
+        output_file.write(records)
+        state["written"] = True
+    elif self.output_format == "jsonl":
+      records = str(data_frame.to_json(orient="records", lines=True))
+      output_file.write(records)
+      if records and not records.endswith("\n"):
+        output_file.write("\n")
     else:
-      with tempfile.NamedTemporaryFile(
+      self.ModuleError("Unexpected output format", critical=True)
+
+  def _OutputSearchResults(self, data_frames: Iterator[pd.DataFrame]) -> int:
+    """Stores the search results in a container or file.
+
+    Results other than pandas are appended to the output file as they are
+    fetched, so that they do not all need to be held in memory.
+
+    Args:
+      data_frames: the dataframes containing the Timesketch events.
+
+    Returns:
+      The number of events output.
+    """
+    event_count = 0
+    frames = []
+    output_file = None
+    state: dict[str, Any] = {}
+    if self.output_format != "pandas":
+      output_file = tempfile.NamedTemporaryFile(
         mode="w",
         delete=False,
         encoding="utf-8",
         prefix=f"{self.search_name}_" if self.search_name else "",
         suffix=f".{self.output_format}",
-      ) as output_file:
-        if self.output_format == "csv":
-          data_frame.to_csv(output_file, index=False)
-        elif self.output_format == "json":
-          data_frame.to_json(output_file, orient="records", lines=False)
-        elif self.output_format == "jsonl":
-          data_frame.to_json(output_file, orient="records", lines=True)
-        else:
-          self.ModuleError("Unexpected output format", critical=True)
-        self.StoreContainer(
-          containers.File(
-            name=self.search_name,
-            description=self.search_description,
-            path=output_file.name,
+      )
+
+    with output_file or contextlib.nullcontext():
+      for data_frame in data_frames:
+        if data_frame.empty:
+          continue
+        event_count += len(data_frame)
+        if not self.include_internal_columns:
+          # Remove internal OpenSearch columns
+          data_frame = data_frame.drop(
+            columns=_INTERNAL_COLUMNS, errors="ignore"
           )
+        if output_file:
+          self._WriteSearchResults(data_frame, output_file, state)
+        else:
+          frames.append(data_frame)
+      if output_file and state.get("written"):
+        output_file.write("]")
+
+    if not event_count:
+      if output_file:
+        os.remove(output_file.name)
+      return 0
+
+    if output_file:
+      self.StoreContainer(
+        containers.File(
+          name=self.search_name,
+          description=self.search_description,
+          path=output_file.name,
         )
+      )
+    else:
+      self.StoreContainer(
+        containers.TimesketchEvents(
+          name=self.search_name,
+          description=self.search_description,
+          data_frame=(
+            frames[0] if len(frames) == 1
+            else pd.concat(frames, ignore_index=True)
+          ),
+          query=self.query_string,
+          sketch_id=self.sketch_id,
+        )
+      )
+    return event_count
 
   def FindSketch(self) -> None:
     """Attempts to find a sketch by Sketch ID, cache, or attribute container."""
@@ -330,29 +716,105 @@ class TimesketchSearchEventCollector(module.BaseModule):
       return
     self.sketch = self._GetSketch(self.sketch_id)
 
-  def _StoreDataTypesAggregationContainer(
-    self, data_frame: pd.DataFrame
-  ) -> None:
-    """Aggregates the data types in the search results and stores them.
+  def _GetTimelineIds(self) -> list[int]:
+    """Returns the IDs of the timelines to search.
 
-    Args:
-      data_frame: the dataframe containing the Timesketch events.
+    Returns:
+      The selected indices, or the IDs of all the timelines of the sketch.
     """
-    if "data_type" not in data_frame.columns:
-      self.logger.warning(
-        "No 'data_type' column found in the search results "
-        "skipping aggregation."
+    assert self.sketch
+    return self.indices or [
+      timeline.id for timeline in self.sketch.list_timelines()
+    ]
+
+  def _BuildAggregationQuery(self) -> dict[str, Any]:
+    """Builds the OpenSearch query selecting the events to aggregate.
+
+    The query is restricted to the timelines of the sketch, as the search
+    index of a timeline can be shared with other sketches.
+
+    Returns:
+      The OpenSearch query, with the same filters as the search.
+    """
+    date_query = GenerateTimerangeQuery(self.start_datetime, self.end_datetime)
+    filters: list[dict[str, Any]] = [
+      {"query_string": {
+        "query": f"({self.query_string}) AND ({date_query})"
+      }},
+      {"terms": {"__ts_timeline_id": self._GetTimelineIds()}},
+    ]
+    for label in self.labels:
+      filters.append({
+        "nested": {
+          "path": "timesketch_label",
+          "query": {"bool": {"must": [
+            {"term": {
+              "timesketch_label.name.keyword": _LABEL_NAMES.get(label, label)
+            }},
+            {"term": {"timesketch_label.sketch_id": self.sketch_id}},
+          ]}},
+        }
+      })
+    return {"query": {"bool": {"filter": filters}}, "size": 0}
+
+  def _RunAggregations(self) -> None:
+    """Runs the aggregations on the Timesketch server and stores them.
+
+    All aggregations are sent in a single request, so that no events need to
+    be downloaded to aggregate them.
+    """
+    assert self.sketch
+    aggregation_dsl = self._BuildAggregationQuery()
+    aggregation_dsl["aggs"] = self.aggregations
+    with opentelemetry.start_span('Timesketch.Aggregate', {
+        'sketch_id': self.sketch.id,
+        'aggregations': ','.join(self.aggregations),
+    }):
+      try:
+        aggregation_obj = self.sketch.aggregate(json.dumps(aggregation_dsl))
+        objects = aggregation_obj.lazyload_data().get("objects") or [{}]
+      except (RuntimeError, ValueError) as exception:
+        if len(self.aggregations) > 1:
+          self.ModuleError(
+            f"Unable to run aggregations: {exception!s}", critical=True
+          )
+        # The data types are only informative, the search can still run.
+        self.logger.warning(
+          f"Unable to aggregate data types, skipping aggregation: "
+          f"{exception!s}"
+        )
+        return
+    results = objects[0]
+
+    for name, aggregation in self.aggregations.items():
+      buckets = results.get(name, {}).get("buckets", [])
+      if name == _DATA_TYPES_AGGREGATION and not buckets:
+        self.logger.warning(
+          "No data types found in the search results, skipping aggregation."
+        )
+        continue
+      # The aggregated field, for aggregations that have one.
+      key = next(
+        (body["field"] for body in aggregation.values()
+         if isinstance(body, dict) and "field" in body),
+        name,
       )
-      return
-    datatypes = data_frame["data_type"].value_counts().to_dict()
-    self.StoreContainer(
-      containers.TimesketchAggregation(
-        name="data_types",
-        key="data_type",
-        description="Data types in the search results",
-        results=datatypes,
+      self.StoreContainer(
+        containers.TimesketchAggregation(
+          name=name,
+          key=key,
+          description=(
+            "Data types in the search results"
+            if name == _DATA_TYPES_AGGREGATION
+            else f"Aggregation {name} of the search results"
+          ),
+          results={
+            bucket.get("key_as_string", bucket.get("key")):
+              bucket.get("doc_count", 0)
+            for bucket in buckets
+          },
+        )
       )
-    )
 
   def Process(self) -> None:
     """Processes the Timesketch search query."""
@@ -362,20 +824,25 @@ class TimesketchSearchEventCollector(module.BaseModule):
         "Unable to obtain valid sketch ID or sketch, aborting.", critical=True
       )
       return
-    data_frame = self._GetSearchResults(
-      self.sketch,
-      self.query_string,
-      self.return_fields,
-      self.start_datetime,
-      self.end_datetime,
-      self.labels,
-      self.indices,
-    )
-    self.logger.info(f"Search returned {len(data_frame)} event(s).")
-    if data_frame.empty:
+    self._RunAggregations()
+    if self.output_format == "none":
       return
-    self._OutputSearchResults(data_frame)
-    self._StoreDataTypesAggregationContainer(data_frame)
+
+    required_columns = self.GetRequiredColumns()
+    if required_columns and self.return_fields == "*":
+      # Only fetch the fields that are used downstream.
+      self.return_fields = ",".join(sorted(required_columns))
+      self.logger.info(
+        f"Only fetching fields used downstream: {self.return_fields}"
+      )
+
+    with futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+      slices = self._PlanSlices(executor)
+      self.logger.info(f"Searching {len(slices)} slice(s) of the sketch.")
+      event_count = self._OutputSearchResults(
+        self._FetchSlices(executor, slices)
+      )
+    self.logger.info(f"Search returned {event_count} event(s).")
 
 
 modules_manager.ModulesManager.RegisterModule(TimesketchSearchEventCollector)
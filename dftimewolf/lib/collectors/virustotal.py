@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 """Downloads several items for a VT file."""
 
+import asyncio
+import json
 import os
+import re
+import shutil
 import tempfile
+import threading
 import urllib.parse
 import zipfile
-from typing import Callable
+from concurrent import futures
+from typing import Any, Callable
 
+import ratelimit
 import vt
 
 from dftimewolf.lib import module
@@ -17,6 +24,108 @@ from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 
 
+# Maximum number of hashes looked up and downloaded concurrently.
+MAX_WORKERS = 8
+
+# Maximum number of archives extracted concurrently.
+MAX_EXTRACT_WORKERS = 4
+
+# Number of VirusTotal API requests allowed per period, across all threads.
+CALL_LIMIT = 60
+
+# Ratelimit period.
+ONE_MINUTE = 60
+
+# Size of the chunks downloads are streamed to disk in.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@ratelimit.sleep_and_retry
+@ratelimit.limits(calls=CALL_LIMIT, period=ONE_MINUTE)
+def _CallAPI(method: Callable[..., Any], path: str) -> Any:
+  """Calls a VirusTotal client method under the rate limit.
+
+  Args:
+    method: The client method to call.
+    path: The API path or URL to request.
+
+  Returns:
+    The result of the client method.
+  """
+  return method(path)
+
+
+class VTArtifactStore:
+  """A local store of downloaded VirusTotal artifacts.
+
+  Artifacts are keyed by sample hash and artifact type. A manifest is written
+  once all the artifacts of a sample have been downloaded, so that incomplete
+  entries are never used.
+  """
+
+  _MANIFEST_FILENAME = 'manifest.json'
+
+  def __init__(self, path: str) -> None:
+    """Initializes the store.
+
+    Args:
+      path: Directory holding the store.
+    """
+    self._path = path
+
+  def _EntryDirectory(self, vt_hash: str, vt_type: str) -> str:
+    """Returns the directory for a sample and artifact type."""
+    return os.path.join(self._path, vt_type, vt_hash.lower())
+
+  def Get(self, vt_hash: str, vt_type: str) -> list[str] | None:
+    """Looks up the artifacts of a sample.
+
+    Args:
+      vt_hash: The sample hash.
+      vt_type: The artifact type.
+
+    Returns:
+      The paths to the stored artifacts, or None if the sample is not stored.
+    """
+    entry_directory = self._EntryDirectory(vt_hash, vt_type)
+    manifest_path = os.path.join(entry_directory, self._MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+      return None
+    with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+      filenames = json.load(manifest_file)
+    paths = [os.path.join(entry_directory, name) for name in filenames]
+    if not all(os.path.exists(path) for path in paths):
+      return None
+    return paths
+
+  def NewArtifactPath(self, vt_hash: str, vt_type: str, name: str) -> str:
+    """Returns the path to store a new artifact of a sample at.
+
+    Args:
+      vt_hash: The sample hash.
+      vt_type: The artifact type.
+      name: Name of the artifact.
+    """
+    entry_directory = self._EntryDirectory(vt_hash, vt_type)
+    os.makedirs(entry_directory, exist_ok=True)
+    return os.path.join(entry_directory, name)
+
+  def Commit(self, vt_hash: str, vt_type: str, paths: list[str]) -> None:
+    """Records that all the artifacts of a sample are stored.
+
+    Args:
+      vt_hash: The sample hash.
+      vt_type: The artifact type.
+      paths: Paths to the artifacts, as returned by NewArtifactPath.
+    """
+    entry_directory = self._EntryDirectory(vt_hash, vt_type)
+    os.makedirs(entry_directory, exist_ok=True)
+    manifest_path = os.path.join(entry_directory, self._MANIFEST_FILENAME)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as manifest_file:
+      json.dump([os.path.basename(path) for path in paths], manifest_file)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
 class VTCollector(module.BaseModule):
   """VirusTotal (VT) Collector.
 
@@ -49,29 +158,47 @@ class VTCollector(module.BaseModule):
 
     self.hashes_list: list[str] = []
     self.directory = ''
-    self.client: vt.client.Client
     self.vt_type = ''
+    self._vt_api_key = ''
+    self._store: VTArtifactStore | None = None
+    self._thread_local = threading.local()
+    # The clients of the download threads, with their event loops.
+    self._clients: list[tuple[vt.Client, asyncio.AbstractEventLoop]] = []
+    self._clients_lock = threading.Lock()
 
   def Process(self) -> None:
     """Process of the VirusTotal collector after setup"""
-
-    for vt_hash in self.hashes_list:
-      try:
-        download_link_list = self._getDownloadLinks(vt_hash)
-
-        for download_link in download_link_list:
-          filename = f'{vt_hash}.{self.vt_type}'
-
-          downloaded_filepath = self._downloadFile(download_link, filename)
-
-          if downloaded_filepath is None:
-            self.logger.warning(
-                f'File not found {urllib.parse.quote(download_link)}')
+    try:
+      self._CollectHashes()
+    finally:
+      self._CloseClients()
+
+  def _CollectHashes(self) -> None:
+    """Downloads the files of all hashes, and creates their containers."""
+    with futures.ThreadPoolExecutor(
+        max_workers=MAX_EXTRACT_WORKERS) as extract_executor:
+      extractions: list[futures.Future[None]] = []
+      with futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        future_to_hash = {
+            executor.submit(self._CollectHash, vt_hash): vt_hash
+            for vt_hash in self.hashes_list}
+        for future in futures.as_completed(future_to_hash):
+          vt_hash = future_to_hash[future]
+          try:
+            filepaths = future.result()
+          except vt.error.APIError:
+            self.logger.warning(f"Hash not found on VT: {vt_hash}")
             continue
 
-          self._createContainer(vt_hash=vt_hash, filepath=downloaded_filepath)
-      except vt.error.APIError:
-        self.logger.warning(f"Hash not found on VT: {vt_hash}")
+          for filepath in filepaths:
+            if self.vt_type == 'evtx':
+              extractions.append(extract_executor.submit(
+                  self._createContainer, vt_hash=vt_hash, filepath=filepath))
+            else:
+              self._createContainer(vt_hash=vt_hash, filepath=filepath)
+
+      for extraction in futures.as_completed(extractions):
+        extraction.result()
 
   # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(
@@ -80,6 +207,7 @@ class VTCollector(module.BaseModule):
       vt_api_key: str,
       vt_type: str,
       directory: str,
+      store_directory: str | None = None,
   ) -> None:
     """Sets up an VirusTotal (VT) collector.
 
@@ -88,9 +216,14 @@ class VTCollector(module.BaseModule):
       vt_api_key: VirusTotal Enterprise API Key
       vt_type: Which file to fetch
       directory: Where to store the downloaded files to
+      store_directory: Where to keep downloaded files across runs, so that
+          samples that were already downloaded are not fetched again. Files
+          are downloaded on every run if not set.
     """
 
     self.directory = self._CheckOutputPath(directory)
+    if store_directory:
+      self._store = VTArtifactStore(store_directory)
 
     if not hashes:
       self.ModuleError('You need to specify at least one hash', critical=True)
@@ -111,41 +244,147 @@ class VTCollector(module.BaseModule):
           critical=True,
       )
 
-    self.client = vt.Client(vt_api_key)
+    self._vt_api_key = vt_api_key
 
-    if self.client is None:
-      self.ModuleError(
-          'Error creating VirusTotal Client instance',
-          critical=True,
-      )
+  def _GetClient(self) -> vt.Client:
+    """Returns a VirusTotal client for the calling thread.
+
+    The client runs its requests on the event loop of the thread it was
+    created in, so it cannot be shared between threads.
+    """
+    client = getattr(self._thread_local, 'client', None)
+    if client is None:
+      client = vt.Client(self._vt_api_key)
+      self._thread_local.client = client
+      # The client creates an event loop for the thread if it has none.
+      try:
+        event_loop = asyncio.get_event_loop()
+      except RuntimeError:
+        event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(event_loop)
+      with self._clients_lock:
+        self._clients.append((client, event_loop))
+    return client
+
+  def _CloseClients(self) -> None:
+    """Closes the clients of the download threads, and their event loops.
+
+    The download threads are done, so their event loops are not running and
+    can run the closing of their clients.
+    """
+    with self._clients_lock:
+      clients, self._clients = self._clients, []
+    for client, event_loop in clients:
+      event_loop.run_until_complete(client.close_async())
+      event_loop.close()
+    self._thread_local = threading.local()
+
+  def _CollectHash(self, vt_hash: str) -> list[str]:
+    """Fetches the artifacts of a sample, from the local store if possible.
+
+    Args:
+      vt_hash: Hash of the sample.
+
+    Returns:
+      Paths to the artifacts in the output directory.
+    """
+    if not self._store:
+      output_paths = []
+      for download_link, filename in self._GetArtifactNames(vt_hash):
+        output_path = self._downloadFile(
+            download_link, os.path.join(self.directory, filename))
+        if output_path is None:
+          self.logger.warning(
+              f'File not found {urllib.parse.quote(download_link)}')
+          continue
+        output_paths.append(output_path)
+      return output_paths
+
+    stored_paths = self._store.Get(vt_hash, self.vt_type)
+    if stored_paths is not None:
+      self.logger.info(
+          f'Using {len(stored_paths)} stored {self.vt_type} files for '
+          f'{vt_hash}')
+    else:
+      stored_paths = []
+      complete = True
+      for download_link, filename in self._GetArtifactNames(vt_hash):
+        stored_path = self._downloadFile(
+            download_link,
+            self._store.NewArtifactPath(vt_hash, self.vt_type, filename))
+        if stored_path is None:
+          self.logger.warning(
+              f'File not found {urllib.parse.quote(download_link)}')
+          complete = False
+          continue
+        stored_paths.append(stored_path)
+      # Only store complete results, so that samples with missing or not yet
+      # available artifacts are looked up again next time.
+      if complete and stored_paths:
+        self._store.Commit(vt_hash, self.vt_type, stored_paths)
+
+    output_paths = []
+    for stored_path in stored_paths:
+      output_path = os.path.join(
+          self.directory, os.path.basename(stored_path))
+      if not os.path.exists(output_path):
+        try:
+          os.link(stored_path, output_path)
+        except OSError:
+          shutil.copyfile(stored_path, output_path)
+      output_paths.append(output_path)
+    return output_paths
+
+  def _GetArtifactNames(self, vt_hash: str) -> list[tuple[str, str]]:
+    """Returns the download links of the artifacts of a sample.
+
+    Args:
+      vt_hash: Hash of the sample.
+
+    Returns:
+      The download link and file name of each artifact.
+    """
+    artifacts = []
+    for download_link in self._getDownloadLinks(vt_hash):
+      # Links end with /file_behaviours/<analysis ID>/<vt_type>.
+      analysis_id = download_link.rstrip('/').split('/')[-2]
+      artifacts.append((
+          download_link,
+          re.sub(r'[^-\w.]', '_', f'{analysis_id}.{self.vt_type}')))
+    return artifacts
 
   def _downloadFile(self,
                     download_link: str,
-                    filename: str) -> str | None:
-    """Downloads a file to a given filename.
+                    download_file_path: str) -> str | None:
+    """Streams a file to a given path.
 
     Args:
       download_link: URL to be downloaded.
-      filename: Filename the output will be written to.
+      download_file_path: Path the output will be written to.
 
     Returns:
-      BufferedWriter of the written file
-      None: if nothing is found
+      The path of the written file, or None if nothing is found.
     """
     self.logger.debug(f"Download link {urllib.parse.quote(download_link)}")
 
-    download = self.client.get(download_link)
+    download = _CallAPI(self._GetClient().get, download_link)
     if download.status != 200:
       return None
 
-    file_content = download.content.read()
-
-    if len(file_content) == 0:
+    size = 0
+    temporary_path = f'{download_file_path}.part'
+    with open(temporary_path, 'wb') as download_file:
+      while True:
+        chunk = download.content.read(DOWNLOAD_CHUNK_SIZE)
+        if not chunk:
+          break
+        download_file.write(chunk)
+        size += len(chunk)
+
+    if size == 0:
+      os.remove(temporary_path)
       return None
-    download_file_path = os.path.join(self.directory, filename)
-    file = open(download_file_path, "wb")
-    file.write(file_content)
-    file.close()
+    os.replace(temporary_path, download_file_path)
     self.logger.info(f"File downloaded to: {download_file_path}")
 
     return download_file_path
@@ -213,9 +452,8 @@ class VTCollector(module.BaseModule):
     Returns:
       list: List of strings with URLs to the requested files.
     """
-    assert self.client is not None
-
-    vt_data = self.client.get_data(f'/files/{vt_hash}/behaviours')
+    vt_data = _CallAPI(
+        self._GetClient().get_data, f'/files/{vt_hash}/behaviours')
     return_list = []
 
     for analysis in vt_data:
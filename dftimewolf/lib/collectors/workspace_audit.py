@@ -2,21 +2,28 @@
 """Pulls audit logs from Google Workspace."""
 
 import datetime
-import os.path
+import os
 import json
 import re
+import shutil
 import tempfile
+import threading
+from concurrent import futures
 
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 
 import filelock
+import google_auth_httplib2
+import httplib2
 from google.auth.exceptions import DefaultCredentialsError, RefreshError
 from google.auth.transport.requests import Request
 from google.oauth2 import credentials as oauth2_credentials
 from google.auth import external_account_authorized_user
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient import discovery
+from googleapiclient import errors as googleapi_errors
 
+from dftimewolf.lib import high_water_marks
 from dftimewolf.lib import module
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
@@ -28,6 +35,22 @@ from dftimewolf.lib.containers import manager as container_manager
 RE_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$')
 WORKSPACE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
+# Partial response selector for list requests. Partial responses cannot
+# exclude fields, so every field of the activity resource is listed except
+# the per record "kind" and "etag" values, which carry no investigative value.
+ACTIVITY_FIELDS = (
+    'id', 'actor', 'ipAddress', 'ownerDomain', 'events', 'networkInfo',
+    'resourceDetails')
+DEFAULT_FIELDS = f'nextPageToken,items({",".join(ACTIVITY_FIELDS)})'
+
+# Maximum number of list requests chains run simultaneously.
+MAX_WORKERS = 8
+
+# Workspace audit records can be available hours after the activity, so
+# incremental runs start this long before the previous high-water mark.
+INCREMENTAL_LOOKBACK = datetime.timedelta(hours=6)
+
+
 class WorkspaceAuditCollector(module.BaseModule):
   """Collector for Google Workspace Audit logs. """
 
@@ -48,11 +71,17 @@ class WorkspaceAuditCollector(module.BaseModule):
                      telemetry_=telemetry_,
                      publish_message_callback=publish_message_callback)
     self._credentials: external_account_authorized_user.Credentials | oauth2_credentials.Credentials
-    self._application_name = ''
+    self._application_names: list[str] = []
     self._filter_expression = ''
-    self._user_key = 'all'
+    self._user_keys: list[str] = ['all']
     self._start_time: datetime.datetime
     self._end_time: datetime.datetime
+    self._window_size: Optional[datetime.timedelta] = None
+    self._incremental = False
+    self._thread_local = threading.local()
+    # Records on the boundary of two time windows are returned for both.
+    self._boundary_records: set[tuple[str, str, str, str]] = set()
+    self._boundary_lock = threading.Lock()
 
   def _BuildAuditResource(
       self,
@@ -118,36 +147,54 @@ class WorkspaceAuditCollector(module.BaseModule):
 
     return credentials
 
-  # pylint: disable=arguments-differ
+  def _GetHttp(self) -> google_auth_httplib2.AuthorizedHttp:
+    """Returns an authorized HTTP object for the calling thread.
+
+    The reports resource is shared by all threads, but httplib2 connections
+    are not thread-safe, so each thread executes requests with its own.
+    """
+    http = getattr(self._thread_local, 'http', None)
+    if http is None:
+      http = google_auth_httplib2.AuthorizedHttp(
+          self._credentials, http=httplib2.Http())
+      self._thread_local.http = http
+    return http
+
+  # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(self,
             application_name: str,
             filter_expression: str,
             user_key: str,
             start_time: datetime.datetime,
-            end_time: datetime.datetime) -> None:
+            end_time: datetime.datetime,
+            window_hours: Optional[int] = None,
+            incremental: bool = False) -> None:
     """Sets up a Workspace Audit logs collector.
 
     Args:
-      application_name: name of the application to fetch logs for. See
-          https://developers.google.com/admin-sdk/reports/reference/rest/v1
-          /activities/list#ApplicationName
+      application_name: comma-separated list of applications to fetch logs
+          for. See https://developers.google.com/admin-sdk/reports/reference
+          /rest/v1/activities/list#ApplicationName
       filter_expression: Workspace logs filter expression.
-      user_key: profile ID or email for which data should be
-          collected. Can be 'all' for all users.
+      user_key: comma-separated list of profile IDs or emails for which data
+          should be collected. Can be 'all' for all users.
       start_time: Beginning of the time period to return results for.
       end_time: End of the time period to return results for.
+      window_hours: Optional. If set, the time period is split into windows of
+          this many hours that are collected in parallel.
+      incremental: Optional. If True, only collect the records that are newer
+          than the ones collected by the previous incremental run for the same
+          application, user and filter expression.
     """
-
-    # Omit '-' delimiter from the filter_expression (meeting_id) for
-    # the meet application
-    if application_name == 'meet' and '-' in filter_expression:
-      filter_expression = filter_expression.replace('-', '')
-      self.logger.debug("Found '-' delimiter in the meeting_id and removed it!")
-
     self._credentials = self._GetCredentials()
-    self._application_name = application_name
+    self._application_names = [
+        a.strip() for a in application_name.split(',') if a.strip()]
     self._filter_expression = filter_expression
-    self._user_key = user_key
+    self._user_keys = [
+        u.strip() for u in (user_key or 'all').split(',') if u.strip()]
+    self._window_size = (
+        datetime.timedelta(hours=int(window_hours)) if window_hours else None)
+    self._incremental = incremental
 
     self._end_time = end_time
     self._start_time = start_time
@@ -163,41 +210,198 @@ class WorkspaceAuditCollector(module.BaseModule):
             'Please choose a more recent start date '
             f'(Earliest: {max_date}).', critical=True)
 
-  def Process(self) -> None:
-    """Copies audit logs from a Google Workspace log."""
-    output_file = tempfile.NamedTemporaryFile(
-        mode='w', delete=False, encoding='utf-8', suffix='.jsonl')
-    output_path = output_file.name
-    self.logger.info(f"Downloading logs to {output_path:s}")
+  def _GetFilterExpression(self, application_name: str) -> str:
+    """Returns the filter expression to use for an application.
+
+    Args:
+      application_name: The application the filter expression is for.
+
+    Returns:
+      The filter expression.
+    """
+    filter_expression = self._filter_expression
+    # Omit '-' delimiter from the filter_expression (meeting_id) for
+    # the meet application
+    if application_name == 'meet' and '-' in filter_expression:
+      filter_expression = filter_expression.replace('-', '')
+      self.logger.debug("Found '-' delimiter in the meeting_id and removed it!")
+    return filter_expression
+
+  def _GetTimeWindows(
+      self,
+      start_time: Optional[datetime.datetime]
+  ) -> list[tuple[Optional[datetime.datetime], Optional[datetime.datetime]]]:
+    """Splits the collection time period into windows.
+
+    Args:
+      start_time: Beginning of the time period to split.
+
+    Returns:
+      A list of (start time, end time) tuples, in chronological order.
+    """
+    if not (self._window_size and start_time):
+      return [(start_time, self._end_time)]
+
+    end_time = self._end_time or datetime.datetime.now(
+        tz=datetime.timezone.utc)
+    windows: list[
+        tuple[Optional[datetime.datetime], Optional[datetime.datetime]]] = []
+    window_start = start_time
+    while window_start < end_time:
+      window_end = min(window_start + self._window_size, end_time)
+      windows.append((window_start, window_end))
+      window_start = window_end
+    return windows or [(start_time, self._end_time)]
+
+  def _GetStartTime(
+      self,
+      previous: Optional[high_water_marks.HighWaterMark]
+  ) -> Optional[datetime.datetime]:
+    """Returns the start time to collect from, given a high-water mark.
+
+    Args:
+      previous: The high-water mark of the previous incremental collection.
+
+    Returns:
+      The latest of the configured start time and the start of the lookback
+      window of the high-water mark.
+    """
+    if not previous:
+      return self._start_time
+    since = previous.timestamp - INCREMENTAL_LOOKBACK
+    if self._start_time and (
+        high_water_marks.ParseTimestamp(self._start_time) >= since):
+      return self._start_time
+    return since
+
+  def _CollectRecords(self,
+                      audit_resource: Any,
+                      application_name: str,
+                      user_key: str,
+                      start_time: Optional[datetime.datetime],
+                      end_time: Optional[datetime.datetime],
+                      previous: Optional[high_water_marks.HighWaterMark]
+                      ) -> tuple[
+                          str, Optional[high_water_marks.HighWaterMarkTracker]]:
+    """Writes the audit records for a single request chain to a shard file.
+
+    Args:
+      audit_resource: The shared reports resource.
+      application_name: The application to fetch logs for.
+      user_key: The user to fetch logs for.
+      start_time: Beginning of the time period to return results for.
+      end_time: End of the time period to return results for.
+      previous: The high-water mark of the previous incremental collection.
+
+    Returns:
+      The path to the shard file, and the high-water mark tracker for the
+      shard if collection is incremental.
+    """
+    tracker = None
+    if self._incremental:
+      tracker = high_water_marks.HighWaterMarkTracker(
+          previous, INCREMENTAL_LOOKBACK)
 
-    audit_resource = self._BuildAuditResource(self._credentials)
     request_parameters = {
-        'userKey': self._user_key,
-        'applicationName': self._application_name
+        'userKey': user_key,
+        'applicationName': application_name,
+        'fields': DEFAULT_FIELDS
     }
-    if self._filter_expression:
-      request_parameters['filters'] = self._filter_expression
-    if self._start_time:
-      request_parameters['startTime'] = self._start_time.strftime(
+    filter_expression = self._GetFilterExpression(application_name)
+    if filter_expression:
+      request_parameters['filters'] = filter_expression
+    if start_time:
+      request_parameters['startTime'] = start_time.strftime(
           WORKSPACE_TIME_FORMAT)
-    if self._end_time:
-      request_parameters['endTime'] = self._end_time.strftime(
+    if end_time:
+      request_parameters['endTime'] = end_time.strftime(
           WORKSPACE_TIME_FORMAT)
 
-    try:
+    with tempfile.NamedTemporaryFile(
+        mode='w', delete=False, encoding='utf-8', suffix='.jsonl'
+        ) as output_file:
       # Pylint can't see the activities method.
       # pylint: disable=no-member
       request = audit_resource.activities().list(**request_parameters)  # pyrefly: ignore=[missing-attribute]
       while request is not None:
-        response = request.execute()
+        response = request.execute(http=self._GetHttp())
         audit_records = response.get('items', [])
         for audit_record in audit_records:
+          identifiers = audit_record.get('id', {})
+          if self._IsBoundaryDuplicate(
+              application_name, user_key, identifiers, start_time, end_time):
+            continue
+          if tracker and not tracker.Add(
+              identifiers['time'], identifiers.get('uniqueQualifier', '')):
+            continue
           output_file.write(json.dumps(audit_record))
           output_file.write('\n')
 
         # Pylint can't see the activities method.
         # pylint: disable=no-member
         request = audit_resource.activities().list_next(request, response)
+      return output_file.name, tracker
+
+  def _IsBoundaryDuplicate(self,
+                           application_name: str,
+                           user_key: str,
+                           identifiers: dict[str, str],
+                           start_time: Optional[datetime.datetime],
+                           end_time: Optional[datetime.datetime]) -> bool:
+    """Checks whether a window boundary record was collected by another window.
+
+    Args:
+      application_name: The application the record was collected for.
+      user_key: The user the record was collected for.
+      identifiers: The record identifiers.
+      start_time: Beginning of the record's time window.
+      end_time: End of the record's time window.
+
+    Returns:
+      True if the record is on a window boundary and was already collected.
+    """
+    if 'time' not in identifiers:
+      return False
+    record_time = high_water_marks.ParseTimestamp(identifiers['time'])
+    if not any(
+        boundary and record_time == high_water_marks.ParseTimestamp(boundary)
+        for boundary in (start_time, end_time)):
+      return False
+    key = (application_name, user_key, identifiers['time'],
+           identifiers.get('uniqueQualifier', ''))
+    with self._boundary_lock:
+      if key in self._boundary_records:
+        return True
+      self._boundary_records.add(key)
+    return False
+
+  def Process(self) -> None:
+    """Copies audit logs from a Google Workspace log."""
+    self._boundary_records = set()
+    audit_resource = self._BuildAuditResource(self._credentials)
+    store = high_water_marks.HighWaterMarkStore()
+
+    shards: dict[str, dict[str, list[futures.Future[
+        tuple[str, Optional[high_water_marks.HighWaterMarkTracker]]]]]] = {}
+    try:
+      with futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for application_name in self._application_names:
+          shards[application_name] = {}
+          for user_key in self._user_keys:
+            previous = None
+            if self._incremental:
+              previous = store.Get(
+                  self.__class__.__name__, f'{application_name}:{user_key}',
+                  self._GetFilterExpression(application_name))
+            shards[application_name][user_key] = [
+                executor.submit(
+                    self._CollectRecords, audit_resource, application_name,
+                    user_key, start_time, end_time, previous)
+                for start_time, end_time in self._GetTimeWindows(
+                    self._GetStartTime(previous))]
+
+        for application_name, user_shards in shards.items():
+          self._StoreApplicationLogs(application_name, user_shards, store)
     except (RefreshError, DefaultCredentialsError) as exception:
       self.ModuleError(
           'Something is wrong with your gcloud access token or '
@@ -205,11 +409,69 @@ class WorkspaceAuditCollector(module.BaseModule):
           '$ gcloud auth application-default login')
       self.ModuleError(str(exception), critical=True)
 
+  def _StoreApplicationLogs(
+      self,
+      application_name: str,
+      user_shards: dict[str, list[futures.Future[
+          tuple[str, Optional[high_water_marks.HighWaterMarkTracker]]]]],
+      store: high_water_marks.HighWaterMarkStore) -> None:
+    """Concatenates the shards of an application and stores a container.
+
+    When collection is incremental, the high-water marks of the users whose
+    shards were all collected successfully are also updated.
+
+    Args:
+      application_name: The application the shards were collected for.
+      user_shards: Futures resolving to the shard paths and trackers, keyed by
+          user and in time window order.
+      store: The high-water mark store.
+    """
+    filter_expression = self._GetFilterExpression(application_name)
+    shard_paths = []
+    for user_key, shard_futures in user_shards.items():
+      user_tracker = high_water_marks.HighWaterMarkTracker(
+          lookback=INCREMENTAL_LOOKBACK)
+      user_failed = False
+      for shard_future in shard_futures:
+        try:
+          shard_path, tracker = shard_future.result()
+        except googleapi_errors.HttpError as exception:
+          self.ModuleError(
+              f'Failed to collect {application_name} logs: {exception}')
+          user_failed = True
+          continue
+        shard_paths.append(shard_path)
+        if tracker:
+          user_tracker.Merge(tracker)
+      if self._incremental and user_tracker.current and not user_failed:
+        store.Set(self.__class__.__name__, f'{application_name}:{user_key}',
+                  filter_expression, user_tracker.current)
+    if not shard_paths:
+      return
+    if self._incremental and not any(
+        os.path.getsize(path) for path in shard_paths):
+      self.PublishMessage(f'No new {application_name} records')
+      for shard_path in shard_paths:
+        os.remove(shard_path)
+      return
+
+    if len(shard_paths) == 1:
+      output_path = shard_paths[0]
+    else:
+      with tempfile.NamedTemporaryFile(
+          mode='wb', delete=False, suffix='.jsonl') as output_file:
+        output_path = output_file.name
+        for shard_path in shard_paths:
+          with open(shard_path, 'rb') as shard_file:
+            shutil.copyfileobj(shard_file, output_file)
+          os.remove(shard_path)
+
     logs_report = containers.WorkspaceLogs(
-        application_name=self._application_name, path=output_path,
-        filter_expression=self._filter_expression, user_key=self._user_key,
+        application_name=application_name, path=output_path,
+        filter_expression=filter_expression,
+        user_key=','.join(self._user_keys),
         start_time=self._start_time, end_time=self._end_time)
-    self.logger.info(f'Downloaded logs to {output_path}')
+    self.logger.info(f'Downloaded {application_name} logs to {output_path}')
     self.StoreContainer(logs_report)
 
 
@@ -6,7 +6,7 @@ import contextvars
 import dataclasses
 import logging
 import threading
-from typing import Any, cast, Sequence, Type, TypeVar, Callable
+from typing import Any, cast, Iterable, Sequence, Type, TypeVar, Callable
 
 from dftimewolf.lib.containers import interface
 
@@ -27,12 +27,15 @@ class _MODULE():
             The container (a ref)
             The originating module
     callback_map: A dict, keyed by container type of callback methods
+    required_columns: The columns that the module consumes from the containers
+        of its dependencies, or None if it may consume any column.
   """
   name: str
   dependencies: list[str] = dataclasses.field(default_factory=list)
   storage: dict[str, list[tuple[interface.AttributeContainer, str]]] = dataclasses.field(default_factory=dict)
   callback_map: dict[str, list[Callable[[interface.AttributeContainer], None]]] = dataclasses.field(default_factory=dict)
   completed: bool = False
+  required_columns: set[str] | None = None
 
   def RegisterCallback(
       self, container_type: str, callback: Callable[[interface.AttributeContainer], None]) -> None:
@@ -226,6 +229,56 @@ class ContainerManager():
 
     self._modules[module_name].RegisterCallback(container_type.CONTAINER_TYPE, callback)
 
+  def RegisterRequiredColumns(
+      self, module_name: str, columns: Iterable[str]) -> None:
+    """Declares the columns a module consumes from its dependencies.
+
+    Args:
+      module_name: The module name declaring the columns
+      columns: The consumed column names
+
+    Raises:
+      RuntimeError: If the manager has not been configured with a recipe yet, or
+          if the module does not exist.
+    """
+    if not self._modules:
+      raise RuntimeError('Container manager has not parsed a recipe yet')
+    if module_name not in self._modules:
+      raise RuntimeError('Registering columns for a non-existent module')
+
+    with self._mutex:
+      module = self._modules[module_name]
+      module.required_columns = (module.required_columns or set()) | set(columns)
+
+  def GetRequiredColumns(self, module_name: str) -> set[str] | None:
+    """Returns the columns consumed by the modules depending on a module.
+
+    Modules that produce records can use this to only fetch the columns that
+    are used downstream.
+
+    Args:
+      module_name: The module producing records.
+
+    Returns:
+      The union of the columns declared by the modules that depend on the given
+      module, or None if any of them has not declared its columns, or if no
+      module depends on it.
+
+    Raises:
+      RuntimeError: If the manager has not been configured with a recipe yet.
+    """
+    if not self._modules:
+      raise RuntimeError('Container manager has not parsed a recipe yet')
+
+    with self._mutex:
+      dependants = [
+          module for module in self._modules.values()
+          if module_name in module.dependencies and module.name != module_name]
+      if not dependants or any(
+          module.required_columns is None for module in dependants):
+        return None
+      return set().union(*(module.required_columns for module in dependants))
+
   def WaitForCallbackCompletion(self) -> None:
     """Waits for all scheduled callbacks to be completed."""
     self._callback_pool.shutdown(wait=True)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Reads EBS snapshots with the EBS direct APIs.
+
+The EBS direct APIs (ListSnapshotBlocks and GetSnapshotBlock) give access to
+the blocks of a snapshot without creating a volume from it, attaching it to an
+instance and copying it from there. Only the blocks that were written are
+returned by ListSnapshotBlocks; the others read as zeros.
+
+See https://docs.aws.amazon.com/ebs/latest/userguide/ebs-accessing-snapshot.html
+"""
+
+import base64
+import collections
+import hashlib
+import math
+import os
+from concurrent import futures
+from typing import Any, Callable, Iterator, Optional
+
+# Size of the parts of a multipart upload to S3. Parts must be at least
+# 5 MiB, and an upload has at most 10,000 parts.
+S3_PART_SIZE = 16 * 1024 * 1024
+S3_MAX_PARTS = 10000
+
+# Maximum number of bytes of upload parts held in memory at once. Parts grow
+# with the volume size, so fewer of them are uploaded at once for large
+# volumes. A single part is always allowed.
+MAX_BYTES_IN_FLIGHT = 512 * 1024 * 1024
+
+# Maximum number of blocks listed per ListSnapshotBlocks call.
+_LIST_BLOCKS_PAGE_SIZE = 10000
+
+_GIB = 1024 * 1024 * 1024
+
+
+class SnapshotBlockReader:
+  """Reads the blocks of an EBS snapshot in parallel.
+
+  Attributes:
+    snapshot_id: The snapshot ID.
+    volume_size: Size of the snapshot volume, in bytes.
+    block_size: Size of the snapshot blocks, in bytes.
+    blocks: Tokens of the allocated blocks, by block index.
+  """
+
+  def __init__(self,
+               ebs_client: Any,
+               snapshot_id: str,
+               max_workers: int = 16,
+               max_bytes_in_flight: int = MAX_BYTES_IN_FLIGHT) -> None:
+    """Initializes the reader.
+
+    Args:
+      ebs_client: A boto3 EBS client.
+      snapshot_id: The snapshot ID.
+      max_workers: Maximum number of blocks or parts transferred at once.
+      max_bytes_in_flight: Maximum number of bytes of upload parts held in
+          memory at once.
+    """
+    self._ebs = ebs_client
+    self._max_workers = max(1, max_workers)
+    self._max_bytes_in_flight = max_bytes_in_flight
+    self.snapshot_id = snapshot_id
+    self.volume_size = 0
+    self.block_size = 0
+    self.blocks: dict[int, str] = {}
+
+  def ListBlocks(self) -> None:
+    """Lists the allocated blocks of the snapshot."""
+    self.blocks = {}
+    kwargs = {
+        'SnapshotId': self.snapshot_id,
+        'MaxResults': _LIST_BLOCKS_PAGE_SIZE,
+    }
+    while True:
+      response = self._ebs.list_snapshot_blocks(**kwargs)
+      self.volume_size = int(response['VolumeSize']) * _GIB
+      self.block_size = int(response['BlockSize'])
+      for block in response.get('Blocks', []):
+        self.blocks[int(block['BlockIndex'])] = block['BlockToken']
+      if not response.get('NextToken'):
+        return
+      kwargs['NextToken'] = response['NextToken']
+
+  def ReadBlock(self, index: int) -> bytes:
+    """Reads a block of the snapshot.
+
+    Args:
+      index: The block index.
+
+    Returns:
+      The block data. Unallocated blocks are read as zeros.
+
+    Raises:
+      ValueError: If the block data does not match its checksum.
+    """
+    token = self.blocks.get(index)
+    if token is None:
+      return bytes(self.block_size)
+    response = self._ebs.get_snapshot_block(
+        SnapshotId=self.snapshot_id, BlockIndex=index, BlockToken=token)
+    data: bytes = response['BlockData'].read()
+    if response.get('ChecksumAlgorithm') == 'SHA256':
+      checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+      if checksum != response.get('Checksum'):
+        raise ValueError(
+            f'Checksum mismatch for block {index:d} of {self.snapshot_id:s}')
+    return data
+
+  def ReadRange(self,
+                offset: int,
+                size: int,
+                executor: Optional[futures.Executor] = None) -> bytes:
+    """Reads a block aligned range of the snapshot.
+
+    Args:
+      offset: Offset of the range, a multiple of the block size.
+      size: Size of the range.
+      executor: Optional. Executor reading the blocks of the range
+          concurrently. Blocks are read one after the other by default.
+
+    Returns:
+      The range data.
+    """
+    first = offset // self.block_size
+    last = math.ceil(min(offset + size, self.volume_size) / self.block_size)
+    if executor:
+      return b''.join(executor.map(self.ReadBlock, range(first, last)))
+    return b''.join(self.ReadBlock(index) for index in range(first, last))
+
+  def _MapInOrder(self,
+                  chunk_size: int,
+                  function: Callable[[int], Any],
+                  max_in_flight: int) -> Iterator[Any]:
+    """Applies a function to every chunk of the snapshot in parallel.
+
+    At most max_in_flight chunks are in flight at a time, so the memory used
+    is bounded however large the snapshot is.
+
+    Args:
+      chunk_size: Size of the chunks, a multiple of the block size.
+      function: Function called with the offset of each chunk.
+      max_in_flight: Maximum number of chunks in flight.
+
+    Yields:
+      The result of the function for each chunk, in order.
+    """
+    offsets = iter(range(0, self.volume_size, chunk_size))
+    with futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+      in_flight: collections.deque[futures.Future[Any]] = collections.deque()
+      for offset in offsets:
+        in_flight.append(executor.submit(function, offset))
+        if len(in_flight) >= max_in_flight:
+          yield in_flight.popleft().result()
+      while in_flight:
+        yield in_flight.popleft().result()
+
+  def WriteSparseImage(self, path: str) -> str:
+    """Writes the snapshot to a raw image, leaving unallocated blocks sparse.
+
+    Args:
+      path: Path of the image to write.
+
+    Returns:
+      The SHA-256 hash of the image.
+    """
+    if not self.block_size:
+      self.ListBlocks()
+    sha256 = hashlib.sha256()
+    zeros = bytes(self.block_size)
+    with open(path, 'wb') as image:
+      image.truncate(self.volume_size)
+      fd = image.fileno()
+
+      def _CopyBlock(offset: int) -> bytes:
+        index = offset // self.block_size
+        if index not in self.blocks:
+          return zeros
+        data = self.ReadBlock(index)
+        os.pwrite(fd, data, offset)
+        return data
+
+      for data in self._MapInOrder(
+          self.block_size, _CopyBlock, self._max_workers):
+        sha256.update(data)
+    return sha256.hexdigest()
+
+  def UploadToS3(self, s3_client: Any, bucket: str, key: str) -> str:
+    """Streams the snapshot to S3 as a raw image, with a multipart upload.
+
+    Args:
+      s3_client: A boto3 S3 client.
+      bucket: The destination bucket.
+      key: The destination object key.
+
+    Returns:
+      The SHA-256 hash of the image.
+    """
+    if not self.block_size:
+      self.ListBlocks()
+    part_size = max(
+        S3_PART_SIZE, math.ceil(self.volume_size / S3_MAX_PARTS))
+    part_size = math.ceil(part_size / self.block_size) * self.block_size
+    max_parts = max(
+        1, min(self._max_workers, self._max_bytes_in_flight // part_size))
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket, Key=key)['UploadId']
+
+    # The blocks of the parts in flight share one pool of workers.
+    block_executor = futures.ThreadPoolExecutor(max_workers=self._max_workers)
+
+    def _UploadPart(offset: int) -> tuple[dict[str, Any], bytes]:
+      data = self.ReadRange(offset, part_size, block_executor)
+      part_number = offset // part_size + 1
+      response = s3_client.upload_part(
+          Bucket=bucket, Key=key, UploadId=upload_id,
+          PartNumber=part_number, Body=data)
+      return {'ETag': response['ETag'], 'PartNumber': part_number}, data
+
+    sha256 = hashlib.sha256()
+    parts = []
+    try:
+      with block_executor:
+        for part, data in self._MapInOrder(part_size, _UploadPart, max_parts):
+          parts.append(part)
+          sha256.update(data)
+    except Exception:
+      s3_client.abort_multipart_upload(
+          Bucket=bucket, Key=key, UploadId=upload_id)
+      raise
+    s3_client.complete_multipart_upload(
+        Bucket=bucket, Key=key, UploadId=upload_id,
+        MultipartUpload={'Parts': parts})
+    return sha256.hexdigest()
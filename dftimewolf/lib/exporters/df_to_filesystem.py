@@ -69,9 +69,13 @@ class DataFrameToDiskExporter(module.BaseModule):
 
     self._formats: list[str] = []
     self._output_dir: str = ''
+    self._columns: list[str] = []
 
   # pylint: disable=arguments-differ
-  def SetUp(self, output_formats: str, output_directory: str) -> None:
+  def SetUp(self,
+            output_formats: str,
+            output_directory: str,
+            columns: str | None = None) -> None:
     """Set up the module.
 
     Args:
@@ -79,7 +83,13 @@ class DataFrameToDiskExporter(module.BaseModule):
           csv, jsonl, markdown. If not specified, 'jsonl' is used.
       output_directory: Where to write the output. The directory is created if
           it doesn't already exist.
+      columns: Comma separated columns to export. If not specified, all columns
+          are exported.
     """
+    if columns:
+      self._columns = [c.strip() for c in columns.split(',') if c.strip()]
+      self.RegisterRequiredColumns(self._columns)
+
     if output_formats:
       self._formats = [
         s.strip().lower() for s in output_formats.split(',') if s]
@@ -148,7 +158,10 @@ class DataFrameToDiskExporter(module.BaseModule):
 
       self.logger.debug(f'Exporting {container.name} to {output_path}')
 
-      self._ExportSingleDataframe(df=container.data_frame,
+      df = container.data_frame
+      if self._columns:
+        df = df[[c for c in self._columns if c in df.columns]]
+      self._ExportSingleDataframe(df=df,
                                   output_format=f,
                                   output_path=output_path)
 
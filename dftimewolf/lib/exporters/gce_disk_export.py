@@ -1,7 +1,14 @@
 # -*- coding: utf-8 -*-
 """Export disk image from a GCP project to Google Cloud Storage."""
 
-from typing import Callable
+import dataclasses
+import os
+import time
+from typing import Any, Callable, Optional
+
+from googleapiclient.errors import HttpError
+from libcloudforensics.providers.gcp.internal import build
+from libcloudforensics.providers.gcp.internal import common
 from libcloudforensics.providers.gcp.internal import project as gcp_project
 
 from dftimewolf.lib.containers import containers
@@ -14,6 +21,32 @@ from dftimewolf.lib.exporters.gce_disk_export_base import GoogleCloudDiskExportB
 
 # pylint: disable=line-too-long
 
+# Seconds to wait between two polls of the in-flight operations.
+POLL_INTERVAL = 5
+
+# Cloud Build image used by `gcloud compute images export`.
+_EXPORT_BUILD_IMAGE = 'gcr.io/compute-image-import/gce_vm_image_export:release'
+
+
+@dataclasses.dataclass
+class _DiskExport:
+  """State of the export of one disk.
+
+  Attributes:
+    source_disk: The disk being exported.
+    image_name: Name of the temporary image created from the disk.
+    output_url: GCS path the image is exported to.
+    stage: The running stage: "image", "build" or "delete".
+    operation: The running Compute Engine or Cloud Build operation.
+    failed: True if the image could not be exported.
+  """
+  source_disk: containers.GCEDisk
+  image_name: str
+  output_url: str
+  stage: str = 'image'
+  operation: dict[str, Any] = dataclasses.field(default_factory=dict)
+  failed: bool = False
+
 
 class GoogleCloudDiskExport(GoogleCloudDiskExportBase):
   """Google Cloud Platform (GCP) Disk Export.
@@ -46,8 +79,11 @@ class GoogleCloudDiskExport(GoogleCloudDiskExportBase):
     self._gcs_output_location: str = ''
     self._image_format: str = ''
     self._exported_image_name: str = ''
+    self._max_concurrent_exports = 1
+    self._export_zone = ''
+    self._cloud_build: build.GoogleCloudBuild
 
-  # pylint: disable=arguments-differ
+  # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(self,
             source_project_name: str,
             gcs_output_location: str,
@@ -56,7 +92,9 @@ class GoogleCloudDiskExport(GoogleCloudDiskExportBase):
             remote_instance_name: str,
             all_disks: bool,
             exported_image_name: str,
-            image_format: str) -> None:
+            image_format: str,
+            max_concurrent_exports: int = 5,
+            export_zone: Optional[str] = None) -> None:
     """Sets up a Google Cloud Platform (GCP) Disk Export.
 
     This method creates the required objects to initialize
@@ -97,8 +135,18 @@ class GoogleCloudDiskExport(GoogleCloudDiskExportBase):
           is selected, exported image name as
           "exported-image-{TIMESTAMP('%Y%m%d%H%M%S')}".
       image_format: The image format to use.
+      max_concurrent_exports: Optional. Maximum number of disks being
+          exported at the same time. Default is 5.
+      export_zone: Optional. Zone the Cloud Build export workers run in.
+          Defaults to the default zone of the analysis project.
     """
+    if exported_image_name and not common.REGEX_DISK_NAME.match(
+        exported_image_name):
+      self.ModuleError(
+          f'Exported image name {exported_image_name} does not comply with '
+          f'{common.REGEX_DISK_NAME.pattern}', critical=True)
     self._image_format = image_format
+    self._max_concurrent_exports = max(1, int(max_concurrent_exports))
     self._gcs_output_location = gcs_output_location
     self._exported_image_name = exported_image_name
 
@@ -107,6 +155,7 @@ class GoogleCloudDiskExport(GoogleCloudDiskExportBase):
       self._analysis_project = gcp_project.GoogleCloudProject(analysis_project_name)
     else:
       self._analysis_project = self._source_project
+    self._export_zone = export_zone or self._analysis_project.default_zone
 
     if remote_instance_name:
       instance_disks = self._GetDisksFromInstance(instance_name=remote_instance_name,
@@ -126,24 +175,226 @@ class GoogleCloudDiskExport(GoogleCloudDiskExportBase):
         self.StoreContainer(container, for_self_only=True)
 
   def Process(self) -> None:
-    """Creates and exports disk image to the output bucket."""
+    """Creates and exports disk images to the output bucket.
+
+    Image creations, exports and deletions of all disks are started without
+    waiting on each other, up to max_concurrent_exports disks at a time, and
+    their operations are polled together. Each exported image is stored as
+    soon as its export completes.
+    """
+    self._cloud_build = build.GoogleCloudBuild(
+        self._analysis_project.project_id)
+    pending = []
     for source_disk in self.GetContainers(containers.GCEDisk):
       if source_disk.project != self._source_project.project_id:
         self.logger.info('Source project mismatch: skipping %s', str(source_disk))
         continue
+      pending.append(source_disk)
+
+    # The requested output name can only be used if it is not shared.
+    output_name = self._exported_image_name if len(pending) == 1 else None
+    in_flight: list[_DiskExport] = []
+    while pending or in_flight:
+      while pending and len(in_flight) < self._max_concurrent_exports:
+        export = self._StartImageCreation(pending.pop(0), output_name)
+        if export:
+          in_flight.append(export)
+
+      progressed = False
+      for export in list(in_flight):
+        try:
+          operation = self._PollOperation(export)
+          if operation is None:
+            continue
+          progressed = True
+          running = self._AdvanceExport(export, operation)
+        except HttpError as exception:
+          # Only this export fails, its temporary image is still deleted.
+          progressed = True
+          running = self._FailExport(export, exception)
+        if not running:
+          in_flight.remove(export)
+      if in_flight and not progressed:
+        time.sleep(POLL_INTERVAL)
+
+  def _StartImageCreation(
+      self,
+      source_disk: containers.GCEDisk,
+      output_name: Optional[str]) -> Optional[_DiskExport]:
+    """Starts creating the temporary image of a disk.
+
+    Args:
+      source_disk: The disk to export.
+      output_name: Name of the exported file, without extension. Defaults to
+          the image name.
+
+    Returns:
+      The export state, or None if the image creation could not be started.
+    """
+    disk = self._source_project.compute.GetDisk(source_disk.name)
+    image_name = common.GenerateUniqueInstanceName(
+        disk.name, common.COMPUTE_NAME_LIMIT)
+    output_url = os.path.join(
+        self._gcs_output_location, output_name or image_name)
+    output_url += f'.{self._image_format}' if self._image_format else '.tar.gz'
+    export = _DiskExport(
+        source_disk=source_disk, image_name=image_name, output_url=output_url)
+
+    self.logger.info(f'Creating image {image_name} from disk {disk.name}')
+    images = self._analysis_project.compute.GceApi().images()  # pylint: disable=no-member
+    try:
+      export.operation = images.insert(
+          project=self._analysis_project.project_id,
+          forceCreate=True,
+          body={
+              'name': image_name,
+              'sourceDisk': f'projects/{disk.project_id}/zones/{disk.zone}/disks/{disk.name}',
+          }).execute()
+    except HttpError as exception:
+      self.ModuleError(
+          f'Could not create an image from disk {disk.name}: {exception}')
+      return None
+    return export
+
+  def _PollOperation(self, export: _DiskExport) -> Optional[dict[str, Any]]:
+    """Polls the running operation of an export.
+
+    Args:
+      export: The export to poll.
+
+    Returns:
+      The operation if it is done, None otherwise.
+    """
+    project_id = self._analysis_project.project_id
+    if export.stage == 'build':
+      operations = self._cloud_build.GcbApi().operations()  # pylint: disable=no-member
+      operation: dict[str, Any] = operations.get(
+          name=export.operation['name']).execute()
+      return operation if operation.get('done') else None
+
+    operations = self._analysis_project.compute.GceApi().globalOperations()  # pylint: disable=no-member
+    operation = operations.get(
+        project=project_id, operation=export.operation['name']).execute()
+    return operation if operation.get('status') == 'DONE' else None
+
+  def _AdvanceExport(
+      self, export: _DiskExport, operation: dict[str, Any]) -> bool:
+    """Starts the next stage of an export once its operation is done.
 
-      image_object = self._analysis_project.compute.CreateImageFromDisk(
-          self._source_project.compute.GetDisk(source_disk.name))
-      # If self.exported_image_name = None, default output_name is
-      # {src_disk.name}-{TIMESTAMP('%Y%m%d%H%M%S')}.tar.gz
-      output_url = image_object.ExportImage(self._gcs_output_location,
-                                            output_name=self._exported_image_name,
-                                            image_format=self._image_format)
-      image_object.Delete()
-      self.logger.info(f'Disk was exported to: {output_url}')
-      container = containers.GCSObject(path=output_url)
-      container.metadata.update(source_disk.metadata)
+    Args:
+      export: The export to advance.
+      operation: The completed operation of the current stage.
+
+    Returns:
+      False if the export is finished, True otherwise.
+    """
+    error = operation.get('error')
+    if export.stage == 'image':
+      if error:
+        self.ModuleError(
+            f'Could not create image {export.image_name}: {error}')
+        return False
+      export.operation = self._cloud_build.CreateBuild(
+          self._ExportBuildBody(export))
+      export.stage = 'build'
+      return True
+
+    if export.stage == 'build':
+      if error:
+        export.failed = True
+        self.ModuleError(
+            f'Could not export image {export.image_name}: {error.get("message")}')
+      return self._DeleteImage(export)
+
+    if error:
+      self.logger.warning(
+          f'Could not delete temporary image {export.image_name}: {error}')
+    return self._FinishExport(export)
+
+  def _FailExport(self, export: _DiskExport, exception: HttpError) -> bool:
+    """Marks an export as failed after an API error, and cleans it up.
+
+    Args:
+      export: The failed export.
+      exception: The API error.
+
+    Returns:
+      False if the export is finished, True if its image is being deleted.
+    """
+    if export.stage == 'delete':
+      # The export itself is done, only its image deletion failed.
+      self.logger.warning(
+          f'Could not delete temporary image {export.image_name}: {exception}')
+      return self._FinishExport(export)
+    export.failed = True
+    self.ModuleError(
+        f'Could not export disk {export.source_disk.name}: {exception}')
+    return self._DeleteImage(export)
+
+  def _DeleteImage(self, export: _DiskExport) -> bool:
+    """Starts deleting the temporary image of an export.
+
+    Args:
+      export: The export to delete the image of.
+
+    Returns:
+      True if the deletion was started, False if the export is finished.
+    """
+    export.stage = 'delete'
+    images = self._analysis_project.compute.GceApi().images()  # pylint: disable=no-member
+    try:
+      export.operation = images.delete(
+          project=self._analysis_project.project_id,
+          image=export.image_name).execute()
+    except HttpError as exception:
+      self.logger.warning(
+          f'Could not delete temporary image {export.image_name}: {exception}')
+      return self._FinishExport(export)
+    return True
+
+  def _FinishExport(self, export: _DiskExport) -> bool:
+    """Stores the exported image of an export, unless it failed.
+
+    Args:
+      export: The finished export.
+
+    Returns:
+      False, as the export is finished.
+    """
+    if not export.failed:
+      self.logger.info(f'Disk was exported to: {export.output_url}')
+      container = containers.GCSObject(path=export.output_url)
+      container.metadata.update(export.source_disk.metadata)
       self.StoreContainer(container)
+    return False
+
+  def _ExportBuildBody(self, export: _DiskExport) -> dict[str, Any]:
+    """Returns the Cloud Build request exporting an image to GCS.
+
+    Args:
+      export: The export to build the request for.
+    """
+    # Mirrors the request of libcloudforensics GoogleComputeImage.ExportImage,
+    # which blocks until the build is done, so that exports can be polled
+    # together. Keep both in sync.
+    build_args = [
+        f'-source_image={export.image_name}',
+        f'-destination_uri={export.output_url}',
+        '-timeout=86400s',
+        '-client_id=api',
+        f'-zone={self._export_zone}',
+    ]
+    if self._image_format:
+      build_args.append(f'-format={self._image_format}')
+    return {
+        'timeout': '86400s',
+        'steps': [{
+            'args': build_args,
+            'name': _EXPORT_BUILD_IMAGE,
+            'env': [],
+        }],
+        'tags': ['gce-daisy', 'gce-daisy-image-export'],
+    }
 
 
 modules_manager.ModulesManager.RegisterModule(GoogleCloudDiskExport)
@@ -23,7 +23,7 @@ The export process happen in the following order:
 
 import os
 import time
-from typing import Callable
+from typing import Any, Callable
 
 from libcloudforensics.providers.gcp.internal import common as gcp_common
 from libcloudforensics.providers.gcp.internal import project as gcp_project
@@ -40,6 +40,18 @@ from utils import utils
 
 _EXPORT_STARTUP_SCRIPT = 'export_machine_startup_script.sh'
 
+# Bounds of the delay between two polls of the export instance, in seconds.
+# The delay doubles while no disk finishes exporting and is reset whenever
+# one does.
+MIN_POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 120
+
+# Export instance label values, keyed by disk name, set by the startup script
+# once the export of a disk has finished.
+_EXPORT_VERIFIED = 'archive_hash_verified'
+_EXPORT_FAILED = frozenset([
+    'archive_hash_not_verified', 'archived_disk_not_found_check_logs'])
+
 class GoogleCloudDiskExportStream(GoogleCloudDiskExportBase):
   """Google Cloud Platform (GCP) disk bit-stream export.
 
@@ -164,54 +176,82 @@ class GoogleCloudDiskExportStream(GoogleCloudDiskExportBase):
       data_disks=self._source_disks,
       additional_scopes=['https://www.googleapis.com/auth/cloud-platform'])
 
-    while not self._ExportJobFinished():
-      self.logger.info(
-        ('Waiting for export instance {0:s} to finish exporting disks. '
-        'This can take up-to few minutes or hours depending on disks size. '
-        'All non-boot disk must have "archive" and "archive_hash_verified" '
-        'labels equal "true" for the export job to finish.').format(
-          export_instance.name))
-      time.sleep(30)
-
-    export_instace_api_object = export_instance.GetOperation()
-    for disk in self._source_disks:
-      for key_value_dict in export_instace_api_object.get(
-        'metadata', {}).get('items', []):
-        if not key_value_dict['key'].startswith('archive_path_'):
-          continue
-        # Reading the last value of the partition result, which is sometimes
-        # prefixed with special characters making its position inconsistent.
-        archived_disk = key_value_dict['key'].partition('archive_path_')[-1]
-        if archived_disk == disk.name:
-          value_tuple = key_value_dict['value'].partition(r'\n')
-          disk_path_gcs = value_tuple[-1]
-          container = containers.URL(path=disk_path_gcs)
-          self.StoreContainer(container)
-          self.logger.info(
-            f'Disk "{archived_disk}" exported. Output path: {disk_path_gcs} '
-          )
-          self.logger.info(
-            "To import this disk as an image in a different project, please use"
-            " the following command: "
-          )
-          self.logger.info(
-            f"  gcloud compute images import {archived_disk} --source-file "
-            f"{disk_path_gcs} --data-disk --project={{PROJECT_ID}}"
-          )
+    self.logger.info(
+      ('Waiting for export instance {0:s} to finish exporting disks. '
+      'This can take up-to few minutes or hours depending on disks size. '
+      'The export instance labels each disk once its export is verified.'
+      ).format(export_instance.name))
+    self._WaitForExports(export_instance)
 
     export_instance.Delete()
 
-  def _ExportJobFinished(self) -> bool:
-    """Determines if export job has finished.
+  def _WaitForExports(
+      self, export_instance: compute.GoogleComputeInstance) -> None:
+    """Waits for the export of all disks, storing each one once exported.
+
+    The startup script labels the export instance with the status of each
+    disk, so a single instance lookup tracks all the disks. The lookups back
+    off exponentially while no disk finishes.
+
+    Args:
+      export_instance: The export instance.
+    """
+    pending = {disk.name for disk in self._source_disks}
+    interval = MIN_POLL_INTERVAL
+    while True:
+      export_instance_api_object = export_instance.GetOperation()
+      labels = export_instance_api_object.get('labels', {})
+      finished = {
+          name for name in pending
+          if labels.get(name) == _EXPORT_VERIFIED
+          or labels.get(name) in _EXPORT_FAILED}
+      for disk_name in sorted(finished):
+        if labels[disk_name] == _EXPORT_VERIFIED:
+          self._StoreExportedDisk(disk_name, export_instance_api_object)
+        else:
+          self.ModuleError(
+              f'Export of disk "{disk_name}" failed: {labels[disk_name]}')
+      pending -= finished
+      if not pending:
+        return
+      interval = (
+          MIN_POLL_INTERVAL if finished
+          else min(interval * 2, MAX_POLL_INTERVAL))
+      time.sleep(interval)
 
-    Returns:
-      True if export is done, else False.
+  def _StoreExportedDisk(
+      self,
+      disk_name: str,
+      export_instance_api_object: dict[str, Any]) -> None:
+    """Stores the GCS path of an exported disk.
+
+    Args:
+      disk_name: Name of the exported disk.
+      export_instance_api_object: The export instance API object, whose
+          metadata holds the GCS path of each disk.
     """
-    for disk in self._source_disks:
-      labels_dict = disk.GetLabels()
-      label_value = labels_dict.get('archive_hash_verified', False)
-      if not label_value  or label_value != 'true':
-        return False # no need to continue checking other labels
-    return True
+    for key_value_dict in export_instance_api_object.get(
+      'metadata', {}).get('items', []):
+      if not key_value_dict['key'].startswith('archive_path_'):
+        continue
+      # Reading the last value of the partition result, which is sometimes
+      # prefixed with special characters making its position inconsistent.
+      archived_disk = key_value_dict['key'].partition('archive_path_')[-1]
+      if archived_disk == disk_name:
+        value_tuple = key_value_dict['value'].partition(r'\n')
+        disk_path_gcs = value_tuple[-1]
+        container = containers.URL(path=disk_path_gcs)
+        self.StoreContainer(container)
+        self.logger.info(
+          f'Disk "{archived_disk}" exported. Output path: {disk_path_gcs} '
+        )
+        self.logger.info(
+          "To import this disk as an image in a different project, please use"
+          " the following command: "
+        )
+        self.logger.info(
+          f"  gcloud compute images import {archived_disk} --source-file "
+          f"{disk_path_gcs} --data-disk --project={{PROJECT_ID}}"
+        )
 
 modules_manager.ModulesManager.RegisterModule(GoogleCloudDiskExportStream)
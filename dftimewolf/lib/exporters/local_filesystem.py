@@ -4,9 +4,10 @@
 import os
 import shutil
 import tempfile
+from concurrent import futures
 from typing import Optional, Callable
 
-from dftimewolf.lib import module, utils
+from dftimewolf.lib import file_copy, module, utils
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
 from dftimewolf.lib import cache
@@ -35,19 +36,30 @@ class LocalFilesystemCopy(module.BaseModule):
                      publish_message_callback=publish_message_callback)
     self._target_directory = str()
     self._compress = False
+    self._max_workers: Optional[int] = None
+    self._use_hardlinks = False
 
   # pylint: disable=arguments-differ
   def SetUp(self,
             target_directory: Optional[str]=None,
-            compress: bool=False) -> None:
+            compress: bool=False,
+            max_workers: Optional[int]=None,
+            use_hardlinks: bool=False) -> None:
     """Sets up the _target_directory attribute.
 
     Args:
       target_directory (Optional[str]): path of the directory in which
           collected files will be copied.
       compress (bool): Whether to compress the resulting directory or not
+      max_workers (Optional[int]): Maximum number of files copied or
+          compressed at once. Defaults to the ThreadPoolExecutor default.
+      use_hardlinks (bool): Whether to hardlink the copies to the collected
+          files when they are on the same filesystem. The copies then share
+          their data with the collected files.
     """
     self._compress = compress
+    self._max_workers = int(max_workers) if max_workers else None
+    self._use_hardlinks = use_hardlinks
     if not target_directory:
       self._target_directory = tempfile.mkdtemp(prefix='dftimewolf_local_fs')
     else:
@@ -55,68 +67,73 @@ class LocalFilesystemCopy(module.BaseModule):
 
   def Process(self) -> None:
     """Checks whether the paths exists and updates the state accordingly."""
-    for file_container in self.GetContainers(containers.File, pop=True):
+    file_containers = self.GetContainers(containers.File, pop=True)
+    for file_container in file_containers:
       self.logger.debug(
         "{0:s} -> {1:s}".format(file_container.path, self._target_directory)
       )
 
-      if not self._compress:
+    if not self._compress:
+      full_paths = self._CopyFilesOrDirectories(
+          [file_container.path for file_container in file_containers],
+          self._target_directory)
+      for path_ in full_paths:
+        file_name = os.path.basename(path_)
+        self.StoreContainer(containers.File(name=file_name, path=path_))
+      return
+
+    with futures.ThreadPoolExecutor(
+        max_workers=self._max_workers) as executor:
+      compressions = [
+          (file_container, executor.submit(
+              utils.Compress, file_container.path, self._target_directory))
+          for file_container in file_containers]
+      for file_container, future in compressions:
         try:
-          full_paths = self._CopyFileOrDirectory(
-              file_container.path, self._target_directory)
-        except OSError as exception:
-          self.ModuleError(
-              'Could not copy files to {0:s}: {1!s}'.format(
-                  self._target_directory, exception),
-              critical=True)
-        for path_ in full_paths:
-          file_name = os.path.basename(path_)
-          self.StoreContainer(containers.File(name=file_name, path=path_))
-      else:
-        try:
-          tar_file = utils.Compress(file_container.path, self._target_directory)
-          out_container = containers.File(
-              name=os.path.basename(tar_file), path=tar_file)
-          out_container.metadata.update(file_container.metadata)
-          self.StoreContainer(out_container)
-          self.logger.info(
-              f'{file_container.path} was compressed into {tar_file}')
+          tar_file = future.result()
         except RuntimeError as exception:
           self.ModuleError(str(exception), critical=True)
-          return
+        out_container = containers.File(
+            name=os.path.basename(tar_file), path=tar_file)
+        out_container.metadata.update(file_container.metadata)
+        self.StoreContainer(out_container)
+        self.logger.info(
+            f'{file_container.path} was compressed into {tar_file}')
 
-  def _CopyFileOrDirectory(
-      self, source: str, destination_directory: str) -> list[str]:
-    """Recursively copies files from source to destination_directory.
+  def _CopyFilesOrDirectories(
+      self, sources: list[str], destination_directory: str) -> list[str]:
+    """Recursively copies files from sources to destination_directory.
 
     Files will be copied to `destination_directory`'s root. Directories
-    will be copied to subdirectories in `destination_directory`.
+    will be copied to subdirectories in `destination_directory`. Files are
+    copied in parallel, with reflinks or copy_file_range where the
+    filesystems support them.
 
     Args:
-      source (str): source file or directory to copy into the destination
-          directory.
+      sources (list[str]): source files or directories to copy into the
+          destination directory.
       destination_directory (str): destination directory in which to copy
-          source.
+          the sources.
 
     Returns:
       list[str]: The full copied output paths.
     """
     full_paths = []
-    if os.path.isdir(source):
-      try:
-        basename = os.path.basename(source)
-        full_paths.append(shutil.copytree(
-            source,
-            os.path.join(destination_directory, basename),
-            dirs_exist_ok=True))
-      except shutil.Error as e:
-        self.ModuleError(str(e), critical=True)
-    else:
+    with file_copy.ParallelCopier(
+        max_workers=self._max_workers,
+        use_hardlinks=self._use_hardlinks) as copier:
       try:
-        full_paths.append(shutil.copy2(source, destination_directory))
-      except shutil.SameFileError as exception:
-        self.logger.warning(str(exception))
-
+        for source in sources:
+          try:
+            full_paths.append(copier.Copy(source, destination_directory))
+          except shutil.SameFileError as exception:
+            self.logger.warning(str(exception))
+        copier.Wait()
+      except OSError as exception:
+        self.ModuleError(
+            'Could not copy files to {0:s}: {1!s}'.format(
+                destination_directory, exception),
+            critical=True)
     return full_paths
 
 
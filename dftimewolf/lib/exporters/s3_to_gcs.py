@@ -1,24 +1,50 @@
 # -*- coding: utf-8 -*-
 """Export objects from AWS S3 to a GCP GCS bucket."""
 
+import csv
+import datetime
+import io
+import json
+import os
 import re
-from typing import Any, Callable, Type
+import time
+import uuid
+from typing import Any, Callable, Iterator, Optional
 
+from libcloudforensics.providers.aws.internal import account
 from libcloudforensics.providers.gcp.internal import project as gcp_project
 from libcloudforensics.providers.utils.storage_utils import SplitStoragePath
 from libcloudforensics.errors import ResourceCreationError
 from google.cloud.storage.client import Client as storage_client
 from dftimewolf.lib import module
-from dftimewolf.lib.containers import containers, interface
+from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
 from dftimewolf.lib import cache
 from dftimewolf.lib import spanner_telemetry as telemetry
 from dftimewolf.lib.containers import manager as container_manager
 
 
-class S3ToGCSCopy(module.ThreadAwareModule):
+# Maximum number of objects listed in the manifest of a single transfer job.
+MAX_OBJECTS_PER_JOB = 10000
+
+# Seconds to wait between two polls of the transfer jobs.
+POLL_INTERVAL = 5
+
+# Folder of the destination bucket the transfer manifests are written to.
+MANIFEST_FOLDER = 'dftimewolf-transfer-manifests'
+
+# Maximum number of objects that failed to copy named in an error message.
+MAX_REPORTED_FAILURES = 10
+
+
+class S3ToGCSCopy(module.BaseModule):
   """AWS S3 objects to GCP GCS.
 
+  Objects are copied by Storage Transfer Service jobs, one per source bucket
+  and batch of MAX_OBJECTS_PER_JOB objects. Each job copies the objects listed
+  in a manifest written to the destination bucket, and all jobs are polled
+  together.
+
   Attributes:
     aws_region (str): AWS region (for account.AWSAccount creation).
     dest_project (gcp_project.GoogleCloudProject): Destination project with the
@@ -58,6 +84,7 @@ class S3ToGCSCopy(module.ThreadAwareModule):
     self.dest_bucket: str = ''
     self.filter: Any = None
     self.bucket_exists = False
+    self._storage_client: Optional[storage_client] = None
 
   # pylint: disable=arguments-differ
   def SetUp(self,
@@ -94,8 +121,84 @@ class S3ToGCSCopy(module.ThreadAwareModule):
       for obj in s3_objects.split(','):
         self.StoreContainer(containers.AWSS3Object(obj))
 
-  def PreProcess(self) -> None:
-    """Prep work for copying objects from S3 to GCS - Bucket creation."""
+  def Process(self) -> None:
+    """Copies the objects from S3 to the destination GCS bucket."""
+    s3_objects: dict[str, list[str]] = {}
+    for container in self.GetContainers(containers.AWSS3Object):
+      if self.filter and not self.filter.match(container.path):
+        self.logger.debug(
+          "{0:s} does not match filter. Skipping.".format(container.path)
+        )
+        continue
+      s3_bucket, s3_path = SplitStoragePath(container.path)
+      s3_objects.setdefault(s3_bucket, []).append(s3_path)
+    if not s3_objects:
+      return
+
+    self._PrepareBucket()
+    aws_credentials = self._GetAWSCredentials()
+
+    jobs: dict[str, tuple[str, list[str]]] = {}
+    for s3_bucket, s3_paths in sorted(s3_objects.items()):
+      s3_paths = sorted(set(s3_paths))
+      for start in range(0, len(s3_paths), MAX_OBJECTS_PER_JOB):
+        batch = s3_paths[start:start + MAX_OBJECTS_PER_JOB]
+        manifest = self._WriteManifest(batch)
+        job_name = self._CreateTransferJob(
+            s3_bucket, manifest, aws_credentials)
+        self.logger.info(
+            f'Transfer job {job_name} copies {len(batch)} objects from '
+            f's3://{s3_bucket}')
+        jobs[job_name] = (manifest, batch)
+
+    for job_name, operation in self._WaitForTransferJobs(list(jobs)):
+      manifest, batch = jobs[job_name]
+      self._DeleteManifest(manifest)
+      if operation.get('error'):
+        self.ModuleError(
+            f'Transfer job {job_name} failed: {operation["error"]}')
+        continue
+      counters = operation.get('metadata', {}).get('counters', {})
+      self.logger.info(
+          'Transfer job {0:s} copied {1:s}/{2:s} objects ({3:s} bytes).'.format(
+              job_name,
+              counters.get('objectsCopiedToSink', '0'),
+              counters.get('objectsFoundFromSource', '0'),
+              counters.get('bytesCopiedToSink', '0')))
+      copied = self._ListCopiedObjects(batch, counters)
+      if len(copied) < len(batch):
+        missing = sorted(set(batch) - set(copied))
+        self.ModuleError(
+            f'Transfer job {job_name} failed to copy {len(missing)} objects: '
+            f'{", ".join(missing[:MAX_REPORTED_FAILURES])}')
+      for s3_path in copied:
+        self.StoreContainer(
+            containers.GCSObject(self.dest_bucket + '/' + s3_path))
+
+  def _ListCopiedObjects(
+      self, s3_paths: list[str], counters: dict[str, str]) -> list[str]:
+    """Returns the objects of a transfer job that reached the destination.
+
+    Objects can fail to copy without failing the job, in which case the
+    destination bucket is listed to find the objects that were copied.
+
+    Args:
+      s3_paths: Paths of the objects the job transferred.
+      counters: The counters of the transfer operation.
+
+    Returns:
+      The paths of the objects present in the destination bucket.
+    """
+    if not int(counters.get('objectsFromSourceFailed', '0')):
+      return s3_paths
+    client = self._GetStorageClient()
+    blobs = client.list_blobs(
+        self.dest_bucket, prefix=os.path.commonprefix(s3_paths))
+    present = {blob.name for blob in blobs}
+    return [s3_path for s3_path in s3_paths if s3_path in present]
+
+  def _PrepareBucket(self) -> None:
+    """Creates the destination bucket if needed and grants access to it."""
     # Check if the destination bucket exists. If not, create it.
     if not self.bucket_exists:
       try:
@@ -110,27 +213,129 @@ class S3ToGCSCopy(module.ThreadAwareModule):
     except Exception as exception: # pylint: disable=broad-except
       self.ModuleError(str(exception), critical=True)
 
-  def Process(self, container: containers.AWSS3Object) -> None:  # pyrefly: ignore[bad-override]
-    """Creates and exports disk image to the output bucket."""
-    if self.filter and not self.filter.match(container.path):
-      self.logger.debug(
-        "{0:s} does not match filter. Skipping.".format(container.path)
-      )
-      return
-
+  def _GetAWSCredentials(self) -> Any:
+    """Returns the long term AWS credentials the transfer jobs use."""
     # Grab the first AWS Availability Zone in the region. AWS availability zones
     # are named for the region, appended with a, b, c...
     az = self.aws_region + 'a'
+    aws_credentials = account.AWSAccount(az).session.get_credentials()
+    if (aws_credentials is None or aws_credentials.access_key is None or
+        aws_credentials.access_key.startswith('ASIA')):
+      self.ModuleError(
+          'Could not create transfer. No long term AWS credentials available',
+          critical=True)
+    return aws_credentials
+
+  def _GetStorageClient(self) -> storage_client:
+    """Returns the GCS client of the destination project."""
+    if not self._storage_client:
+      self._storage_client = storage_client(project=self.dest_project_name)
+    return self._storage_client
 
-    # We must create a new client for each thread, rather than use the class
-    # member self.dest_project due to an underlying thread safety issue in
-    # httplib2: https://github.com/googleapis/google-cloud-python/issues/3501
-    client = gcp_project.GoogleCloudProject(self.dest_project_name)
-    client.storagetransfer.S3ToGCS(
-        container.path, az, 'gs://' + self.dest_bucket)
-    _, s3_path = SplitStoragePath(container.path)
-    output = self.dest_bucket + '/' + s3_path
-    self.StoreContainer(containers.GCSObject(output))
+  def _WriteManifest(self, s3_paths: list[str]) -> str:
+    """Writes a transfer manifest to the destination bucket.
+
+    Args:
+      s3_paths: Paths of the objects to transfer, relative to their bucket.
+
+    Returns:
+      The GCS path of the manifest.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    for s3_path in s3_paths:
+      writer.writerow([s3_path])
+    blob_name = f'{MANIFEST_FOLDER}/{uuid.uuid4().hex}.csv'
+    client = self._GetStorageClient()
+    client.bucket(self.dest_bucket).blob(blob_name).upload_from_string(
+        output.getvalue(), content_type='text/csv')
+    return f'gs://{self.dest_bucket}/{blob_name}'
+
+  def _DeleteManifest(self, manifest: str) -> None:
+    """Deletes a transfer manifest from the destination bucket.
+
+    Args:
+      manifest: The GCS path of the manifest.
+    """
+    _, blob_name = SplitStoragePath(manifest)
+    client = self._GetStorageClient()
+    client.bucket(self.dest_bucket).blob(blob_name).delete()
+
+  def _CreateTransferJob(
+      self, s3_bucket: str, manifest: str, aws_credentials: Any) -> str:
+    """Creates a transfer job copying the objects listed in a manifest.
+
+    Args:
+      s3_bucket: The source S3 bucket.
+      manifest: The GCS path of the manifest.
+      aws_credentials: The AWS credentials to read the S3 bucket with.
+
+    Returns:
+      The name of the transfer job.
+    """
+    today = datetime.datetime.now()
+    date = {'year': today.year, 'month': today.month, 'day': today.day}
+    transfer_job_body = {
+        'projectId': self.dest_project_name,
+        'description': 'created_by_dftimewolf',
+        'transferSpec': {
+            'transferManifest': {'location': manifest},
+            'awsS3DataSource': {
+                'bucketName': s3_bucket,
+                'awsAccessKey': {
+                    'accessKeyId': aws_credentials.access_key,
+                    'secretAccessKey': aws_credentials.secret_key,
+                },
+            },
+            'gcsDataSink': {'bucketName': self.dest_bucket, 'path': ''},
+        },
+        'schedule': {
+            'scheduleStartDate': date,
+            'scheduleEndDate': date,
+            'endTimeOfDay': {},
+        },
+        'status': 'ENABLED',
+    }
+    gcst_jobs = self.dest_project.storagetransfer.GcstApi().transferJobs()  # pylint: disable=no-member
+    transfer_job = gcst_jobs.create(body=transfer_job_body).execute()
+    job_name: str = transfer_job.get('name', '')
+    if not job_name:
+      self.ModuleError(
+          f'Could not create transfer. Job output: {transfer_job}',
+          critical=True)
+    return job_name
+
+  def _WaitForTransferJobs(
+      self, job_names: list[str]) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Polls the operations of transfer jobs until all of them are done.
+
+    The operations of all the jobs are listed at once on every poll.
+
+    Args:
+      job_names: Names of the transfer jobs.
+
+    Yields:
+      The name and operation of each job, as soon as it is done.
+    """
+    gcst_transfers = self.dest_project.storagetransfer.GcstApi().transferOperations()  # pylint: disable=no-member
+    pending = set(job_names)
+    while pending:
+      time.sleep(POLL_INTERVAL)
+      filter_string = json.dumps(
+          {'projectId': self.dest_project_name, 'jobNames': sorted(pending)})
+      request = gcst_transfers.list(
+          name='transferOperations', filter=filter_string)
+      while request is not None:
+        response = request.execute()
+        for operation in response.get('operations', []):
+          job_name = operation.get('metadata', {}).get('transferJobName')
+          if job_name in pending and operation.get('done'):
+            pending.remove(job_name)
+            yield job_name, operation
+        request = gcst_transfers.list_next(request, response)
+      if pending:
+        self.logger.info(
+            f'Waiting for {len(pending)} transfer jobs to finish...')
 
   def _SetBucketServiceAccountPermissions(self) -> None:
     """Grant access to the storage transfer service account to use the bucket.
@@ -140,7 +345,7 @@ class S3ToGCSCopy(module.ThreadAwareModule):
     request = api_handle.googleServiceAccounts().get(projectId=self.dest_project_name)  # pylint: disable=no-member  # pyrefly: ignore=[missing-attribute]
     service_account = request.execute()['accountEmail']
 
-    client = storage_client(project=self.dest_project_name)
+    client = self._GetStorageClient()
     bucket = client.get_bucket(self.dest_bucket)
     policy = bucket.get_iam_policy(requested_policy_version=3)
     policy.version = 3
@@ -167,16 +372,5 @@ class S3ToGCSCopy(module.ThreadAwareModule):
     buckets = [b['id'] for b in self.dest_project.storage.ListBuckets()]
     return bucket_name in buckets
 
-  def GetThreadOnContainerType(self) -> Type[interface.AttributeContainer]:
-    return containers.AWSS3Object
-
-  def GetThreadPoolSize(self) -> int:
-    # https://cloud.google.com/storage-transfer/quotas
-    # limit is 100 per 100 seconds, or 1000/day.
-    return 30
-
-  def PostProcess(self) -> None:
-    pass
-
 
 modules_manager.ModulesManager.RegisterModule(S3ToGCSCopy)
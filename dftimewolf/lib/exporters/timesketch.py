@@ -2,6 +2,7 @@
 """Export processing results to Timesketch.
 Threaded version of existing Timesketch module."""
 
+import threading
 import time
 import uuid
 from typing import Optional, Type, Set, Callable
@@ -56,6 +57,11 @@ class TimesketchExporter(module.ThreadAwareModule):
     self.host_url = str()
     self.sketch: ts_sketch.Sketch
     self._processed_timelines: Set[int] = set()
+    # Timeline name and index of the containers uploaded to a shared timeline,
+    # by TIMESKETCH_TIMELINE metadata value.
+    self._shared_timelines: dict[str, tuple[str, str]] = {}
+    self._shared_timeline_locks: dict[str, threading.Lock] = {}
+    self._shared_timelines_lock = threading.Lock()
 
   # pylint: disable=arguments-differ
   def SetUp(
@@ -244,12 +250,40 @@ class TimesketchExporter(module.ThreadAwareModule):
   def Process(self, container: containers.File) -> None:  # pyrefly: ignore[bad-override]
     """Executes a Timesketch export.
 
+    Containers with the same TIMESKETCH_TIMELINE metadata value, such as the
+    rotated files of a collector following logs, are appended to a single
+    timeline.
+
     Args:
       container (containers.File): A container holding a File to import."""
+    shared_timeline = container.metadata.get('TIMESKETCH_TIMELINE')
+    if not shared_timeline:
+      self._Upload(container, self._GetTimelineName(container.name))
+      return
+
+    with self._shared_timelines_lock:
+      lock = self._shared_timeline_locks.setdefault(
+          shared_timeline, threading.Lock())
+    # Uploads to a shared timeline are serialized, so that the first one
+    # creates the timeline and the next ones append to its index.
+    with lock:
+      if shared_timeline in self._shared_timelines:
+        timeline_name, index_name = self._shared_timelines[shared_timeline]
+        self._Upload(container, timeline_name, index_name=index_name)
+        return
+      timeline_name = self._GetTimelineName(shared_timeline)
+      index_name = self._Upload(container, timeline_name)
+      if index_name:
+        self._shared_timelines[shared_timeline] = (timeline_name, index_name)
 
+  def _GetTimelineName(self, description: Optional[str]) -> str:
+    """Returns a unique timeline name.
+
+    Args:
+      description: Name of the uploaded file or timeline, if any.
+    """
     recipe_name = self._cache.GetRecipeName()
     rand = uuid.uuid4().hex[-5:]
-    description = container.name
     if description:
       name = description.rpartition('.')[0]
       name = name if name else description
@@ -259,7 +293,22 @@ class TimesketchExporter(module.ThreadAwareModule):
       timeline_name = f'{recipe_name}'
 
     # Give each timeline a unique name
-    timeline_name = f'{timeline_name}_{rand}'
+    return f'{timeline_name}_{rand}'
+
+  def _Upload(self,
+              container: containers.File,
+              timeline_name: str,
+              index_name: Optional[str] = None) -> Optional[str]:
+    """Uploads a file to a timeline.
+
+    Args:
+      container: A container holding a File to import.
+      timeline_name: Name of the timeline to upload the file to.
+      index_name: Index of an existing timeline to append the file to.
+
+    Returns:
+      The index of the timeline, or None if the upload failed.
+    """
     self.logger.info(
       f"Uploading timeline {timeline_name} to sketch {self.sketch_id}..."
     )
@@ -272,6 +321,8 @@ class TimesketchExporter(module.ThreadAwareModule):
       with importer.ImportStreamer() as streamer:
         streamer.set_sketch(self.sketch)
         streamer.set_timeline_name(timeline_name)
+        if index_name:
+          streamer.set_index_name(index_name)
 
         path = container.path
         try:
@@ -280,10 +331,15 @@ class TimesketchExporter(module.ThreadAwareModule):
           self.ModuleError(
               'Unable to import {0:s}: {1!s}'.format(path, exception),
               critical=False)
-        if streamer.response and container.description:
-          if not streamer.timeline:
-            raise RuntimeError(f'Timeline {timeline_name} not found')
-          streamer.timeline.description = container.description
+          return None
+        if not streamer.response:
+          return None
+        timeline = streamer.timeline
+        if not timeline:
+          raise RuntimeError(f'Timeline {timeline_name} not found')
+        if container.description and not index_name:
+          timeline.description = container.description
+        return str(timeline.index_name)
 
   def GetThreadOnContainerType(self) -> Type[interface.AttributeContainer]:
     return containers.File
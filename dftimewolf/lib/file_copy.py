@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""Copies files and directories with a pool of workers.
+
+Each file is copied with the cheapest method the filesystems allow: a
+hardlink when requested, a reflink (FICLONE) on copy-on-write filesystems,
+copy_file_range to copy within the kernel, and a buffered copy otherwise.
+"""
+
+import errno
+import os
+import shutil
+import sys
+import threading
+from concurrent import futures
+from typing import Any, Optional
+
+try:
+  import fcntl
+  HAS_FCNTL = True
+except ImportError:
+  HAS_FCNTL = False
+
+# Linux ioctl sharing the extents of a file with another, from linux/fs.h.
+FICLONE = 0x40049409
+
+# Size of the reads and writes of buffered copies.
+BUFFER_SIZE = 1024 * 1024
+
+# Errors meaning that a copy method is not supported between two files.
+_UNSUPPORTED_ERRNOS = frozenset([
+    errno.EBADF, errno.EINVAL, errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP,
+    errno.EPERM, errno.EXDEV, errno.ETXTBSY])
+
+
+def _Reflink(source_fd: int, destination_fd: int) -> bool:
+  """Shares the extents of the source file with the destination file.
+
+  Returns:
+    Whether the reflink was created.
+  """
+  if not HAS_FCNTL or not sys.platform.startswith('linux'):
+    return False
+  try:
+    fcntl.ioctl(destination_fd, getattr(fcntl, 'FICLONE', FICLONE), source_fd)
+  except OSError as exception:
+    if exception.errno in _UNSUPPORTED_ERRNOS:
+      return False
+    raise
+  return True
+
+
+def _CopyFileRange(source_fd: int, destination_fd: int) -> bool:
+  """Copies the source file to the destination file within the kernel.
+
+  Returns:
+    Whether the file was copied.
+  """
+  if not hasattr(os, 'copy_file_range'):
+    return False
+  try:
+    while os.copy_file_range(source_fd, destination_fd, BUFFER_SIZE * 64):
+      pass
+  except OSError as exception:
+    if exception.errno in _UNSUPPORTED_ERRNOS:
+      # Start over with another method.
+      os.lseek(source_fd, 0, os.SEEK_SET)
+      os.lseek(destination_fd, 0, os.SEEK_SET)
+      os.ftruncate(destination_fd, 0)
+      return False
+    raise
+  return True
+
+
+def CopyFile(source: str, destination: str, use_hardlinks: bool = False) -> str:
+  """Copies a file and its metadata, like shutil.copy2.
+
+  Args:
+    source: Path of the file to copy.
+    destination: Path of the copy, or of the directory to copy it to.
+    use_hardlinks: Whether to link the copy to the source file when both are
+        on the same filesystem. The copy and the source then share their data.
+
+  Returns:
+    Path of the copy.
+
+  Raises:
+    shutil.SameFileError: If the source and the destination are the same file.
+    OSError: If the file could not be copied.
+  """
+  if os.path.isdir(destination):
+    destination = os.path.join(destination, os.path.basename(source))
+  if os.path.exists(destination) and os.path.samefile(source, destination):
+    raise shutil.SameFileError(
+        f'{source!r} and {destination!r} are the same file')
+
+  if use_hardlinks:
+    if os.path.lexists(destination):
+      os.remove(destination)
+    try:
+      os.link(source, destination)
+      return destination
+    except OSError as exception:
+      if exception.errno not in _UNSUPPORTED_ERRNOS | {errno.EMLINK}:
+        raise
+
+  with open(source, 'rb') as source_file, open(destination, 'wb') as output:
+    source_fd, destination_fd = source_file.fileno(), output.fileno()
+    if (not _Reflink(source_fd, destination_fd) and
+        not _CopyFileRange(source_fd, destination_fd)):
+      shutil.copyfileobj(source_file, output, BUFFER_SIZE)
+  shutil.copystat(source, destination)
+  return destination
+
+
+class ParallelCopier:
+  """Copies files and directories with a pool of workers.
+
+  Copies are queued with Copy, and Wait returns once they are all done. A
+  copier is used as a context manager, which shuts down its workers.
+  """
+
+  def __init__(self,
+               max_workers: Optional[int] = None,
+               use_hardlinks: bool = False) -> None:
+    """Initializes the copier.
+
+    Args:
+      max_workers: Maximum number of files copied at once. Defaults to the
+          ThreadPoolExecutor default.
+      use_hardlinks: Whether to link the copies to the source files when both
+          are on the same filesystem.
+    """
+    self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+    self._use_hardlinks = use_hardlinks
+    self._lock = threading.Lock()
+    self._pending: list[tuple[str, str, futures.Future[str]]] = []
+    self._directories: list[tuple[str, str]] = []
+    # Last queued copy to each destination path.
+    self._destinations: dict[str, futures.Future[str]] = {}
+
+  def __enter__(self) -> 'ParallelCopier':
+    """Returns the copier."""
+    return self
+
+  def __exit__(self, *unused_exc_info: Any) -> None:
+    """Cancels the queued copies and shuts down the workers."""
+    self._executor.shutdown(wait=True, cancel_futures=True)
+
+  def _CopyAfter(self,
+                 previous: futures.Future[str],
+                 source: str,
+                 destination: str) -> str:
+    """Copies a file once the previous copy to its destination is done."""
+    futures.wait([previous])
+    return CopyFile(source, destination, self._use_hardlinks)
+
+  def _Submit(self, source: str, destination: str) -> None:
+    """Queues the copy of a file.
+
+    Copies to the same destination run one after the other, in the order they
+    were queued, as concurrent writes or links to one path would corrupt the
+    copy or fail. The previous copy was queued first, so it is already
+    running by the time the next one waits for it.
+    """
+    key = os.path.abspath(destination)
+    with self._lock:
+      previous = self._destinations.get(key)
+      if previous and not previous.done():
+        future = self._executor.submit(
+            self._CopyAfter, previous, source, destination)
+      else:
+        future = self._executor.submit(
+            CopyFile, source, destination, self._use_hardlinks)
+      self._destinations[key] = future
+      self._pending.append((source, destination, future))
+
+  def Copy(self, source: str, destination_directory: str) -> str:
+    """Queues the copy of a file or directory into a directory.
+
+    Directories are copied recursively, like shutil.copytree with
+    dirs_exist_ok, and files are copied like shutil.copy2.
+
+    Args:
+      source: Path of the file or directory to copy.
+      destination_directory: Directory to copy the source to.
+
+    Returns:
+      Path the source is copied to.
+
+    Raises:
+      shutil.SameFileError: If the source is a file already in the
+          destination directory.
+    """
+    destination = os.path.join(
+        destination_directory, os.path.basename(source.rstrip(os.sep)))
+    if not os.path.isdir(source):
+      if os.path.exists(destination) and os.path.samefile(source, destination):
+        raise shutil.SameFileError(
+            f'{source!r} and {destination!r} are the same file')
+      self._Submit(source, destination)
+      return destination
+
+    for directory, _, file_names in os.walk(source, followlinks=True):
+      target = os.path.join(destination, os.path.relpath(directory, source))
+      os.makedirs(target, exist_ok=True)
+      self._directories.append((directory, os.path.normpath(target)))
+      for file_name in file_names:
+        self._Submit(
+            os.path.join(directory, file_name), os.path.join(target, file_name))
+    return destination
+
+  def Wait(self) -> None:
+    """Waits for the queued copies to finish.
+
+    Raises:
+      shutil.Error: If files could not be copied. The error lists the
+          (source, destination, reason) of every failed copy.
+    """
+    with self._lock:
+      pending, self._pending = self._pending, []
+      self._destinations = {}
+    copy_errors = []
+    for source, destination, future in pending:
+      try:
+        future.result()
+      except OSError as exception:
+        copy_errors.append((source, destination, str(exception)))
+
+    # Copying files updates the timestamps of their directory, so directory
+    # metadata is copied last, deepest directories first.
+    directories, self._directories = self._directories, []
+    for source, destination in reversed(directories):
+      try:
+        shutil.copystat(source, destination)
+      except OSError as exception:
+        copy_errors.append((source, destination, str(exception)))
+    if copy_errors:
+      raise shutil.Error(copy_errors)
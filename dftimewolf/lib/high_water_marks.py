@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Persistent high-water marks for incremental log collection.
+
+A high-water mark records the time of the latest event collected for a given
+(collector, scope, filter) combination, along with the identifiers of the
+events collected during a lookback window before that time. Log sources can
+deliver events late, so collectors fetch events from the start of the lookback
+window rather than from the high-water mark itself, and drop the events whose
+identifiers were already collected.
+"""
+
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+import filelock
+
+
+def ParseTimestamp(timestamp: str | datetime.datetime) -> datetime.datetime:
+  """Parses an event timestamp, assuming UTC for naive ones.
+
+  Args:
+    timestamp: An ISO 8601 / RFC 3339 string, or a datetime object.
+
+  Returns:
+    A timezone aware datetime.
+  """
+  if isinstance(timestamp, str):
+    timestamp = timestamp.replace('Z', '+00:00')
+    # RFC 3339 timestamps can have more fractional digits than Python parses.
+    if '.' in timestamp:
+      seconds, _, rest = timestamp.partition('.')
+      digits = len(rest) - len(rest.lstrip('0123456789'))
+      timestamp = f'{seconds}.{rest[:min(digits, 6)]:0<6}{rest[digits:]}'
+    timestamp = datetime.datetime.fromisoformat(timestamp)
+  if timestamp.tzinfo is None:
+    return timestamp.replace(tzinfo=datetime.timezone.utc)
+  return timestamp.astimezone(datetime.timezone.utc)
+
+
+@dataclasses.dataclass
+class HighWaterMark:
+  """The latest point a collection has reached.
+
+  Attributes:
+    timestamp: Time of the latest collected event.
+    event_ids: Times of the collected events within the lookback window,
+        keyed by event identifier.
+    lookback: How long before the timestamp event identifiers are kept for.
+  """
+  timestamp: datetime.datetime
+  event_ids: dict[str, datetime.datetime] = dataclasses.field(
+      default_factory=dict)
+  lookback: datetime.timedelta = datetime.timedelta(0)
+
+  @property
+  def window_start(self) -> datetime.datetime:
+    """Returns the start of the lookback window."""
+    return self.timestamp - self.lookback
+
+  def IsNew(self, timestamp: str | datetime.datetime, event_id: str) -> bool:
+    """Checks whether an event was not collected by a previous run.
+
+    Args:
+      timestamp: The event time.
+      event_id: The event identifier.
+
+    Returns:
+      True if the event is in or after the lookback window, and was not
+      collected yet.
+    """
+    if ParseTimestamp(timestamp) < self.window_start:
+      return False
+    return event_id not in self.event_ids
+
+  def Prune(self) -> None:
+    """Forgets the identifiers of the events older than the lookback window."""
+    window_start = self.window_start
+    self.event_ids = {
+        event_id: event_time
+        for event_id, event_time in self.event_ids.items()
+        if event_time >= window_start}
+
+
+class HighWaterMarkTracker:
+  """Computes the new high-water mark from the events of a collection.
+
+  The tracker also filters out the events that were already collected, based on
+  the high-water mark of the previous collection. All the events seen are
+  recorded, including the ones already collected, so that the new high-water
+  mark covers its whole lookback window.
+  """
+
+  # Minimum number of event identifiers to hold before pruning the ones
+  # outside of the lookback window.
+  _PRUNE_THRESHOLD = 10000
+
+  def __init__(self,
+               previous: Optional[HighWaterMark] = None,
+               lookback: datetime.timedelta = datetime.timedelta(0)) -> None:
+    """Initializes the tracker.
+
+    Args:
+      previous: The high-water mark of the previous collection, if any.
+      lookback: How long before the high-water mark the collection starts.
+    """
+    self.previous = previous
+    self.lookback = lookback
+    self.current: Optional[HighWaterMark] = None
+    if previous:
+      self.current = HighWaterMark(
+          previous.timestamp, dict(previous.event_ids), lookback)
+    self._prune_size = self._PRUNE_THRESHOLD
+
+  def _Record(self, event_time: datetime.datetime, event_id: str) -> None:
+    """Records a collected event in the current high-water mark.
+
+    Args:
+      event_time: The event time.
+      event_id: The event identifier.
+    """
+    if not self.current:
+      self.current = HighWaterMark(event_time, {}, self.lookback)
+    self.current.timestamp = max(self.current.timestamp, event_time)
+    self.current.event_ids[event_id] = event_time
+    if len(self.current.event_ids) > self._prune_size:
+      self.current.Prune()
+      self._prune_size = max(
+          self._PRUNE_THRESHOLD, 2 * len(self.current.event_ids))
+
+  def Add(self, timestamp: str | datetime.datetime, event_id: str) -> bool:
+    """Registers a collected event.
+
+    Args:
+      timestamp: The event time.
+      event_id: The event identifier.
+
+    Returns:
+      True if the event is new and should be emitted, False if it was already
+      collected by a previous run.
+    """
+    event_time = ParseTimestamp(timestamp)
+    is_new = not self.previous or self.previous.IsNew(event_time, event_id)
+    self._Record(event_time, event_id)
+    return is_new
+
+  def Merge(self, other: 'HighWaterMarkTracker') -> None:
+    """Merges the events registered by another tracker into this one.
+
+    Args:
+      other: A tracker that processed another part of the same collection.
+    """
+    if not other.current:
+      return
+    for event_id, event_time in other.current.event_ids.items():
+      self._Record(event_time, event_id)
+    if self.current:
+      self.current.timestamp = max(
+          self.current.timestamp, other.current.timestamp)
+
+
+class HighWaterMarkStore:
+  """A local JSON file store for high-water marks.
+
+  The store is shared by all collectors and dfTimewolf processes, and is
+  protected by a file lock.
+  """
+
+  _STATE_FILENAME = '.dftimewolf_high_water_marks.json'
+
+  def __init__(self, path: Optional[str] = None) -> None:
+    """Initializes the store.
+
+    Args:
+      path: Optional path to the store file. Defaults to a file in the user's
+          home directory.
+    """
+    self._path = path or os.path.join(
+        os.path.expanduser('~'), self._STATE_FILENAME)
+    self._lock = filelock.FileLock(self._path + '.lock')
+
+  @staticmethod
+  def _Key(collector: str, scope: str, filter_expression: str) -> str:
+    """Returns the store key for a collection."""
+    return hashlib.sha256(
+        '\0'.join((collector, scope, filter_expression)).encode('utf-8')
+    ).hexdigest()
+
+  def _Load(self) -> dict[str, Any]:
+    """Loads the store contents. Must be called with the lock held."""
+    if not os.path.exists(self._path):
+      return {}
+    with open(self._path, 'r', encoding='utf-8') as state_file:
+      state: dict[str, Any] = json.load(state_file)
+    return state
+
+  def Get(self,
+          collector: str,
+          scope: str,
+          filter_expression: str) -> Optional[HighWaterMark]:
+    """Retrieves the high-water mark of a collection.
+
+    Args:
+      collector: Name of the collector class.
+      scope: What the collection is for, e.g. a project or an application.
+      filter_expression: The filter expression of the collection.
+
+    Returns:
+      The high-water mark, or None if the collection never ran.
+    """
+    with self._lock:
+      entry = self._Load().get(self._Key(collector, scope, filter_expression))
+    if not entry:
+      return None
+    timestamp = ParseTimestamp(entry['timestamp'])
+    event_ids = entry['event_ids']
+    # Marks stored before lookback windows only list the events at their time.
+    if isinstance(event_ids, list):
+      event_ids = dict.fromkeys(event_ids, timestamp.isoformat())
+    return HighWaterMark(
+        timestamp,
+        {event_id: ParseTimestamp(event_time)
+         for event_id, event_time in event_ids.items()},
+        datetime.timedelta(seconds=entry.get('lookback_seconds', 0)))
+
+  def Set(self,
+          collector: str,
+          scope: str,
+          filter_expression: str,
+          high_water_mark: HighWaterMark) -> None:
+    """Stores the high-water mark of a collection.
+
+    Args:
+      collector: Name of the collector class.
+      scope: What the collection is for, e.g. a project or an application.
+      filter_expression: The filter expression of the collection.
+      high_water_mark: The high-water mark to store.
+    """
+    with self._lock:
+      state = self._Load()
+      state[self._Key(collector, scope, filter_expression)] = {
+          'collector': collector,
+          'scope': scope,
+          'filter_expression': filter_expression,
+          'timestamp': high_water_mark.timestamp.isoformat(),
+          'event_ids': {
+              event_id: event_time.isoformat()
+              for event_id, event_time in sorted(
+                  high_water_mark.event_ids.items())
+              if event_time >= high_water_mark.window_start},
+          'lookback_seconds': high_water_mark.lookback.total_seconds(),
+      }
+      temporary_path = self._path + '.tmp'
+      with open(temporary_path, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file, indent=2, sort_keys=True)
+      os.replace(temporary_path, self._path)
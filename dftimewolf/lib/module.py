@@ -4,6 +4,7 @@
 import abc
 import logging
 import sys
+import threading
 import traceback
 from typing import Any, Callable, Literal, NoReturn, Optional, overload, Sequence, Type, TypeVar, cast
 
@@ -18,6 +19,45 @@ from dftimewolf.lib.containers import manager as container_manager
 
 T = TypeVar("T", bound="interface.AttributeContainer")  # pylint: disable=invalid-name,line-too-long
 
+# Events set to stop modules that run until cancelled, such as collectors
+# following logs, when the user interrupts a recipe.
+_STOP_EVENTS: set[threading.Event] = set()
+_STOP_EVENTS_LOCK = threading.Lock()
+
+
+def RegisterStopEvent(event: threading.Event) -> None:
+  """Registers an event to set when the user interrupts a recipe.
+
+  Args:
+    event: The event a module waits on to stop running.
+  """
+  with _STOP_EVENTS_LOCK:
+    _STOP_EVENTS.add(event)
+
+
+def UnregisterStopEvent(event: threading.Event) -> None:
+  """Unregisters an event registered with RegisterStopEvent.
+
+  Args:
+    event: The event to unregister.
+  """
+  with _STOP_EVENTS_LOCK:
+    _STOP_EVENTS.discard(event)
+
+
+def RequestStop() -> bool:
+  """Asks the modules running until cancelled to stop.
+
+  Returns:
+    Whether a module was asked to stop. False if no module runs until
+    cancelled, or if they were all asked to stop already.
+  """
+  with _STOP_EVENTS_LOCK:
+    events = [event for event in _STOP_EVENTS if not event.is_set()]
+  for event in events:
+    event.set()
+  return bool(events)
+
 
 class BaseModule(object):
   """Interface of a DFTimewolf module.
@@ -154,6 +194,30 @@ class BaseModule(object):
         callback=callback,
         container_type=container_type)
 
+  def RegisterRequiredColumns(self, columns: Sequence[str]) -> None:
+    """Declares the columns this module consumes from upstream containers.
+
+    Upstream modules that support it will only fetch these columns, so this
+    should only be called by modules that ignore any other column. Columns
+    that an upstream module does not produce are ignored, and only the
+    modules this module directly depends on are affected.
+
+    Args:
+      columns: The consumed column names.
+    """
+    self._container_manager.RegisterRequiredColumns(
+        module_name=self.name, columns=columns)
+
+  def GetRequiredColumns(self) -> Optional[set[str]]:
+    """Returns the columns consumed by the downstream modules.
+
+    Only valid once all modules have been set up, that is from Process().
+
+    Returns:
+      The column names, or None if all columns should be fetched.
+    """
+    return self._container_manager.GetRequiredColumns(self.name)
+
   def StoreContainer(self,
                      container: "interface.AttributeContainer",
                      for_self_only: bool=False) -> None:
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""Parallel downloads of GCS and S3 objects.
+
+Large objects are split into slices fetched with concurrent ranged reads and
+written in place; small objects are fetched with a single read, several at a
+time. The checksums published by the object store (CRC32C and MD5 for GCS,
+the ETag for S3) are computed while the data arrives and checked once the
+object is complete.
+"""
+
+import abc
+import base64
+import collections
+import dataclasses
+import hashlib
+import os
+from concurrent import futures
+from typing import Any, Iterator, Optional
+
+import google_crc32c
+from libcloudforensics.providers.utils.storage_utils import SplitStoragePath
+
+# Objects larger than this are downloaded in slices.
+SLICE_THRESHOLD = 32 * 1024 * 1024
+
+# Size of the slices of large objects.
+SLICE_SIZE = 8 * 1024 * 1024
+
+
+class ChecksumError(ValueError):
+  """Raised when a downloaded object does not match its checksum."""
+
+
+@dataclasses.dataclass
+class ObjectInfo:
+  """Size and published checksums of an object.
+
+  Attributes:
+    size: Object size, in bytes.
+    checksums: Expected hex digests, by algorithm: "crc32c", "md5", or
+        "s3_etag" for the ETag of objects uploaded in several parts.
+    part_size: Size of the parts of an object uploaded in several parts.
+  """
+  size: int
+  checksums: dict[str, str] = dataclasses.field(default_factory=dict)
+  part_size: int = 0
+
+
+class ObjectSource(abc.ABC):
+  """An object that can be read by byte range."""
+
+  def __init__(self, path: str) -> None:
+    """Initializes the source.
+
+    Args:
+      path: The object path, such as gs://bucket/object.
+    """
+    self.path = path
+    self.bucket, self.key = SplitStoragePath(path)
+
+  @abc.abstractmethod
+  def Stat(self) -> ObjectInfo:
+    """Returns the size and checksums of the object.
+
+    Later reads must fail if the object changes after this call.
+    """
+
+  @abc.abstractmethod
+  def ReadRange(self, start: int, end: int) -> bytes:
+    """Reads a byte range of the object.
+
+    Args:
+      start: Offset of the first byte.
+      end: Offset after the last byte.
+    """
+
+
+class GCSObjectSource(ObjectSource):
+  """A Google Cloud Storage object."""
+
+  def __init__(self, client: Any, path: str) -> None:
+    """Initializes the source.
+
+    Args:
+      client: A google.cloud.storage client.
+      path: The object path, gs://bucket/object.
+    """
+    super().__init__(path)
+    self._blob = client.bucket(self.bucket).blob(self.key)
+    self._generation: Optional[int] = None
+
+  def Stat(self) -> ObjectInfo:
+    """Returns the size and checksums of the object."""
+    self._blob.reload()
+    # Downloads update the blob properties, so the generation is kept apart.
+    self._generation = self._blob.generation
+    info = ObjectInfo(size=int(self._blob.size))
+    if self._blob.crc32c:
+      info.checksums['crc32c'] = base64.b64decode(self._blob.crc32c).hex()
+    # Composite objects have no MD5 hash.
+    if self._blob.md5_hash:
+      info.checksums['md5'] = base64.b64decode(self._blob.md5_hash).hex()
+    return info
+
+  def ReadRange(self, start: int, end: int) -> bytes:
+    """Reads a byte range of the object generation returned by Stat."""
+    data: bytes = self._blob.download_as_bytes(
+        start=start,
+        end=end - 1,
+        raw_download=True,
+        checksum=None,
+        if_generation_match=self._generation)
+    return data
+
+
+class S3ObjectSource(ObjectSource):
+  """An AWS S3 object."""
+
+  def __init__(self, client: Any, path: str) -> None:
+    """Initializes the source.
+
+    Args:
+      client: A boto3 S3 client.
+      path: The object path, s3://bucket/object.
+    """
+    super().__init__(path)
+    self._client = client
+    self._etag = ''
+
+  def Stat(self) -> ObjectInfo:
+    """Returns the size and checksums of the object."""
+    response = self._client.head_object(Bucket=self.bucket, Key=self.key)
+    self._etag = response['ETag']
+    info = ObjectInfo(size=int(response['ContentLength']))
+    etag = self._etag.strip('"')
+    # The ETag of objects encrypted with KMS keys is not an MD5 digest.
+    if response.get('ServerSideEncryption') == 'aws:kms':
+      return info
+    if '-' in etag:
+      first_part = self._client.head_object(
+          Bucket=self.bucket, Key=self.key, PartNumber=1, IfMatch=self._etag)
+      info.checksums['s3_etag'] = etag
+      info.part_size = int(first_part['ContentLength'])
+    else:
+      info.checksums['md5'] = etag
+    return info
+
+  def ReadRange(self, start: int, end: int) -> bytes:
+    """Reads a byte range of the object version returned by Stat."""
+    response = self._client.get_object(
+        Bucket=self.bucket,
+        Key=self.key,
+        Range=f'bytes={start:d}-{end - 1:d}',
+        IfMatch=self._etag)
+    data: bytes = response['Body'].read()
+    return data
+
+
+class _Checksummer:
+  """Computes the checksums of an object from its data, in order."""
+
+  def __init__(self, info: ObjectInfo) -> None:
+    """Initializes the checksummer.
+
+    Args:
+      info: The object size and expected checksums.
+    """
+    self._info = info
+    self._crc32c = google_crc32c.Checksum()
+    self._md5 = hashlib.md5()
+    self._part_md5 = hashlib.md5()
+    self._part_left = info.part_size
+    self._part_digests: list[bytes] = []
+
+  def Update(self, data: bytes) -> None:
+    """Adds the next bytes of the object."""
+    if 'crc32c' in self._info.checksums:
+      self._crc32c.update(data)
+    if 'md5' in self._info.checksums:
+      self._md5.update(data)
+    if 's3_etag' in self._info.checksums:
+      view = memoryview(data)
+      while view:
+        chunk, view = view[:self._part_left], view[self._part_left:]
+        self._part_md5.update(chunk)
+        self._part_left -= len(chunk)
+        if not self._part_left:
+          self._part_digests.append(self._part_md5.digest())
+          self._part_md5 = hashlib.md5()
+          self._part_left = self._info.part_size
+
+  def Verify(self) -> None:
+    """Checks the computed checksums against the expected ones.
+
+    Raises:
+      ChecksumError: If a checksum does not match.
+    """
+    actual = {
+        'crc32c': self._crc32c.digest().hex(),
+        'md5': self._md5.hexdigest(),
+    }
+    if 's3_etag' in self._info.checksums:
+      digests = list(self._part_digests)
+      if self._part_left != self._info.part_size:
+        digests.append(self._part_md5.digest())
+      actual['s3_etag'] = (
+          hashlib.md5(b''.join(digests)).hexdigest() + f'-{len(digests):d}')
+    for algorithm, expected in self._info.checksums.items():
+      if actual[algorithm] != expected:
+        raise ChecksumError(
+            f'{algorithm} mismatch: expected {expected}, '
+            f'got {actual[algorithm]}')
+
+
+class ObjectDownloader:
+  """Downloads objects, slicing large ones into parallel ranged reads."""
+
+  def __init__(self,
+               max_workers: int = 16,
+               max_concurrent_objects: int = 8,
+               slice_size: int = SLICE_SIZE,
+               slice_threshold: int = SLICE_THRESHOLD) -> None:
+    """Initializes the downloader.
+
+    At most max_workers slices of each large object are held in memory.
+
+    Args:
+      max_workers: Maximum number of concurrent slice reads.
+      max_concurrent_objects: Maximum number of objects downloaded at once.
+      slice_size: Size of the slices of large objects.
+      slice_threshold: Objects larger than this are downloaded in slices.
+    """
+    self._max_workers = max(1, max_workers)
+    self._max_concurrent_objects = max(1, max_concurrent_objects)
+    self._slice_size = slice_size
+    self._slice_threshold = slice_threshold
+    self._slice_executor: Optional[futures.ThreadPoolExecutor] = None
+
+  def Download(self, source: ObjectSource, path: str) -> ObjectInfo:
+    """Downloads an object and verifies its checksums.
+
+    The object is written to a temporary file next to path, which is renamed
+    once the checksums are verified.
+
+    Args:
+      source: The object to download.
+      path: The local path to write the object to.
+
+    Returns:
+      The object size and checksums.
+
+    Raises:
+      ChecksumError: If the object does not match its checksums.
+    """
+    info = source.Stat()
+    checksummer = _Checksummer(info)
+    temporary_path = f'{path}.part'
+    try:
+      with open(temporary_path, 'wb') as output:
+        if info.size <= self._slice_threshold or not self._slice_executor:
+          data = source.ReadRange(0, info.size) if info.size else b''
+          output.write(data)
+          checksummer.Update(data)
+        else:
+          output.truncate(info.size)
+          for data in self._ReadSlices(source, info.size, output.fileno()):
+            checksummer.Update(data)
+      checksummer.Verify()
+      os.replace(temporary_path, path)
+    finally:
+      if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    return info
+
+  def _ReadSlices(
+      self, source: ObjectSource, size: int, fd: int) -> Iterator[bytes]:
+    """Reads the slices of an object in parallel and writes them in place.
+
+    Args:
+      source: The object to read.
+      size: The object size.
+      fd: File descriptor to write the slices to.
+
+    Yields:
+      The data of each slice, in order.
+    """
+    assert self._slice_executor
+
+    def _ReadSlice(start: int) -> bytes:
+      data = source.ReadRange(start, min(start + self._slice_size, size))
+      os.pwrite(fd, data, start)
+      return data
+
+    in_flight: collections.deque[futures.Future[bytes]] = collections.deque()
+    try:
+      for start in range(0, size, self._slice_size):
+        in_flight.append(self._slice_executor.submit(_ReadSlice, start))
+        if len(in_flight) >= self._max_workers:
+          yield in_flight.popleft().result()
+      while in_flight:
+        yield in_flight.popleft().result()
+    finally:
+      for future in in_flight:
+        future.cancel()
+      futures.wait(in_flight)
+
+  def DownloadAll(
+      self, downloads: list[tuple[ObjectSource, str]]
+  ) -> Iterator[tuple[ObjectSource, str, Optional[Exception]]]:
+    """Downloads several objects concurrently.
+
+    Args:
+      downloads: The objects to download, with their local paths.
+
+    Yields:
+      Each object, its local path, and the exception raised while downloading
+      it or None, as soon as its download finishes.
+    """
+    with futures.ThreadPoolExecutor(
+        max_workers=self._max_workers) as self._slice_executor:
+      with futures.ThreadPoolExecutor(
+          max_workers=self._max_concurrent_objects) as executor:
+        pending = {
+            executor.submit(self.Download, source, path): (source, path)
+            for source, path in downloads}
+        for future in futures.as_completed(pending):
+          source, path = pending[future]
+          exception = future.exception()
+          yield source, path, (
+              exception if isinstance(exception, Exception) else None)
+    self._slice_executor = None
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Downloads GCS and S3 objects to the local filesystem."""
+
+import os
+import tempfile
+from typing import Any, Callable, Optional
+
+import boto3
+from google.cloud.storage.client import Client as storage_client
+
+from dftimewolf.lib import cache
+from dftimewolf.lib import module
+from dftimewolf.lib import object_download
+from dftimewolf.lib import spanner_telemetry as telemetry
+from dftimewolf.lib.containers import containers
+from dftimewolf.lib.containers import manager as container_manager
+from dftimewolf.lib.modules import manager as modules_manager
+
+
+class CloudObjectDownloader(module.BaseModule):
+  """Downloads GCSObject and AWSS3Object containers into File containers.
+
+  Large objects are fetched with parallel ranged reads and small ones several
+  at a time. Every object is checked against the checksums published by its
+  object store before its File container is emitted.
+  """
+
+  def __init__(self,
+               name: str,
+               container_manager_: container_manager.ContainerManager,
+               cache_: cache.DFTWCache,
+               telemetry_: telemetry.BaseTelemetry,
+               publish_message_callback: Callable[[str, str, bool], None]):
+    """Initializes a cloud object downloader."""
+    super().__init__(name=name,
+                     cache_=cache_,
+                     container_manager_=container_manager_,
+                     telemetry_=telemetry_,
+                     publish_message_callback=publish_message_callback)
+    self._output_directory = ''
+    self._aws_region: Optional[str] = None
+    self._gcp_project: Optional[str] = None
+    self._max_workers = 16
+
+  # pylint: disable=arguments-differ
+  def SetUp(self,
+            output_directory: Optional[str] = None,
+            aws_region: Optional[str] = None,
+            gcp_project: Optional[str] = None,
+            max_workers: int = 16) -> None:
+    """Sets up the cloud object downloader.
+
+    Args:
+      output_directory: Directory to download the objects to. Defaults to a
+          temporary directory.
+      aws_region: AWS region of the S3 client.
+      gcp_project: GCP project billed for the GCS downloads.
+      max_workers: Maximum number of concurrent ranged reads.
+    """
+    self._output_directory = output_directory or tempfile.mkdtemp()
+    self._aws_region = aws_region
+    self._gcp_project = gcp_project
+    self._max_workers = int(max_workers)
+
+  def _LocalPath(self, source: object_download.ObjectSource) -> str:
+    """Returns the local path of an object, creating its parent directory."""
+    path = os.path.normpath(
+        os.path.join(self._output_directory, source.bucket, source.key))
+    if not path.startswith(os.path.abspath(self._output_directory) + os.sep):
+      path = os.path.join(
+          self._output_directory, source.bucket, os.path.basename(source.key))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+  def Process(self) -> None:
+    """Downloads the objects and emits their File containers."""
+    self._output_directory = os.path.abspath(self._output_directory)
+    sources: list[object_download.ObjectSource] = []
+    gcs_objects = self.GetContainers(containers.GCSObject)
+    if gcs_objects:
+      gcs_client: Any = storage_client(project=self._gcp_project)
+      sources.extend(
+          object_download.GCSObjectSource(gcs_client, gcs_object.path)
+          for gcs_object in gcs_objects)
+    s3_objects = self.GetContainers(containers.AWSS3Object)
+    if s3_objects:
+      s3_client = boto3.client('s3', region_name=self._aws_region)
+      sources.extend(
+          object_download.S3ObjectSource(s3_client, s3_object.path)
+          for s3_object in s3_objects)
+
+    downloader = object_download.ObjectDownloader(
+        max_workers=self._max_workers)
+    downloads = [(source, self._LocalPath(source)) for source in sources]
+    for source, path, error in downloader.DownloadAll(downloads):
+      if error:
+        self.ModuleError(
+            f'Could not download {source.path:s}: {error!s}', critical=False)
+        continue
+      self.logger.info(f'Downloaded {source.path:s} to {path:s}')
+      self.StoreContainer(containers.File(
+          name=os.path.basename(path),
+          path=path,
+          description=f'Downloaded from {source.path:s}'))
+
+
+modules_manager.ModulesManager.RegisterModule(CloudObjectDownloader)
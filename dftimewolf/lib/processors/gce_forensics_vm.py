@@ -2,7 +2,7 @@
 """Creates an analysis VM and attaches GCP disks to it for analysis."""
 
 import time
-from typing import Callable
+from typing import Callable, Optional
 
 from libcloudforensics import errors as lcf_errors
 from libcloudforensics.providers.gcp import forensics as gcp_forensics
@@ -15,6 +15,7 @@ from dftimewolf.lib.containers import containers
 from dftimewolf.lib.modules import manager as modules_manager
 from dftimewolf.lib import cache
 from dftimewolf.lib import spanner_telemetry as telemetry
+from dftimewolf.lib import vm_pool
 from dftimewolf.lib.containers import manager as container_manager
 
 
@@ -73,6 +74,7 @@ class GCEForensicsVM(module.BaseModule):
     self.image_family = str()
     self._gcp_label: dict[str, str] = {}
     self.create_analysis_vm = bool()
+    self._vm_pool: Optional[vm_pool.VMPool] = None
 
   # pylint: disable=arguments-differ,too-many-arguments
   def SetUp(self,
@@ -85,7 +87,8 @@ class GCEForensicsVM(module.BaseModule):
             image_project: str,
             image_family: str,
             create_analysis_vm: bool,
-            analysis_vm_name: str) -> None:
+            analysis_vm_name: str,
+            vm_pool_size: int = 0) -> None:
     """Sets up a GCE Forensics VM processor.
 
     Args:
@@ -100,6 +103,10 @@ class GCEForensicsVM(module.BaseModule):
       analysis_vm_name: A name to use for the created analysis vm. Actual name
           will also be suffixed with the incident ID (if the ID is not already
           in the name.)
+      vm_pool_size: Optional. If set, lease the analysis VM from a warm pool
+          of reusable analysis VMs instead of starting one. The pool is
+          replenished by the vm_pool_release recipe. The name of a leased VM
+          is not changed.
     """
     self.create_analysis_vm = create_analysis_vm
     if not self.create_analysis_vm:
@@ -128,12 +135,28 @@ class GCEForensicsVM(module.BaseModule):
           self.analysis_vm_name,
           common.COMPUTE_NAME_LIMIT)
 
+    if vm_pool_size:
+      self._vm_pool = vm_pool.VMPool(
+          vm_pool.GCEPoolBackend(
+              self.project.project_id, self.project.default_zone,
+              boot_disk_size, boot_disk_type, int(cpu_cores), image_project,
+              image_family),
+          int(vm_pool_size))
+
   def Process(self) -> None:
     """Launches the analysis VM."""
     if not self.create_analysis_vm:
       self.logger.warning('Skipping Process for Forensics VM creation.')
       return
 
+    if self._vm_pool:
+      self.analysis_vm = self._vm_pool.Lease(
+          self.incident_id or self.analysis_vm_name).instance
+      self.analysis_vm_name = self.analysis_vm.name
+    self._SetUpAnalysisVm()
+
+  def _SetUpAnalysisVm(self) -> None:
+    """Starts the analysis VM if needed and attaches the evidence disks."""
     self.PublishMessage(f'Your analysis VM will be: {self.analysis_vm_name}')
     self.logger.info("Complimentary gcloud command:")
     self.logger.info(
@@ -145,23 +168,24 @@ class GCEForensicsVM(module.BaseModule):
             name=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_NAME,
             type_=self._ANALYSIS_VM_CONTAINER_ATTRIBUTE_TYPE,
             value=self.analysis_vm_name))
-    try:
-      # pylint: disable=too-many-function-args
-      # pylint: disable=redundant-keyword-arg
-      self.analysis_vm, created = gcp_forensics.StartAnalysisVm(
-          self.project.project_id,
-          self.analysis_vm_name,
-          self.project.default_zone,
-          self.boot_disk_size,
-          self.boot_disk_type,
-          int(self.cpu_cores),
-          image_project=self.image_project,
-          image_family=self.image_family)
-    except lcf_errors.ResourceCreationError as exception:
-      self.logger.error(f'Could not create VM: {exception}')
-      self.ModuleError(str(exception), critical=True)
-    if not created:
-      self.logger.debug(f"Instance {self.analysis_vm_name} exists: reusing.")
+    if not self._vm_pool:
+      try:
+        # pylint: disable=too-many-function-args
+        # pylint: disable=redundant-keyword-arg
+        self.analysis_vm, created = gcp_forensics.StartAnalysisVm(
+            self.project.project_id,
+            self.analysis_vm_name,
+            self.project.default_zone,
+            self.boot_disk_size,
+            self.boot_disk_type,
+            int(self.cpu_cores),
+            image_project=self.image_project,
+            image_family=self.image_family)
+      except lcf_errors.ResourceCreationError as exception:
+        self.logger.error(f'Could not create VM: {exception}')
+        self.ModuleError(str(exception), critical=True)
+      if not created:
+        self.logger.debug(f"Instance {self.analysis_vm_name} exists: reusing.")
     if self._gcp_label:
       self.analysis_vm.AddLabels(self._gcp_label)
       self.analysis_vm.GetBootDisk().AddLabels(self._gcp_label)
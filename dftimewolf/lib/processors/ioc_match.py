@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+"""Matches collected logs against threat intelligence indicators."""
+
+import collections
+import ipaddress
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent import futures
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from dftimewolf.lib import module
+from dftimewolf.lib.containers import containers
+from dftimewolf.lib.modules import manager as modules_manager
+from dftimewolf.lib import cache
+from dftimewolf.lib import spanner_telemetry as telemetry
+from dftimewolf.lib.containers import manager as container_manager
+
+try:
+  import ahocorasick
+  HAS_AHOCORASICK = True
+except ImportError:
+  HAS_AHOCORASICK = False
+
+
+# Number of log lines or data frame rows sent to a worker process at a time.
+CHUNK_SIZE = 10000
+
+# Number of chunks queued per worker process, bounding memory usage.
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# Literal indicators shorter than this are ignored, as they match everything.
+MIN_LITERAL_LENGTH = 4
+
+_HASH_REGEX = re.compile(r'^(?:[0-9a-f]{32}|[0-9a-f]{40}|[0-9a-f]{64})$')
+_HASH_TOKEN_REGEX = re.compile(r'(?<![0-9a-f])[0-9a-f]{32,64}(?![0-9a-f])')
+_IPV4_TOKEN_REGEX = re.compile(r'(?<![\d.])\d{1,3}(?:\.\d{1,3}){3}(?![\d.])')
+_IPV6_TOKEN_REGEX = re.compile(
+    r'(?<![0-9a-f:])[0-9a-f]{0,4}(?::[0-9a-f]{0,4}){2,7}(?![0-9a-f:])')
+
+
+def _NormalizeAddress(token: str) -> Optional[str]:
+  """Returns the canonical form of an IP address, or None if invalid."""
+  try:
+    return ipaddress.ip_address(token).compressed
+  except ValueError:
+    return None
+
+
+class AhoCorasick:
+  """An Aho-Corasick automaton matching many literal strings at once.
+
+  Searching is linear in the length of the text plus the number of matches,
+  regardless of the number of patterns. This is the pure Python fallback of
+  NativeAhoCorasick, used when pyahocorasick is not installed.
+  """
+
+  def __init__(self, patterns: Iterable[str]) -> None:
+    """Builds the automaton.
+
+    Args:
+      patterns: The strings to search for.
+    """
+    self._goto: list[dict[str, int]] = [{}]
+    self._fail: list[int] = [0]
+    self._output: list[list[str]] = [[]]
+
+    for pattern in patterns:
+      state = 0
+      for character in pattern:
+        next_state = self._goto[state].get(character)
+        if next_state is None:
+          next_state = len(self._goto)
+          self._goto[state][character] = next_state
+          self._goto.append({})
+          self._fail.append(0)
+          self._output.append([])
+        state = next_state
+      if pattern not in self._output[state]:
+        self._output[state].append(pattern)
+
+    # Breadth-first computation of the failure links.
+    queue = collections.deque(self._goto[0].values())
+    while queue:
+      state = queue.popleft()
+      for character, next_state in self._goto[state].items():
+        queue.append(next_state)
+        fail = self._fail[state]
+        while fail and character not in self._goto[fail]:
+          fail = self._fail[fail]
+        self._fail[next_state] = self._goto[fail].get(character, 0)
+        if self._fail[next_state] == next_state:
+          self._fail[next_state] = 0
+        self._output[next_state].extend(
+            self._output[self._fail[next_state]])
+
+  def Search(self, text: str) -> Iterator[tuple[int, str]]:
+    """Finds all occurrences of the patterns in a text.
+
+    Args:
+      text: The text to search.
+
+    Yields:
+      Tuples of the start offset of a match and the matching pattern.
+    """
+    goto = self._goto
+    fail = self._fail
+    output = self._output
+    state = 0
+    for index, character in enumerate(text):
+      while state and character not in goto[state]:
+        state = fail[state]
+      state = goto[state].get(character, 0)
+      for pattern in output[state]:
+        yield index - len(pattern) + 1, pattern
+
+
+class NativeAhoCorasick:
+  """An Aho-Corasick automaton backed by the pyahocorasick C extension."""
+
+  def __init__(self, patterns: Iterable[str]) -> None:
+    """Builds the automaton.
+
+    Args:
+      patterns: The strings to search for.
+    """
+    self._automaton = ahocorasick.Automaton()
+    for pattern in patterns:
+      self._automaton.add_word(pattern, pattern)
+    self._automaton.make_automaton()
+
+  def Search(self, text: str) -> Iterator[tuple[int, str]]:
+    """Finds all occurrences of the patterns in a text.
+
+    Args:
+      text: The text to search.
+
+    Yields:
+      Tuples of the start offset of a match and the matching pattern.
+    """
+    for end, pattern in self._automaton.iter(text):
+      yield end - len(pattern) + 1, pattern
+
+
+class IndicatorMatcher:
+  """Matches text against literal, IP address and hash indicators.
+
+  IP addresses and hashes are matched exactly against the corresponding
+  tokens of the text, using hashed sets. Other indicators are matched as
+  case-insensitive substrings that are not part of a longer word.
+  """
+
+  def __init__(self, indicators: Iterable[str]) -> None:
+    """Initializes the matcher.
+
+    Args:
+      indicators: The indicators, as returned by NormalizeIndicator.
+    """
+    self._exact: set[str] = set()
+    literals = []
+    for indicator in indicators:
+      if _HASH_REGEX.match(indicator) or _NormalizeAddress(indicator):
+        self._exact.add(indicator)
+      else:
+        literals.append(indicator)
+    self._automaton: Optional[AhoCorasick | NativeAhoCorasick] = None
+    if literals and HAS_AHOCORASICK:
+      self._automaton = NativeAhoCorasick(literals)
+    elif literals:
+      self._automaton = AhoCorasick(literals)
+
+  @staticmethod
+  def NormalizeIndicator(indicator: str) -> Optional[str]:
+    """Returns the normalized form of an indicator, or None to ignore it."""
+    indicator = indicator.strip().lower()
+    if _HASH_REGEX.match(indicator):
+      return indicator
+    address = _NormalizeAddress(indicator)
+    if address:
+      return address
+    if len(indicator) < MIN_LITERAL_LENGTH:
+      return None
+    return indicator
+
+  def Match(self, text: str) -> set[str]:
+    """Returns the indicators found in a text."""
+    text = text.lower()
+    hits = set()
+
+    if self._exact:
+      for token in _HASH_TOKEN_REGEX.findall(text):
+        if token in self._exact:
+          hits.add(token)
+      for token in (_IPV4_TOKEN_REGEX.findall(text) +
+                    _IPV6_TOKEN_REGEX.findall(text)):
+        address = _NormalizeAddress(token)
+        if address in self._exact:
+          hits.add(address)
+
+    if self._automaton:
+      for start, pattern in self._automaton.Search(text):
+        end = start + len(pattern)
+        if start and text[start - 1].isalnum() and pattern[0].isalnum():
+          continue
+        if (end < len(text) and text[end].isalnum() and
+            pattern[-1].isalnum()):
+          continue
+        hits.add(pattern)
+    return hits
+
+
+# Matcher of the worker process, built by _InitializeWorker.
+_worker_matcher: Optional[IndicatorMatcher] = None
+
+
+def _InitializeWorker(indicators: list[str]) -> None:
+  """Builds the indicator matcher in a worker process.
+
+  Args:
+    indicators: The normalized indicators.
+  """
+  global _worker_matcher  # pylint: disable=global-statement
+  _worker_matcher = IndicatorMatcher(indicators)
+
+
+def _ValuesText(value: Any) -> str:
+  """Returns the values of a decoded event, one per line.
+
+  Indicators are matched against the values rather than the JSON encoding of
+  the event, in which backslashes and non-ASCII characters are escaped.
+
+  Args:
+    value: A decoded JSON value or data frame row.
+  """
+  if isinstance(value, str):
+    return value
+  if isinstance(value, dict):
+    return '\n'.join(_ValuesText(item) for item in value.values())
+  if isinstance(value, (list, tuple)):
+    return '\n'.join(_ValuesText(item) for item in value)
+  if value is None:
+    return ''
+  return str(value)
+
+
+def _MatchChunk(
+    lines: list[str], decode_json: bool) -> list[tuple[int, list[str]]]:
+  """Matches a chunk of lines with the matcher of the worker process.
+
+  Args:
+    lines: The lines to match.
+    decode_json: Whether the lines are JSON events, matched on their decoded
+        values. Lines that are not valid JSON are matched as they are.
+
+  Returns:
+    Tuples of the index of a matching line in the chunk and the indicators
+    that matched it.
+  """
+  assert _worker_matcher is not None
+  results = []
+  for index, line in enumerate(lines):
+    if decode_json:
+      try:
+        line = _ValuesText(json.loads(line))
+      except json.JSONDecodeError:
+        pass
+    hits = _worker_matcher.Match(line)
+    if hits:
+      results.append((index, sorted(hits)))
+  return results
+
+
+class IOCMatchProcessor(module.BaseModule):
+  """Matches JSONL File and DataFrame containers against threat intelligence.
+
+  Indicators are read from ThreatIntelligence containers: the indicator
+  attribute holds a single indicator, and the path attribute can point to a
+  file with one indicator per line. Only the matching events are emitted,
+  along with the indicators and threats that matched them.
+  """
+
+  def __init__(self,
+               name: str,
+               container_manager_: container_manager.ContainerManager,
+               cache_: cache.DFTWCache,
+               telemetry_: telemetry.BaseTelemetry,
+               publish_message_callback: Callable[[str, str, bool], None]):
+    """Initializes an IOC match processor."""
+    super().__init__(name=name,
+                     cache_=cache_,
+                     container_manager_=container_manager_,
+                     telemetry_=telemetry_,
+                     publish_message_callback=publish_message_callback)
+    self._max_workers = 1
+    self._threats: dict[str, set[str]] = {}
+
+  # pylint: disable=arguments-differ
+  def SetUp(self, max_workers: Optional[int] = None) -> None:
+    """Sets up the IOC match processor.
+
+    Args:
+      max_workers: Maximum number of matching processes. Defaults to the
+          number of CPUs.
+    """
+    self._max_workers = int(max_workers or os.cpu_count() or 1)
+    if not HAS_AHOCORASICK:
+      self.logger.info(
+          'pyahocorasick is not installed, matching literal indicators in '
+          'pure Python. Install it with `poetry install --with ahocorasick` '
+          'or `pip install pyahocorasick` for faster matching.')
+
+  def _LoadIndicators(self) -> None:
+    """Loads the indicators of the ThreatIntelligence containers."""
+    self._threats = {}
+    for intel in self.GetContainers(containers.ThreatIntelligence):
+      indicators = [intel.indicator] if intel.indicator else []
+      if intel.path and os.path.isfile(intel.path):
+        with open(intel.path, 'r', encoding='utf-8') as indicators_file:
+          indicators.extend(
+              line for line in indicators_file
+              if line.strip() and not line.startswith('#'))
+      for indicator in indicators:
+        normalized = IndicatorMatcher.NormalizeIndicator(indicator)
+        if not normalized:
+          self.logger.debug(f'Ignoring indicator "{indicator.strip()}"')
+          continue
+        self._threats.setdefault(normalized, set()).add(intel.name)
+
+  def _DescribeHits(self, hits: list[str]) -> list[dict[str, str]]:
+    """Returns the indicators and threats of a match."""
+    return [
+        {'indicator': indicator, 'threat': threat}
+        for indicator in hits
+        for threat in sorted(self._threats[indicator])]
+
+  def _MatchChunks(
+      self,
+      executor: futures.Executor,
+      chunks: Iterator[tuple[Any, list[str]]],
+      decode_json: bool = False
+  ) -> Iterator[tuple[Any, list[tuple[int, list[str]]]]]:
+    """Matches chunks in the worker processes, with bounded memory usage.
+
+    Args:
+      executor: The worker process pool.
+      chunks: Tuples of an opaque chunk reference and the chunk lines.
+      decode_json: Whether the lines are JSON events, matched on their
+          decoded values.
+
+    Yields:
+      Tuples of the chunk reference and the matches of the chunk, in order.
+    """
+    in_flight: collections.deque[
+        tuple[Any, futures.Future[list[tuple[int, list[str]]]]]] = (
+            collections.deque())
+    for reference, lines in chunks:
+      in_flight.append(
+          (reference, executor.submit(_MatchChunk, lines, decode_json)))
+      if len(in_flight) >= self._max_workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+        reference, future = in_flight.popleft()
+        yield reference, future.result()
+    while in_flight:
+      reference, future = in_flight.popleft()
+      yield reference, future.result()
+
+  def _MatchFile(
+      self, executor: futures.Executor, file_container: containers.File
+  ) -> None:
+    """Matches the events of a JSONL file and stores the matching ones.
+
+    Args:
+      executor: The worker process pool.
+      file_container: The JSONL file container.
+    """
+
+    def _ReadChunks(input_file: Any) -> Iterator[tuple[Any, list[str]]]:
+      lines = []
+      for line in input_file:
+        lines.append(line)
+        if len(lines) == CHUNK_SIZE:
+          yield lines, lines
+          lines = []
+      if lines:
+        yield lines, lines
+
+    match_count = 0
+    with open(file_container.path, 'r', encoding='utf-8') as input_file, \
+        tempfile.NamedTemporaryFile(
+            mode='w', delete=False, encoding='utf-8',
+            suffix='.jsonl') as output_file:
+      for lines, matches in self._MatchChunks(
+          executor, _ReadChunks(input_file), decode_json=True):
+        for index, hits in matches:
+          try:
+            event = json.loads(lines[index])
+          except json.JSONDecodeError:
+            event = {'message': lines[index].rstrip('\n')}
+          event['ioc_matches'] = self._DescribeHits(hits)
+          output_file.write(json.dumps(event))
+          output_file.write('\n')
+          match_count += 1
+
+    self.logger.info(
+        f'{match_count} events of {file_container.name} matched indicators')
+    if not match_count:
+      os.remove(output_file.name)
+      return
+    self.StoreContainer(containers.File(
+        name=f'{file_container.name}_ioc_matches',
+        path=output_file.name,
+        description=f'Events of {file_container.name} matching indicators'))
+
+  def _MatchDataFrame(
+      self,
+      executor: futures.Executor,
+      data_frame_container: containers.DataFrame
+  ) -> None:
+    """Matches the rows of a data frame and stores the matching ones.
+
+    Args:
+      executor: The worker process pool.
+      data_frame_container: The data frame container.
+    """
+    data_frame = data_frame_container.data_frame
+
+    def _ReadChunks() -> Iterator[tuple[Any, list[str]]]:
+      for start in range(0, len(data_frame), CHUNK_SIZE):
+        chunk = data_frame.iloc[start:start + CHUNK_SIZE]
+        yield start, [
+            _ValuesText(row) for row in chunk.to_dict(orient='records')]
+
+    positions = []
+    ioc_matches = []
+    for start, matches in self._MatchChunks(executor, _ReadChunks()):
+      for index, hits in matches:
+        positions.append(start + index)
+        ioc_matches.append(self._DescribeHits(hits))
+
+    self.logger.info(
+        f'{len(positions)} rows of {data_frame_container.name} matched '
+        'indicators')
+    if not positions:
+      return
+    matching = data_frame.iloc[positions].copy()
+    matching['ioc_matches'] = ioc_matches
+    self.StoreContainer(containers.DataFrame(
+        data_frame=matching,
+        description=(
+            f'Rows of {data_frame_container.name} matching indicators'),
+        name=f'{data_frame_container.name}_ioc_matches',
+        source='IOCMatchProcessor'))
+
+  def Process(self) -> None:
+    """Matches the collected logs against the collected indicators."""
+    self._LoadIndicators()
+    if not self._threats:
+      self.logger.warning('No indicators to match')
+      return
+
+    file_containers = [
+        c for c in self.GetContainers(containers.File)
+        if c.path.endswith('.jsonl')]
+    data_frame_containers = self.GetContainers(containers.DataFrame)
+    self.logger.info(
+        f'Matching {len(self._threats)} indicators against '
+        f'{len(file_containers)} JSONL files and '
+        f'{len(data_frame_containers)} data frames')
+
+    with futures.ProcessPoolExecutor(
+        max_workers=self._max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_InitializeWorker,
+        initargs=(list(self._threats),)) as executor:
+      for file_container in file_containers:
+        self._MatchFile(executor, file_container)
+      for data_frame_container in data_frame_containers:
+        self._MatchDataFrame(executor, data_frame_container)
+
+
+modules_manager.ModulesManager.RegisterModule(IOCMatchProcessor)
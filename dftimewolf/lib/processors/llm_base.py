@@ -163,6 +163,7 @@ class DataFrameLLMProcessor(LLMProcessorBase):
     self.columns_to_process = [x for x in columns_to_process.split(",") if x]
     if len(self.columns_to_process) == 0:
       self.ModuleError("No columns to process", critical=True)
+    self.RegisterRequiredColumns(self.columns_to_process)
 
   def _ProcessDataFrame(self, dataframe: pd.DataFrame) -> None:
     """Processes a dataframe using a LLM provider.
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Returns the analysis VMs leased for an incident to their warm pool."""
+
+from typing import Callable, Optional
+
+from dftimewolf.lib import module
+from dftimewolf.lib.modules import manager as modules_manager
+from dftimewolf.lib import cache
+from dftimewolf.lib import spanner_telemetry as telemetry
+from dftimewolf.lib import vm_pool
+from dftimewolf.lib.containers import manager as container_manager
+
+
+PLATFORMS = ('aws', 'azure', 'gcp')
+
+
+class VMPoolRelease(module.BaseModule):
+  """Returns the analysis VMs leased for an incident to their warm pool.
+
+  Analysis VMs leased by the forensics collectors keep their evidence disks
+  attached once the recipe is done. This module detaches the evidence disks
+  and marks the VMs as free, once the analysis of the incident is over. It
+  then replenishes the pool, so that the collectors never wait for new VMs
+  to start.
+
+  Attributes:
+    incident_id: The incident ID the analysis VMs were leased for.
+    recycle: True to delete the analysis VMs instead of reusing them.
+  """
+
+  def __init__(self,
+               name: str,
+               container_manager_: container_manager.ContainerManager,
+               cache_: cache.DFTWCache,
+               telemetry_: telemetry.BaseTelemetry,
+               publish_message_callback: Callable[[str, str, bool], None]):
+    """Initializes a VM pool release module.
+
+    Args:
+      name: The modules runtime name.
+      container_manager_: A common container manager object.
+      cache_: A common DFTWCache object.
+      telemetry_: A common telemetry collector object.
+      publish_message_callback: A callback to send modules messages to.
+    """
+    super().__init__(name=name,
+                     cache_=cache_,
+                     container_manager_=container_manager_,
+                     telemetry_=telemetry_,
+                     publish_message_callback=publish_message_callback)
+    self.incident_id = ''
+    self.recycle = False
+    self._vm_pool: Optional[vm_pool.VMPool] = None
+
+  # pylint: disable=arguments-differ,too-many-arguments
+  def SetUp(self,
+            platform: str,
+            incident_id: str,
+            zone: str,
+            project_name: Optional[str] = None,
+            profile_name: Optional[str] = None,
+            resource_group_name: Optional[str] = None,
+            lock_bucket: Optional[str] = None,
+            recycle: bool = False,
+            pool_size: int = 0) -> None:
+    """Sets up the VM pool release module.
+
+    Args:
+      platform: The cloud hosting the pool, one of aws, azure or gcp.
+      incident_id: The incident ID the analysis VMs were leased for.
+      zone: The zone of the analysis VMs, or their region on Azure.
+      project_name: The GCP project of the analysis VMs.
+      profile_name: The AWS or Azure profile of the analysis VMs.
+      resource_group_name: The Azure resource group of the analysis VMs.
+      lock_bucket: The S3 bucket holding the lock objects of the AWS analysis
+          VMs.
+      recycle: True to delete the analysis VMs instead of reusing them.
+      pool_size: Number of free VMs to keep in the pool once the VMs are
+          released. 0 does not replenish the pool.
+    """
+    if platform not in PLATFORMS:
+      self.ModuleError(
+          f'Unsupported platform {platform}, expected one of: '
+          f'{", ".join(PLATFORMS)}', critical=True)
+    self.incident_id = incident_id
+    self.recycle = recycle
+
+    backend: vm_pool.PoolBackend
+    if platform == 'gcp':
+      if not project_name:
+        self.ModuleError('project_name is required for gcp', critical=True)
+      backend = vm_pool.GCEPoolBackend(str(project_name), zone)
+    elif platform == 'aws':
+      if not lock_bucket:
+        self.ModuleError('lock_bucket is required for aws', critical=True)
+      backend = vm_pool.AWSPoolBackend(
+          zone, str(profile_name or ''), str(lock_bucket))
+    else:
+      if not resource_group_name:
+        self.ModuleError(
+            'resource_group_name is required for azure', critical=True)
+      backend = vm_pool.AzurePoolBackend(
+          str(resource_group_name), zone, str(profile_name or ''))
+    self._vm_pool = vm_pool.VMPool(backend, int(pool_size))
+
+  def Process(self) -> None:
+    """Returns the analysis VMs leased for the incident to the pool."""
+    assert self._vm_pool
+    released = self._vm_pool.ReleaseLease(self.incident_id, self.recycle)
+    if not released:
+      self.logger.warning(
+          f'No analysis VM is leased for incident {self.incident_id}')
+    else:
+      action = 'Deleted' if self.recycle else 'Returned to the pool'
+      self.PublishMessage(
+          f'{action} analysis VMs of incident {self.incident_id}: '
+          f'{", ".join(released)}')
+    if self._vm_pool.size:
+      started = self._vm_pool.Replenish()
+      if started:
+        self.PublishMessage(
+            f'Started analysis VMs to replenish the pool: '
+            f'{", ".join(vm.name for vm in started)}')
+
+
+modules_manager.ModulesManager.RegisterModule(VMPoolRelease)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""Scans collected files with collected Yara rules."""
+
+import hashlib
+import mmap
+import multiprocessing
+import os
+from concurrent import futures
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from dftimewolf.lib import module
+from dftimewolf.lib.containers import containers
+from dftimewolf.lib.modules import manager as modules_manager
+from dftimewolf.lib import cache
+from dftimewolf.lib import spanner_telemetry as telemetry
+from dftimewolf.lib.containers import manager as container_manager
+
+try:
+  import yara
+  HAS_YARA = True
+except ImportError:
+  HAS_YARA = False
+
+
+# Number of files sent to a worker process at a time.
+SCAN_CHUNK_SIZE = 16
+
+# Maximum number of matched string instances reported per rule and file.
+MAX_REPORTED_INSTANCES = 10
+
+_COLUMNS = ['path', 'rule', 'namespace', 'tags', 'strings', 'error']
+
+# Compiled rules of the worker process, loaded by _InitializeWorker.
+_worker_rules: Any = None
+
+
+def _InitializeWorker(compiled_rules_path: str) -> None:
+  """Loads the compiled rules in a scanning worker process.
+
+  Args:
+    compiled_rules_path: Path to the compiled rules file.
+  """
+  global _worker_rules  # pylint: disable=global-statement
+  _worker_rules = yara.load(compiled_rules_path)
+
+
+def _ScanFile(path: str) -> list[dict[str, Any]]:
+  """Scans a file with the compiled rules of the worker process.
+
+  Args:
+    path: Path to the file to scan.
+
+  Returns:
+    A list of matches, or a single entry describing the error if the file
+    could not be scanned.
+  """
+  try:
+    with open(path, 'rb') as scanned_file:
+      if not os.fstat(scanned_file.fileno()).st_size:
+        matches = _worker_rules.match(data=b'')
+      else:
+        with mmap.mmap(
+            scanned_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+          matches = _worker_rules.match(data=data)
+  except (OSError, yara.Error) as exception:
+    return [{'path': path, 'error': str(exception)}]
+
+  results = []
+  for match in matches:
+    strings = []
+    for string_match in match.strings:
+      for instance in string_match.instances[:MAX_REPORTED_INSTANCES]:
+        strings.append(f'{string_match.identifier}@{instance.offset}')
+    results.append({
+        'path': path,
+        'rule': match.rule,
+        'namespace': match.namespace,
+        'tags': ','.join(match.tags),
+        'strings': ','.join(strings),
+    })
+  return results
+
+
+class YaraScanProcessor(module.BaseModule):
+  """Scans File and Directory containers with YaraRule containers.
+
+  Rules are compiled once and cached on disk, keyed by a hash of the rule
+  texts. A digest of each compiled rules file is stored next to it, and cached
+  files that do not match their digest or fail to load are compiled again.
+  Files are memory-mapped and scanned across a pool of processes.
+  """
+
+  _CACHE_DIRECTORY = '.dftimewolf_yara_cache'
+
+  def __init__(self,
+               name: str,
+               container_manager_: container_manager.ContainerManager,
+               cache_: cache.DFTWCache,
+               telemetry_: telemetry.BaseTelemetry,
+               publish_message_callback: Callable[[str, str, bool], None]):
+    """Initializes a Yara scan processor."""
+    super().__init__(name=name,
+                     cache_=cache_,
+                     container_manager_=container_manager_,
+                     telemetry_=telemetry_,
+                     publish_message_callback=publish_message_callback)
+    self._max_workers = 1
+    self._cache_directory = ''
+
+  # pylint: disable=arguments-differ
+  def SetUp(self,
+            max_workers: Optional[int] = None,
+            cache_directory: Optional[str] = None) -> None:
+    """Sets up the Yara scan processor.
+
+    Args:
+      max_workers: Maximum number of scanning processes. Defaults to the
+          number of CPUs.
+      cache_directory: Where to cache compiled rules. Defaults to a directory
+          in the user's home directory.
+    """
+    if not HAS_YARA:
+      self.ModuleError(
+          'yara-python is required by YaraScanProcessor, install it with '
+          '`poetry install --with yara` or `pip install yara-python`',
+          critical=True)
+    self._max_workers = int(max_workers or os.cpu_count() or 1)
+    self._cache_directory = cache_directory or os.path.join(
+        os.path.expanduser('~'), self._CACHE_DIRECTORY)
+
+  @staticmethod
+  def _FileDigest(path: str) -> str:
+    """Returns the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as input_file:
+      for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+  def _IsCachedRulesValid(self, compiled_rules_path: str) -> bool:
+    """Checks that a cached compiled rules file is intact and loads.
+
+    Args:
+      compiled_rules_path: Path to the cached compiled rules file.
+
+    Returns:
+      True if the file matches its stored digest and yara can load it.
+    """
+    try:
+      with open(f'{compiled_rules_path}.sha256', 'r',
+                encoding='utf-8') as digest_file:
+        expected_digest = digest_file.read().strip()
+      if self._FileDigest(compiled_rules_path) != expected_digest:
+        self.logger.warning(
+            f'Cached compiled rules {compiled_rules_path} do not match their '
+            'digest, compiling them again')
+        return False
+      yara.load(compiled_rules_path)
+    except (OSError, yara.Error) as exception:
+      self.logger.warning(
+          f'Unable to load cached compiled rules {compiled_rules_path}, '
+          f'compiling them again: {exception!s}')
+      return False
+    return True
+
+  def _CompileRules(self, rules: list[containers.YaraRule]) -> str:
+    """Compiles Yara rules, reusing previously compiled rules if possible.
+
+    Each rule container is compiled in its own namespace, so that identical
+    rule names from different sources do not clash.
+
+    Args:
+      rules: The Yara rule containers to compile.
+
+    Returns:
+      Path to the compiled rules file.
+    """
+    sources = {
+        f'{index}_{rule.name}': rule.rule_text
+        for index, rule in enumerate(sorted(
+            rules, key=lambda rule: (rule.name, rule.rule_text)))}
+    digest = hashlib.sha256()
+    for namespace, rule_text in sources.items():
+      digest.update(namespace.encode('utf-8') + b'\0')
+      digest.update(rule_text.encode('utf-8') + b'\0')
+    compiled_rules_path = os.path.join(
+        self._cache_directory, f'{digest.hexdigest()}.yarc')
+
+    if (os.path.exists(compiled_rules_path) and
+        self._IsCachedRulesValid(compiled_rules_path)):
+      self.logger.info(f'Using cached compiled rules {compiled_rules_path}')
+      return compiled_rules_path
+
+    try:
+      compiled_rules = yara.compile(sources=sources)
+    except yara.SyntaxError as exception:
+      self.ModuleError(
+          f'Unable to compile Yara rules: {exception!s}', critical=True)
+    os.makedirs(self._cache_directory, mode=0o700, exist_ok=True)
+    compiled_rules.save(f'{compiled_rules_path}.tmp')
+    with open(f'{compiled_rules_path}.sha256.tmp', 'w',
+              encoding='utf-8') as digest_file:
+      digest_file.write(self._FileDigest(f'{compiled_rules_path}.tmp'))
+    os.replace(f'{compiled_rules_path}.tmp', compiled_rules_path)
+    os.replace(f'{compiled_rules_path}.sha256.tmp',
+               f'{compiled_rules_path}.sha256')
+    return compiled_rules_path
+
+  def _GetPaths(self) -> list[str]:
+    """Lists the files to scan from the File and Directory containers."""
+    roots = [c.path for c in self.GetContainers(containers.File)]
+    roots.extend(c.path for c in self.GetContainers(containers.Directory))
+
+    paths = []
+    for root in roots:
+      if not os.path.isdir(root):
+        paths.append(root)
+        continue
+      for directory, _, filenames in os.walk(root):
+        paths.extend(
+            os.path.join(directory, filename) for filename in filenames)
+    return sorted(set(paths))
+
+  def Process(self) -> None:
+    """Scans the collected files with the collected rules."""
+    rules = self.GetContainers(containers.YaraRule)
+    if not rules:
+      self.logger.warning('No Yara rules to scan with')
+      return
+    paths = self._GetPaths()
+    if not paths:
+      self.logger.warning('No files to scan')
+      return
+
+    compiled_rules_path = self._CompileRules(list(rules))
+    self.logger.info(
+        f'Scanning {len(paths)} files with {len(rules)} Yara rule sets')
+
+    results: list[dict[str, Any]] = []
+    with futures.ProcessPoolExecutor(
+        max_workers=self._max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_InitializeWorker,
+        initargs=(compiled_rules_path,)) as executor:
+      for file_results in executor.map(
+          _ScanFile, paths, chunksize=SCAN_CHUNK_SIZE):
+        results.extend(file_results)
+
+    errors = [result for result in results if result.get('error')]
+    for error in errors:
+      self.logger.warning(f'Unable to scan {error["path"]}: {error["error"]}')
+    matches = [result for result in results if not result.get('error')]
+
+    data_frame = pd.DataFrame(results, columns=_COLUMNS)
+    self.StoreContainer(containers.DataFrame(
+        data_frame=data_frame,
+        description=f'Yara matches in {len(paths)} scanned files',
+        name='yara_scan_results',
+        source='YaraScanProcessor'))
+
+    summary = (
+        f'Yara scan: {len(matches)} matches in '
+        f'{len({match["path"] for match in matches})} of {len(paths)} files '
+        f'({len(errors)} files could not be scanned)')
+    self.PublishMessage(summary)
+    report_lines = [f'## {summary}', '']
+    if matches:
+      report_lines.extend(['Rule|Path|Strings', '---|---|---'])
+      report_lines.extend(
+          f'`{match["rule"]}`|`{match["path"]}`|{match["strings"]}'
+          for match in matches)
+    self.StoreContainer(containers.Report(
+        module_name='YaraScanProcessor',
+        text='\n'.join(report_lines),
+        text_format='markdown'))
+
+
+modules_manager.ModulesManager.RegisterModule(YaraScanProcessor)
@@ -0,0 +1,711 @@
+# -*- coding: utf-8 -*-
+"""A warm pool of reusable forensics analysis VMs.
+
+Starting an analysis VM and installing its forensics packages dominates the
+run time of small cases. A pool keeps a number of pre-provisioned analysis VMs
+around, labelled as members of the pool, that collectors lease instead of
+starting a new VM.
+
+The pool state is stored in the labels (or tags) of the VMs themselves, so it
+is shared by all dfTimewolf runs using the same cloud project or account:
+
+* dftw-pool: The name of the pool the VM belongs to.
+* dftw-pool-state: "free" or "leased".
+* dftw-pool-lease: Identifier of the current lease, usually the incident ID.
+* dftw-pool-expires: When the current lease expires, in seconds since epoch.
+
+A leased VM keeps its evidence disks attached for the analysis once the
+collector is done, so leases are not returned when a run finishes. They are
+returned to the pool by the vm_pool_release recipe, or automatically when they
+expire: the evidence disks are detached and the VM is marked as free again.
+
+Starting new VMs is slow, so collectors only lease VMs and never wait for the
+pool to be replenished: the vm_pool_release recipe replenishes the pool once
+the leases of an incident are returned.
+"""
+
+import abc
+import dataclasses
+import logging
+import re
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+from azure.core import exceptions as az_exceptions
+from botocore import exceptions as boto_exceptions
+from googleapiclient.errors import HttpError
+from libcloudforensics.providers.aws import forensics as aws_forensics
+from libcloudforensics.providers.aws.internal import account as aws_account
+from libcloudforensics.providers.aws.internal import common as aws_common
+from libcloudforensics.providers.aws.internal import ec2
+from libcloudforensics.providers.azure import forensics as az_forensics
+from libcloudforensics.providers.azure.internal import account as az_account
+from libcloudforensics.providers.azure.internal import compute as az_compute
+from libcloudforensics.providers.gcp import forensics as gcp_forensics
+from libcloudforensics.providers.gcp.internal import project as gcp_project
+
+
+logger = logging.getLogger('dftimewolf')
+
+POOL_LABEL = 'dftw-pool'
+STATE_LABEL = 'dftw-pool-state'
+LEASE_LABEL = 'dftw-pool-lease'
+EXPIRES_LABEL = 'dftw-pool-expires'
+
+STATE_FREE = 'free'
+STATE_LEASED = 'leased'
+
+# Default name of the analysis VM pool.
+DEFAULT_POOL_NAME = 'dftw-analysis'
+
+# How long a lease lasts before the VM is returned to the pool.
+DEFAULT_LEASE_SECONDS = 24 * 60 * 60
+
+
+def SanitizeLabelValue(value: str) -> str:
+  """Makes a string usable as a label value on all supported clouds.
+
+  GCE label values are the most restrictive: at most 63 lowercase letters,
+  digits, underscores and dashes.
+
+  Args:
+    value: The value to sanitize.
+
+  Returns:
+    The sanitized value.
+  """
+  return re.sub(r'[^a-z0-9_-]', '-', value.lower())[:63]
+
+
+@dataclasses.dataclass
+class PooledVM:
+  """An analysis VM that is a member of a pool.
+
+  Attributes:
+    name: The VM name.
+    labels: The VM labels or tags.
+    instance: The libcloudforensics instance object.
+  """
+  name: str
+  labels: dict[str, str]
+  instance: Any = None
+
+  @property
+  def state(self) -> str:
+    """The pool state of the VM."""
+    return self.labels.get(STATE_LABEL, '')
+
+  @property
+  def lease_expired(self) -> bool:
+    """Whether the VM is leased and the lease has expired."""
+    try:
+      expires = int(self.labels.get(EXPIRES_LABEL, ''))
+    except ValueError:
+      return False
+    return self.state == STATE_LEASED and expires <= time.time()
+
+
+class PoolBackend(abc.ABC):
+  """Interface to the cloud hosting a pool of analysis VMs."""
+
+  @abc.abstractmethod
+  def ListVms(self, labels: dict[str, str]) -> list[PooledVM]:
+    """Lists the VMs that have all of the given labels.
+
+    Args:
+      labels: The labels to match.
+
+    Returns:
+      The matching VMs.
+    """
+
+  @abc.abstractmethod
+  def CreateVm(self, name: str, labels: dict[str, str]) -> PooledVM:
+    """Starts a new analysis VM.
+
+    Args:
+      name: The VM name.
+      labels: The labels to create the VM with.
+
+    Returns:
+      The new VM.
+    """
+
+  @abc.abstractmethod
+  def UpdateLabels(self,
+                   vm: PooledVM,
+                   labels: dict[str, str],
+                   expected: dict[str, str]) -> bool:
+    """Updates the labels of a VM if its current labels are as expected.
+
+    The check and the update must be atomic, so that two runs cannot lease
+    the same VM.
+
+    Args:
+      vm: The VM to update.
+      labels: The labels to set.
+      expected: Labels the VM must currently have.
+
+    Returns:
+      True if the labels were updated, False if the VM labels did not match.
+    """
+
+  @abc.abstractmethod
+  def DetachDisks(self, vm: PooledVM) -> None:
+    """Detaches all disks but the boot disk from a VM.
+
+    Args:
+      vm: The VM to detach disks from.
+    """
+
+  @abc.abstractmethod
+  def DeleteVm(self, vm: PooledVM) -> None:
+    """Deletes a VM.
+
+    Args:
+      vm: The VM to delete.
+    """
+
+
+class VMPool:
+  """A pool of reusable analysis VMs."""
+
+  def __init__(self,
+               backend: PoolBackend,
+               size: int,
+               pool_name: str = DEFAULT_POOL_NAME,
+               lease_seconds: int = DEFAULT_LEASE_SECONDS) -> None:
+    """Initializes the pool.
+
+    Args:
+      backend: The cloud backend of the pool.
+      size: Number of free VMs to keep in the pool.
+      pool_name: Name of the pool.
+      lease_seconds: How long leases last.
+    """
+    self._backend = backend
+    self.size = size
+    self.pool_name = SanitizeLabelValue(pool_name)
+    self._lease_seconds = lease_seconds
+    self._lock = threading.Lock()
+
+  def _ListVms(self) -> list[PooledVM]:
+    """Lists the VMs of the pool, returning expired leases first."""
+    vms = self._backend.ListVms({POOL_LABEL: self.pool_name})
+    for vm in vms:
+      if vm.lease_expired:
+        logger.info(f'Lease of analysis VM {vm.name} expired, returning it')
+        self._Return(vm)
+    return sorted(vms, key=lambda vm: vm.name)
+
+  def _LeaseLabels(self, lease_id: str) -> dict[str, str]:
+    """Returns the labels of a VM leased under the given identifier."""
+    return {
+        POOL_LABEL: self.pool_name,
+        STATE_LABEL: STATE_LEASED,
+        LEASE_LABEL: SanitizeLabelValue(lease_id),
+        EXPIRES_LABEL: str(int(time.time()) + self._lease_seconds),
+    }
+
+  def _FreeLabels(self) -> dict[str, str]:
+    """Returns the labels of a free VM."""
+    return {
+        POOL_LABEL: self.pool_name,
+        STATE_LABEL: STATE_FREE,
+        LEASE_LABEL: '',
+        EXPIRES_LABEL: '',
+    }
+
+  def _NewVmName(self) -> str:
+    """Returns a unique name for a new VM of the pool."""
+    return f'{self.pool_name}-{uuid.uuid4().hex[:8]}'
+
+  def _Return(self, vm: PooledVM) -> None:
+    """Detaches the disks of a leased VM and marks it as free.
+
+    Args:
+      vm: The leased VM.
+    """
+    self._backend.DetachDisks(vm)
+    if self._backend.UpdateLabels(
+        vm, self._FreeLabels(), {LEASE_LABEL: vm.labels.get(LEASE_LABEL, '')}):
+      vm.labels.update(self._FreeLabels())
+
+  def Lease(self, lease_id: str) -> PooledVM:
+    """Leases a free VM from the pool, starting a new one if there is none.
+
+    Args:
+      lease_id: Identifier of the lease, usually the incident ID.
+
+    Returns:
+      The leased VM.
+    """
+    with self._lock:
+      for vm in self._ListVms():
+        if vm.state != STATE_FREE:
+          continue
+        labels = self._LeaseLabels(lease_id)
+        if self._backend.UpdateLabels(vm, labels, {STATE_LABEL: STATE_FREE}):
+          vm.labels.update(labels)
+          logger.info(f'Leased analysis VM {vm.name} from pool {self.pool_name}')
+          return vm
+      name = self._NewVmName()
+
+    logger.info(
+        f'No free analysis VM in pool {self.pool_name}, starting {name}')
+    return self._backend.CreateVm(name, self._LeaseLabels(lease_id))
+
+  def _Release(self, vm: PooledVM, recycle: bool) -> None:
+    """Returns a VM to the pool, or deletes it.
+
+    Args:
+      vm: The VM to release.
+      recycle: True to delete the VM instead of reusing it.
+    """
+    if recycle:
+      logger.info(f'Deleting analysis VM {vm.name}')
+      self._backend.DeleteVm(vm)
+    elif vm.state == STATE_LEASED:
+      logger.info(f'Returning analysis VM {vm.name} to pool {self.pool_name}')
+      self._Return(vm)
+
+  def Release(self, vm_name: str, recycle: bool = False) -> None:
+    """Returns a leased VM to the pool.
+
+    Args:
+      vm_name: Name of the leased VM.
+      recycle: True to delete the VM instead of reusing it. The pool is
+          replenished by the next call to Replenish.
+
+    Raises:
+      ValueError: If the VM is not a member of the pool.
+    """
+    vms = [vm for vm in self._ListVms() if vm.name == vm_name]
+    if not vms:
+      raise ValueError(
+          f'Analysis VM {vm_name} is not part of pool {self.pool_name}')
+    self._Release(vms[0], recycle)
+
+  def ReleaseLease(self, lease_id: str, recycle: bool = False) -> list[str]:
+    """Returns all the VMs leased under an identifier to the pool.
+
+    Args:
+      lease_id: Identifier of the lease, usually the incident ID.
+      recycle: True to delete the VMs instead of reusing them.
+
+    Returns:
+      The names of the released VMs.
+    """
+    lease_label = SanitizeLabelValue(lease_id)
+    vms = [
+        vm for vm in self._ListVms()
+        if vm.state == STATE_LEASED and
+        vm.labels.get(LEASE_LABEL) == lease_label]
+    for vm in vms:
+      self._Release(vm, recycle)
+    return [vm.name for vm in vms]
+
+  def Replenish(self) -> list[PooledVM]:
+    """Starts or deletes VMs so that the pool has as many free VMs as its size.
+
+    Returns:
+      The VMs that were started.
+    """
+    with self._lock:
+      free_vms = [vm for vm in self._ListVms() if vm.state == STATE_FREE]
+      names = [self._NewVmName() for _ in range(self.size - len(free_vms))]
+    for vm in free_vms[self.size:]:
+      # Lease the VM first, so that no other run leases it while it is deleted.
+      if self._backend.UpdateLabels(
+          vm, self._LeaseLabels(self.pool_name), {STATE_LABEL: STATE_FREE}):
+        logger.info(
+            f'Deleting analysis VM {vm.name}, pool {self.pool_name} has more '
+            f'than {self.size:d} free VMs')
+        self._backend.DeleteVm(vm)
+    created = []
+    for name in names:
+      logger.info(f'Starting analysis VM {name} for pool {self.pool_name}')
+      created.append(self._backend.CreateVm(name, self._FreeLabels()))
+    return created
+
+
+class GCEPoolBackend(PoolBackend):
+  """Pool backend for Google Compute Engine analysis VMs."""
+
+  # pylint: disable=too-many-arguments
+  def __init__(self,
+               project_id: str,
+               zone: str,
+               boot_disk_size: int = 50,
+               boot_disk_type: str = 'pd-standard',
+               cpu_cores: int = 4,
+               image_project: str = 'ubuntu-os-cloud',
+               image_family: str = 'ubuntu-2204-lts') -> None:
+    """Initializes the backend.
+
+    The analysis VM options are only used to start new VMs.
+
+    Args:
+      project_id: Project to start the analysis VMs in.
+      zone: Zone to start the analysis VMs in.
+      boot_disk_size: Size of the analysis VM boot disk (in GB).
+      boot_disk_type: Disk type of the analysis VM boot disk.
+      cpu_cores: Number of CPU cores of the analysis VMs.
+      image_project: Project hosting the analysis VM image.
+      image_family: Image family of the analysis VM image.
+    """
+    self._project = gcp_project.GoogleCloudProject(
+        project_id, default_zone=zone)
+    self._zone = zone
+    self._vm_options = (boot_disk_size, boot_disk_type, cpu_cores)
+    self._image_project = image_project
+    self._image_family = image_family
+
+  def ListVms(self, labels: dict[str, str]) -> list[PooledVM]:
+    """Lists the VMs of the zone that have all of the given labels."""
+    instances = self._project.compute.ListInstanceByLabels(
+        labels, filter_union=False)
+    return [
+        PooledVM(name=name, labels=instance.GetLabels(), instance=instance)
+        for name, instance in instances.items()
+        if instance.zone == self._zone]
+
+  def CreateVm(self, name: str, labels: dict[str, str]) -> PooledVM:
+    """Starts a new analysis VM with the given labels."""
+    # pylint: disable=too-many-function-args
+    instance, _ = gcp_forensics.StartAnalysisVm(
+        self._project.project_id,
+        name,
+        self._zone,
+        *self._vm_options,
+        image_project=self._image_project,
+        image_family=self._image_family)
+    instance.AddLabels(labels, blocking_call=True)
+    return PooledVM(name=name, labels=dict(labels), instance=instance)
+
+  def UpdateLabels(self,
+                   vm: PooledVM,
+                   labels: dict[str, str],
+                   expected: dict[str, str]) -> bool:
+    """Updates the labels of a VM, guarded by the label fingerprint."""
+    client = self._project.compute.GceApi().instances()  # pylint: disable=no-member
+    resource = client.get(
+        project=self._project.project_id, zone=self._zone,
+        instance=vm.name).execute()
+    current = resource.get('labels', {})
+    if any(current.get(key, '') != value for key, value in expected.items()):
+      return False
+    try:
+      client.setLabels(
+          project=self._project.project_id, zone=self._zone, instance=vm.name,
+          body={
+              'labels': dict(current, **labels),
+              'labelFingerprint': resource['labelFingerprint'],
+          }).execute()
+    except HttpError as exception:
+      if exception.resp.status == 412:
+        return False
+      raise
+    return True
+
+  def DetachDisks(self, vm: PooledVM) -> None:
+    """Detaches all disks but the boot disk from a VM."""
+    boot_disk = vm.instance.GetBootDisk().name
+    for name, disk in vm.instance.ListDisks().items():
+      if name != boot_disk:
+        vm.instance.DetachDisk(disk)
+
+  def DeleteVm(self, vm: PooledVM) -> None:
+    """Deletes a VM and its boot disk."""
+    vm.instance.Delete(delete_disks=False)
+
+
+class AWSPoolBackend(PoolBackend):
+  """Pool backend for Amazon EC2 analysis VMs.
+
+  EC2 tags cannot be updated conditionally, so tag updates are serialized by a
+  lock object per VM in an S3 bucket, created with a conditional write that
+  fails if the object already exists.
+  """
+
+  # Prefix of the lock objects in the lock bucket.
+  _LOCK_PREFIX = 'dftw-pool-locks/'
+
+  # Age after which a lock object is considered left over by a crashed run.
+  _LOCK_SECONDS = 300
+
+  # pylint: disable=too-many-arguments
+  def __init__(self,
+               zone: str,
+               profile_name: str,
+               lock_bucket: str,
+               boot_volume_size: int = 50,
+               cpu_cores: int = 16,
+               ami: Optional[str] = None) -> None:
+    """Initializes the backend.
+
+    The analysis VM options are only used to start new VMs.
+
+    Args:
+      zone: Availability zone to start the analysis VMs in.
+      profile_name: AWS profile to start the analysis VMs with.
+      lock_bucket: S3 bucket holding the lock objects of the pool VMs.
+      boot_volume_size: Size of the analysis VM boot volume (in GB).
+      cpu_cores: Number of CPU cores of the analysis VMs.
+      ami: The AMI of the analysis VMs, or None for the default.
+
+    Raises:
+      ValueError: If no lock bucket is given.
+    """
+    if not lock_bucket:
+      raise ValueError('An S3 lock bucket is required to pool AWS VMs')
+    self._account = aws_account.AWSAccount(zone, aws_profile=profile_name)
+    self._lock_bucket = lock_bucket
+    self._zone = zone
+    self._profile_name = profile_name
+    self._boot_volume_size = boot_volume_size
+    self._cpu_cores = cpu_cores
+    self._ami = ami
+
+  def _Describe(self, filters: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Describes the running and stopped instances matching filters."""
+    client = self._account.ClientApi(aws_common.EC2_SERVICE)
+    paginator = client.get_paginator('describe_instances')
+    filters = filters + [
+        {'Name': 'availability-zone', 'Values': [self._zone]},
+        {'Name': 'instance-state-name', 'Values': ['running', 'stopped']}]
+    return [
+        instance
+        for page in paginator.paginate(Filters=filters)
+        for reservation in page['Reservations']
+        for instance in reservation['Instances']]
+
+  def _ToPooledVm(self, instance: dict[str, Any]) -> PooledVM:
+    """Converts an instance description to a pooled VM."""
+    tags = {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
+    name = tags.get('Name', instance['InstanceId'])
+    return PooledVM(
+        name=name,
+        labels=tags,
+        instance=ec2.AWSInstance(
+            self._account, instance['InstanceId'], self._account.default_region,
+            self._zone, instance.get('VpcId', ''), name=name))
+
+  def ListVms(self, labels: dict[str, str]) -> list[PooledVM]:
+    """Lists the VMs of the zone that have all of the given tags."""
+    return [
+        self._ToPooledVm(instance) for instance in self._Describe([
+            {'Name': f'tag:{key}', 'Values': [value]}
+            for key, value in labels.items()])]
+
+  def CreateVm(self, name: str, labels: dict[str, str]) -> PooledVM:
+    """Starts a new analysis VM with the given tags."""
+    instance, _ = aws_forensics.StartAnalysisVm(
+        name,
+        self._zone,
+        self._boot_volume_size,
+        ami=self._ami,
+        cpu_cores=self._cpu_cores,
+        dst_profile=self._profile_name,
+        tags=labels)
+    return PooledVM(name=name, labels=dict(labels), instance=instance)
+
+  def _AcquireLock(self, s3_client: Any, key: str) -> bool:
+    """Creates a lock object, unless another run holds it.
+
+    A lock object older than _LOCK_SECONDS is deleted and acquired again,
+    so that a crashed run does not lock a VM forever.
+
+    Args:
+      s3_client: An S3 client.
+      key: The key of the lock object.
+
+    Returns:
+      True if the lock was acquired.
+    """
+    for _ in range(2):
+      try:
+        s3_client.put_object(
+            Bucket=self._lock_bucket, Key=key, Body=b'', IfNoneMatch='*')
+        return True
+      except boto_exceptions.ClientError as exception:
+        if exception.response['Error']['Code'] not in (
+            'PreconditionFailed', 'ConditionalRequestConflict'):
+          raise
+      try:
+        lock = s3_client.head_object(Bucket=self._lock_bucket, Key=key)
+      except boto_exceptions.ClientError:
+        # Released in the meantime.
+        continue
+      if lock['LastModified'].timestamp() > time.time() - self._LOCK_SECONDS:
+        return False
+      logger.warning(f'Removing stale analysis VM pool lock {key}')
+      try:
+        s3_client.delete_object(
+            Bucket=self._lock_bucket, Key=key, IfMatch=lock['ETag'])
+      except boto_exceptions.ClientError:
+        return False
+    return False
+
+  def UpdateLabels(self,
+                   vm: PooledVM,
+                   labels: dict[str, str],
+                   expected: dict[str, str]) -> bool:
+    """Updates the tags of a VM while holding its S3 lock object."""
+    instance_id = vm.instance.instance_id
+    s3_client = self._account.ClientApi(aws_common.S3_SERVICE)
+    lock_key = f'{self._LOCK_PREFIX}{instance_id}'
+    if not self._AcquireLock(s3_client, lock_key):
+      return False
+    try:
+      descriptions = self._Describe(
+          [{'Name': 'instance-id', 'Values': [instance_id]}])
+      if not descriptions:
+        return False
+      current = self._ToPooledVm(descriptions[0]).labels
+      if any(current.get(key, '') != value for key, value in expected.items()):
+        return False
+      self._account.ClientApi(aws_common.EC2_SERVICE).create_tags(
+          Resources=[instance_id],
+          Tags=[{'Key': key, 'Value': value} for key, value in labels.items()])
+      return True
+    finally:
+      s3_client.delete_object(Bucket=self._lock_bucket, Key=lock_key)
+
+  def DetachDisks(self, vm: PooledVM) -> None:
+    """Detaches all volumes but the root volume from a VM."""
+    instance_id = vm.instance.instance_id
+    client = self._account.ClientApi(aws_common.EC2_SERVICE)
+    description = self._Describe(
+        [{'Name': 'instance-id', 'Values': [instance_id]}])[0]
+    volume_ids = [
+        mapping['Ebs']['VolumeId']
+        for mapping in description.get('BlockDeviceMappings', [])
+        if mapping['DeviceName'] != description.get('RootDeviceName')]
+    for volume_id in volume_ids:
+      client.detach_volume(VolumeId=volume_id, InstanceId=instance_id)
+    if volume_ids:
+      client.get_waiter('volume_available').wait(VolumeIds=volume_ids)
+
+  def DeleteVm(self, vm: PooledVM) -> None:
+    """Terminates a VM."""
+    vm.instance.Delete()
+
+
+class AzurePoolBackend(PoolBackend):
+  """Pool backend for Microsoft Azure analysis VMs.
+
+  Tag updates are conditioned on the ETag of the VM, so that an update fails
+  if another run updated the VM since its tags were read.
+  """
+
+  # pylint: disable=too-many-arguments
+  def __init__(self,
+               resource_group_name: str,
+               region: str,
+               profile_name: str,
+               ssh_public_key: str = '',
+               boot_disk_size: int = 50,
+               cpu_cores: int = 4,
+               memory_in_mb: int = 8192) -> None:
+    """Initializes the backend.
+
+    The analysis VM options are only used to start new VMs.
+
+    Args:
+      resource_group_name: Resource group to start the analysis VMs in.
+      region: Region to start the analysis VMs in. Defaults to the default
+          region of the account.
+      profile_name: Azure profile to start the analysis VMs with.
+      ssh_public_key: The public SSH key to add to the analysis VMs.
+      boot_disk_size: Size of the analysis VM boot disk (in GB).
+      cpu_cores: Number of CPU cores of the analysis VMs.
+      memory_in_mb: Memory of the analysis VMs, in MB.
+    """
+    self._account = az_account.AZAccount(
+        resource_group_name, profile_name=profile_name)
+    self._resource_group_name = resource_group_name
+    self._region = region or self._account.default_region
+    self._profile_name = profile_name
+    self._ssh_public_key = ssh_public_key
+    self._boot_disk_size = boot_disk_size
+    self._cpu_cores = cpu_cores
+    self._memory_in_mb = memory_in_mb
+
+  @property
+  def _vms(self) -> Any:
+    """The Azure virtual machines client."""
+    return self._account.compute.compute_client.virtual_machines
+
+  def _ToPooledVm(self, vm: Any) -> PooledVM:
+    """Converts an Azure virtual machine to a pooled VM."""
+    return PooledVM(
+        name=vm.name,
+        labels=dict(vm.tags or {}),
+        instance=az_compute.AZComputeVirtualMachine(
+            self._account, vm.id, vm.name, vm.location, zones=vm.zones))
+
+  def ListVms(self, labels: dict[str, str]) -> list[PooledVM]:
+    """Lists the VMs of the resource group that have all of the given tags."""
+    return [
+        self._ToPooledVm(vm)
+        for vm in self._vms.list(self._resource_group_name)
+        if vm.location == self._region and all(
+            (vm.tags or {}).get(key) == value
+            for key, value in labels.items())]
+
+  def CreateVm(self, name: str, labels: dict[str, str]) -> PooledVM:
+    """Starts a new analysis VM with the given tags."""
+    instance, _ = az_forensics.StartAnalysisVm(
+        self._resource_group_name,
+        name,
+        self._boot_disk_size,
+        self._ssh_public_key,
+        cpu_cores=self._cpu_cores,
+        memory_in_mb=self._memory_in_mb,
+        region=self._region,
+        tags=labels,
+        dst_profile=self._profile_name)
+    return PooledVM(name=name, labels=dict(labels), instance=instance)
+
+  def UpdateLabels(self,
+                   vm: PooledVM,
+                   labels: dict[str, str],
+                   expected: dict[str, str]) -> bool:
+    """Updates the tags of a VM, guarded by the VM ETag.
+
+    Raises:
+      RuntimeError: If the compute API does not return the VM ETag.
+      HttpResponseError: If the update fails for another reason than a
+          concurrent update.
+    """
+    model = self._vms.get(self._resource_group_name, vm.name)
+    if not model.etag:
+      raise RuntimeError(
+          f'No ETag returned for VM {vm.name}, unable to lease it safely')
+    current = dict(model.tags or {})
+    if any(current.get(key, '') != value for key, value in expected.items()):
+      return False
+    try:
+      self._vms.begin_update(
+          self._resource_group_name, vm.name,
+          {'tags': dict(current, **labels)}, if_match=model.etag).result()
+    except az_exceptions.HttpResponseError as exception:
+      if exception.status_code == 412:
+        return False
+      raise
+    return True
+
+  def DetachDisks(self, vm: PooledVM) -> None:
+    """Detaches all data disks from a VM."""
+    model = self._vms.get(self._resource_group_name, vm.name)
+    if model.storage_profile.data_disks:
+      model.storage_profile.data_disks = []
+      self._vms.begin_create_or_update(
+          self._resource_group_name, vm.name, model).result()
+
+  def DeleteVm(self, vm: PooledVM) -> None:
+    """Deletes a VM."""
+    self._vms.begin_delete(self._resource_group_name, vm.name).result()
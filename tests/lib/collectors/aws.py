@@ -10,6 +10,7 @@ import mock
 from libcloudforensics.providers.aws.internal import account as aws_account
 from libcloudforensics.providers.aws.internal import ebs, ec2
 
+from dftimewolf.lib import errors
 from dftimewolf.lib.collectors import aws
 from dftimewolf.lib.containers import containers
 from tests.lib import modules_test_base
@@ -140,6 +141,38 @@ class AWSCollectorTest(modules_test_base.ModuleTestBase):
         dst_profile='test-analysis-profile-name'
     )
 
+  # pylint: disable=invalid-name
+  @mock.patch('boto3.session.Session._setup_loader')
+  @mock.patch('libcloudforensics.providers.aws.forensics.StartAnalysisVm')
+  @mock.patch('dftimewolf.lib.vm_pool.VMPool')
+  @mock.patch('dftimewolf.lib.vm_pool.AWSPoolBackend')
+  def testSetUpVmPool(
+      self, mock_backend, mock_pool, mock_StartAnalysisVm, mock_loader):
+    """Tests leasing the analysis VM from a pool."""
+    mock_loader.return_value = None
+    mock_pool.return_value.Lease.return_value.instance = FAKE_ANALYSIS_VM
+
+    self._module.SetUp(
+        'test-remote-profile-name',
+        'test-remote-zone',
+        'fake_incident_id',
+        remote_instance_id='my-owned-instance-id',
+        analysis_zone='test-analysis-zone',
+        vm_pool_size=2,
+        vm_pool_lock_bucket='test-lock-bucket')
+    self._AssertNoErrors()
+
+    mock_StartAnalysisVm.assert_not_called()
+    mock_backend.assert_called_with(
+        'test-analysis-zone', 'test-remote-profile-name', 'test-lock-bucket',
+        50, 16, None)
+    mock_pool.assert_called_with(mock_backend.return_value, 2)
+    mock_pool.return_value.Lease.assert_called_with('fake_incident_id')
+    mock_pool.return_value.Replenish.assert_not_called()
+    self.assertEqual(self._module.analysis_vms, [FAKE_ANALYSIS_VM])
+    tickets = self._module.GetContainers(containers.TicketAttribute)
+    self.assertEqual([t.value for t in tickets], ['fake-analysis-vm'])
+
   # pylint: disable=line-too-long, invalid-name
   @mock.patch('boto3.session.Session._setup_loader')
   @mock.patch('libcloudforensics.providers.aws.forensics.StartAnalysisVm')
@@ -184,6 +217,117 @@ class AWSCollectorTest(modules_test_base.ModuleTestBase):
         'fake-volume-id-copy',
         forensics_vm.evidence_disk.volume_id)
 
+  # pylint: disable=line-too-long, invalid-name
+  @mock.patch('boto3.session.Session._setup_loader')
+  @mock.patch('libcloudforensics.providers.aws.forensics.StartAnalysisVm')
+  @mock.patch('libcloudforensics.providers.aws.forensics.CreateVolumeCopy')
+  @mock.patch('dftimewolf.lib.collectors.aws.AWSCollector._FindVolumesToCopy')
+  def testProcessSharding(self,
+                          mock_FindVolumesToCopy,
+                          mock_CreateVolumeCopy,
+                          mock_StartAnalysisVm,
+                          mock_loader):
+    """Tests that volumes are sharded across several analysis VMs."""
+    first_vm = mock.Mock(instance_id='vm-0')
+    first_vm.name = 'aws-forensics-vm-fake_incident_id'
+    second_vm = mock.Mock(instance_id='vm-1')
+    second_vm.name = 'aws-forensics-vm-fake_incident_id-1'
+    mock_StartAnalysisVm.side_effect = [(first_vm, None), (second_vm, None)]
+    volumes = [
+        ebs.AWSVolume(
+            f'fake-volume-id-{index:d}', FAKE_AWS_ACCOUNT, 'fake-zone-2',
+            'fake-zone-2b', False)
+        for index in range(13)]
+    mock_FindVolumesToCopy.return_value = volumes
+    mock_CreateVolumeCopy.side_effect = lambda *_, volume_id, **__: (
+        ebs.AWSVolume(
+            volume_id + '-copy', FAKE_AWS_ACCOUNT, 'fake-zone-2',
+            'fake-zone-2b', False))
+    mock_loader.return_value = None
+
+    self._module.SetUp(
+        'test-remote-profile-name',
+        'test-remote-zone',
+        'fake_incident_id',
+        remote_instance_id='my-owned-instance-id',
+        all_volumes=True)
+    self._ProcessModule()
+
+    mock_StartAnalysisVm.assert_called_with(
+        'aws-forensics-vm-fake_incident_id-1',
+        'test-remote-zone',
+        boot_volume_size=50,
+        ami=None,
+        cpu_cores=16,
+        dst_profile='test-remote-profile-name')
+    self.assertEqual(
+        sorted(call[0][1] for call in first_vm.AttachVolume.call_args_list),
+        [f'/dev/sd{suffix:s}' for suffix in 'fghijklmnop'])
+    self.assertEqual(
+        sorted(call[0][1] for call in second_vm.AttachVolume.call_args_list),
+        ['/dev/sdf', '/dev/sdg'])
+
+    forensics_vms = self._module.GetContainers(containers.ForensicsVM)
+    self.assertEqual(
+        [vm.evidence_disk.volume_id for vm in forensics_vms],
+        [volume.volume_id + '-copy' for volume in volumes])
+    self.assertEqual(
+        [vm.name for vm in forensics_vms],
+        [first_vm.name] * 11 + [second_vm.name] * 2)
+    ticket_attributes = self._module.GetContainers(
+        containers.TicketAttribute)
+    self.assertEqual(
+        [attribute.value for attribute in ticket_attributes],
+        [first_vm.name, second_vm.name])
+
+  # pylint: disable=line-too-long, invalid-name
+  @mock.patch('boto3.session.Session._setup_loader')
+  @mock.patch('libcloudforensics.providers.aws.forensics.StartAnalysisVm')
+  @mock.patch('libcloudforensics.providers.aws.forensics.CreateVolumeCopy')
+  @mock.patch('dftimewolf.lib.collectors.aws.AWSCollector._FindVolumesToCopy')
+  def testProcessCopyFailure(self,
+                             mock_FindVolumesToCopy,
+                             mock_CreateVolumeCopy,
+                             mock_StartAnalysisVm,
+                             mock_loader):
+    """Tests that successful copies are output when another copy fails."""
+    analysis_vm = mock.Mock(instance_id='vm-0')
+    analysis_vm.name = 'aws-forensics-vm-fake_incident_id'
+    mock_StartAnalysisVm.return_value = (analysis_vm, None)
+    volumes = [
+        ebs.AWSVolume(
+            f'fake-volume-id-{index:d}', FAKE_AWS_ACCOUNT, 'fake-zone-2',
+            'fake-zone-2b', False)
+        for index in range(3)]
+    mock_FindVolumesToCopy.return_value = volumes
+
+    def _CreateVolumeCopy(*unused_args, volume_id, **unused_kwargs):
+      if volume_id == 'fake-volume-id-1':
+        raise RuntimeError('Snapshot failed')
+      return ebs.AWSVolume(
+          volume_id + '-copy', FAKE_AWS_ACCOUNT, 'fake-zone-2',
+          'fake-zone-2b', False)
+
+    mock_CreateVolumeCopy.side_effect = _CreateVolumeCopy
+    mock_loader.return_value = None
+
+    self._module.SetUp(
+        'test-remote-profile-name',
+        'test-remote-zone',
+        'fake_incident_id',
+        remote_instance_id='my-owned-instance-id',
+        all_volumes=True)
+    with self.assertRaises(errors.DFTimewolfError) as error:
+      self._ProcessModule()
+    self.assertIn('1 of 3 volume copies failed', error.exception.message)
+    self.assertIn(
+        'fake-volume-id-1: Snapshot failed', error.exception.message)
+
+    forensics_vms = self._module.GetContainers(containers.ForensicsVM)
+    self.assertEqual(
+        [vm.evidence_disk.volume_id for vm in forensics_vms],
+        ['fake-volume-id-0-copy', 'fake-volume-id-2-copy'])
+
   # pylint: disable=line-too-long
   @mock.patch('boto3.session.Session._setup_loader')
   @mock.patch('libcloudforensics.providers.aws.internal.ec2.AWSInstance.GetBootVolume')
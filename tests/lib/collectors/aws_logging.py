@@ -4,6 +4,11 @@
 
 
 import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
 import unittest
 from unittest import mock
 from datetime import datetime as dt
@@ -13,9 +18,46 @@ from botocore import exceptions as boto_exceptions
 from dftimewolf.lib.collectors import aws_logging
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib import errors
+from dftimewolf.lib import high_water_marks
 from tests.lib import modules_test_base
 
 
+# pylint: disable=invalid-name
+class FakeS3Client:
+  """A local in-memory stand-in for the S3 API used by the collector."""
+
+  def __init__(self, objects):
+    self.objects = objects
+
+  def get_paginator(self, operation_name):
+    """Returns a paginator over the stored objects."""
+    assert operation_name == 'list_objects_v2'
+    client = self
+
+    class _Paginator:
+
+      def paginate(self, Bucket, Prefix):
+        """Yields a single page of objects matching the prefix."""
+        del Bucket  # Unused
+        contents = [{'Key': key, 'Size': len(data)}
+                    for key, data in sorted(client.objects.items())
+                    if key.startswith(Prefix)]
+        return [{'Contents': contents}] if contents else [{}]
+
+    return _Paginator()
+
+  def get_object(self, Bucket, Key):
+    """Returns an object."""
+    del Bucket  # Unused
+    return {'Body': io.BytesIO(self.objects[Key])}
+# pylint: enable=invalid-name
+
+
+def _TrailObject(records):
+  """Builds a gzipped CloudTrail object."""
+  return gzip.compress(json.dumps({'Records': records}).encode('utf-8'))
+
+
 class AWSLoggingTest(modules_test_base.ModuleTestBase):
   """Tests for the AWS logging collector."""
 
@@ -89,6 +131,172 @@ class AWSLoggingTest(modules_test_base.ModuleTestBase):
       self._ProcessModule()
     mock_client.lookup_events.side_effect = None
 
+  @mock.patch('boto3.session.Session')
+  def testProcessTrailBucket(self, mock_boto3):
+    """Tests reading CloudTrail objects from an S3 bucket."""
+    prefix = 'trail/AWSLogs/123456789012/CloudTrail'
+    fake_s3 = FakeS3Client({
+        f'{prefix}/us-east-1/2021/01/01/a.json.gz': _TrailObject([
+            {'eventTime': '2021-01-01T10:00:00Z', 'eventName': 'RunInstances',
+             'userIdentity': {'userName': 'fakename'}},
+            {'eventTime': '2021-01-01T11:00:00Z', 'eventName': 'GetObject',
+             'userIdentity': {'userName': 'othername'}},
+        ]),
+        f'{prefix}/us-east-1/2021/01/03/b.json.gz': _TrailObject([
+            {'eventTime': '2021-01-02T23:59:00Z', 'eventName': 'Late',
+             'userIdentity': {'userName': 'fakename'}},
+            {'eventTime': '2021-01-03T01:00:00Z', 'eventName': 'OutOfRange',
+             'userIdentity': {'userName': 'fakename'}},
+        ]),
+        f'{prefix}/us-west-2/2021/01/01/c.json.gz': _TrailObject([
+            {'eventTime': '2021-01-01T12:00:00Z', 'eventName': 'AssumeRole',
+             'userIdentity': {'sessionContext': {
+                 'sessionIssuer': {'userName': 'fakename'}}}},
+        ]),
+        f'{prefix}/eu-west-1/2021/01/01/d.json.gz': _TrailObject([
+            {'eventTime': '2021-01-01T12:00:00Z', 'eventName': 'OtherRegion',
+             'userIdentity': {'userName': 'fakename'}},
+        ]),
+    })
+    mock_session = mock.MagicMock(spec=['client'])
+    mock_sts = mock.MagicMock(spec=['get_caller_identity'])
+    mock_sts.get_caller_identity.return_value = {'Account': '123456789012'}
+    mock_session.client.side_effect = (
+        lambda name, **kwargs: fake_s3 if name == 's3' else mock_sts)
+    mock_boto3.return_value = mock_session
+
+    self._module.SetUp(
+        region='us-east-1',
+        query_filter='Username,fakename',
+        start_time=datetime.datetime(2021, 1, 1, 0, 0, 0),
+        end_time=datetime.datetime(2021, 1, 3, 0, 0, 0),
+        trail_bucket='fake-bucket',
+        trail_prefix='/trail/',
+        trail_regions='us-east-1,us-west-2')
+    self._ProcessModule()
+
+    aws_containers = self._module.GetContainers(containers.File)
+    self.assertEqual(len(aws_containers), 1)
+    with open(aws_containers[0].path, encoding='utf-8') as output_file:
+      event_names = sorted(
+          json.loads(line)['EventName'] for line in output_file)
+    self.assertEqual(event_names, ['AssumeRole', 'Late', 'RunInstances'])
+
+  @mock.patch('boto3.session.Session')
+  def testTrailBucketEventFormat(self, mock_boto3):
+    """Tests that S3 and LookupEvents collections write the same events."""
+    record = {
+        'eventVersion': '1.08',
+        'eventID': 'abc-123',
+        'eventTime': '2021-01-01T10:00:00Z',
+        'eventSource': 'ec2.amazonaws.com',
+        'eventName': 'RunInstances',
+        'readOnly': False,
+        'userIdentity': {'userName': 'fakename', 'accessKeyId': 'AKIAFAKE'},
+        'resources': [{'type': 'AWS::EC2::Instance', 'ARN': 'i-0123'}],
+    }
+    # The event returned by LookupEvents for the same record.
+    lookup_event = {
+        'EventId': 'abc-123',
+        'EventName': 'RunInstances',
+        'ReadOnly': 'false',
+        'AccessKeyId': 'AKIAFAKE',
+        'EventTime': dt(2021, 1, 1, 10, 0, 0, tzinfo=datetime.timezone.utc),
+        'EventSource': 'ec2.amazonaws.com',
+        'Username': 'fakename',
+        'Resources': [
+            {'ResourceType': 'AWS::EC2::Instance', 'ResourceName': 'i-0123'}],
+        'CloudTrailEvent': json.dumps(record),
+    }
+    fake_s3 = FakeS3Client({
+        'AWSLogs/123456789012/CloudTrail/us-east-1/2021/01/01/a.json.gz':
+            _TrailObject([record])})
+    mock_cloudtrail = mock.MagicMock(spec=['lookup_events'])
+    mock_cloudtrail.lookup_events.return_value = {'Events': [lookup_event]}
+    mock_sts = mock.MagicMock(spec=['get_caller_identity'])
+    mock_sts.get_caller_identity.return_value = {'Account': '123456789012'}
+    clients = {'s3': fake_s3, 'cloudtrail': mock_cloudtrail, 'sts': mock_sts}
+    mock_session = mock.MagicMock(spec=['client'])
+    mock_session.client.side_effect = lambda name, **kwargs: clients[name]
+    mock_boto3.return_value = mock_session
+
+    lines = []
+    for trail_bucket in (None, 'fake-bucket'):
+      self._module.SetUp(
+          region='us-east-1',
+          start_time=datetime.datetime(2021, 1, 1, 0, 0, 0),
+          end_time=datetime.datetime(2021, 1, 2, 0, 0, 0),
+          trail_bucket=trail_bucket)
+      self._ProcessModule()
+      output = self._module.GetContainers(containers.File, pop=True)
+      with open(output[0].path, encoding='utf-8') as output_file:
+        lines.append(output_file.read())
+      os.remove(output[0].path)
+
+    self.assertEqual(lines[0], lines[1])
+    event = json.loads(lines[1])
+    self.assertEqual(json.loads(event['CloudTrailEvent']), record)
+    self.assertEqual(event['EventTime'], '2021-01-01 10:00:00+00:00')
+
+  @mock.patch('boto3.session.Session')
+  def testProcessIncremental(self, mock_boto3):
+    """Tests that incremental runs only emit new and late events."""
+    events = [
+        {'EventId': 'a', 'EventTime': dt(2021, 1, 1, 10, 0, 0)},
+        {'EventId': 'b', 'EventTime': dt(2021, 1, 1, 11, 0, 0)},
+    ]
+    mock_session = mock.MagicMock(spec=['client'])
+    mock_client = mock.MagicMock(spec=['lookup_events', 'get_caller_identity'])
+    mock_client.lookup_events.side_effect = (
+        lambda **kwargs: {'Events': list(events)})
+    mock_session.client.return_value = mock_client
+    mock_boto3.return_value = mock_session
+
+    with tempfile.TemporaryDirectory() as directory:
+      store = high_water_marks.HighWaterMarkStore(
+          os.path.join(directory, 'state.json'))
+      with mock.patch.object(
+          high_water_marks, 'HighWaterMarkStore', return_value=store):
+        self._module.SetUp(
+            region='fake-region',
+            start_time=datetime.datetime(2021, 1, 1, 0, 0, 0),
+            incremental=True)
+        self._ProcessModule()
+        first_run = self._module.GetContainers(containers.File, pop=True)
+        self.assertEqual(len(first_run), 1)
+
+        # Nothing new: no container is emitted and the output file is removed.
+        with mock.patch.object(
+            aws_logging.os, 'remove', wraps=os.remove) as mock_remove:
+          self._ProcessModule()
+        self.assertFalse(self._module.GetContainers(containers.File))
+        mock_remove.assert_called_once()
+        self.assertFalse(os.path.exists(mock_remove.call_args.args[0]))
+        self.assertEqual(
+            mock_client.lookup_events.call_args.kwargs['StartTime'],
+            dt(2021, 1, 1, 10, 45, 0, tzinfo=datetime.timezone.utc))
+
+        # Event 'late' is delivered after the previous run, but happened
+        # before its high-water mark.
+        events.append(
+            {'EventId': 'late', 'EventTime': dt(2021, 1, 1, 10, 50, 0)})
+        events.append({'EventId': 'c', 'EventTime': dt(2021, 1, 1, 11, 0, 0)})
+        events.append({'EventId': 'd', 'EventTime': dt(2021, 1, 1, 12, 0, 0)})
+        self._ProcessModule()
+        delta = self._module.GetContainers(containers.File)
+        self.assertEqual(len(delta), 1)
+        with open(delta[0].path, encoding='utf-8') as output_file:
+          event_ids = [json.loads(line)['EventId'] for line in output_file]
+        self.assertEqual(event_ids, ['late', 'c', 'd'])
+
+  def testSetupTrailBucketInvalidFilter(self):
+    """Tests that unsupported filter keys are rejected for S3 collection."""
+    with self.assertRaises(errors.DFTimewolfError):
+      self._module.SetUp(
+          region='us-east-1',
+          query_filter='Unknown,value',
+          trail_bucket='fake-bucket')
+
 
 if __name__ == '__main__':
   unittest.main()
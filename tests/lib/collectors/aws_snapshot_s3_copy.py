@@ -283,5 +283,47 @@ class AWSSnapshotS3CopyCollectorTest(modules_test_base.ModuleTestBase):
           's3://fake-bucket/snap-12345678/mlog.txt']))
 
 
+  @mock.patch('boto3.session.Session._setup_loader')
+  @mock.patch('dftimewolf.lib.ebs_direct.SnapshotBlockReader')
+  @mock.patch('libcloudforensics.providers.aws.forensics.CopyEBSSnapshotToS3SetUp')
+  @mock.patch('libcloudforensics.providers.aws.forensics.CopyEBSSnapshotToS3Process')
+  def testProcessEbsDirect(self,
+      mock_copyebssnapshottos3process,
+      mock_copyebssnapshottos3setup,
+      mock_reader,
+      mock_loader):
+    """Tests the process method, when reading with the EBS direct APIs."""
+    mock_loader.return_value = None
+    mock_reader.return_value.UploadToS3.return_value = 'fake-sha256'
+
+    snaps_str = ','.join(
+        [str(s['SnapshotId']) for s in FAKE_DESCRIBE_SNAPSHOTS['Snapshots']])
+
+    with mock.patch('botocore.client.BaseClient._make_api_call',
+        new=MockMakeAPICall):
+      self._module.SetUp(
+          snaps_str, FAKE_BUCKET, FAKE_REGION, use_ebs_direct=True)
+      with mock.patch.object(self._module, 's3') as mock_s3:
+        self._ProcessModule()
+    self._AssertNoErrors()
+
+    mock_copyebssnapshottos3setup.assert_not_called()
+    mock_copyebssnapshottos3process.assert_not_called()
+    mock_reader.return_value.UploadToS3.assert_any_call(
+        mock_s3, FAKE_BUCKET, 'snap-01234567/image.bin')
+    mock_s3.put_object.assert_any_call(
+        Bucket=FAKE_BUCKET,
+        Key='snap-12345678/image.bin.sha256',
+        Body=b'fake-sha256  image.bin\n')
+
+    actual_output = [c.path for c in \
+        self._module.GetContainers(containers.AWSS3Object)]
+    self.assertEqual(sorted(actual_output), [
+          's3://fake-bucket/snap-01234567/image.bin',
+          's3://fake-bucket/snap-01234567/image.bin.sha256',
+          's3://fake-bucket/snap-12345678/image.bin',
+          's3://fake-bucket/snap-12345678/image.bin.sha256'])
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -10,6 +10,7 @@ import mock
 from libcloudforensics.providers.azure.internal import account as az_account
 from libcloudforensics.providers.azure.internal import compute
 
+from dftimewolf.lib import errors
 from dftimewolf.lib.collectors import azure
 from dftimewolf.lib.containers import containers
 from tests.lib import modules_test_base
@@ -206,6 +207,133 @@ class AzureCollectorTest(modules_test_base.ModuleTestBase):
     self.assertEqual(
         'fake-disk-copy', forensics_vm.evidence_disk.name)
 
+  # pylint: disable=invalid-name, line-too-long
+  @mock.patch('libcloudforensics.providers.azure.internal.resource.AZResource.GetOrCreateResourceGroup')
+  @mock.patch('libcloudforensics.providers.azure.internal.common.GetCredentials')
+  @mock.patch('libcloudforensics.providers.azure.forensics.StartAnalysisVm')
+  @mock.patch('libcloudforensics.providers.azure.forensics.CreateDiskCopy')
+  @mock.patch('dftimewolf.lib.collectors.azure.AzureCollector._FindDisksToCopy')
+  def testProcessMultipleVms(self,
+                             mock_FindDisksToCopy,
+                             mock_CreateDiskCopy,
+                             mock_StartAnalysisVm,
+                             mock_GetCredentials,
+                             mock_GetOrCreateResourceGroup):
+    """Tests that disks are spread over several analysis VMs."""
+    first_vm = mock.Mock()
+    first_vm.name = 'azure-forensics-vm-fake_incident_id'
+    second_vm = mock.Mock()
+    second_vm.name = 'azure-forensics-vm-fake_incident_id-1'
+    mock_StartAnalysisVm.side_effect = [(first_vm, None), (second_vm, None)]
+    disks = [
+        compute.AZComputeDisk(
+            FAKE_ACCOUNT,
+            '/subscriptions/id/resourceGroups/id/providers/Microsoft.Compute'
+            f'/VM/fake-disk-id-{index:d}',
+            f'fake-disk-{index:d}',
+            'fake-region')
+        for index in range(3)]
+    mock_FindDisksToCopy.return_value = disks
+    mock_CreateDiskCopy.side_effect = lambda *_, disk_name, **__: (
+        compute.AZComputeDisk(
+            FAKE_ACCOUNT,
+            '/subscriptions/id/resourceGroups/id/providers/Microsoft.Compute'
+            f'/VM/{disk_name:s}-copy-id',
+            disk_name + '-copy',
+            'fake-region'))
+    mock_GetCredentials.return_value = ('fake-subscription-id', mock.Mock())
+    mock_GetOrCreateResourceGroup.return_value = 'fake-resource-group'
+
+    self._module.SetUp(
+      'test-remote-profile-name',
+      'test-analysis-resource-group-name',
+      'fake_incident_id',
+      'fake-ssh-public-key',
+      remote_instance_name='fake-owned-vm',
+      all_disks=True,
+      max_concurrent_copies=3,
+      max_disks_per_vm=2
+    )
+    self._ProcessModule()
+
+    mock_StartAnalysisVm.assert_called_with(
+        'test-analysis-resource-group-name',
+        'azure-forensics-vm-fake_incident_id-1',
+        boot_disk_size=50,
+        ssh_public_key='fake-ssh-public-key',
+        cpu_cores=4,
+        memory_in_mb=8192,
+        region='',
+        dst_profile='test-remote-profile-name')
+    self.assertEqual(first_vm.AttachDisk.call_count, 2)
+    second_vm.AttachDisk.assert_called_once()
+    forensics_vms = self._module.GetContainers(containers.ForensicsVM)
+    self.assertEqual(
+        [vm.evidence_disk.name for vm in forensics_vms],
+        ['fake-disk-0-copy', 'fake-disk-1-copy', 'fake-disk-2-copy'])
+    self.assertEqual(
+        [vm.name for vm in forensics_vms],
+        [first_vm.name, first_vm.name, second_vm.name])
+
+  # pylint: disable=invalid-name, line-too-long
+  @mock.patch('libcloudforensics.providers.azure.internal.resource.AZResource.GetOrCreateResourceGroup')
+  @mock.patch('libcloudforensics.providers.azure.internal.common.GetCredentials')
+  @mock.patch('libcloudforensics.providers.azure.forensics.StartAnalysisVm')
+  @mock.patch('libcloudforensics.providers.azure.forensics.CreateDiskCopy')
+  @mock.patch('dftimewolf.lib.collectors.azure.AzureCollector._FindDisksToCopy')
+  def testProcessCopyFailure(self,
+                             mock_FindDisksToCopy,
+                             mock_CreateDiskCopy,
+                             mock_StartAnalysisVm,
+                             mock_GetCredentials,
+                             mock_GetOrCreateResourceGroup):
+    """Tests that successful copies are output when another copy fails."""
+    analysis_vm = mock.Mock()
+    analysis_vm.name = 'azure-forensics-vm-fake_incident_id'
+    mock_StartAnalysisVm.return_value = (analysis_vm, None)
+    disks = [
+        compute.AZComputeDisk(
+            FAKE_ACCOUNT,
+            '/subscriptions/id/resourceGroups/id/providers/Microsoft.Compute'
+            f'/VM/fake-disk-id-{index:d}',
+            f'fake-disk-{index:d}',
+            'fake-region')
+        for index in range(3)]
+    mock_FindDisksToCopy.return_value = disks
+
+    def _CreateDiskCopy(*unused_args, disk_name, **unused_kwargs):
+      if disk_name == 'fake-disk-1':
+        raise RuntimeError('Quota exceeded')
+      return compute.AZComputeDisk(
+          FAKE_ACCOUNT,
+          '/subscriptions/id/resourceGroups/id/providers/Microsoft.Compute'
+          f'/VM/{disk_name:s}-copy-id',
+          disk_name + '-copy',
+          'fake-region')
+
+    mock_CreateDiskCopy.side_effect = _CreateDiskCopy
+    mock_GetCredentials.return_value = ('fake-subscription-id', mock.Mock())
+    mock_GetOrCreateResourceGroup.return_value = 'fake-resource-group'
+
+    self._module.SetUp(
+      'test-remote-profile-name',
+      'test-analysis-resource-group-name',
+      'fake_incident_id',
+      'fake-ssh-public-key',
+      remote_instance_name='fake-owned-vm',
+      all_disks=True
+    )
+    with self.assertRaises(errors.DFTimewolfError) as error:
+      self._ProcessModule()
+    self.assertEqual(
+        error.exception.message,
+        '1 of 3 disk copies failed: fake-disk-1: Quota exceeded')
+    self.assertTrue(error.exception.critical)
+    forensics_vms = self._module.GetContainers(containers.ForensicsVM)
+    self.assertEqual(
+        [vm.evidence_disk.name for vm in forensics_vms],
+        ['fake-disk-0-copy', 'fake-disk-2-copy'])
+
   # pylint: disable=invalid-name, line-too-long
   @mock.patch('libcloudforensics.providers.azure.internal.resource.AZResource.GetOrCreateResourceGroup')
   @mock.patch('libcloudforensics.providers.azure.internal.common.GetCredentials')
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 """Tests the Azure logging collector."""
 
-
+import datetime
+import os
+import tempfile
 import unittest
 from unittest import mock
 
@@ -31,8 +33,8 @@ class AzureLogging(modules_test_base.ModuleTestBase):
         filter_expression='eventTimestamp ge \'2022-02-01\'',
         profile_name='profile1')
     self.assertEqual(
-        self._module._subscription_id,
-        '55c5ff71-b3e2-450d-89da-cb12c1a38d87')
+        self._module._subscription_ids,
+        ['55c5ff71-b3e2-450d-89da-cb12c1a38d87'])
     self.assertEqual(
         self._module._filter_expression,
         'eventTimestamp ge \'2022-02-01\'')
@@ -52,7 +54,8 @@ class AzureLogging(modules_test_base.ModuleTestBase):
     mock_event_data = mock.MagicMock(spec=['as_dict'])
 
     mock_monitor_client.activity_logs = mock_activity_logs_client
-    mock_activity_logs_client.list.return_value = iter([mock_event_data])
+    mock_activity_logs_client.list.return_value.by_page.side_effect = (
+        lambda: iter([[mock_event_data]]))
     mock_event_data.as_dict.return_value = {'log_entry': 1}
 
     mock_monitor.return_value = mock_monitor_client
@@ -60,13 +63,17 @@ class AzureLogging(modules_test_base.ModuleTestBase):
 
     self._module.SetUp(
         subscription_id='55c5ff71-b3e2-450d-89da-cb12c1a38d87',
-        filter_expression='eventTimestamp ge \'2022-02-01\'')
+        filter_expression=(
+            'eventTimestamp ge \'2022-02-01\' and '
+            'eventTimestamp le \'2022-02-01T12:00:00\''))
     self._ProcessModule()
 
     mock_monitor.assert_called_with(
         'Credentials', '55c5ff71-b3e2-450d-89da-cb12c1a38d87')
     mock_activity_logs_client.list.assert_called_with(
-        filter='eventTimestamp ge \'2022-02-01\'')
+        filter=(
+            'eventTimestamp ge \'2022-02-01T00:00:00+00:00\' and '
+            'eventTimestamp le \'2022-02-01T12:00:00+00:00\''))
 
     azure_containers = self._module.GetContainers(containers.File)
     self.assertTrue(azure_containers)
@@ -84,6 +91,120 @@ class AzureLogging(modules_test_base.ModuleTestBase):
     with self.assertRaises(errors.DFTimewolfError):
       self._ProcessModule()
 
+  @mock.patch('libcloudforensics.providers.azure.internal.common.GetCredentials')  # pylint: disable=line-too-long
+  @mock.patch('azure.mgmt.monitor.MonitorManagementClient')
+  def testProcessWindowsAndSubscriptions(self, mock_monitor, mock_credentials):
+    """Tests collection of several subscriptions split in time windows."""
+    filters = []
+
+    def _List(filter):  # pylint: disable=redefined-builtin
+      filters.append(filter)
+      entry = mock.MagicMock(spec=['as_dict'])
+      entry.as_dict.return_value = {'filter': filter}
+      result = mock.MagicMock(spec=['by_page'])
+      result.by_page.return_value = iter([[entry], [entry]])
+      return result
+
+    mock_monitor_client = mock.MagicMock(spec=['activity_logs'])
+    mock_monitor_client.activity_logs.list.side_effect = _List
+    mock_monitor.return_value = mock_monitor_client
+    mock_credentials.return_value = ('_', 'Credentials')
+
+    self._module.SetUp(
+        subscription_id='subscription-1,subscription-2',
+        filter_expression=(
+            'eventTimestamp ge \'2022-02-01\' and '
+            'eventTimestamp le \'2022-02-03T12:00:00Z\' and '
+            'resourceGroupName eq \'group\''),
+        window_hours=24)
+    self._ProcessModule()
+
+    # One client per subscription, three windows per subscription.
+    self.assertEqual(mock_monitor.call_count, 2)
+    self.assertEqual(len(filters), 6)
+    self.assertIn(
+        'eventTimestamp ge \'2022-02-03T00:00:00+00:00\' and '
+        'eventTimestamp le \'2022-02-03T12:00:00+00:00\' and '
+        'resourceGroupName eq \'group\'', filters)
+
+    azure_containers = self._module.GetContainers(containers.File)
+    self.assertEqual(len(azure_containers), 2)
+    with open(azure_containers[0].path, encoding='utf-8') as output_file:
+      lines = output_file.readlines()
+    self.assertEqual(len(lines), 6)
+    self.assertIn('2022-02-01T00:00:00+00:00', lines[0])
+    self.assertIn('2022-02-03T00:00:00+00:00', lines[-1])
+
+  @mock.patch('libcloudforensics.providers.azure.internal.common.GetCredentials')  # pylint: disable=line-too-long
+  @mock.patch('azure.mgmt.monitor.MonitorManagementClient')
+  def testProcessWindowBoundaries(self, mock_monitor, mock_credentials):
+    """Tests that events on a window boundary are only collected once."""
+    boundary = datetime.datetime(2022, 2, 2, tzinfo=datetime.timezone.utc)
+
+    def _List(filter):  # pylint: disable=redefined-builtin
+      # Both windows include the events at their shared boundary.
+      entry = mock.MagicMock(spec=['as_dict', 'event_timestamp'])
+      entry.event_timestamp = boundary
+      entry.as_dict.return_value = {'filter': filter}
+      result = mock.MagicMock(spec=['by_page'])
+      result.by_page.return_value = iter([[entry]])
+      return result
+
+    mock_monitor.return_value.activity_logs.list.side_effect = _List
+    mock_credentials.return_value = ('_', 'Credentials')
+
+    self._module.SetUp(
+        subscription_id='subscription-1',
+        filter_expression=(
+            'eventTimestamp ge \'2022-02-01\' and '
+            'eventTimestamp le \'2022-02-03\''),
+        window_hours=24)
+    self._ProcessModule()
+
+    azure_containers = self._module.GetContainers(containers.File)
+    with open(azure_containers[0].path, encoding='utf-8') as output_file:
+      lines = output_file.readlines()
+    self.assertEqual(len(lines), 1)
+    self.assertIn('le \'2022-02-02T00:00:00+00:00\'', lines[0])
+
+  @mock.patch('libcloudforensics.providers.azure.internal.common.GetCredentials')  # pylint: disable=line-too-long
+  @mock.patch('azure.mgmt.monitor.MonitorManagementClient')
+  def testProcessWindowError(self, mock_monitor, mock_credentials):
+    """Tests that shard files are removed when a window fails."""
+    shard_paths = []
+    named_temporary_file = tempfile.NamedTemporaryFile
+
+    def _NamedTemporaryFile(**kwargs):
+      output_file = named_temporary_file(**kwargs)
+      shard_paths.append(output_file.name)
+      return output_file
+
+    def _List(filter):  # pylint: disable=redefined-builtin
+      if '2022-02-02T00:00:00+00:00\' and' in filter:
+        raise az_exceptions.HttpResponseError('Server error')
+      entry = mock.MagicMock(spec=['as_dict'])
+      entry.as_dict.return_value = {'filter': filter}
+      result = mock.MagicMock(spec=['by_page'])
+      result.by_page.return_value = iter([[entry]])
+      return result
+
+    mock_monitor.return_value.activity_logs.list.side_effect = _List
+    mock_credentials.return_value = ('_', 'Credentials')
+
+    self._module.SetUp(
+        subscription_id='subscription-1',
+        filter_expression=(
+            'eventTimestamp ge \'2022-02-01\' and '
+            'eventTimestamp le \'2022-02-04\''),
+        window_hours=24)
+    with mock.patch.object(
+        tempfile, 'NamedTemporaryFile', side_effect=_NamedTemporaryFile):
+      with self.assertRaises(errors.DFTimewolfError):
+        self._ProcessModule()
+
+    self.assertEqual(len(shard_paths), 3)
+    self.assertFalse([path for path in shard_paths if os.path.exists(path)])
+
 
 if __name__ == '__main__':
   unittest.main()
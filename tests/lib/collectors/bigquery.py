@@ -2,10 +2,15 @@
 # -*- coding: utf-8 -*-
 """Tests the BigQuery collector."""
 
+import datetime
+import json
+import os
 import unittest
 import mock
 import pandas as pd
+from google.cloud import bigquery as google_bigquery
 
+from dftimewolf.lib import errors
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib.collectors import bigquery
 from tests.lib import modules_test_base
@@ -69,6 +74,73 @@ class BigQueryCollectorTest(modules_test_base.ModuleTestBase):
     conts = self._module.GetContainers(containers.File)
     self.assertEqual(len(conts), 0)
 
+  @mock.patch('google.cloud.bigquery.Client')
+  def testQueryStreaming(self, mock_bq):
+    """Tests streaming query results to JSONL one record batch at a time."""
+    batches = [mock.MagicMock(num_rows=2), mock.MagicMock(num_rows=1)]
+    batches[0].to_pylist.return_value = [
+        {'foo': 1, 'timestamp': datetime.datetime(2023, 1, 1, 10, 0)},
+        {'foo': 2, 'timestamp': None}]
+    batches[1].to_pylist.return_value = [{'foo': 3, 'timestamp': None}]
+    mock_bq().query().result().to_arrow_iterable.return_value = iter(batches)
+
+    with mock.patch.object(bigquery, 'HAS_BQ_STORAGE', True), \
+        mock.patch.object(
+            bigquery, 'bigquery_storage', create=True) as mock_storage:
+      self._module.SetUp(
+          'test_project', 'test_query', 'test_description', False,
+          streaming=True, max_stream_count=4)
+      self._module.StoreContainer(containers.BigQueryQuery(
+          'other_query', 'other_description', False))
+      self._ProcessModule()
+    self._AssertNoErrors()
+
+    # Clients are shared between the queries.
+    mock_storage.BigQueryReadClient.assert_called_once_with()
+    mock_bq().query().result().to_arrow_iterable.assert_called_with(
+        bqstorage_client=mock_storage.BigQueryReadClient(),
+        max_stream_count=4)
+    mock_bq().query().to_dataframe.assert_not_called()
+
+    conts = self._module.GetContainers(containers.File)
+    self.assertEqual(len(conts), 2)
+    with open(conts[0].path, 'r', encoding='utf-8') as output_file:
+      rows = [json.loads(line) for line in output_file]
+    for cont in conts:
+      os.remove(cont.path)
+    self.assertEqual(rows, [
+        {'foo': 1, 'timestamp': '2023-01-01T10:00:00'},
+        {'foo': 2, 'timestamp': None},
+        {'foo': 3, 'timestamp': None}])
+
+  @mock.patch('google.cloud.bigquery.Client')
+  def testQueryRequiredColumns(self, mock_bq):
+    """Tests that only the columns used downstream are selected."""
+    mock_bq().query().to_dataframe.return_value = pd.DataFrame([1], ['foo'])
+    mock_bq().query().schema = [
+        google_bigquery.SchemaField(name, 'STRING')
+        for name in ('message', 'datetime', 'other')]
+    self._container_manager.RegisterRequiredColumns(
+        'downstream', ['message', 'datetime', 'unknown'])
+    self._module.SetUp('test_project', 'test_query;', 'test_description', True)
+    self._ProcessModule()
+
+    mock_bq().query.assert_called_with(
+        'SELECT `datetime`, `message` FROM (test_query)')
+    self.assertTrue(
+        mock_bq().query.call_args_list[-2].kwargs['job_config'].dry_run)
+
+    # None of the columns used downstream are known, select all of them.
+    mock_bq().query().schema = [google_bigquery.SchemaField('foo', 'STRING')]
+    self._ProcessModule()
+    mock_bq().query.assert_called_with('test_query;')
+
+  def testSetUpParquetRequiresStreaming(self):
+    """Tests that the Parquet output format is only used when streaming."""
+    with self.assertRaises(errors.DFTimewolfError):
+      self._module.SetUp('test_project', 'test_query', 'test_description',
+                         False, output_format='parquet')
+
 
 if __name__ == '__main__':
   unittest.main()
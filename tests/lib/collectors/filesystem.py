@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 """Tests the local filesystem collector."""
 
+import json
+import os
+import tempfile
 import unittest
 
 import mock
@@ -30,6 +33,48 @@ class LocalFileSystemTest(modules_test_base.ModuleTestBase):
     self.assertEqual(files[0].name, '1')
     self.assertEqual(files[1].path, '/fake/path/2')
     self.assertEqual(files[1].name, '2')
+    self.assertNotIn('manifest', files[0].metadata)
+
+  def testHashing(self):
+    """Tests that inputs are hashed and duplicate files collapsed."""
+    with tempfile.TemporaryDirectory() as directory:
+      paths = []
+      for filename, content in [
+          ('a', b'evidence'), ('b', b'evidence'), ('c', b'')]:
+        paths.append(os.path.join(directory, filename))
+        with open(paths[-1], 'wb') as test_file:
+          test_file.write(content)
+      sub_directory = os.path.join(directory, 'sub')
+      os.mkdir(sub_directory)
+      with open(os.path.join(sub_directory, 'd'), 'wb') as test_file:
+        test_file.write(b'evidence')
+
+      self._module.SetUp(
+          paths=','.join(paths + [sub_directory]), hash_files=True)
+      self._ProcessModule()
+
+      files = self._module.GetContainers(containers.File)
+      self.assertEqual([f.name for f in files], ['a', 'c', 'sub'])
+      self.assertEqual(files[0].metadata['size'], 8)
+      self.assertEqual(
+          files[0].metadata['sha256'],
+          'ee8250fb76e094b34b471f13a73dbbe51d1ae142e9df59d7c0d31ec20f0a0a8e')
+      self.assertEqual(files[0].metadata['crc32'], '0c615710')
+      self.assertEqual(files[0].metadata['duplicates'], [paths[1]])
+      self.assertEqual(files[1].metadata['size'], 0)
+      self.assertEqual(files[2].metadata['file_count'], 1)
+      self.assertEqual(files[2].metadata['size'], 8)
+
+      manifest_path = files[0].metadata['manifest']
+      with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+        manifest = [json.loads(line) for line in manifest_file]
+      os.remove(manifest_path)
+      self.assertEqual(len(manifest), 4)
+      self.assertNotIn('duplicate_of', manifest[0])
+      self.assertEqual(manifest[1]['duplicate_of'], paths[0])
+      self.assertEqual(manifest[3]['input'], sub_directory)
+      self.assertEqual(manifest[3]['duplicate_of'], paths[0])
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -57,6 +57,28 @@ FAKE_DISK_COPY = [
         'disk2-copy')
 ]
 
+
+def _Instance(name, zone, *disk_names):
+  """Builds an instance resource as returned by the Compute Engine API."""
+  prefix = f'https://www.googleapis.com/compute/v1/projects/p/zones/{zone}'
+  return {
+      'name': name,
+      'zone': prefix,
+      'disks': [
+          {'source': f'{prefix}/disks/{disk_name}', 'boot': index == 0}
+          for index, disk_name in enumerate(disk_names)]}
+
+
+def _AggregatedInstances(*instances):
+  """Builds instances.aggregatedList responses."""
+  items = {}
+  for instance in instances:
+    zone = instance['zone'].rsplit('/', 1)[-1]
+    items.setdefault(f'zones/{zone}', {'instances': []})
+    items[f'zones/{zone}']['instances'].append(instance)
+  return [{'items': items}]
+
+
 class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
   """Tests for the GCEDiskCopy collector."""
 
@@ -65,6 +87,10 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
   def setUp(self) -> None:
     self._InitModule(gce_disk_copy.GCEDiskCopy)
     super().setUp()
+    patcher = mock.patch.object(
+        compute.GoogleCloudCompute, 'GetProjectMetadata', return_value={})
+    self._mock_get_project_metadata = patcher.start()
+    self.addCleanup(patcher.stop)
 
   def testSetUp(self) -> None:
     """Tests the SetUp method of the collector."""
@@ -190,25 +216,13 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
 
   # pylint: disable=line-too-long,invalid-name
   @typing.no_type_check
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.GetBootDisk')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetDisk')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.ListDisks')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetInstance')
-  # We're manually calling protected functions
-  # pylint: disable=protected-access
-  def testPreProcess(self,
-                     mock_get_instance,
-                     mock_list_disks,
-                     mock_get_disk,
-                     mock_GetBootDisk):
-    """Tests the _FindDisksToCopy function with different SetUp() calls."""
-    mock_list_disks.return_value = {
-        'bootdisk': FAKE_BOOT_DISK,
-        'disk1': FAKE_DISK
-    }
-    mock_get_disk.return_value = FAKE_DISK
-    mock_get_instance.return_value = FAKE_INSTANCE
-    mock_GetBootDisk.return_value = FAKE_BOOT_DISK
+  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GceApi')
+  @mock.patch('libcloudforensics.providers.gcp.internal.common.ExecuteRequest')
+  def testPreProcess(self, mock_execute_request, unused_mock_gce_api):
+    """Tests that PreProcess stores the disks to copy."""
+    mock_execute_request.return_value = _AggregatedInstances(
+        _Instance('my-owned-instance', 'source_zone', 'bootdisk', 'disk1'),
+        _Instance('other-instance', 'source_zone', 'otherdisk'))
 
     # Nothing is specified, GoogleCloudCollector should collect the instance's
     # boot disk
@@ -226,7 +240,12 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
     disks = self._module.GetContainers(containers.GCEDisk)
     self.assertEqual(len(disks), 1)
     self.assertEqual(disks[0].name, 'bootdisk')
-    mock_GetBootDisk.assert_called_once()
+    self.assertEqual(disks[0].metadata['SOURCE_MACHINE'], 'my-owned-instance')
+    self.assertEqual(disks[0].metadata['SOURCE_ZONE'], 'source_zone')
+    mock_execute_request.assert_called_once_with(
+        mock.ANY, 'aggregatedList', {
+            'project': 'test-target-project-name',
+            'filter': 'name eq "(my\\-owned\\-instance)"'})
 
     # Specifying all_disks should return all disks for the instance
     # (see mock_list_disks return value)
@@ -267,12 +286,97 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
     actual = sorted([d.name for d in disks])
     self.assertEqual(expected, actual)
 
+  # pylint: disable=line-too-long
   @typing.no_type_check
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetInstance')
-  def testInstanceNotFound(self, mock_GetInstance):
+  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GceApi')
+  @mock.patch('libcloudforensics.providers.gcp.internal.common.ExecuteRequest')
+  def testScheduling(self, mock_execute_request, unused_mock_gce_api):
+    """Tests that copies are grouped by zone and the pool sized to match."""
+    mock_execute_request.return_value = _AggregatedInstances(
+        _Instance('a', 'us-central1-a', 'a1', 'a2', 'a3'),
+        _Instance('b', 'us-central1-b', 'b1'),
+        _Instance('c', 'europe-west1-b', 'c1'))
+
+    self._module.SetUp(
+        'test-analysis-project-name',
+        'test-target-project-name',
+        '',
+        'fake_zone',
+        'a,b,c',
+        None,
+        True,
+        False
+    )
+    with mock.patch.object(gce_disk_copy, 'MAX_CONCURRENT_COPIES_PER_ZONE', 2):
+      self._module.PreProcess()
+      self.assertEqual(
+          [d.name for d in self._module.GetContainers(containers.GCEDisk)],
+          ['a1', 'b1', 'c1', 'a2', 'a3'])
+      self.assertEqual(
+          dict(self._module.zone_disk_counts),
+          {'us-central1-a': 3, 'us-central1-b': 1, 'europe-west1-b': 1})
+      self.assertEqual(self._module.GetThreadPoolSize(), 4)
+      with mock.patch.object(
+          gce_disk_copy, 'MAX_CONCURRENT_COPIES_PER_REGION', 1):
+        self.assertEqual(self._module.GetThreadPoolSize(), 2)
+
+      # The remaining snapshot quota bounds the number of parallel copies.
+      self._mock_get_project_metadata.return_value = {
+          'quotas': [{'metric': 'SNAPSHOTS', 'limit': 10.0, 'usage': 7.0}]}
+      self._module.GetContainers(containers.GCEDisk, True)
+      self._module.PreProcess()
+      self.assertEqual(self._module.GetThreadPoolSize(), 3)
+
+  # pylint: disable=line-too-long
+  @typing.no_type_check
+  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GceApi')
+  @mock.patch('libcloudforensics.providers.gcp.internal.common.ExecuteRequest')
+  def testSchedulingDiskNames(self, mock_execute_request, unused_mock_gce_api):
+    """Tests that the zones of disks passed by name are resolved in bulk."""
+    prefix = 'https://www.googleapis.com/compute/v1/projects/p'
+    mock_execute_request.return_value = [{'items': {
+        'zones/us-central1-a': {'disks': [
+            {'name': 'd1', 'zone': f'{prefix}/zones/us-central1-a'},
+            {'name': 'd2', 'zone': f'{prefix}/zones/us-central1-a'},
+            {'name': 'd3', 'zone': f'{prefix}/zones/us-central1-a'}]},
+        'zones/us-central1-b': {'disks': [
+            {'name': 'd3', 'zone': f'{prefix}/zones/us-central1-b'}]},
+        'regions/us-central1': {'disks': [
+            {'name': 'r1', 'region': f'{prefix}/regions/us-central1'}]},
+    }}]
+
+    self._module.SetUp(
+        'test-analysis-project-name',
+        'test-target-project-name',
+        '',
+        'fake_zone',
+        None,
+        'd1,d2,d3,r1',
+        False,
+        False
+    )
+    with mock.patch.object(gce_disk_copy, 'MAX_CONCURRENT_COPIES_PER_ZONE', 1):
+      self._module.PreProcess()
+      self.assertEqual(self._module.GetThreadPoolSize(), 3)
+    mock_execute_request.assert_called_once_with(
+        mock.ANY, 'aggregatedList', {
+            'project': 'test-target-project-name',
+            'filter': 'name eq "(d1|d2|d3|r1)"'})
+
+    disks = self._module.GetContainers(containers.GCEDisk)
+    self.assertEqual(
+        {d.name: d.metadata.get('SOURCE_ZONE') for d in disks},
+        {'d1': 'us-central1-a', 'd2': 'us-central1-a', 'd3': None, 'r1': None})
+    self.assertEqual(
+        dict(self._module.zone_disk_counts), {'us-central1-a': 2, '': 2})
+
+  @typing.no_type_check
+  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GceApi')
+  @mock.patch('libcloudforensics.providers.gcp.internal.common.ExecuteRequest')
+  def testInstanceNotFound(self, mock_execute_request, unused_mock_gce_api):
     """Test that an error is thrown when the instance isn't found."""
-    mock_GetInstance.side_effect = lcf_errors.ResourceNotFoundError('message',
-                                                                    'name')
+    mock_execute_request.return_value = _AggregatedInstances(
+        _Instance('nonexistent', 'other_zone', 'disk1'))
 
     self._module.SetUp(
         'test-analysis-project-name',
@@ -291,8 +395,9 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
         error.exception.message, 'No instances found with disks to copy.')
 
   @typing.no_type_check
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetInstance')
-  def testHTTPErrors(self, mock_GetInstance):
+  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GceApi')
+  @mock.patch('libcloudforensics.providers.gcp.internal.common.ExecuteRequest')
+  def testHTTPErrors(self, mock_GetInstance, unused_mock_gce_api):
     """Tests the 403 checked for in PreProcess."""
     # 403
     mock_GetInstance.side_effect = HttpError(httplib2.Response({
@@ -340,7 +445,7 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
   @typing.no_type_check
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetInstance')
   @mock.patch('libcloudforensics.providers.gcp.forensics.CreateDiskCopy')
-  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._GetDisksFromInstance')
+  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._ListInstanceDisks')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.ListDisks')
   def testProcessWithStop(self,
                           mock_list_disks,
@@ -348,8 +453,8 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
                           mock_CreateDiskCopy,
                           mock_GetInstance):
     """Tests the collector's Process() function, stopping the instance."""
-    mock_getDisksFromInstance.return_value = [
-        d.name for d in FAKE_DISK_MULTIPLE]
+    mock_getDisksFromInstance.return_value = {
+        'my-owned-instance': [(d.name, '') for d in FAKE_DISK_MULTIPLE]}
     mock_CreateDiskCopy.side_effect = FAKE_DISK_COPY
     mock_GetInstance.return_value = FAKE_INSTANCE
     mock_list_disks.return_value = {
@@ -398,7 +503,7 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
   @typing.no_type_check
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetInstance')
   @mock.patch('libcloudforensics.providers.gcp.forensics.CreateDiskCopy')
-  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._GetDisksFromInstance')
+  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._ListInstanceDisks')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.ListDisks')
   def testProcessWithoutStop(self,
                              mock_list_disks,
@@ -406,8 +511,8 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
                              mock_CreateDiskCopy,
                              mock_GetInstance):
     """Tests the collector's Process() function."""
-    mock_getDisksFromInstance.return_value = [
-        d.name for d in FAKE_DISK_MULTIPLE]
+    mock_getDisksFromInstance.return_value = {
+        'my-owned-instance': [(d.name, '') for d in FAKE_DISK_MULTIPLE]}
     mock_CreateDiskCopy.side_effect = FAKE_DISK_COPY
     mock_GetInstance.return_value = FAKE_INSTANCE
     mock_list_disks.return_value = {
@@ -511,7 +616,7 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
   @typing.no_type_check
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetInstance')
   @mock.patch('libcloudforensics.providers.gcp.forensics.CreateDiskCopy')
-  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._GetDisksFromInstance')
+  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._ListInstanceDisks')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.ListDisks')
   def testProcessMultipleSingleFailure(self,
                                        mock_list_disks,
@@ -519,9 +624,8 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
                                        mock_CreateDiskCopy,
                                        mock_GetInstance):
     """Tests processing when multiple instances are requested, but one is not found."""
-    mock_getDisksFromInstance.side_effect = [
-        lcf_errors.ResourceNotFoundError('Not found', 'Not found'),
-        [d.name for d in FAKE_DISK_MULTIPLE]]
+    mock_getDisksFromInstance.return_value = {
+        'found': [(d.name, '') for d in FAKE_DISK_MULTIPLE]}
     mock_CreateDiskCopy.side_effect = FAKE_DISK_COPY
     mock_GetInstance.return_value = FAKE_INSTANCE
     mock_list_disks.return_value = {
@@ -574,7 +678,7 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
   @typing.no_type_check
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetInstance')
   @mock.patch('libcloudforensics.providers.gcp.forensics.CreateDiskCopy')
-  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._GetDisksFromInstance')
+  @mock.patch('dftimewolf.lib.collectors.gce_disk_copy.GCEDiskCopy._ListInstanceDisks')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.ListDisks')
   @mock.patch('libcloudforensics.providers.gcp.forensics.InstanceNetworkQuarantine')
   def testProcessWithQuarantine(self,
@@ -584,8 +688,8 @@ class GCEDiskCopyTest(modules_test_base.ModuleTestBase):
                                 mock_CreateDiskCopy,
                                 mock_GetInstance):
     """Tests the collector's Process() function, quarantining the instance."""
-    mock_getDisksFromInstance.return_value = [
-        d.name for d in FAKE_DISK_MULTIPLE]
+    mock_getDisksFromInstance.return_value = {
+        'my-owned-instance': [(d.name, '') for d in FAKE_DISK_MULTIPLE]}
     mock_CreateDiskCopy.side_effect = FAKE_DISK_COPY
     mock_GetInstance.return_value = FAKE_INSTANCE
     mock_list_disks.return_value = {
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 """Tests the Google Drive collector."""
 
+import hashlib
+import os
+import tempfile
 import unittest
 from unittest import mock
 
@@ -12,6 +15,33 @@ from dftimewolf.lib.containers import containers
 from tests.lib import modules_test_base
 
 
+def _MockBatchRequests(mock_drive_service, metadata):
+  """Makes batch requests on a mock Drive service return file metadata.
+
+  Args:
+    mock_drive_service: The mock Drive service.
+    metadata: Metadata to return, keyed by Drive ID.
+
+  Returns:
+    A list that will hold the Drive IDs requested by each batch.
+  """
+  batches = []
+
+  def _NewBatch(callback):
+    request_ids = []
+    batches.append(request_ids)
+    batch = mock.Mock()
+    batch.add.side_effect = (
+        lambda request, request_id: request_ids.append(request_id))
+    batch.execute.side_effect = lambda http: [
+        callback(request_id, metadata[request_id], None)
+        for request_id in request_ids]
+    return batch
+
+  mock_drive_service.new_batch_http_request.side_effect = _NewBatch
+  return batches
+
+
 class GoogleDriveCollectorTest(modules_test_base.ModuleTestBase):
   """Tests for the Google Drive collector."""
 
@@ -140,7 +170,8 @@ class GoogleDriveCollectorTest(modules_test_base.ModuleTestBase):
     self.mock_drive_service.files.return_value.list.assert_called_with(
         q="'folder_id' in parents and trashed = false",
         spaces="drive",
-        fields="nextPageToken, files",
+        fields="nextPageToken, files(id, name, mimeType, md5Checksum, size)",
+        pageSize=1000,
         pageToken=None,
     )
     self.assertEqual(self.mock_media_io.call_count, 2)
@@ -170,14 +201,15 @@ class GoogleDriveCollectorTest(modules_test_base.ModuleTestBase):
         output_directory=None,
     )
 
-    # Mock drive_resource.files().get().execute() calls
-    self.mock_drive_service.files.return_value.get.return_value.execute.side_effect = [  # pylint: disable=line-too-long
-        {"id": "id3", "name": "file3.txt", "mimeType": "text/plain"},
-        {"id": "id4", "name": "file4.txt", "mimeType": "text/plain"},
-    ]
+    metadata = {
+        "id3": {"id": "id3", "name": "file3.txt", "mimeType": "text/plain"},
+        "id4": {"id": "id4", "name": "file4.txt", "mimeType": "text/plain"},
+    }
+    batches = _MockBatchRequests(self.mock_drive_service, metadata)
 
     self._module.Process()
 
+    self.assertEqual(batches, [["id3", "id4"]])
     self.assertEqual(self.mock_media_io.call_count, 2)
     file_containers = self._container_manager.GetContainers(
         self._module.name, containers.File
@@ -224,6 +256,201 @@ class GoogleDriveCollectorTest(modules_test_base.ModuleTestBase):
         [f["id"] for f in files], ["folder1", "file3", "file4"]
     )
 
+  @mock.patch.object(gdrive, "MAX_BATCH_SIZE", 2)
+  def testProcessWithDriveIdsBatches(self):
+    """Tests that drive IDs metadata is fetched in bounded batch requests."""
+    self._module.SetUp(
+        folder_id="",
+        recursive=False,
+        drive_ids="id1,id2,id3",
+        max_download_workers=5,
+        output_directory=None,
+    )
+    metadata = {
+        drive_id: {"id": drive_id, "name": drive_id, "mimeType": "text/plain"}
+        for drive_id in ("id1", "id2", "id3")
+    }
+    batches = _MockBatchRequests(self.mock_drive_service, metadata)
+
+    self._module.Process()
+
+    self.assertEqual(batches, [["id1", "id2"], ["id3"]])
+    self.assertEqual(self.mock_media_io.call_count, 3)
+
+  def testListDriveFolderParallel(self):
+    """Tests listing a folder tree with concurrent workers."""
+    tree = {
+        "root": [
+            {"id": "a", "mimeType": "application/vnd.google-apps.folder"},
+            {"id": "b", "mimeType": "application/vnd.google-apps.folder"},
+            {"id": "file1", "mimeType": "text/plain"},
+        ],
+        "a": [
+            {"id": "c", "mimeType": "application/vnd.google-apps.folder"},
+            {"id": "file2", "mimeType": "text/plain"},
+        ],
+        "b": [{"id": "file3", "mimeType": "text/plain"}],
+        "c": [{"id": "file4", "mimeType": "text/plain"}],
+    }
+
+    def _List(q, **kwargs):
+      del kwargs  # Unused
+      folder_id = q.split("'")[1]
+      request = mock.Mock()
+      request.execute.return_value = {"files": tree[folder_id]}
+      return request
+
+    mock_drive_resource = mock.Mock()
+    mock_drive_resource.files.return_value.list.side_effect = _List
+    get_http = mock.Mock()
+    listed = []
+
+    files = gdrive.ListDriveFolder(
+        mock_drive_resource,
+        folder_id="root",
+        fields="fields",
+        recursive=True,
+        max_workers=4,
+        get_http=get_http,
+        file_callback=lambda drive_file: listed.append(drive_file["id"]),
+    )
+
+    expected = ["a", "b", "c", "file1", "file2", "file3", "file4"]
+    self.assertSameElements([f["id"] for f in files], expected)
+    self.assertSameElements(listed, expected)
+    self.assertEqual(get_http.call_count, 4)
+
+
+class GoogleDriveCollectorDownloadTest(modules_test_base.ModuleTestBase):
+  """Tests for the Google Drive collector downloads of existing files."""
+
+  _module: gdrive.GoogleDriveCollector  # pyrefly: ignore[bad-override-mutable-attribute]
+
+  _CONTENT = b"0123456789abcdefghij"
+
+  def setUp(self):
+    self._InitModule(gdrive.GoogleDriveCollector)
+    super().setUp()
+    self._output_directory = tempfile.TemporaryDirectory()
+    self._output_path = os.path.join(self._output_directory.name, "id1_file")
+    self._md5 = hashlib.md5(self._CONTENT).hexdigest()
+    self._offsets = []
+    self._ranges = []
+
+    patcher = mock.patch("dftimewolf.lib.auth.GetGoogleOauth2Credential")
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    patcher = mock.patch("googleapiclient.discovery.build")
+    self.mock_build = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.mock_build.return_value.files.return_value.get_media.side_effect = (
+        self._FakeMediaRequest)
+    patcher = mock.patch.object(
+        gdrive, "MediaIoBaseDownload", side_effect=self._FakeDownloader)
+    self.mock_media_io = patcher.start()
+    self.addCleanup(patcher.stop)
+
+    self._module.SetUp(
+        folder_id="",
+        recursive=False,
+        drive_ids="id1",
+        max_download_workers=1,
+        output_directory=self._output_directory.name,
+        chunk_size_mb=1,
+    )
+
+  def tearDown(self):
+    self._output_directory.cleanup()
+    super().tearDown()
+
+  def _FakeDownloader(self, out_file, request, chunksize):
+    """Returns a fake MediaIoBaseDownload serving the test content."""
+    del request  # Unused
+    self.assertEqual(chunksize, 1024 * 1024)
+    downloader = mock.Mock()
+
+    def _NextChunk(num_retries):
+      del num_retries  # Unused
+      self._offsets.append(0)
+      out_file.write(self._CONTENT)
+      status = mock.Mock()
+      status.progress.return_value = 1.0
+      return status, True
+
+    downloader.next_chunk.side_effect = _NextChunk
+    return downloader
+
+  def _FakeMediaRequest(self, fileId):  # pylint: disable=invalid-name
+    """Returns a fake media request serving ranges of the test content."""
+    self.assertEqual(fileId, "id1")
+    request = mock.Mock(headers={})
+
+    def _Execute(num_retries):
+      del num_retries  # Unused
+      start, end = request.headers["Range"].split("=")[1].split("-")
+      self._ranges.append((int(start), int(end)))
+      return self._CONTENT[int(start):int(end) + 1]
+
+    request.execute.side_effect = _Execute
+    return request
+
+  def _WriteLocalFile(self, content):
+    """Writes the local copy of the test file."""
+    with open(self._output_path, "wb") as local_file:
+      local_file.write(content)
+
+  def _ReadLocalFile(self):
+    """Reads the local copy of the test file."""
+    with open(self._output_path, "rb") as local_file:
+      return local_file.read()
+
+  def testSkipIdentical(self):
+    """Tests that files matching the Drive checksum are not downloaded."""
+    self._WriteLocalFile(self._CONTENT)
+    self.assertTrue(self._module._DownloadFile(  # pylint: disable=protected-access
+        "id1", self._output_path, self._md5, str(len(self._CONTENT))))
+    self.mock_media_io.assert_not_called()
+
+  def testResumePartial(self):
+    """Tests that partial downloads are resumed."""
+    self._WriteLocalFile(self._CONTENT[:8])
+    self.assertTrue(self._module._DownloadFile(  # pylint: disable=protected-access
+        "id1", self._output_path, self._md5, str(len(self._CONTENT))))
+    self.assertEqual(self._ranges, [(8, 19)])
+    self.mock_media_io.assert_not_called()
+    self.assertEqual(self._ReadLocalFile(), self._CONTENT)
+
+  def testResumeMismatch(self):
+    """Tests that resumed downloads not matching Drive are restarted."""
+    self._WriteLocalFile(b"x" * 8)
+    self.assertTrue(self._module._DownloadFile(  # pylint: disable=protected-access
+        "id1", self._output_path, self._md5, str(len(self._CONTENT))))
+    self.assertEqual(self._ranges, [(8, 19)])
+    self.assertEqual(self._offsets, [0])
+    self.assertEqual(self._ReadLocalFile(), self._CONTENT)
+
+  def testRestartModified(self):
+    """Tests that local files that differ from Drive are downloaded again."""
+    self._WriteLocalFile(b"x" * len(self._CONTENT))
+    self.assertTrue(self._module._DownloadFile(  # pylint: disable=protected-access
+        "id1", self._output_path, self._md5, str(len(self._CONTENT))))
+    self.assertEqual(self._offsets, [0])
+    self.assertEqual(self._ReadLocalFile(), self._CONTENT)
+
+  def testChecksumMismatch(self):
+    """Tests that downloads that do not match the checksum are removed."""
+    self.assertFalse(self._module._DownloadFile(  # pylint: disable=protected-access
+        "id1", self._output_path, "0" * 32, str(len(self._CONTENT))))
+    self.assertFalse(os.path.exists(self._output_path))
+
+  def testDriveResourcePerThread(self):
+    """Tests that download threads reuse their Drive resource."""
+    for index in range(3):
+      self._module._DownloadFile(  # pylint: disable=protected-access
+          "id1", f"{self._output_path}{index}", self._md5,
+          str(len(self._CONTENT)))
+    self.assertEqual(self.mock_build.call_count, 1)
+
 
 if __name__ == "__main__":
   unittest.main()
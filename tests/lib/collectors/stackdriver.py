@@ -2,10 +2,27 @@
 # -*- coding: utf-8 -*-
 """Tests the Google Cloud Platform (GCP) logging collector."""
 
+import datetime
+import itertools
+import json
+import os
+import tempfile
 import unittest
 from unittest import mock
 
+from dftimewolf.lib import high_water_marks
+from dftimewolf.lib import module
 from dftimewolf.lib.collectors import gcp_logging
+from dftimewolf.lib.containers import containers
+from tests.lib import modules_test_base
+
+
+def _FakeEntry(insert_id, timestamp):
+  """Returns a fake log entry."""
+  entry = mock.MagicMock()
+  entry.to_api_repr.return_value = {
+      'insertId': insert_id, 'timestamp': timestamp}
+  return entry
 
 
 class GCPLoggingTest(unittest.TestCase):
@@ -22,5 +39,181 @@ class GCPLoggingTest(unittest.TestCase):
     self.assertIsNotNone(gcp_logging_collector)
 
 
+class GCPLogsCollectorIncrementalTest(modules_test_base.ModuleTestBase):
+  """Tests for the GCP logging collector incremental mode."""
+
+  def setUp(self):
+    self._InitModule(gcp_logging.GCPLogsCollector)
+    super().setUp()
+    self._directory = tempfile.TemporaryDirectory()
+    self._store = high_water_marks.HighWaterMarkStore(
+        os.path.join(self._directory.name, 'state.json'))
+
+  def tearDown(self):
+    self._directory.cleanup()
+    super().tearDown()
+
+  @mock.patch.object(gcp_logging.GCPLogsCollector, 'SetupLoggingClient')
+  def testProcessIncremental(self, mock_setup_client):
+    """Tests that incremental runs only query and emit new entries."""
+    entries = [
+        _FakeEntry('a', '2024-01-01T10:00:00Z'),
+        _FakeEntry('b', '2024-01-01T11:00:00Z'),
+    ]
+    filters = []
+
+    def _ListEntries(filter_, **kwargs):
+      del kwargs  # Unused
+      filters.append(filter_)
+      return iter(list(entries))
+
+    mock_setup_client.return_value.list_entries.side_effect = _ListEntries
+
+    with mock.patch.object(
+        high_water_marks, 'HighWaterMarkStore', return_value=self._store):
+      self._module.SetUp(
+          project_name='test-project',
+          filter_expression='logName=test',
+          backoff=False,
+          delay='0',
+          start_time=None,
+          end_time=None,
+          incremental=True)
+      self._ProcessModule()
+      self.assertEqual(filters[-1], 'logName=test')
+      self.assertEqual(
+          len(self._module.GetContainers(containers.File, pop=True)), 1)
+
+      # Entries already collected are dropped, and late entries are kept.
+      entries.extend([
+          _FakeEntry('late', '2024-01-01T10:55:00Z'),
+          _FakeEntry('c', '2024-01-01T11:00:00Z'),
+          _FakeEntry('d', '2024-01-01T12:00:00Z'),
+      ])
+      self._module.SetUp(
+          project_name='test-project',
+          filter_expression='logName=test',
+          backoff=False,
+          delay='0',
+          start_time=None,
+          end_time=None,
+          incremental=True)
+      self._ProcessModule()
+
+    self.assertEqual(
+        filters[-1],
+        '(logName=test) AND timestamp >= "2024-01-01T10:45:00+00:00"')
+    files = self._module.GetContainers(containers.File)
+    self.assertEqual([f.name for f in files], ['logName=test'])
+    with open(files[0].path, encoding='utf-8') as output_file:
+      insert_ids = [json.loads(line)['insertId'] for line in output_file]
+    self.assertEqual(insert_ids, ['late', 'c', 'd'])
+    mark = high_water_marks.ParseTimestamp('2024-01-01T12:00:00Z')
+    self.assertEqual(
+        self._store.Get('GCPLogsCollector', 'test-project', 'logName=test'),
+        high_water_marks.HighWaterMark(
+            mark, {'d': mark}, gcp_logging.INCREMENTAL_LOOKBACK))
+
+
+class GCPLogsCollectorFollowTest(modules_test_base.ModuleTestBase):
+  """Tests for the GCP logging collector follow mode."""
+
+  def setUp(self):
+    self._InitModule(gcp_logging.GCPLogsCollector)
+    super().setUp()
+
+  @mock.patch.object(gcp_logging, 'FOLLOW_POLL_SECONDS', 0)
+  @mock.patch.object(gcp_logging.GCPLogsCollector, 'SetupLoggingClient')
+  def testFollow(self, mock_setup_client):
+    """Tests that new entries are emitted in rotated files."""
+    polls = [
+        [_FakeEntry('a', '2024-01-01T10:00:00Z'),
+         _FakeEntry('b', '2024-01-01T10:00:01Z'),
+         _FakeEntry('c', '2024-01-01T10:00:02Z')],
+        # Entries seen by the previous poll are returned again.
+        [_FakeEntry('b', '2024-01-01T10:00:01Z'),
+         _FakeEntry('c', '2024-01-01T10:00:02Z'),
+         _FakeEntry('d', '2024-01-01T10:00:03Z')],
+        [_FakeEntry('e', '2024-01-01T10:00:04Z')],
+    ]
+    filters = []
+
+    def _ListEntries(filter_, **kwargs):
+      del kwargs  # Unused
+      filters.append(filter_)
+      if len(filters) == len(polls):
+        # Like Ctrl+C, from the SIGINT handler.
+        self.assertTrue(module.RequestStop())
+      return polls[len(filters) - 1]
+
+    mock_setup_client.return_value.list_entries.side_effect = _ListEntries
+
+    self._module.SetUp(
+        project_name='test-project',
+        filter_expression='logName=test',
+        backoff=False,
+        delay='0',
+        start_time=datetime.datetime(2024, 1, 1, 10, 0, 0),
+        end_time=None,
+        follow=True,
+        rotate_seconds=3600,
+        rotate_entries=2)
+    self._ProcessModule()
+
+    self.assertEqual(
+        filters[0],
+        '(logName=test) AND timestamp >= "2024-01-01T09:59:00+00:00"')
+    self.assertEqual(
+        filters[2],
+        '(logName=test) AND timestamp >= "2024-01-01T09:59:03+00:00"')
+
+    files = self._container_manager.GetContainers(
+        'downstream', containers.File)
+    self.assertEqual(
+        [f.name for f in files],
+        ['gcp_logs_test-project_20240101T100000',
+         'gcp_logs_test-project_20240101T100002',
+         'gcp_logs_test-project_20240101T100004'])
+    insert_ids = []
+    for output in files:
+      with open(output.path, encoding='utf-8') as output_file:
+        insert_ids.append(
+            [json.loads(line)['insertId'] for line in output_file])
+    self.assertEqual(insert_ids, [['a', 'b'], ['c', 'd'], ['e']])
+    self.assertEqual(
+        {f.metadata['TIMESKETCH_TIMELINE'] for f in files},
+        {'gcp_logs_test-project'})
+    self.assertFalse(module.RequestStop())
+
+  @mock.patch.object(gcp_logging.time, 'monotonic')
+  @mock.patch.object(gcp_logging.GCPLogsCollector, 'SetupLoggingClient')
+  def testFollowMaxDuration(self, mock_setup_client, mock_monotonic):
+    """Tests that following stops after max_follow_seconds."""
+    mock_monotonic.side_effect = itertools.count(step=10)
+    mock_setup_client.return_value.list_entries.side_effect = [
+        [_FakeEntry('a', '2024-01-01T10:00:00Z')]] + [[]] * 10
+
+    self._module.SetUp(
+        project_name='test-project',
+        filter_expression='logName=test',
+        backoff=False,
+        delay='0',
+        start_time=datetime.datetime(2024, 1, 1, 10, 0, 0),
+        end_time=None,
+        follow=True,
+        rotate_seconds=3600,
+        max_follow_seconds=25)
+    self._ProcessModule()
+
+    # The entries buffered when following stops are stored.
+    files = self._container_manager.GetContainers(
+        'downstream', containers.File)
+    self.assertEqual(
+        [f.name for f in files], ['gcp_logs_test-project_20240101T100000'])
+    self.assertLess(
+        mock_setup_client.return_value.list_entries.call_count, 10)
+    self.assertFalse(module.RequestStop())
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -3,11 +3,16 @@
 """Tests the Timesketch collector."""
 
 import datetime
+import json
+import os
+import unittest
+from concurrent import futures
 from typing import Any
 
 import mock
 import pandas as pd
 
+from dftimewolf.lib import errors
 from dftimewolf.lib.collectors import timesketch
 from dftimewolf.lib.containers import containers
 from tests.lib import modules_test_base
@@ -21,6 +26,13 @@ class TimesketchSearchEventCollectorTest(modules_test_base.ModuleTestBase):
   def setUp(self) -> None:
     self._InitModule(timesketch.TimesketchSearchEventCollector)
     super().setUp()
+    patcher = mock.patch.object(
+      timesketch.TimesketchSearchEventCollector,
+      "_PlanSlices",
+      return_value=[timesketch.SearchSlice(None, None)],
+    )
+    patcher.start()
+    self.addCleanup(patcher.stop)
 
   @mock.patch("dftimewolf.lib.timesketch_utils.GetApiClient")
   def testSetupWithToken(self, mock_get_api_client: Any) -> None:
@@ -258,8 +270,7 @@ class TimesketchSearchEventCollectorTest(modules_test_base.ModuleTestBase):
   def testStoreAggregationContainer(
     self, mock_get_search_results: Any, _mock_get_api_client: Any
   ) -> None:
-    """Tests the _StoreDataTypesAggregationContainer function."""
-    # Mocking the search results
+    """Tests that data types are aggregated by the Timesketch server."""
     mock_get_search_results.return_value = pd.DataFrame(
       {"data_type": ["type1", "type2", "type1", "type3", "type2"]}
     )
@@ -270,6 +281,13 @@ class TimesketchSearchEventCollectorTest(modules_test_base.ModuleTestBase):
       end_datetime=datetime.datetime(2024, 11, 12),
       token_password="test_token",
     )
+    self._module.sketch.aggregate.return_value.lazyload_data.return_value = {
+      "objects": [{"data_types": {"buckets": [
+        {"key": "type1", "doc_count": 2},
+        {"key": "type2", "doc_count": 2},
+        {"key": "type3", "doc_count": 1},
+      ]}}]
+    }
 
     # Running the module process
     self._ProcessModule()
@@ -286,3 +304,301 @@ class TimesketchSearchEventCollectorTest(modules_test_base.ModuleTestBase):
     self.assertEqual(
       aggregation_container.description, "Data types in the search results"
     )
+    self.assertEqual(
+      aggregation_container.results, {"type1": 2, "type2": 2, "type3": 1}
+    )
+
+  @mock.patch("dftimewolf.lib.timesketch_utils.GetApiClient")
+  @mock.patch.object(
+    timesketch.TimesketchSearchEventCollector, "_GetSearchResults"
+  )
+  def testRequiredColumns(
+    self, mock_get_search_results: Any, _mock_get_api_client: Any
+  ) -> None:
+    """Tests that only the fields used downstream are fetched."""
+    mock_get_search_results.return_value = pd.DataFrame([1, 2])
+    self._container_manager.RegisterRequiredColumns(
+      "downstream", ["message", "datetime"])
+    self._module.SetUp(sketch_id="1", token_password="test_token")
+    self._ProcessModule()
+
+    self.assertEqual(self._module.return_fields, "datetime,message")
+    self.assertEqual(mock_get_search_results.call_args[0][2], "datetime,message")
+
+  @mock.patch("dftimewolf.lib.timesketch_utils.GetApiClient")
+  @mock.patch.object(
+    timesketch.TimesketchSearchEventCollector, "_GetSearchResults"
+  )
+  def testAggregationsOnly(
+    self, mock_get_search_results: Any, _mock_get_api_client: Any
+  ) -> None:
+    """Tests running aggregations without downloading events."""
+    self._module.SetUp(
+      sketch_id="1",
+      query_string="tag:malware",
+      start_datetime=datetime.datetime(2024, 11, 11),
+      end_datetime=datetime.datetime(2024, 11, 12),
+      indices="3",
+      labels="star",
+      output_format="none",
+      token_password="test_token",
+      aggregations="terms:domain:5,date_histogram:datetime:1h",
+      aggregation_dsl='{"users": {"cardinality": {"field": "username"}}}',
+    )
+    mock_aggregate = self._module.sketch.aggregate
+    mock_aggregate.return_value.lazyload_data.return_value = {
+      "objects": [{
+        "data_types": {"buckets": [{"key": "type1", "doc_count": 4}]},
+        "terms:domain:5": {"buckets": [{"key": "evil.com", "doc_count": 3}]},
+        "date_histogram:datetime:1h": {"buckets": [
+          {"key": 1731283200000, "key_as_string": "2024-11-11T00:00:00",
+           "doc_count": 4}]},
+        "users": {"value": 2},
+      }]
+    }
+    self._ProcessModule()
+    self._AssertNoErrors()
+
+    mock_get_search_results.assert_not_called()
+    self._module._PlanSlices.assert_not_called()  # pylint: disable=protected-access
+    mock_aggregate.assert_called_once()
+    aggregation_dsl = json.loads(mock_aggregate.call_args[0][0])
+    self.assertEqual(aggregation_dsl["size"], 0)
+    self.assertEqual(aggregation_dsl["aggs"]["terms:domain:5"],
+                     {"terms": {"field": "domain", "size": 5}})
+    self.assertEqual(
+      aggregation_dsl["aggs"]["date_histogram:datetime:1h"],
+      {"date_histogram": {"field": "datetime", "calendar_interval": "1h"}})
+    filters = aggregation_dsl["query"]["bool"]["filter"]
+    self.assertEqual(filters[0]["query_string"]["query"], (
+      "(tag:malware) AND "
+      "(datetime:[2024-11-11T00:00:00 TO 2024-11-12T00:00:00])"))
+    self.assertEqual(filters[1], {"terms": {"__ts_timeline_id": [3]}})
+    self.assertEqual(filters[2]["nested"]["path"], "timesketch_label")
+
+    aggregations = {
+      aggregation.name: aggregation
+      for aggregation in self._module.GetContainers(
+        containers.TimesketchAggregation)
+    }
+    self.assertEqual(len(aggregations), 4)
+    self.assertEqual(aggregations["terms:domain:5"].key, "domain")
+    self.assertEqual(aggregations["terms:domain:5"].results, {"evil.com": 3})
+    self.assertEqual(
+      aggregations["date_histogram:datetime:1h"].results,
+      {"2024-11-11T00:00:00": 4})
+    self.assertEqual(aggregations["users"].key, "username")
+    self.assertEqual(aggregations["users"].results, {})
+    self.assertEqual(self._module.GetContainers(containers.File), [])
+
+  @mock.patch("dftimewolf.lib.timesketch_utils.GetApiClient")
+  @mock.patch.object(
+    timesketch.TimesketchSearchEventCollector, "_GetSearchResults"
+  )
+  def testAggregationErrors(
+    self, mock_get_search_results: Any, _mock_get_api_client: Any
+  ) -> None:
+    """Tests aggregating the sketch timelines, and failed aggregations."""
+    mock_get_search_results.return_value = pd.DataFrame(
+      {"message": ["a"], "data_type": ["x"], "_id": ["1"]})
+    self._module.SetUp(
+      sketch_id="1",
+      output_format="pandas",
+      token_password="test_token",
+    )
+    self._module.sketch.list_timelines.return_value = [
+      mock.Mock(id=1), mock.Mock(id=2)]
+    mock_aggregate = self._module.sketch.aggregate
+    mock_aggregate.side_effect = ValueError("Unable to query results")
+    self._ProcessModule()
+    self._AssertNoErrors()
+
+    aggregation_dsl = json.loads(mock_aggregate.call_args[0][0])
+    self.assertIn(
+      {"terms": {"__ts_timeline_id": [1, 2]}},
+      aggregation_dsl["query"]["bool"]["filter"])
+    self.assertEqual(
+      self._module.GetContainers(containers.TimesketchAggregation), [])
+    self.assertEqual(
+      len(self._module.GetContainers(containers.TimesketchEvents)), 1)
+
+    self._module.SetUp(
+      sketch_id="1",
+      output_format="pandas",
+      token_password="test_token",
+      aggregations="terms:domain",
+    )
+    self._module.sketch.aggregate.side_effect = ValueError("Bad aggregation")
+    with self.assertRaises(errors.DFTimewolfError):
+      self._ProcessModule()
+
+  @mock.patch("dftimewolf.lib.timesketch_utils.GetApiClient")
+  @mock.patch.object(
+    timesketch.TimesketchSearchEventCollector, "_GetSearchResults"
+  )
+  def testProcessSlices(
+    self, mock_get_search_results: Any, _mock_get_api_client: Any
+  ) -> None:
+    """Tests that the results of each slice are appended to the output."""
+    slices = [
+      timesketch.SearchSlice(
+        datetime.datetime(2024, 11, 11, hour),
+        datetime.datetime(2024, 11, 11, hour + 1),
+        [1],
+        False,
+        2,
+      )
+      for hour in range(3)
+    ]
+    self._module._PlanSlices.return_value = slices  # pylint: disable=protected-access
+    mock_get_search_results.side_effect = [
+      pd.DataFrame({"message": ["a", "b"], "data_type": ["x", "y"],
+                    "_id": ["1", "2"]}),
+      pd.DataFrame(),
+      pd.DataFrame({"message": ["c"], "data_type": ["x"], "_id": ["3"]}),
+    ]
+    self._module.SetUp(
+      sketch_id="1",
+      output_format="json",
+      token_password="test_token",
+    )
+    self._ProcessModule()
+    self._AssertNoErrors()
+
+    self.assertEqual(mock_get_search_results.call_count, 3)
+    mock_get_search_results.assert_any_call(
+      self._module.sketch, "*", "*", slices[1].start_datetime,
+      slices[1].end_datetime, [], [1], False, 2)
+
+    file_containers = self._module.GetContainers(containers.File)
+    self.assertEqual(len(file_containers), 1)
+    with open(file_containers[0].path, "r", encoding="utf-8") as output_file:
+      events = json.load(output_file)
+    os.remove(file_containers[0].path)
+    self.assertEqual(events, [
+      {"message": "a", "data_type": "x"},
+      {"message": "b", "data_type": "y"},
+      {"message": "c", "data_type": "x"},
+    ])
+
+
+
+class SearchSliceTest(unittest.TestCase):
+  """Tests for search slicing."""
+
+  def testGenerateTimerangeQuery(self) -> None:
+    """Tests generating an end exclusive time range query."""
+    self.assertEqual(
+      timesketch.GenerateTimerangeQuery(
+        datetime.datetime(2024, 11, 11), datetime.datetime(2024, 11, 12),
+        end_inclusive=False),
+      "datetime:[2024-11-11T00:00:00 TO 2024-11-12T00:00:00}")
+
+  def testParseAggregationSpec(self) -> None:
+    """Tests parsing aggregation specifications."""
+    self.assertEqual(
+      timesketch.ParseAggregationSpec("terms:data_type"),
+      {"terms": {"field": "data_type", "size": 100}})
+    self.assertEqual(
+      timesketch.ParseAggregationSpec("date_histogram:datetime:30m"),
+      {"date_histogram": {"field": "datetime", "fixed_interval": "30m"}})
+    with self.assertRaises(ValueError):
+      timesketch.ParseAggregationSpec("histogram:datetime")
+    with self.assertRaises(ValueError):
+      timesketch.ParseAggregationSpec("terms")
+
+  def testSplit(self) -> None:
+    """Tests splitting a slice in two halves."""
+    search_slice = timesketch.SearchSlice(
+      datetime.datetime(2024, 11, 11), datetime.datetime(2024, 11, 12), [1])
+    first, second = search_slice.Split()
+    self.assertEqual(first, timesketch.SearchSlice(
+      datetime.datetime(2024, 11, 11), datetime.datetime(2024, 11, 11, 12),
+      [1], False))
+    self.assertEqual(second, timesketch.SearchSlice(
+      datetime.datetime(2024, 11, 11, 12), datetime.datetime(2024, 11, 12),
+      [1], True))
+
+    self.assertIsNone(timesketch.SearchSlice(
+      datetime.datetime(2024, 11, 11), datetime.datetime(2024, 11, 11, 0, 0, 1)
+    ).Split())
+    self.assertIsNone(timesketch.SearchSlice(None, None).Split())
+
+
+class TimesketchSearchSlicingTest(modules_test_base.ModuleTestBase):
+  """Tests for slicing searches of the TimesketchSearchEventCollector."""
+
+  _module: timesketch.TimesketchSearchEventCollector  # pyrefly: ignore[bad-override-mutable-attribute]
+
+  def setUp(self) -> None:
+    self._InitModule(timesketch.TimesketchSearchEventCollector)
+    super().setUp()
+
+  @mock.patch("dftimewolf.lib.timesketch_utils.GetApiClient")
+  @mock.patch.object(timesketch, "MAX_SLICE_EVENTS", 1000)
+  def testPlanSlices(self, _mock_get_api_client: Any) -> None:
+    """Tests splitting a search until slices are small enough."""
+    start = datetime.datetime(2024, 11, 11)
+    end = datetime.datetime(2024, 11, 12)
+
+    def _CountEvents(search_slice: timesketch.SearchSlice) -> int:
+      # 100 events per hour in the first index, none in the second.
+      if search_slice.indices == [2]:
+        return 0
+      duration = search_slice.end_datetime - search_slice.start_datetime
+      return int(duration.total_seconds() / 36)
+
+    self._module.SetUp(
+      sketch_id="1",
+      start_datetime=start,
+      end_datetime=end,
+      indices="1,2",
+      token_password="test_token",
+    )
+    with mock.patch.object(
+        self._module, "_CountEvents", side_effect=_CountEvents):
+      with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        slices = self._module._PlanSlices(executor)  # pylint: disable=protected-access
+
+    self.assertEqual(len(slices), 4)
+    self.assertEqual(slices[0].start_datetime, start)
+    self.assertEqual(slices[-1].end_datetime, end)
+    for previous, search_slice in zip(slices, slices[1:]):
+      self.assertEqual(previous.end_datetime, search_slice.start_datetime)
+      self.assertFalse(previous.end_inclusive)
+    self.assertTrue(slices[-1].end_inclusive)
+    self.assertEqual({s.expected_size for s in slices}, {600})
+    self.assertEqual({tuple(s.indices) for s in slices}, {(1,)})
+
+  @mock.patch("dftimewolf.lib.timesketch_utils.GetApiClient")
+  def testGetTimeBoundsStartOnly(self, _mock_get_api_client: Any) -> None:
+    """Tests bounding a slice with a start datetime and no end datetime."""
+    start = datetime.datetime(2024, 11, 11, tzinfo=datetime.timezone.utc)
+    last_event = pd.DataFrame(
+      {"datetime": ["2024-11-12T02:00:00.123456+02:00"]})
+    first_event = pd.DataFrame(
+      {"datetime": ["2024-11-11T01:00:00.123456+00:00"]})
+    self._module.SetUp(
+      sketch_id="1",
+      start_datetime=start,
+      token_password="test_token",
+    )
+    with mock.patch.object(self._module, "_BuildSearch") as mock_build_search:
+      mock_build_search.return_value.to_pandas.side_effect = [
+        first_event, last_event]
+      search_slice = self._module._GetTimeBounds(  # pylint: disable=protected-access
+        timesketch.SearchSlice(start, None, [1]))
+
+    self.assertEqual(search_slice.start_datetime, start)
+    self.assertEqual(
+      search_slice.end_datetime,
+      datetime.datetime(2024, 11, 12, 0, 0, 1, tzinfo=datetime.timezone.utc))
+    first, second = search_slice.Split()
+    self.assertEqual(
+      first.end_datetime,
+      datetime.datetime(2024, 11, 11, 12, 0, 0, tzinfo=datetime.timezone.utc))
+    self.assertEqual(second.end_datetime, search_slice.end_datetime)
+
+
+if __name__ == "__main__":
+  unittest.main()
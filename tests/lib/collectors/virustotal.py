@@ -2,10 +2,16 @@
 # -*- coding: utf-8 -*-
 """Tests the VirusTotal (VT) collector."""
 
+import io
+import os
+import tempfile
 import unittest
+import zipfile
 from unittest import mock
 
 from dftimewolf.lib.collectors import virustotal
+from dftimewolf.lib.containers import containers
+from tests.lib import modules_test_base
 
 
 FAKE_VT_API_KEY = '123456789'
@@ -53,5 +59,115 @@ class VTCollectingTest(unittest.TestCase):
         self._vt_collector.hashes_list)
 
 
+class VTCollectorProcessTest(modules_test_base.ModuleTestBase):
+  """Tests for the VirusTotal collector Process."""
+
+  def setUp(self):
+    self._InitModule(virustotal.VTCollector)
+    super().setUp()
+    self._directory = tempfile.TemporaryDirectory()
+    self._output_directory = os.path.join(self._directory.name, 'output')
+    self._store_directory = os.path.join(self._directory.name, 'store')
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as archive_file:
+      archive_file.writestr('Security.evtx', b'evtx content')
+    self._contents = {'pcap': b'pcap content' * 1000,
+                      'evtx': archive.getvalue()}
+
+    patcher = mock.patch('vt.Client')
+    mock_client_class = patcher.start()
+    self.addCleanup(patcher.stop)
+    self._client = mock_client_class.return_value
+    self._client.get_data.side_effect = self._GetData
+    self._client.get.side_effect = self._Get
+    self._client.close_async = mock.AsyncMock()
+    patcher = mock.patch.object(virustotal, 'DOWNLOAD_CHUNK_SIZE', 1000)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    self._directory.cleanup()
+    super().tearDown()
+
+  def _GetData(self, path):
+    """Returns fake behaviour reports for a sample."""
+    vt_hash = path.split('/')[2]
+    return [
+        {'attributes': {'has_pcap': True, 'has_evtx': True},
+         'links': {'self': f'https://vt/api/v3/file_behaviours/'
+                           f'{vt_hash}_Sandbox {index}'}}
+        for index in range(2)]
+
+  def _Get(self, link):
+    """Returns a fake streamed download."""
+    response = mock.Mock(status=200)
+    response.content = io.BytesIO(self._contents[link.rsplit('/', 1)[1]])
+    return response
+
+  def _SetUpModule(self, vt_type, store=True):
+    """Sets up the module for two samples."""
+    self._module.SetUp(
+        hashes='a' * 64 + ',' + 'b' * 64,
+        vt_api_key=FAKE_VT_API_KEY,
+        vt_type=vt_type,
+        directory=self._output_directory,
+        store_directory=self._store_directory if store else None)
+
+  def testProcessPcap(self):
+    """Tests concurrent downloads, and that stored samples are reused."""
+    self._SetUpModule(FAKE_VT_TYPE_PCAP)
+    self._ProcessModule()
+
+    files = self._module.GetContainers(containers.File, pop=True)
+    self.assertEqual(len(files), 4)
+    self.assertEqual(self._client.get_data.call_count, 2)
+    self.assertEqual(self._client.get.call_count, 4)
+    for file_container in files:
+      self.assertEqual(
+          os.path.dirname(file_container.path), self._output_directory)
+      with open(file_container.path, 'rb') as downloaded_file:
+        self.assertEqual(downloaded_file.read(), self._contents['pcap'])
+
+    # A second run only uses the local store.
+    self._ProcessModule()
+    self.assertEqual(len(self._module.GetContainers(containers.File)), 4)
+    self.assertEqual(self._client.get_data.call_count, 2)
+    self.assertEqual(self._client.get.call_count, 4)
+
+  def testProcessWithoutStore(self):
+    """Tests that files are downloaded on every run without a store."""
+    self._SetUpModule(FAKE_VT_TYPE_PCAP, store=False)
+    self._ProcessModule()
+    self.assertEqual(
+        len(self._module.GetContainers(containers.File, pop=True)), 4)
+    self._ProcessModule()
+
+    self.assertEqual(len(self._module.GetContainers(containers.File)), 4)
+    self.assertEqual(self._client.get.call_count, 8)
+    self.assertFalse(os.path.exists(self._store_directory))
+    self.assertEqual(len(os.listdir(self._output_directory)), 4)
+
+  def testClientsClosed(self):
+    """Tests that the clients of the download threads are closed."""
+    self._SetUpModule(FAKE_VT_TYPE_PCAP)
+    self._ProcessModule()
+
+    self.assertGreater(self._client.close_async.await_count, 0)
+    self.assertEqual(
+        self._client.close_async.await_count,
+        virustotal.vt.Client.call_count)
+
+  def testProcessEvtx(self):
+    """Tests that EVTX archives are extracted."""
+    self._SetUpModule(FAKE_VT_TYPE_EVTX)
+    self._ProcessModule()
+
+    directories = self._module.GetContainers(containers.Directory)
+    self.assertEqual(len(directories), 4)
+    for directory in directories:
+      self.assertEqual(os.listdir(directory.path), ['Security.evtx'])
+
+
 if __name__ == '__main__':
   unittest.main()
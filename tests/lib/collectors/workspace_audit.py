@@ -4,9 +4,16 @@
 from unittest import mock
 import unittest
 import datetime
+import json
+import os
+import tempfile
+
+from googleapiclient import errors as googleapi_errors
 
 from dftimewolf.lib import errors
+from dftimewolf.lib import high_water_marks
 from dftimewolf.lib.collectors import workspace_audit
+from dftimewolf.lib.containers import containers
 
 
 class WorkspaceAuditCollectorTest(unittest.TestCase):
@@ -52,8 +59,180 @@ class WorkspaceAuditCollectorTest(unittest.TestCase):
       'Maximum gWorkspace retention is 6 months. Please choose a more recent '
       'start date (Earliest: 2022-07-05T00:00:00Z).')
 
+  def testDefaultFields(self):
+    """Tests that only kind and etag are dropped from the activities."""
+    # Fields of the activity resource of the Admin SDK Reports API.
+    activity_fields = {
+        'kind', 'etag', 'id', 'actor', 'ownerDomain', 'ipAddress', 'events',
+        'networkInfo', 'resourceDetails'}
+    items = workspace_audit.DEFAULT_FIELDS.split('items(')[1].rstrip(')')
+    self.assertEqual(
+        set(items.split(',')), activity_fields - {'kind', 'etag'})
+
+  @mock.patch.object(workspace_audit.WorkspaceAuditCollector, '_GetHttp')
+  @mock.patch.object(
+      workspace_audit.WorkspaceAuditCollector, '_BuildAuditResource')
+  @mock.patch.object(workspace_audit.WorkspaceAuditCollector, '_GetCredentials')
+  def testProcessFanOut(
+      self, unused_mock_get_credentials, mock_build_resource, unused_mock_http):
+    """Tests collecting several applications, users and time windows."""
+    requests = []
+
+    def _List(**kwargs):
+      requests.append(kwargs)
+      request = mock.MagicMock()
+      request.execute.return_value = {'items': [kwargs]}
+      return request
+
+    mock_resource = mock.MagicMock()
+    mock_resource.activities.return_value.list.side_effect = _List
+    mock_resource.activities.return_value.list_next.return_value = None
+    mock_build_resource.return_value = mock_resource
 
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    start_time = now - datetime.timedelta(days=2)
+    self.ws_collector.SetUp(
+        application_name='login,drive',
+        filter_expression='',
+        user_key='user1@example.com,user2@example.com',
+        start_time=start_time,
+        end_time=now,
+        window_hours=24)
+    self.ws_collector.Process()
+
+    # 2 applications x 2 users x 2 windows.
+    self.assertEqual(len(requests), 8)
+    mock_build_resource.assert_called_once()
+    for request in requests:
+      self.assertEqual(request['fields'], workspace_audit.DEFAULT_FIELDS)
+
+    # pylint: disable=protected-access
+    stored = [
+        call.kwargs['container'] for call in
+        self.ws_collector._container_manager.StoreContainer.call_args_list]
+    self.assertEqual(len(stored), 2)
+    self.assertTrue(
+        all(isinstance(c, containers.WorkspaceLogs) for c in stored))
+    self.assertEqual(
+        [c.application_name for c in stored], ['login', 'drive'])
+    self.assertEqual(
+        stored[0].user_key, 'user1@example.com,user2@example.com')
+
+    with open(stored[1].path, encoding='utf-8') as output_file:
+      records = [json.loads(line) for line in output_file]
+    self.assertEqual(
+        [(r['applicationName'], r['userKey']) for r in records],
+        [('drive', 'user1@example.com')] * 2 +
+        [('drive', 'user2@example.com')] * 2)
+    self.assertLess(records[0]['startTime'], records[1]['startTime'])
 
+  @mock.patch.object(workspace_audit.WorkspaceAuditCollector, '_GetHttp')
+  @mock.patch.object(
+      workspace_audit.WorkspaceAuditCollector, '_BuildAuditResource')
+  @mock.patch.object(workspace_audit.WorkspaceAuditCollector, '_GetCredentials')
+  def testProcessIncremental(
+      self, unused_mock_get_credentials, mock_build_resource, unused_mock_http):
+    """Tests the per user high-water marks of incremental collections."""
+    now = datetime.datetime.now(tz=datetime.timezone.utc).replace(
+        microsecond=0)
+    start_time = now - datetime.timedelta(days=2)
+    mark = start_time + datetime.timedelta(hours=12)
+
+    def _Time(delta_hours):
+      return (mark + datetime.timedelta(hours=delta_hours)).strftime(
+          workspace_audit.WORKSPACE_TIME_FORMAT)
+
+    # Records returned by the list requests of each user, by request start.
+    records = {
+        'user1@example.com': [
+            {'id': {'time': _Time(-1), 'uniqueQualifier': 'late'}},
+            {'id': {'time': _Time(0), 'uniqueQualifier': 'old'}},
+            {'id': {'time': _Time(0), 'uniqueQualifier': 'new-1'}},
+            {'id': {'time': _Time(24), 'uniqueQualifier': 'new-2'}},
+            {'id': {'time': _Time(24), 'uniqueQualifier': 'new-3'}},
+        ],
+        'user2@example.com': [
+            {'id': {'time': _Time(1), 'uniqueQualifier': 'user2-1'}},
+        ],
+    }
+    requests = []
+
+    def _List(**kwargs):
+      requests.append(kwargs)
+      request = mock.MagicMock()
+      window_start = datetime.datetime.strptime(
+          kwargs['startTime'], workspace_audit.WORKSPACE_TIME_FORMAT).replace(
+              tzinfo=datetime.timezone.utc)
+      window_end = datetime.datetime.strptime(
+          kwargs['endTime'], workspace_audit.WORKSPACE_TIME_FORMAT).replace(
+              tzinfo=datetime.timezone.utc)
+      if (kwargs['userKey'] == 'user2@example.com' and
+          window_end - window_start < datetime.timedelta(hours=24)):
+        request.execute.side_effect = googleapi_errors.HttpError(
+            mock.MagicMock(status=500), b'Server error')
+        return request
+      request.execute.return_value = {'items': [
+          record for record in records[kwargs['userKey']]
+          if window_start <= high_water_marks.ParseTimestamp(
+              record['id']['time']) <= window_end]}
+      return request
+
+    mock_resource = mock.MagicMock()
+    mock_resource.activities.return_value.list.side_effect = _List
+    mock_resource.activities.return_value.list_next.return_value = None
+    mock_build_resource.return_value = mock_resource
+
+    with tempfile.TemporaryDirectory() as directory:
+      store = high_water_marks.HighWaterMarkStore(
+          os.path.join(directory, 'state.json'))
+      previous = high_water_marks.HighWaterMark(
+          mark, {'old': mark}, workspace_audit.INCREMENTAL_LOOKBACK)
+      store.Set('WorkspaceAuditCollector', 'login:user1@example.com', '',
+                previous)
+      store.Set('WorkspaceAuditCollector', 'login:user2@example.com', '',
+                previous)
+
+      with mock.patch.object(
+          high_water_marks, 'HighWaterMarkStore', return_value=store):
+        self.ws_collector.SetUp(
+            application_name='login',
+            filter_expression='',
+            user_key='user1@example.com,user2@example.com',
+            start_time=start_time,
+            end_time=now,
+            window_hours=24,
+            incremental=True)
+        self.ws_collector.Process()
+
+      # Each user restarts from the lookback window of its own high-water
+      # mark, which collects the late record.
+      self.assertEqual(
+          sorted((r['userKey'], r['startTime']) for r in requests
+                 if r['startTime'] == _Time(-6)),
+          [('user1@example.com', _Time(-6)), ('user2@example.com', _Time(-6))])
+
+      # The trackers of the windows of user1 are merged, and the mark of user2
+      # is kept since one of its windows failed.
+      self.assertEqual(
+          store.Get('WorkspaceAuditCollector', 'login:user1@example.com', ''),
+          high_water_marks.HighWaterMark(
+              high_water_marks.ParseTimestamp(_Time(24)),
+              {'new-2': high_water_marks.ParseTimestamp(_Time(24)),
+               'new-3': high_water_marks.ParseTimestamp(_Time(24))},
+              workspace_audit.INCREMENTAL_LOOKBACK))
+      self.assertEqual(
+          store.Get('WorkspaceAuditCollector', 'login:user2@example.com', ''),
+          previous)
+
+    # pylint: disable=protected-access
+    stored = [
+        call.kwargs['container'] for call in
+        self.ws_collector._container_manager.StoreContainer.call_args_list]
+    with open(stored[0].path, encoding='utf-8') as output_file:
+      qualifiers = [
+          json.loads(line)['id']['uniqueQualifier'] for line in output_file]
+    self.assertEqual(
+        qualifiers, ['late', 'new-1', 'new-2', 'new-3', 'user2-1'])
 
 
 if __name__ == '__main__':
@@ -780,6 +780,31 @@ class ContainerManagerTest(unittest.TestCase):
         'Test Exception',
         exc_info=True)
 
+  def test_RequiredColumns(self):
+    """Tests that required columns are the union over dependant modules."""
+    self._container_manager.ParseRecipe(_TEST_RECIPE)
+
+    # ModuleB has dependants ModuleD and ModuleE, none declared columns.
+    self.assertIsNone(self._container_manager.GetRequiredColumns('ModuleB'))
+
+    self._container_manager.RegisterRequiredColumns('ModuleD', ['a', 'b'])
+    self.assertIsNone(self._container_manager.GetRequiredColumns('ModuleB'))
+    # ModuleC only has ModuleD as a dependant.
+    self.assertEqual(
+        self._container_manager.GetRequiredColumns('ModuleC'), {'a', 'b'})
+
+    self._container_manager.RegisterRequiredColumns('ModuleE', ['b', 'c'])
+    self._container_manager.RegisterRequiredColumns('ModuleE', ['d'])
+    self.assertEqual(
+        self._container_manager.GetRequiredColumns('ModuleB'),
+        {'a', 'b', 'c', 'd'})
+
+    # Nothing depends on ModuleE.
+    self.assertIsNone(self._container_manager.GetRequiredColumns('ModuleE'))
+
+    with self.assertRaisesRegex(RuntimeError, 'non-existent module'):
+      self._container_manager.RegisterRequiredColumns('ModuleF', ['a'])
+
 
 if __name__ == '__main__':
   unittest.main()
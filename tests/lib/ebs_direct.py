@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the EBS direct API snapshot reader."""
+
+import base64
+import hashlib
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+from concurrent import futures
+from typing import Any
+from urllib import parse
+
+import boto3
+import mock
+
+from dftimewolf.lib import ebs_direct
+
+
+BLOCK_SIZE = 512 * 1024
+VOLUME_SIZE_GIB = 1
+SNAPSHOT_ID = 'snap-01234567'
+# Allocated blocks of the fake snapshot, by block index.
+BLOCKS = {
+    0: b'\x01' * BLOCK_SIZE,
+    1: b'\x02' * BLOCK_SIZE,
+    100: b'\x03' * BLOCK_SIZE,
+    2047: b'\x04' * BLOCK_SIZE,
+}
+
+
+class EBSStubHandler(http.server.BaseHTTPRequestHandler):
+  """Serves ListSnapshotBlocks and GetSnapshotBlock for a fake snapshot."""
+
+  page_size = 2
+  corrupt_blocks: set[int] = set()
+
+  def log_message(self, *args: Any) -> None:  # pylint: disable=arguments-differ
+    """Silences the request logs."""
+
+  def _SendJson(self, body: dict[str, Any]) -> None:
+    """Sends a JSON response."""
+    data = json.dumps(body).encode()
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_GET(self) -> None:  # pylint: disable=invalid-name
+    """Handles the EBS direct API GET requests."""
+    url = parse.urlparse(self.path)
+    query = parse.parse_qs(url.query)
+    parts = url.path.strip('/').split('/')
+    if parts[:3] != ['snapshots', SNAPSHOT_ID, 'blocks']:
+      self.send_error(404)
+      return
+
+    if len(parts) == 3:
+      indexes = sorted(BLOCKS)
+      start = int(query.get('pageToken', ['0'])[0])
+      body = {
+          'Blocks': [
+              {'BlockIndex': index, 'BlockToken': f'token-{index}'}
+              for index in indexes[start:start + self.page_size]],
+          'VolumeSize': VOLUME_SIZE_GIB,
+          'BlockSize': BLOCK_SIZE,
+      }
+      if start + self.page_size < len(indexes):
+        body['NextToken'] = str(start + self.page_size)
+      self._SendJson(body)
+      return
+
+    index = int(parts[3])
+    if query.get('blockToken') != [f'token-{index}']:
+      self.send_error(400)
+      return
+    data = BLOCKS[index]
+    checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+    if index in self.corrupt_blocks:
+      data = bytes(len(data))
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/octet-stream')
+    self.send_header('Content-Length', str(len(data)))
+    self.send_header('x-amz-Data-Length', str(len(data)))
+    self.send_header('x-amz-Checksum', checksum)
+    self.send_header('x-amz-Checksum-Algorithm', 'SHA256')
+    self.end_headers()
+    self.wfile.write(data)
+
+
+class FakeS3Client:
+  """Records the parts of multipart uploads."""
+
+  def __init__(self) -> None:
+    self.sha256 = hashlib.sha256()
+    self.parts: dict[int, int] = {}
+    self.completed: list[dict[str, Any]] = []
+    self.aborted = False
+    self._lock = threading.Lock()
+    self._data: dict[int, bytes] = {}
+
+  def create_multipart_upload(self, **kwargs: Any) -> dict[str, Any]:  # pylint: disable=invalid-name
+    """Starts a multipart upload."""
+    del kwargs  # Unused
+    return {'UploadId': 'upload-id'}
+
+  def upload_part(self, PartNumber: int, Body: bytes, **kwargs: Any) -> dict[str, Any]:  # pylint: disable=invalid-name
+    """Uploads a part, only keeping the non zero ones."""
+    del kwargs  # Unused
+    with self._lock:
+      self.parts[PartNumber] = len(Body)
+      if Body.count(0) != len(Body):
+        self._data[PartNumber] = Body
+    return {'ETag': f'etag-{PartNumber}'}
+
+  def complete_multipart_upload(self, MultipartUpload: dict[str, Any], **kwargs: Any) -> None:  # pylint: disable=invalid-name
+    """Completes a multipart upload."""
+    del kwargs  # Unused
+    self.completed = MultipartUpload['Parts']
+
+  def abort_multipart_upload(self, **kwargs: Any) -> None:  # pylint: disable=invalid-name
+    """Aborts a multipart upload."""
+    del kwargs  # Unused
+    self.aborted = True
+
+  def ReadPart(self, part_number: int) -> bytes:
+    """Returns the data of an uploaded part."""
+    return self._data.get(part_number, bytes(self.parts[part_number]))
+
+
+def _ExpectedImageHash() -> str:
+  """Returns the SHA-256 hash of the fake snapshot image."""
+  sha256 = hashlib.sha256()
+  zeros = bytes(BLOCK_SIZE)
+  for index in range(VOLUME_SIZE_GIB * 1024 * 1024 * 1024 // BLOCK_SIZE):
+    sha256.update(BLOCKS.get(index, zeros))
+  return sha256.hexdigest()
+
+
+class SnapshotBlockReaderTest(unittest.TestCase):
+  """Tests for the SnapshotBlockReader class."""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), EBSStubHandler)
+    cls.server_thread = threading.Thread(target=cls.server.serve_forever)
+    cls.server_thread.start()
+    cls.expected_hash = _ExpectedImageHash()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    cls.server_thread.join()
+
+  def setUp(self):
+    self.ebs = boto3.client(
+        'ebs',
+        region_name='us-east-1',
+        endpoint_url=f'http://127.0.0.1:{self.server.server_address[1]}',
+        aws_access_key_id='fake-key',
+        aws_secret_access_key='fake-secret')
+    EBSStubHandler.corrupt_blocks = set()
+    self.reader = ebs_direct.SnapshotBlockReader(
+        self.ebs, SNAPSHOT_ID, max_workers=4)
+
+  def testListBlocks(self):
+    """Tests listing the allocated blocks over several pages."""
+    self.reader.ListBlocks()
+    self.assertEqual(self.reader.volume_size, 1024 * 1024 * 1024)
+    self.assertEqual(self.reader.block_size, BLOCK_SIZE)
+    self.assertEqual(
+        self.reader.blocks,
+        {index: f'token-{index}' for index in BLOCKS})
+
+  def testReadBlock(self):
+    """Tests reading allocated, unallocated and corrupted blocks."""
+    self.reader.ListBlocks()
+    self.assertEqual(self.reader.ReadBlock(100), BLOCKS[100])
+    self.assertEqual(self.reader.ReadBlock(50), bytes(BLOCK_SIZE))
+
+    EBSStubHandler.corrupt_blocks = {100}
+    with self.assertRaises(ValueError):
+      self.reader.ReadBlock(100)
+
+  def testReadRange(self):
+    """Tests reading the blocks of a range concurrently."""
+    self.reader.ListBlocks()
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+      data = self.reader.ReadRange(0, 4 * BLOCK_SIZE, executor)
+    self.assertEqual(data, self.reader.ReadRange(0, 4 * BLOCK_SIZE))
+    self.assertEqual(
+        data, BLOCKS[0] + BLOCKS[1] + bytes(2 * BLOCK_SIZE))
+
+  def testWriteSparseImage(self):
+    """Tests writing a sparse raw image."""
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'image.bin')
+      with mock.patch.object(
+          self.reader, 'ReadBlock', wraps=self.reader.ReadBlock) as read_block:
+        sha256 = self.reader.WriteSparseImage(path)
+
+      # Unallocated blocks are not requested.
+      self.assertEqual(
+          sorted(call.args[0] for call in read_block.call_args_list),
+          sorted(BLOCKS))
+      self.assertEqual(sha256, self.expected_hash)
+      self.assertEqual(os.path.getsize(path), 1024 * 1024 * 1024)
+      with open(path, 'rb') as image:
+        image.seek(100 * BLOCK_SIZE)
+        self.assertEqual(image.read(BLOCK_SIZE), BLOCKS[100])
+        self.assertEqual(image.read(BLOCK_SIZE), bytes(BLOCK_SIZE))
+
+  def testUploadToS3(self):
+    """Tests streaming the image to S3 with a multipart upload."""
+    s3_client = FakeS3Client()
+    sha256 = self.reader.UploadToS3(s3_client, 'bucket', 'snap/image.bin')
+
+    self.assertEqual(sha256, self.expected_hash)
+    part_count = 1024 * 1024 * 1024 // ebs_direct.S3_PART_SIZE
+    self.assertEqual(
+        s3_client.completed,
+        [{'ETag': f'etag-{number}', 'PartNumber': number}
+         for number in range(1, part_count + 1)])
+    self.assertEqual(
+        set(s3_client.parts.values()), {ebs_direct.S3_PART_SIZE})
+    self.assertEqual(s3_client.ReadPart(1)[:BLOCK_SIZE], BLOCKS[0])
+    self.assertFalse(s3_client.aborted)
+
+  def testUploadToS3BytesInFlight(self):
+    """Tests that the parts held in memory are bounded by their size."""
+    reader = ebs_direct.SnapshotBlockReader(
+        self.ebs, SNAPSHOT_ID, max_workers=4,
+        max_bytes_in_flight=2 * ebs_direct.S3_PART_SIZE)
+    map_in_order = reader._MapInOrder  # pylint: disable=protected-access
+    started = []
+    held = []
+
+    def _MapInOrder(chunk_size, function, max_in_flight):
+      def _Function(offset):
+        started.append(offset)
+        return function(offset)
+      results = map_in_order(chunk_size, _Function, max_in_flight)
+      for count, result in enumerate(results):
+        # Parts read but not hashed yet, including this one.
+        held.append(len(started) - count)
+        yield result
+
+    with mock.patch.object(reader, '_MapInOrder', side_effect=_MapInOrder):
+      sha256 = reader.UploadToS3(FakeS3Client(), 'bucket', 'snap/image.bin')
+
+    self.assertEqual(sha256, self.expected_hash)
+    self.assertEqual(max(held), 2)
+
+  def testUploadToS3Error(self):
+    """Tests that the multipart upload is aborted on errors."""
+    EBSStubHandler.corrupt_blocks = {2047}
+    s3_client = FakeS3Client()
+    with self.assertRaises(ValueError):
+      self.reader.UploadToS3(s3_client, 'bucket', 'snap/image.bin')
+    self.assertTrue(s3_client.aborted)
+    self.assertEqual(s3_client.completed, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -107,6 +107,21 @@ class DataFrameToDiskExporterTest(modules_test_base.ModuleTestBase):
     with open(out_containers[0].path, 'r') as f:
       self.assertEqual(f.read(), _EXPECTED_CSV)
 
+  def test_Columns(self):
+    """Tests exporting and declaring a fixed set of columns."""
+    self._module.SetUp(output_formats='csv',
+                       output_directory=self._out_dir,
+                       columns='datetime,key_1,missing')
+    self.assertEqual(
+        self._container_manager.GetRequiredColumns('upstream'),
+        {'datetime', 'key_1', 'missing'})
+    self._ProcessModule()
+
+    out_containers = self._module.GetContainers(containers.File)
+    self.assertLen(out_containers, 1)
+    with open(out_containers[0].path, 'r') as f:
+      self.assertEqual(f.readline(), 'datetime,key_1\n')
+
   def test_Markdown(self):
     """Tests outputting markdown."""
     self._module.SetUp(output_formats='markdown',
@@ -2,13 +2,15 @@
 # -*- coding: utf-8 -*-
 """Tests the GoogleCloudDiskExport."""
 
-import os
+import collections
 import unittest
 
 import mock
+from googleapiclient.errors import HttpError
 from libcloudforensics.providers.gcp.internal import project as gcp_project
 from libcloudforensics.providers.gcp.internal import compute
 
+from dftimewolf.lib import errors
 from dftimewolf.lib.containers import containers
 from dftimewolf.lib.exporters import gce_disk_export
 from tests.lib import modules_test_base
@@ -20,15 +22,65 @@ FAKE_DISK = compute.GoogleComputeDisk(
     FAKE_SOURCE_PROJECT.project_id,
     'fake_zone',
     'fake-source-disk')
-FAKE_IMAGE = compute.GoogleComputeImage(
-    FAKE_SOURCE_PROJECT.project_id,
-    'fake-zone',
-    'fake-source-disk-image-df-export-temp')
 
 
 # pylint: disable=line-too-long
 
 
+class FakeOperations:
+  """Fakes the Compute Engine and Cloud Build APIs used to export images.
+
+  Every operation is done the second time it is polled.
+  """
+
+  def __init__(self):
+    self.polls = collections.Counter()
+    self.requests = []
+    self.build_args = []
+    self.max_in_flight = 0
+    self.images = set()
+    self.gce_api = mock.MagicMock()
+    self.gce_api.images.return_value.insert.side_effect = self._InsertImage
+    self.gce_api.images.return_value.delete.side_effect = self._DeleteImage
+    self.gce_api.globalOperations.return_value.get.side_effect = (
+        lambda project, operation: self._Poll(operation, 'status', 'DONE'))
+    self.build = mock.MagicMock()
+    self.build.return_value.CreateBuild.side_effect = self._CreateBuild
+    self.build.return_value.GcbApi.return_value.operations.return_value.get.side_effect = (
+        lambda name: self._Poll(name, 'done', True))
+
+  @staticmethod
+  def _Request(response):
+    """Returns a request executing to response."""
+    return mock.Mock(execute=mock.Mock(return_value=response))
+
+  def _Poll(self, name, key, value):
+    """Polls an operation."""
+    self.polls[name] += 1
+    return self._Request({key: value} if self.polls[name] > 1 else {})
+
+  def _InsertImage(self, project, body, **unused_kwargs):
+    """Starts creating an image."""
+    del project  # Unused
+    self.images.add(body['name'])
+    self.max_in_flight = max(self.max_in_flight, len(self.images))
+    self.requests.append(('insert', body['sourceDisk']))
+    return self._Request({'name': f'insert-{body["name"]}'})
+
+  def _CreateBuild(self, build_body):
+    """Starts exporting an image."""
+    self.requests.append(('build', build_body['steps'][0]['args'][1]))
+    self.build_args.append(build_body['steps'][0]['args'])
+    return {'name': f'build-{len(self.requests)}'}
+
+  def _DeleteImage(self, project, image):
+    """Starts deleting an image."""
+    del project  # Unused
+    self.images.remove(image)
+    self.requests.append(('delete', image))
+    return self._Request({'name': f'delete-{image}'})
+
+
 class GoogleCloudDiskExportTest(modules_test_base.ModuleTestBase):
   """Tests for the Google Cloud disk exporter."""
 
@@ -37,23 +89,31 @@ class GoogleCloudDiskExportTest(modules_test_base.ModuleTestBase):
   def setUp(self):
     self._InitModule(gce_disk_export.GoogleCloudDiskExport)
     super().setUp()
+    self.operations = FakeOperations()
+    patches = [
+        mock.patch.object(
+            compute.GoogleCloudCompute, 'GceApi',
+            return_value=self.operations.gce_api),
+        mock.patch.object(
+            compute.GoogleCloudCompute, 'GetDisk',
+            side_effect=lambda name: compute.GoogleComputeDisk(
+                'fake-source-project', 'fake-zone', name)),
+        mock.patch(
+            'libcloudforensics.providers.gcp.internal.build.GoogleCloudBuild',
+            self.operations.build),
+        mock.patch(
+            'libcloudforensics.providers.gcp.internal.common.GenerateUniqueInstanceName',
+            side_effect=lambda name, limit: f'{name}-image'),
+        mock.patch('time.sleep'),
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
 
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeImage.Delete')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeImage.ExportImage')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.CreateImageFromDisk')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetDisk')
   @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
-  def testProcessDiskParams(self,
-                            mock_gcp_project,
-                            mock_get_disk,
-                            mock_create_image_from_disk,
-                            mock_export_image,
-                            mock_delete_image):
+  def testProcessDiskParams(self, mock_gcp_project):
     """Tests the exporter's Process() function."""
-    mock_export_image.return_value = 'gs://fake-bucket/image-df-export-temp.tar.gz'
     mock_gcp_project.return_value = FAKE_SOURCE_PROJECT
-    FAKE_SOURCE_PROJECT.compute.GetDisk = mock_get_disk
-    mock_get_disk.return_value = FAKE_DISK
     self._module.SetUp(source_project_name='fake-source-project',
                        gcs_output_location='gs://fake-bucket',
                        analysis_project_name='',
@@ -61,45 +121,31 @@ class GoogleCloudDiskExportTest(modules_test_base.ModuleTestBase):
                        remote_instance_name='',
                        all_disks=False,
                        exported_image_name='image-df-export-temp',
-                       image_format='qcow2')
-    FAKE_SOURCE_PROJECT.compute.CreateImageFromDisk = mock_create_image_from_disk
-    mock_create_image_from_disk.return_value = FAKE_IMAGE
-    FAKE_IMAGE.ExportImage = mock_export_image
-    FAKE_IMAGE.Delete = mock_delete_image
+                       image_format='qcow2',
+                       export_zone='europe-west1-b')
     self._ProcessModule()
-    mock_create_image_from_disk.assert_called_with(
-        FAKE_DISK)
-    mock_export_image.assert_called_with(
-        'gs://fake-bucket',
-        output_name='image-df-export-temp',
-        image_format='qcow2')
-    mock_delete_image.assert_called_once()
-    output_url = os.path.join(
-        'gs://fake-bucket', 'image-df-export-temp.tar.gz')
+    self._AssertNoErrors()
+
+    self.assertIn('-zone=europe-west1-b', self.operations.build_args[0])
+
+    self.assertEqual(self.operations.requests, [
+        ('insert', 'projects/fake-source-project/zones/fake-zone/disks/fake-source-disk'),
+        ('build', '-destination_uri=gs://fake-bucket/image-df-export-temp.qcow2'),
+        ('delete', 'fake-source-disk-image'),
+    ])
     urls = self._module.GetContainers(containers.GCSObject)
     self.assertLen(urls, 1)
-    self.assertEqual(urls[0].path, output_url)
+    self.assertEqual(
+        urls[0].path, 'gs://fake-bucket/image-df-export-temp.qcow2')
     self.assertIn('SOURCE_DISK', urls[0].metadata)
     self.assertIn('SOURCE_MACHINE', urls[0].metadata)
     self.assertEqual(urls[0].metadata['SOURCE_DISK'], 'fake-source-disk')
     self.assertEqual(urls[0].metadata['SOURCE_MACHINE'], 'UNKNOWN_MACHINE')
 
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeImage.Delete')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeImage.ExportImage')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.CreateImageFromDisk')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.GetDisk')
   @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
-  def testProcessDiskFromState(self,
-                               mock_gcp_project,
-                               mock_get_disk,
-                               mock_create_image_from_disk,
-                               mock_export_image,
-                               mock_delete_image):
+  def testProcessDiskFromState(self, mock_gcp_project):
     """Tests the exporter's Process() function."""
-    mock_export_image.return_value = 'gs://fake-bucket/image-df-export-temp.tar.gz'
     mock_gcp_project.return_value = FAKE_SOURCE_PROJECT
-    FAKE_SOURCE_PROJECT.compute.GetDisk = mock_get_disk
-    mock_get_disk.return_value = FAKE_DISK
     self._module.SetUp(source_project_name='fake-source-project',
                        gcs_output_location='gs://fake-bucket',
                        analysis_project_name='',
@@ -107,35 +153,123 @@ class GoogleCloudDiskExportTest(modules_test_base.ModuleTestBase):
                        remote_instance_name='',
                        all_disks=False,
                        exported_image_name='image-df-export-temp',
-                       image_format='qcow2')
+                       image_format='')
 
     container = containers.GCEDisk(name='fake-source-disk', project='fake-source-project')
     container.metadata['SOURCE_MACHINE'] = 'fake-source-machine'
     container.metadata['SOURCE_DISK'] = 'fake-source-disk'
     self._module.StoreContainer(container)
 
-    FAKE_SOURCE_PROJECT.compute.CreateImageFromDisk = mock_create_image_from_disk
-    mock_create_image_from_disk.return_value = FAKE_IMAGE
-    FAKE_IMAGE.ExportImage = mock_export_image
-    FAKE_IMAGE.Delete = mock_delete_image
     self._ProcessModule()
-    mock_create_image_from_disk.assert_called_with(
-        FAKE_DISK)
-    mock_export_image.assert_called_with(
-        'gs://fake-bucket',
-        output_name='image-df-export-temp',
-        image_format='qcow2')
-    mock_delete_image.assert_called_once()
-    output_url = os.path.join(
-        'gs://fake-bucket', 'image-df-export-temp.tar.gz')
+    self._AssertNoErrors()
+
     urls = self._module.GetContainers(containers.GCSObject)
     self.assertLen(urls, 1)
-    self.assertEqual(urls[0].path, output_url)
-    self.assertIn('SOURCE_DISK', urls[0].metadata)
-    self.assertIn('SOURCE_MACHINE', urls[0].metadata)
+    self.assertEqual(
+        urls[0].path, 'gs://fake-bucket/image-df-export-temp.tar.gz')
     self.assertEqual(urls[0].metadata['SOURCE_DISK'], 'fake-source-disk')
     self.assertEqual(urls[0].metadata['SOURCE_MACHINE'], 'fake-source-machine')
 
+  @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
+  def testProcessConcurrent(self, mock_gcp_project):
+    """Tests that exports run concurrently, up to the in-flight limit."""
+    mock_gcp_project.return_value = FAKE_SOURCE_PROJECT
+    self._module.SetUp(source_project_name='fake-source-project',
+                       gcs_output_location='gs://fake-bucket',
+                       analysis_project_name='',
+                       source_disk_names='disk-1,disk-2,disk-3',
+                       remote_instance_name='',
+                       all_disks=False,
+                       exported_image_name='image-df-export-temp',
+                       image_format='',
+                       max_concurrent_exports=2)
+    self._ProcessModule()
+    self._AssertNoErrors()
+
+    self.assertEqual(self.operations.max_in_flight, 2)
+    # A single Cloud Build client polls all the exports.
+    self.operations.build.assert_called_once_with('fake-source-project')
+    for build_args in self.operations.build_args:
+      self.assertIn('-zone=fake-zone', build_args)
+    # Both images are created before either is exported.
+    self.assertEqual(
+        [kind for kind, _ in self.operations.requests[:3]],
+        ['insert', 'insert', 'build'])
+    urls = self._module.GetContainers(containers.GCSObject)
+    self.assertEqual(
+        sorted(url.path for url in urls),
+        [f'gs://fake-bucket/disk-{index}-image.tar.gz' for index in (1, 2, 3)])
+
+  @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
+  def testProcessExportError(self, mock_gcp_project):
+    """Tests that the image of a failed export is deleted."""
+    mock_gcp_project.return_value = FAKE_SOURCE_PROJECT
+    self.operations.build.return_value.GcbApi.return_value.operations.return_value.get.side_effect = (
+        lambda name: FakeOperations._Request(  # pylint: disable=protected-access
+            {'done': True, 'error': {'message': 'Build failed'}}))
+    self._module.SetUp(source_project_name='fake-source-project',
+                       gcs_output_location='gs://fake-bucket',
+                       analysis_project_name='',
+                       source_disk_names='fake-source-disk',
+                       remote_instance_name='',
+                       all_disks=False,
+                       exported_image_name='',
+                       image_format='')
+    self._ProcessModule()
+
+    self.assertEqual(self.operations.images, set())
+    self.assertEqual(self._module.GetContainers(containers.GCSObject), [])
+    self.assertTrue(any(
+        'Build failed' in message.message for message in self.messages
+        if message.is_error))
+
+  @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
+  def testProcessApiError(self, mock_gcp_project):
+    """Tests that an API error only fails its own export."""
+    mock_gcp_project.return_value = FAKE_SOURCE_PROJECT
+    create_build = self.operations.build.return_value.CreateBuild.side_effect
+
+    def _FailSecondBuild(build_body):
+      if 'disk-2-image' in build_body['steps'][0]['args'][0]:
+        raise HttpError(mock.Mock(status=503, reason='Unavailable'), b'')
+      return create_build(build_body)
+
+    self.operations.build.return_value.CreateBuild.side_effect = (
+        _FailSecondBuild)
+    self._module.SetUp(source_project_name='fake-source-project',
+                       gcs_output_location='gs://fake-bucket',
+                       analysis_project_name='',
+                       source_disk_names='disk-1,disk-2,disk-3',
+                       remote_instance_name='',
+                       all_disks=False,
+                       exported_image_name='',
+                       image_format='')
+    self._ProcessModule()
+
+    self.assertEqual(self.operations.images, set())
+    self.assertIn(('delete', 'disk-2-image'), self.operations.requests)
+    urls = self._module.GetContainers(containers.GCSObject)
+    self.assertEqual(
+        sorted(url.path for url in urls),
+        [f'gs://fake-bucket/disk-{index}-image.tar.gz' for index in (1, 3)])
+    self.assertTrue(any(
+        'disk-2' in message.message for message in self.messages
+        if message.is_error))
+
+  @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
+  def testSetUpInvalidImageName(self, mock_gcp_project):
+    """Tests that the exported image name is validated."""
+    mock_gcp_project.return_value = FAKE_SOURCE_PROJECT
+    with self.assertRaises(errors.DFTimewolfError):
+      self._module.SetUp(source_project_name='fake-source-project',
+                         gcs_output_location='gs://fake-bucket',
+                         analysis_project_name='',
+                         source_disk_names='fake-source-disk',
+                         remote_instance_name='',
+                         all_disks=False,
+                         exported_image_name='Invalid_Name',
+                         image_format='')
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -8,6 +8,7 @@ import mock
 from libcloudforensics.providers.gcp.internal import project as gcp_project
 from libcloudforensics.providers.gcp.internal import compute
 
+from dftimewolf.lib.containers import containers
 from dftimewolf.lib.exporters import gce_disk_export_dd
 from tests.lib import modules_test_base
 
@@ -64,8 +65,8 @@ class GoogleCloudDiskExportStreamTest(modules_test_base.ModuleTestBase):
                      'gs://fake-bucket/')
 
   # pylint: disable=line-too-long
+  @mock.patch('time.sleep')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.GetOperation')
-  @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeDisk.GetLabels')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeInstance.Delete')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleComputeDisk.GetOperation')
   @mock.patch('libcloudforensics.providers.gcp.internal.compute.GoogleCloudCompute.CreateInstanceFromArguments')
@@ -77,8 +78,8 @@ class GoogleCloudDiskExportStreamTest(modules_test_base.ModuleTestBase):
                   mock_create_instance_from_arguments,
                   mock_disk_get_operation,
                   mock_delete_instance,
-                  mock_get_disk_labels,
-                  mock_instance_get_operation):
+                  mock_instance_get_operation,
+                  mock_sleep):
     """Tests the exporter's Process() function."""
     mock_gcp_project.return_value = FAKE_SOURCE_PROJECT
     FAKE_SOURCE_PROJECT.compute.GetDisk = mock_get_disk
@@ -95,11 +96,26 @@ class GoogleCloudDiskExportStreamTest(modules_test_base.ModuleTestBase):
     )
     FAKE_SOURCE_PROJECT.compute.CreateInstanceFromArgument = mock_create_instance_from_arguments  # pyrefly: ignore[missing-attribute]
     mock_create_instance_from_arguments.return_value = FAKE_INSTANCE
-    mock_get_disk_labels.return_value = {'archive_hash_verified': 'true'}
-    mock_instance_get_operation.return_value = {}
+    exported = {
+        'labels': {'fake-source-disk': 'archive_hash_verified'},
+        'metadata': {'items': [{
+            'key': 'archive_path_fake-source-disk',
+            'value': r'incident\ngs://fake-bucket/fake-source-disk/disk.image',
+        }]},
+    }
+    mock_instance_get_operation.side_effect = [
+        {}, {'labels': {'fake-source-disk': 'archive_starting'}}, exported]
     self._ProcessModule()
+    self._AssertNoErrors()
     mock_delete_instance.assert_called_once()
     mock_create_instance_from_arguments.assert_called_once()
+    # The poll interval backs off while the disk is being exported.
+    self.assertEqual(
+        [call.args[0] for call in mock_sleep.call_args_list], [10, 20])
+    urls = self._module.GetContainers(containers.URL)
+    self.assertEqual(
+        [url.path for url in urls],
+        ['gs://fake-bucket/fake-source-disk/disk.image'])
 
 
 if __name__ == '__main__':
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 """Tests the local filesystem exporter."""
 
+import os
+import tempfile
 import unittest
 
 import mock
@@ -12,22 +14,6 @@ from dftimewolf.lib.exporters import local_filesystem
 from tests.lib import modules_test_base
 
 
-FAKE_PATHS = {
-    '/fake/evidence_directory': ['file1', 'file2'],
-    '/fake/evidence_file': None
-}
-
-
-def FakeIsDir(string):
-  """Fake isdir function for mocking purposes."""
-  return bool(FAKE_PATHS[string])
-
-
-def FakeListDir(string):
-  """Fake listdir function for mocking purposes."""
-  return FAKE_PATHS[string]
-
-
 class LocalFileSystemTest(modules_test_base.ModuleTestBase):
   """Tests for the local filesystem exporter."""
 
@@ -37,37 +23,39 @@ class LocalFileSystemTest(modules_test_base.ModuleTestBase):
     self._InitModule(local_filesystem.LocalFilesystemCopy)
     super().setUp()
 
-  @mock.patch('shutil.copytree', autospec=True)
-  @mock.patch('shutil.copy2')
-  @mock.patch('os.path.isdir', side_effect=FakeIsDir)
-  @mock.patch('os.listdir', side_effect=FakeListDir)
-  @mock.patch('tempfile.mkdtemp')
-  # pylint: disable=unused-argument
-  def testProcessCopy(self,
-                      mock_mkdtemp,
-                      unused_mocklistdir,
-                      unused_mockisdir,
-                      mock_copy2,
-                      mock_copytree):
+  def testProcessCopy(self):
     """Tests that the module processes input and copies correctly."""
-    mock_copytree.return_value = '/fake/destination'
-    mock_copy2.return_value = '/fake/destination'
-
-    self._module.StoreContainer(containers.File(
-        name='description', path='/fake/evidence_directory'))
-    self._module.StoreContainer(containers.File(
-        name='description2', path='/fake/evidence_file'))
-    mock_mkdtemp.return_value = '/fake/destination'
-
-    self._module.SetUp()
-    self._ProcessModule()
-
-    mock_copytree.assert_has_calls([
-        mock.call('/fake/evidence_directory',
-                  '/fake/destination/evidence_directory',
-                  dirs_exist_ok=True)
-    ])
-    mock_copy2.assert_called_with('/fake/evidence_file', '/fake/destination')
+    with tempfile.TemporaryDirectory() as source_directory, \
+        tempfile.TemporaryDirectory() as destination:
+      evidence_directory = os.path.join(source_directory, 'evidence_directory')
+      os.makedirs(os.path.join(evidence_directory, 'subdirectory'))
+      for path, data in [('file1', b'1'), ('subdirectory/file2', b'2' * 4096)]:
+        with open(os.path.join(evidence_directory, path), 'wb') as output:
+          output.write(data)
+      evidence_file = os.path.join(source_directory, 'evidence_file')
+      with open(evidence_file, 'wb') as output:
+        output.write(b'evidence')
+
+      self._module.StoreContainer(containers.File(
+          name='description', path=evidence_directory))
+      self._module.StoreContainer(containers.File(
+          name='description2', path=evidence_file))
+      self._module.SetUp(target_directory=destination, max_workers=2)
+      self._ProcessModule()
+      self._AssertNoErrors()
+
+      self.assertEqual(
+          [(container.name, container.path)
+           for container in self._module.GetContainers(containers.File)],
+          [('evidence_directory',
+            os.path.join(destination, 'evidence_directory')),
+           ('evidence_file', os.path.join(destination, 'evidence_file'))])
+      with open(os.path.join(
+          destination, 'evidence_directory', 'subdirectory', 'file2'),
+          'rb') as copy:
+        self.assertEqual(copy.read(), b'2' * 4096)
+      with open(os.path.join(destination, 'evidence_file'), 'rb') as copy:
+        self.assertEqual(copy.read(), b'evidence')
 
   @mock.patch('dftimewolf.lib.utils.Compress')
   @mock.patch('tempfile.mkdtemp')
@@ -94,12 +82,8 @@ class LocalFileSystemTest(modules_test_base.ModuleTestBase):
     # pylint: disable=protected-access
     self.assertEqual(self._module._target_directory, '/fake/random')
 
-  @mock.patch('os.path.isdir')
-  @mock.patch('shutil.copytree')
-  def testSetupError(self, mock_copytree, mock_isdir):
+  def testSetupError(self):
     """Tests that an error is generated if target_directory is unavailable."""
-    mock_copytree.side_effect = OSError('FAKEERROR')
-    mock_isdir.return_value = False
     self._module.StoreContainer(
         containers.File(name='blah', path='/sourcefile'))
     self._module.SetUp(target_directory="/nonexistent")
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 """Tests the S3ToGCSCopy module."""
 
+import json
 import unittest
 
 import mock
@@ -34,6 +35,40 @@ FAKE_EXPECTED_OUTPUT = [
   'gs://fake-gcs-bucket/two'
 ]
 
+class FakeStorageTransfer:
+  """Fakes the Storage Transfer Service API.
+
+  Transfer jobs are done the second time their operations are listed.
+  """
+
+  def __init__(self):
+    self.jobs = {}
+    self.list_calls = []
+    self.counters = {}
+    self.api = mock.MagicMock()
+    self.api.transferJobs.return_value.create.side_effect = self._CreateJob
+    self.api.transferOperations.return_value.list.side_effect = self._List
+    self.api.transferOperations.return_value.list_next.return_value = None
+
+  def _CreateJob(self, body):
+    """Creates a transfer job."""
+    name = f'transferJobs/{len(self.jobs)}'
+    self.jobs[name] = body
+    return mock.Mock(execute=mock.Mock(return_value={'name': name}))
+
+  def _List(self, name, filter):  # pylint: disable=redefined-builtin
+    """Lists the operations of transfer jobs."""
+    del name  # Unused
+    job_names = json.loads(filter)['jobNames']
+    self.list_calls.append(job_names)
+    operations = [
+        {'metadata': {'transferJobName': job_name, 'counters': self.counters},
+         'done': True}
+        for job_name in job_names] if len(self.list_calls) > 1 else []
+    return mock.Mock(
+        execute=mock.Mock(return_value={'operations': operations}))
+
+
 class S3ToGCSCopyTest(modules_test_base.ModuleTestBase):
   """Tests for the Google Cloud disk exporter."""
 
@@ -42,6 +77,35 @@ class S3ToGCSCopyTest(modules_test_base.ModuleTestBase):
   def setUp(self):
     self._InitModule(s3_to_gcs.S3ToGCSCopy)
     super().setUp()
+    self.transfer = FakeStorageTransfer()
+    self.storage_client = mock.MagicMock()
+    patches = [
+        mock.patch(
+            'libcloudforensics.providers.gcp.internal.project.GoogleCloudProject',
+            return_value=FAKE_GCP_PROJECT),
+        mock.patch(
+            'libcloudforensics.providers.gcp.internal.storage.GoogleCloudStorage.ListBuckets',
+            return_value=FAKE_GCP_LIST_BUCKETS_RESPONSE),
+        mock.patch(
+            'libcloudforensics.providers.gcp.internal.storage.GoogleCloudStorage.CreateBucket',
+            return_value=FAKE_GCP_CREATE_BUCKET_RESPONSE),
+        mock.patch(
+            'libcloudforensics.providers.gcp.internal.storagetransfer.GoogleCloudStorageTransfer.GcstApi',
+            return_value=self.transfer.api),
+        mock.patch(
+            'dftimewolf.lib.exporters.s3_to_gcs.storage_client',
+            return_value=self.storage_client),
+        mock.patch('time.sleep', return_value=None),
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+    patch = mock.patch(
+        'libcloudforensics.providers.aws.internal.account.AWSAccount')
+    credentials = patch.start().return_value.session.get_credentials
+    self.addCleanup(patch.stop)
+    credentials.return_value.access_key = 'AKIAFAKE'
+    credentials.return_value.secret_key = 'fake-secret'
 
   # pylint: disable=line-too-long
   @mock.patch('libcloudforensics.providers.gcp.internal.storage.GoogleCloudStorage.ListBuckets')
@@ -64,67 +128,25 @@ class S3ToGCSCopyTest(modules_test_base.ModuleTestBase):
     self.assertEqual(FAKE_GCS_BUCKET, self._module.dest_bucket)
     self.assertEqual(sorted(expected_objects), sorted(actual_objects))
 
-  # pylint: disable=line-too-long
-  @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
-  @mock.patch('libcloudforensics.providers.gcp.internal.storage.GoogleCloudStorage.ListBuckets')
-  @mock.patch('libcloudforensics.providers.gcp.internal.storage.GoogleCloudStorage.CreateBucket')
-  @mock.patch('dftimewolf.lib.exporters.s3_to_gcs.S3ToGCSCopy._SetBucketServiceAccountPermissions')
-  @mock.patch('libcloudforensics.providers.gcp.internal.storagetransfer.GoogleCloudStorageTransfer.S3ToGCS')
-  @mock.patch('time.sleep', return_value=None)
-  # pylint: enable=line-too-long
-  def testProcessFromParams(self,
-      mock_sleep,
-      mock_s3_to_gcs,
-      mock_set_bucket_perms,
-      mock_gcp_create_bucket,
-      mock_gcp_list_buckets,
-      mock_gcp_project):
+  def testProcessFromParams(self):
     """Tests the exporter's Process() function when the list comes from
     passed in parameters."""
-    mock_gcp_project.return_value = FAKE_GCP_PROJECT
-    mock_gcp_list_buckets.return_value = FAKE_GCP_LIST_BUCKETS_RESPONSE
-    mock_gcp_create_bucket.return_value = FAKE_GCP_CREATE_BUCKET_RESPONSE
-    mock_set_bucket_perms.return_value = None
-    mock_s3_to_gcs.return_value = None
-    mock_sleep.return_value = None
-
     self._module.SetUp(FAKE_AWS_REGION,
         FAKE_GCP_PROJECT_NAME,
         FAKE_GCS_BUCKET,
         FAKE_S3_OBJECTS)
 
     self._ProcessModule()
+    self._AssertNoErrors()
 
-    expected_output = ['gs://fake-gcs-bucket/one', 'gs://fake-gcs-bucket/two']
     actual_output = [c.path for \
         c in self._module.GetContainers(containers.GCSObject)]
+    self.assertEqual(FAKE_EXPECTED_OUTPUT, sorted(actual_output))
+    self.assertLen(self.transfer.jobs, 1)
 
-    self.assertEqual(sorted(expected_output), sorted(actual_output))
-
-  # pylint: disable=line-too-long
-  @mock.patch('libcloudforensics.providers.gcp.internal.project.GoogleCloudProject')
-  @mock.patch('libcloudforensics.providers.gcp.internal.storage.GoogleCloudStorage.ListBuckets')
-  @mock.patch('libcloudforensics.providers.gcp.internal.storage.GoogleCloudStorage.CreateBucket')
-  @mock.patch('dftimewolf.lib.exporters.s3_to_gcs.S3ToGCSCopy._SetBucketServiceAccountPermissions')
-  @mock.patch('libcloudforensics.providers.gcp.internal.storagetransfer.GoogleCloudStorageTransfer.S3ToGCS')
-  @mock.patch('time.sleep', return_value=None)
-  # pylint: enable=line-too-long
-  def testProcessFromState(self,
-      mock_sleep,
-      mock_s3_to_gcs,
-      mock_set_bucket_perms,
-      mock_gcp_create_bucket,
-      mock_gcp_list_buckets,
-      mock_gcp_project):
+  def testProcessFromState(self):
     """Tests the exporter's Process() function when the list comes from
     a passed in state container."""
-    mock_gcp_project.return_value = FAKE_GCP_PROJECT
-    mock_gcp_list_buckets.return_value = FAKE_GCP_LIST_BUCKETS_RESPONSE
-    mock_gcp_create_bucket.return_value = FAKE_GCP_CREATE_BUCKET_RESPONSE
-    mock_set_bucket_perms.return_value = None
-    mock_s3_to_gcs.return_value = None
-    mock_sleep.return_value = None
-
     for c in FAKE_STATE_S3_OBJECT_LIST:
       self._module.StoreContainer(c)
 
@@ -133,12 +155,77 @@ class S3ToGCSCopyTest(modules_test_base.ModuleTestBase):
         FAKE_GCS_BUCKET)
 
     self._ProcessModule()
+    self._AssertNoErrors()
 
-    expected_output = ['gs://fake-gcs-bucket/one', 'gs://fake-gcs-bucket/two']
     actual_output = [c.path for \
         c in self._module.GetContainers(containers.GCSObject)]
+    self.assertEqual(FAKE_EXPECTED_OUTPUT, sorted(actual_output))
 
-    self.assertEqual(sorted(expected_output), sorted(actual_output))
+  def testProcessBatches(self):
+    """Tests that objects are batched into manifest driven transfer jobs."""
+    s3_objects = [
+        's3://bucket-a/one', 's3://bucket-a/two', 's3://bucket-a/three',
+        's3://bucket-b/four', 's3://bucket-b/ignored.txt']
+    self._module.SetUp(FAKE_AWS_REGION,
+        FAKE_GCP_PROJECT_NAME,
+        FAKE_GCS_BUCKET,
+        ','.join(s3_objects),
+        object_filter=r'.*/[a-z]+$')
+
+    with mock.patch.object(s3_to_gcs, 'MAX_OBJECTS_PER_JOB', 2):
+      self._ProcessModule()
+    self._AssertNoErrors()
+
+    sources = [
+        job['transferSpec']['awsS3DataSource']['bucketName']
+        for job in self.transfer.jobs.values()]
+    self.assertEqual(sources, ['bucket-a', 'bucket-a', 'bucket-b'])
+    for job in self.transfer.jobs.values():
+      self.assertTrue(job['transferSpec']['transferManifest']['location']
+                      .startswith('gs://fake-gcs-bucket/'))
+      self.assertEqual(
+          job['transferSpec']['awsS3DataSource']['awsAccessKey'],
+          {'accessKeyId': 'AKIAFAKE', 'secretAccessKey': 'fake-secret'})
+
+    blob = self.storage_client.bucket.return_value.blob.return_value
+    self.assertEqual(
+        [call.args[0] for call in blob.upload_from_string.call_args_list],
+        ['one\nthree\n', 'two\n', 'four\n'])
+    self.assertEqual(blob.delete.call_count, 3)
+
+    # All the jobs are polled together.
+    self.assertEqual(len(self.transfer.list_calls), 2)
+    self.assertLen(self.transfer.list_calls[0], 3)
+
+    actual_output = [c.path for \
+        c in self._module.GetContainers(containers.GCSObject)]
+    self.assertEqual(sorted(actual_output), [
+        'gs://fake-gcs-bucket/four', 'gs://fake-gcs-bucket/one',
+        'gs://fake-gcs-bucket/three', 'gs://fake-gcs-bucket/two'])
+
+  def testProcessObjectFailures(self):
+    """Tests that objects that failed to copy are not stored."""
+    self.transfer.counters = {
+        'objectsFoundFromSource': '2', 'objectsCopiedToSink': '1',
+        'objectsFromSourceFailed': '1'}
+    self.storage_client.list_blobs.return_value = [mock.Mock()]
+    self.storage_client.list_blobs.return_value[0].name = 'one'
+    self._module.SetUp(FAKE_AWS_REGION,
+        FAKE_GCP_PROJECT_NAME,
+        FAKE_GCS_BUCKET,
+        FAKE_S3_OBJECTS)
+
+    self._ProcessModule()
+
+    self.assertTrue(any(
+        'failed to copy 1 objects: two' in message.message
+        for message in self.messages if message.is_error))
+
+    self.storage_client.list_blobs.assert_called_once_with(
+        FAKE_GCS_BUCKET, prefix='')
+    actual_output = [c.path for \
+        c in self._module.GetContainers(containers.GCSObject)]
+    self.assertEqual(actual_output, ['gs://fake-gcs-bucket/one'])
 
 
 if __name__ == '__main__':
@@ -139,6 +139,48 @@ class TimesketchExporterTest(modules_test_base.ModuleTestBase):
 
     mock_sketch.list_timelines.assert_called_once()
 
+  # pylint: disable=invalid-name
+  @mock.patch('timesketch_import_client.importer.ImportStreamer')
+  @mock.patch('dftimewolf.lib.timesketch_utils.GetApiClient')
+  def testSharedTimeline(self, mock_GetApiClient, mock_streamer):
+    """Tests appending files with the same timeline metadata to a timeline."""
+    mock_sketch = mock.Mock(id=1234, my_acl=['write'])
+    mock_sketch.api.api_root = 'timesketch.com/api/v1'
+    mock_api_client = mock.Mock()
+    mock_api_client.get_sketch.return_value = mock_sketch
+    mock_GetApiClient.return_value = mock_api_client
+    streamer = mock_streamer.return_value.__enter__.return_value
+    streamer.timeline.index_name = 'abcdef0123'
+
+    self._module.SetUp(
+        incident_id=None,
+        sketch_id=1234,
+        analyzers=None,
+        token_password='blah',
+        endpoint=None,
+        username=None,
+        password=None,
+    )
+    for index in range(3):
+      container = containers.File(
+          f'gcp_logs_project_{index:d}', f'/tmp/logs_{index:d}.jsonl')
+      container.metadata['TIMESKETCH_TIMELINE'] = 'gcp_logs_project'
+      self._module.StoreContainer(container)
+    self._module.StoreContainer(containers.File('file.ext', '/tmp/file.ext'))
+    self._ProcessModule()
+
+    timeline_names = [
+        call.args[0] for call in streamer.set_timeline_name.call_args_list]
+    self.assertEqual(len(timeline_names), 4)
+    shared_names = [
+        name for name in timeline_names if 'gcp_logs_project' in name]
+    self.assertEqual(len(shared_names), 3)
+    self.assertEqual(len(set(shared_names)), 1)
+    # The first upload creates the timeline, the next ones append to it.
+    streamer.set_index_name.assert_has_calls(
+        [mock.call('abcdef0123'), mock.call('abcdef0123')])
+    self.assertEqual(streamer.set_index_name.call_count, 2)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the parallel file copier."""
+
+import collections
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from dftimewolf.lib import file_copy
+
+
+class CopyFileTest(unittest.TestCase):
+  """Tests for the CopyFile function."""
+
+  def setUp(self):
+    self._directory = tempfile.TemporaryDirectory()
+    self.source = os.path.join(self._directory.name, 'evidence.bin')
+    self.data = os.urandom(3 * 1024 * 1024 + 17)
+    with open(self.source, 'wb') as output:
+      output.write(self.data)
+    os.utime(self.source, (1000000000, 1000000000))
+    self.destination = os.path.join(self._directory.name, 'copy.bin')
+
+  def tearDown(self):
+    self._directory.cleanup()
+
+  def _AssertCopied(self, path):
+    """Checks the data and modification time of a copy."""
+    with open(path, 'rb') as copy:
+      self.assertEqual(copy.read(), self.data)
+    self.assertEqual(os.stat(path).st_mtime, 1000000000)
+
+  def testCopyFile(self):
+    """Tests copying a file to a path and into a directory."""
+    self.assertEqual(
+        file_copy.CopyFile(self.source, self.destination), self.destination)
+    self._AssertCopied(self.destination)
+    self.assertNotEqual(
+        os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+
+    directory = os.path.join(self._directory.name, 'directory')
+    os.mkdir(directory)
+    path = file_copy.CopyFile(self.source, directory)
+    self.assertEqual(path, os.path.join(directory, 'evidence.bin'))
+    self._AssertCopied(path)
+
+    with self.assertRaises(shutil.SameFileError):
+      file_copy.CopyFile(self.source, self._directory.name)
+
+  def testBufferedFallback(self):
+    """Tests the buffered copy when reflinks and copy_file_range fail."""
+    unsupported = OSError(errno.EXDEV, 'Invalid cross-device link')
+    with mock.patch.object(
+        file_copy, '_Reflink', return_value=False), mock.patch.object(
+            os, 'copy_file_range', side_effect=unsupported, create=True):
+      file_copy.CopyFile(self.source, self.destination)
+    self._AssertCopied(self.destination)
+
+  def testHardlink(self):
+    """Tests linking copies, and copying when links are not possible."""
+    file_copy.CopyFile(self.source, self.destination, use_hardlinks=True)
+    self.assertEqual(
+        os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+
+    os.remove(self.destination)
+    unsupported = OSError(errno.EXDEV, 'Invalid cross-device link')
+    with mock.patch.object(os, 'link', side_effect=unsupported):
+      file_copy.CopyFile(self.source, self.destination, use_hardlinks=True)
+    self._AssertCopied(self.destination)
+    self.assertNotEqual(
+        os.stat(self.source).st_ino, os.stat(self.destination).st_ino)
+
+
+class ParallelCopierTest(unittest.TestCase):
+  """Tests for the ParallelCopier class."""
+
+  def setUp(self):
+    self._directory = tempfile.TemporaryDirectory()
+    self.source = os.path.join(self._directory.name, 'source', 'evidence')
+    self.files = {
+        os.path.join('a', 'b', f'file{index:d}'): os.urandom(index * 1000)
+        for index in range(20)}
+    self.files['top'] = b'top'
+    for path, data in self.files.items():
+      os.makedirs(
+          os.path.dirname(os.path.join(self.source, path)), exist_ok=True)
+      with open(os.path.join(self.source, path), 'wb') as output:
+        output.write(data)
+    os.utime(os.path.join(self.source, 'a'), (1000000000, 1000000000))
+    self.destination = os.path.join(self._directory.name, 'destination')
+    os.mkdir(self.destination)
+
+  def tearDown(self):
+    self._directory.cleanup()
+
+  def testCopy(self):
+    """Tests copying a directory and a file."""
+    with file_copy.ParallelCopier(max_workers=4) as copier:
+      directory = copier.Copy(self.source, self.destination)
+      path = copier.Copy(
+          os.path.join(self.source, 'top'), self.destination)
+      copier.Wait()
+
+    self.assertEqual(directory, os.path.join(self.destination, 'evidence'))
+    self.assertEqual(path, os.path.join(self.destination, 'top'))
+    for relative_path, data in self.files.items():
+      with open(os.path.join(directory, relative_path), 'rb') as copy:
+        self.assertEqual(copy.read(), data)
+    self.assertEqual(
+        os.stat(os.path.join(directory, 'a')).st_mtime, 1000000000)
+
+  def testCopyErrors(self):
+    """Tests that failed copies are all reported."""
+    copy_file = file_copy.CopyFile
+
+    def _FailSomeCopies(source, destination, use_hardlinks):
+      if source.endswith(('file3', 'file7')):
+        raise PermissionError(errno.EACCES, 'Permission denied')
+      return copy_file(source, destination, use_hardlinks)
+
+    with mock.patch.object(
+        file_copy, 'CopyFile', side_effect=_FailSomeCopies):
+      with file_copy.ParallelCopier(max_workers=4) as copier:
+        copier.Copy(self.source, self.destination)
+        with self.assertRaises(shutil.Error) as context:
+          copier.Wait()
+
+    self.assertEqual(
+        sorted(os.path.basename(error[0]) for error in context.exception.args[0]),
+        ['file3', 'file7'])
+
+  def testCopySameDestination(self):
+    """Tests that copies to the same destination do not overlap."""
+    sources = []
+    for index in range(8):
+      directory = os.path.join(self._directory.name, f'host{index:d}')
+      os.mkdir(directory)
+      sources.append(os.path.join(directory, 'evidence.bin'))
+      with open(sources[-1], 'wb') as output:
+        output.write(os.urandom(100000))
+    copy_file = file_copy.CopyFile
+    lock = threading.Lock()
+    running = collections.Counter()
+    overlaps = []
+
+    def _CopyFile(source, destination, use_hardlinks):
+      with lock:
+        running[destination] += 1
+        overlaps.append(running[destination])
+      try:
+        time.sleep(0.01)
+        return copy_file(source, destination, use_hardlinks)
+      finally:
+        with lock:
+          running[destination] -= 1
+
+    with mock.patch.object(file_copy, 'CopyFile', side_effect=_CopyFile):
+      with file_copy.ParallelCopier(
+          max_workers=4, use_hardlinks=True) as copier:
+        for source in sources:
+          copier.Copy(source, self.destination)
+        copier.Wait()
+
+    self.assertEqual(max(overlaps), 1)
+    # The last queued copy wins, like sequential copies.
+    self.assertTrue(os.path.samefile(
+        os.path.join(self.destination, 'evidence.bin'), sources[-1]))
+
+
+if __name__ == '__main__':
+  unittest.main()
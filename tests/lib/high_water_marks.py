@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the high-water marks module."""
+
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from dftimewolf.lib import high_water_marks
+
+
+class ParseTimestampTest(unittest.TestCase):
+  """Tests for ParseTimestamp."""
+
+  def testParseTimestamp(self):
+    """Tests parsing the timestamp formats used by the log collectors."""
+    expected = datetime.datetime(
+        2023, 1, 1, 10, 0, 0, 123456, tzinfo=datetime.timezone.utc)
+    self.assertEqual(
+        high_water_marks.ParseTimestamp('2023-01-01T10:00:00.123456789Z'),
+        expected)
+    self.assertEqual(
+        high_water_marks.ParseTimestamp('2023-01-01T10:00:00.123456+00:00'),
+        expected)
+    self.assertEqual(
+        high_water_marks.ParseTimestamp('2023-01-01T12:00:00.123456+02:00'),
+        expected)
+    self.assertEqual(
+        high_water_marks.ParseTimestamp(expected.replace(tzinfo=None)),
+        expected)
+    self.assertEqual(
+        high_water_marks.ParseTimestamp('2023-01-01T10:00:00Z'),
+        expected.replace(microsecond=0))
+
+
+def _Time(timestamp):
+  """Returns a timezone aware datetime from an ISO 8601 string."""
+  return high_water_marks.ParseTimestamp(timestamp)
+
+
+class HighWaterMarkTrackerTest(unittest.TestCase):
+  """Tests for the HighWaterMarkTracker class."""
+
+  def testAdd(self):
+    """Tests tracking the latest events of a first collection."""
+    tracker = high_water_marks.HighWaterMarkTracker(
+        lookback=datetime.timedelta(hours=1))
+    self.assertTrue(tracker.Add('2023-01-01T10:00:00Z', 'a'))
+    self.assertTrue(tracker.Add('2023-01-01T12:00:00Z', 'b'))
+    self.assertTrue(tracker.Add('2023-01-01T11:00:00Z', 'c'))
+    self.assertTrue(tracker.Add('2023-01-01T12:00:00Z', 'd'))
+
+    self.assertEqual(tracker.current.timestamp, _Time('2023-01-01T12:00:00Z'))
+    tracker.current.Prune()
+    self.assertEqual(
+        tracker.current.event_ids,
+        {'b': _Time('2023-01-01T12:00:00Z'),
+         'c': _Time('2023-01-01T11:00:00Z'),
+         'd': _Time('2023-01-01T12:00:00Z')})
+
+  def testAddWithPrevious(self):
+    """Tests that events already collected are filtered out."""
+    previous = high_water_marks.HighWaterMark(
+        _Time('2023-01-01T12:00:00Z'),
+        {'a': _Time('2023-01-01T11:30:00Z'),
+         'b': _Time('2023-01-01T12:00:00Z')},
+        datetime.timedelta(hours=1))
+    tracker = high_water_marks.HighWaterMarkTracker(
+        previous, datetime.timedelta(hours=1))
+
+    self.assertFalse(tracker.Add('2023-01-01T10:00:00Z', 'z'))
+    self.assertFalse(tracker.Add('2023-01-01T11:30:00Z', 'a'))
+    self.assertFalse(tracker.Add('2023-01-01T12:00:00Z', 'b'))
+    self.assertTrue(tracker.Add('2023-01-01T12:00:00Z', 'c'))
+    self.assertTrue(tracker.Add('2023-01-01T13:00:00Z', 'd'))
+
+    self.assertEqual(tracker.current.timestamp, _Time('2023-01-01T13:00:00Z'))
+    tracker.current.Prune()
+    self.assertEqual(set(tracker.current.event_ids), {'b', 'c', 'd'})
+
+  def testAddLateEvent(self):
+    """Tests that events delivered after the previous run are collected."""
+    lookback = datetime.timedelta(minutes=15)
+    first_run = high_water_marks.HighWaterMarkTracker(lookback=lookback)
+    self.assertTrue(first_run.Add('2023-01-01T11:55:00Z', 'a'))
+    self.assertTrue(first_run.Add('2023-01-01T12:00:00Z', 'b'))
+
+    # Event 'late' happened before the high-water mark, but was only delivered
+    # after the first run. The second run starts at the beginning of the
+    # lookback window, and sees it along with the events already collected.
+    second_run = high_water_marks.HighWaterMarkTracker(
+        first_run.current, lookback)
+    self.assertEqual(
+        first_run.current.window_start, _Time('2023-01-01T11:45:00Z'))
+    self.assertFalse(second_run.Add('2023-01-01T11:55:00Z', 'a'))
+    self.assertTrue(second_run.Add('2023-01-01T11:58:00Z', 'late'))
+    self.assertFalse(second_run.Add('2023-01-01T12:00:00Z', 'b'))
+    self.assertTrue(second_run.Add('2023-01-01T12:05:00Z', 'c'))
+
+    # A third run does not collect the late event again.
+    third_run = high_water_marks.HighWaterMarkTracker(
+        second_run.current, lookback)
+    self.assertFalse(third_run.Add('2023-01-01T11:58:00Z', 'late'))
+    self.assertFalse(third_run.Add('2023-01-01T12:05:00Z', 'c'))
+
+  def testMerge(self):
+    """Tests merging trackers from parallel parts of a collection."""
+    lookback = datetime.timedelta(hours=1)
+    tracker = high_water_marks.HighWaterMarkTracker(lookback=lookback)
+    tracker.Add('2023-01-01T10:00:00Z', 'a')
+    other = high_water_marks.HighWaterMarkTracker(lookback=lookback)
+    other.Add('2023-01-01T10:00:00Z', 'b')
+
+    tracker.Merge(other)
+    self.assertEqual(set(tracker.current.event_ids), {'a', 'b'})
+
+    other.Add('2023-01-02T10:00:00Z', 'c')
+    tracker.Merge(other)
+    self.assertEqual(tracker.current.timestamp, _Time('2023-01-02T10:00:00Z'))
+    tracker.current.Prune()
+    self.assertEqual(set(tracker.current.event_ids), {'c'})
+
+    tracker.Merge(high_water_marks.HighWaterMarkTracker())
+    self.assertEqual(set(tracker.current.event_ids), {'c'})
+
+
+class HighWaterMarkStoreTest(unittest.TestCase):
+  """Tests for the HighWaterMarkStore class."""
+
+  def setUp(self):
+    """Sets up a store in a temporary directory."""
+    self._directory = tempfile.TemporaryDirectory()
+    self._path = os.path.join(self._directory.name, 'state.json')
+    self._store = high_water_marks.HighWaterMarkStore(self._path)
+
+  def tearDown(self):
+    """Removes the temporary directory."""
+    self._directory.cleanup()
+
+  def testGetSet(self):
+    """Tests storing and retrieving high-water marks."""
+    self.assertIsNone(self._store.Get('Collector', 'scope', 'filter'))
+
+    mark = high_water_marks.HighWaterMark(
+        _Time('2023-01-01T10:00:00Z'),
+        {'a': _Time('2023-01-01T09:50:00Z'),
+         'b': _Time('2023-01-01T10:00:00Z')},
+        datetime.timedelta(minutes=15))
+    self._store.Set('Collector', 'scope', 'filter', mark)
+    self._store.Set('Collector', 'scope', 'other filter',
+                    high_water_marks.HighWaterMark(
+                        mark.timestamp,
+                        {'c': mark.timestamp,
+                         'old': _Time('2023-01-01T09:00:00Z')},
+                        datetime.timedelta(minutes=15)))
+
+    store = high_water_marks.HighWaterMarkStore(self._path)
+    self.assertEqual(store.Get('Collector', 'scope', 'filter'), mark)
+    self.assertEqual(
+        store.Get('Collector', 'scope', 'other filter').event_ids,
+        {'c': mark.timestamp})
+    self.assertIsNone(store.Get('Collector', 'other scope', 'filter'))
+
+  def testGetLegacy(self):
+    """Tests retrieving a high-water mark stored without a lookback window."""
+    mark = high_water_marks.HighWaterMark(
+        _Time('2023-01-01T10:00:00Z'), {'a': _Time('2023-01-01T10:00:00Z')})
+    self._store.Set('Collector', 'scope', 'filter', mark)
+    with open(self._path, 'r', encoding='utf-8') as state_file:
+      state = json.load(state_file)
+    for entry in state.values():
+      entry['event_ids'] = ['a']
+      del entry['lookback_seconds']
+    with open(self._path, 'w', encoding='utf-8') as state_file:
+      json.dump(state, state_file)
+
+    self.assertEqual(self._store.Get('Collector', 'scope', 'filter'), mark)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the GCS and S3 object downloader."""
+
+import base64
+import hashlib
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+from typing import Any
+from urllib import parse
+
+import boto3
+import google_crc32c
+from botocore import config as botocore_config
+from google.auth import credentials as auth_credentials
+from google.cloud import storage
+
+from dftimewolf.lib import object_download
+
+
+KIB = 1024
+PART_SIZE = 100 * KIB
+
+# Object data, by bucket and key.
+OBJECTS = {
+    ('bucket', 'small.txt'): b'small object\n' * 10,
+    ('bucket', 'dir/large.bin'): os.urandom(300 * KIB + 123),
+    ('bucket', 'multipart.bin'): os.urandom(250 * KIB),
+    ('bucket', 'empty'): b'',
+}
+MULTIPART_KEYS = {'multipart.bin'}
+
+
+def _MultipartETag(data: bytes) -> str:
+  """Returns the ETag of an object uploaded in parts of PART_SIZE bytes."""
+  digests = [
+      hashlib.md5(data[start:start + PART_SIZE]).digest()
+      for start in range(0, len(data), PART_SIZE)]
+  return f'{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests):d}'
+
+
+class ObjectStoreStubHandler(http.server.BaseHTTPRequestHandler):
+  """Serves the GCS JSON API and S3 object reads, with byte ranges.
+
+  GCS requests are under /storage/v1 and /download/storage/v1, the other
+  requests are S3 path style requests.
+  """
+
+  corrupt_keys: set[str] = set()
+  ranges: list[tuple[str, str]] = []
+  lock = threading.Lock()
+
+  def log_message(self, *args: Any) -> None:  # pylint: disable=arguments-differ
+    """Silences the request logs."""
+
+  def _SendData(self,
+                data: bytes,
+                headers: dict[str, str],
+                body: bool = True) -> None:
+    """Sends the requested range of some data."""
+    status = 200
+    range_header = self.headers.get('Range')
+    if range_header:
+      with self.lock:
+        self.ranges.append((self.path, range_header))
+      start, end = range_header.split('=')[1].split('-')
+      data = data[int(start):int(end) + 1]
+      status = 206
+    self.send_response(status)
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    if body:
+      self.wfile.write(data)
+
+  def _ObjectData(self, bucket: str, key: str) -> bytes:
+    """Returns the data served for an object."""
+    data = OBJECTS[(bucket, key)]
+    if key in self.corrupt_keys:
+      data = data[:-1] + bytes([data[-1] ^ 0xff])
+    return data
+
+  def _HandleGCS(self, url: parse.ParseResult) -> None:
+    """Handles GCS metadata and media requests."""
+    parts = url.path.split('/')
+    media = parts[1] == 'download'
+    bucket, key = parts[-3], parse.unquote(parts[-1])
+    data = OBJECTS[(bucket, key)]
+    if not media:
+      body = json.dumps({
+          'bucket': bucket,
+          'name': key,
+          'generation': '1234',
+          'size': str(len(data)),
+          'md5Hash': base64.b64encode(hashlib.md5(data).digest()).decode(),
+          'crc32c': base64.b64encode(
+              google_crc32c.Checksum(data).digest()).decode(),
+      }).encode()
+      self._SendData(body, {'Content-Type': 'application/json'})
+      return
+    if parse.parse_qs(url.query).get('ifGenerationMatch') != ['1234']:
+      self.send_error(412)
+      return
+    self._SendData(
+        self._ObjectData(bucket, key),
+        {'Content-Type': 'application/octet-stream'})
+
+  def _HandleS3(self, url: parse.ParseResult, body: bool) -> None:
+    """Handles S3 HeadObject and GetObject requests."""
+    bucket, key = url.path.lstrip('/').split('/', 1)
+    key = parse.unquote(key)
+    data = OBJECTS[(bucket, key)]
+    if key in MULTIPART_KEYS:
+      etag = f'"{_MultipartETag(data)}"'
+    else:
+      etag = f'"{hashlib.md5(data).hexdigest()}"'
+    if_match = self.headers.get('If-Match')
+    if if_match and if_match != etag:
+      self.send_error(412)
+      return
+    part_number = parse.parse_qs(url.query).get('partNumber')
+    if part_number:
+      start = (int(part_number[0]) - 1) * PART_SIZE
+      data = data[start:start + PART_SIZE]
+    else:
+      data = self._ObjectData(bucket, key)
+    self._SendData(data, {'ETag': etag}, body=body)
+
+  def _Handle(self, body: bool) -> None:
+    """Routes a request to the GCS or S3 handler."""
+    url = parse.urlparse(self.path)
+    if url.path.startswith(('/storage/v1/', '/download/storage/v1/')):
+      self._HandleGCS(url)
+    else:
+      self._HandleS3(url, body)
+
+  def do_GET(self) -> None:  # pylint: disable=invalid-name
+    """Handles GET requests."""
+    self._Handle(body=True)
+
+  def do_HEAD(self) -> None:  # pylint: disable=invalid-name
+    """Handles HEAD requests."""
+    self._Handle(body=False)
+
+
+class ObjectDownloaderTest(unittest.TestCase):
+  """Tests for the ObjectDownloader class."""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), ObjectStoreStubHandler)
+    cls.server_thread = threading.Thread(target=cls.server.serve_forever)
+    cls.server_thread.start()
+    cls.endpoint = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    cls.server_thread.join()
+
+  def setUp(self):
+    ObjectStoreStubHandler.corrupt_keys = set()
+    ObjectStoreStubHandler.ranges = []
+    self.s3 = boto3.client(
+        's3',
+        region_name='us-east-1',
+        endpoint_url=self.endpoint,
+        aws_access_key_id='fake-key',
+        aws_secret_access_key='fake-secret',
+        config=botocore_config.Config(s3={'addressing_style': 'path'}))
+    self.gcs = storage.Client(
+        project='fake-project',
+        credentials=auth_credentials.AnonymousCredentials(),
+        client_options={'api_endpoint': self.endpoint})
+    self.downloader = object_download.ObjectDownloader(
+        max_workers=4, slice_size=64 * KIB, slice_threshold=128 * KIB)
+    self.directory = tempfile.mkdtemp()
+
+  def _Download(self, *sources):
+    """Downloads objects and returns their local data or errors, by path."""
+    downloads = [
+        (source, os.path.join(self.directory, f'object-{index:d}'))
+        for index, source in enumerate(sources)]
+    results = {}
+    for source, path, error in self.downloader.DownloadAll(downloads):
+      if error:
+        results[source.path] = error
+      else:
+        with open(path, 'rb') as local_file:
+          results[source.path] = local_file.read()
+    return results
+
+  def testStat(self):
+    """Tests reading the size and checksums of objects."""
+    data = OBJECTS[('bucket', 'small.txt')]
+    info = object_download.GCSObjectSource(
+        self.gcs, 'gs://bucket/small.txt').Stat()
+    self.assertEqual(info.size, len(data))
+    self.assertEqual(info.checksums, {
+        'crc32c': google_crc32c.Checksum(data).digest().hex(),
+        'md5': hashlib.md5(data).hexdigest()})
+
+    info = object_download.S3ObjectSource(
+        self.s3, 's3://bucket/multipart.bin').Stat()
+    self.assertEqual(info.part_size, PART_SIZE)
+    self.assertEqual(info.checksums, {
+        's3_etag': _MultipartETag(OBJECTS[('bucket', 'multipart.bin')])})
+
+  def testDownloadGCS(self):
+    """Tests downloading GCS objects, slicing the large ones."""
+    results = self._Download(*[
+        object_download.GCSObjectSource(self.gcs, f'gs://{bucket}/{key}')
+        for bucket, key in OBJECTS])
+
+    for (bucket, key), data in OBJECTS.items():
+      self.assertEqual(results[f'gs://{bucket}/{key}'], data)
+    large_ranges = sorted(
+        header for path, header in ObjectStoreStubHandler.ranges
+        if 'large.bin' in path)
+    self.assertEqual(large_ranges, [
+        'bytes=0-65535', 'bytes=131072-196607', 'bytes=196608-262143',
+        'bytes=262144-307322', 'bytes=65536-131071'])
+
+  def testDownloadS3(self):
+    """Tests downloading S3 objects, with single and multipart ETags."""
+    results = self._Download(*[
+        object_download.S3ObjectSource(self.s3, f's3://{bucket}/{key}')
+        for bucket, key in OBJECTS])
+
+    for (bucket, key), data in OBJECTS.items():
+      self.assertEqual(results[f's3://{bucket}/{key}'], data)
+
+  def testChecksumMismatch(self):
+    """Tests that corrupted downloads are reported and not kept."""
+    ObjectStoreStubHandler.corrupt_keys = {'dir/large.bin', 'multipart.bin'}
+    results = self._Download(
+        object_download.GCSObjectSource(self.gcs, 'gs://bucket/dir/large.bin'),
+        object_download.S3ObjectSource(self.s3, 's3://bucket/multipart.bin'),
+        object_download.S3ObjectSource(self.s3, 's3://bucket/small.txt'))
+
+    self.assertIsInstance(
+        results['gs://bucket/dir/large.bin'], object_download.ChecksumError)
+    self.assertIsInstance(
+        results['s3://bucket/multipart.bin'], object_download.ChecksumError)
+    self.assertEqual(
+        results['s3://bucket/small.txt'], OBJECTS[('bucket', 'small.txt')])
+    self.assertEqual(os.listdir(self.directory), ['object-2'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the cloud object downloader."""
+
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from dftimewolf.lib import object_download
+from dftimewolf.lib.containers import containers
+from dftimewolf.lib.processors import cloud_object_download
+from tests.lib import modules_test_base
+
+
+# Object data, by path.
+_OBJECTS = {
+    'gs://bucket/logs/auth.log': b'auth log\n',
+    's3://other-bucket/disk.raw': b'disk image' * 100,
+    's3://other-bucket/corrupt.bin': b'corrupt',
+}
+
+
+class FakeObjectSource(object_download.ObjectSource):
+  """Serves an object of _OBJECTS, with a wrong MD5 for corrupt.bin."""
+
+  def __init__(self, client, path):
+    del client  # Unused
+    super().__init__(path)
+
+  def Stat(self):
+    md5 = hashlib.md5(_OBJECTS[self.path]).hexdigest()
+    if self.key == 'corrupt.bin':
+      md5 = '0' * 32
+    return object_download.ObjectInfo(
+        size=len(_OBJECTS[self.path]), checksums={'md5': md5})
+
+  def ReadRange(self, start, end):
+    return _OBJECTS[self.path][start:end]
+
+
+class CloudObjectDownloaderTest(modules_test_base.ModuleTestBase):
+  """Tests for the cloud object downloader."""
+
+  _module: cloud_object_download.CloudObjectDownloader  # pyrefly: ignore[bad-override-mutable-attribute]
+
+  def setUp(self):
+    self._InitModule(cloud_object_download.CloudObjectDownloader)
+    super().setUp()
+    self._directory = tempfile.TemporaryDirectory()
+    self._module.SetUp(output_directory=self._directory.name, max_workers=2)
+
+  def tearDown(self):
+    self._directory.cleanup()
+    super().tearDown()
+
+  @mock.patch('boto3.client')
+  @mock.patch.object(cloud_object_download, 'storage_client')
+  @mock.patch.object(object_download, 'S3ObjectSource', FakeObjectSource)
+  @mock.patch.object(object_download, 'GCSObjectSource', FakeObjectSource)
+  def testProcess(self, mock_storage_client, mock_boto3_client):
+    """Tests downloading objects into File containers."""
+    for path in _OBJECTS:
+      if path.startswith('gs://'):
+        self._UpstreamStoreContainer(containers.GCSObject(path))
+      else:
+        self._UpstreamStoreContainer(containers.AWSS3Object(path))
+
+    self._ProcessModule()
+
+    mock_storage_client.assert_called_once_with(project=None)
+    mock_boto3_client.assert_called_once_with('s3', region_name=None)
+    errors = [message for message in self.messages if message.is_error]
+    self.assertEqual(len(errors), 1)
+    self.assertIn('s3://other-bucket/corrupt.bin', errors[0].message)
+
+    files = {
+        container.description: container
+        for container in self._module.GetContainers(containers.File)}
+    self.assertEqual(sorted(files), [
+        'Downloaded from gs://bucket/logs/auth.log',
+        'Downloaded from s3://other-bucket/disk.raw'])
+    disk = files['Downloaded from s3://other-bucket/disk.raw']
+    self.assertEqual(disk.name, 'disk.raw')
+    self.assertEqual(
+        disk.path, os.path.join(self._directory.name, 'other-bucket/disk.raw'))
+    with open(disk.path, 'rb') as disk_file:
+      self.assertEqual(disk_file.read(), _OBJECTS['s3://other-bucket/disk.raw'])
+    self.assertFalse(os.path.exists(
+        os.path.join(self._directory.name, 'other-bucket/corrupt.bin')))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the IOC match processor."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from dftimewolf.lib.containers import containers
+from dftimewolf.lib.processors import ioc_match
+from tests.lib import modules_test_base
+
+
+_SHA256 = 'a' * 64
+
+_EVENTS = [
+    {'message': 'Connection from 10.0.0.1 to 192.168.1.10:443'},
+    {'message': 'Connection from 10.0.0.1 to 192.168.1.100'},
+    {'message': 'Resolved EVIL.example.com'},
+    {'message': 'Resolved notevil.example.com'},
+    {'message': f'Executed binary with hash {_SHA256.upper()}'},
+    {'message': 'Nothing to see here'},
+    {'message': 'Process started', 'image': r'C:\Windows\Temp\evil.exe'},
+    {'message': 'Resolved bösewicht.de'},
+]
+
+
+class AhoCorasickTest(unittest.TestCase):
+  """Tests for the AhoCorasick class."""
+
+  def testSearch(self):
+    """Tests finding overlapping patterns."""
+    automaton = ioc_match.AhoCorasick(['he', 'she', 'his', 'hers'])
+    self.assertEqual(
+        sorted(automaton.Search('ushers')),
+        [(1, 'she'), (2, 'he'), (2, 'hers')])
+    self.assertEqual(list(automaton.Search('xyz')), [])
+
+
+@unittest.skipIf(
+    not ioc_match.HAS_AHOCORASICK, 'Missing pyahocorasick dependency.')
+class NativeAhoCorasickTest(unittest.TestCase):
+  """Tests for the NativeAhoCorasick class."""
+
+  def testSearch(self):
+    """Tests that matches are the same as the pure Python automaton."""
+    patterns = ['he', 'she', 'his', 'hers', 'bösewicht']
+    native = ioc_match.NativeAhoCorasick(patterns)
+    fallback = ioc_match.AhoCorasick(patterns)
+    for text in ('ushers', 'xyz', 'his bösewicht said hershe'):
+      self.assertEqual(
+          sorted(native.Search(text)), sorted(fallback.Search(text)))
+
+
+class IndicatorMatcherTest(unittest.TestCase):
+  """Tests for the IndicatorMatcher class."""
+
+  def testMatch(self):
+    """Tests matching literal, IP address and hash indicators."""
+    self._CheckMatch()
+
+  def testMatchFallback(self):
+    """Tests matching with the pure Python automaton."""
+    with mock.patch.object(ioc_match, 'HAS_AHOCORASICK', False):
+      self._CheckMatch()
+
+  def _CheckMatch(self):
+    """Checks matching literal, IP address and hash indicators."""
+    indicators = [
+        ioc_match.IndicatorMatcher.NormalizeIndicator(indicator)
+        for indicator in ['192.168.1.10', '2001:DB8::0001', _SHA256,
+                          'evil.example.com']]
+    matcher = ioc_match.IndicatorMatcher(indicators)
+
+    self.assertEqual(
+        matcher.Match(json.dumps(_EVENTS[0])), {'192.168.1.10'})
+    self.assertEqual(matcher.Match(json.dumps(_EVENTS[1])), set())
+    self.assertEqual(
+        matcher.Match(json.dumps(_EVENTS[2])), {'evil.example.com'})
+    self.assertEqual(matcher.Match(json.dumps(_EVENTS[3])), set())
+    self.assertEqual(matcher.Match(json.dumps(_EVENTS[4])), {_SHA256})
+    self.assertEqual(
+        matcher.Match('from 2001:db8:0:0::1 port 22'), {'2001:db8::1'})
+
+  def testNormalizeIndicator(self):
+    """Tests that too short literal indicators are ignored."""
+    self.assertIsNone(ioc_match.IndicatorMatcher.NormalizeIndicator(' a\n'))
+    self.assertEqual(
+        ioc_match.IndicatorMatcher.NormalizeIndicator('Evil.COM\n'),
+        'evil.com')
+
+
+class IOCMatchProcessorTest(modules_test_base.ModuleTestBase):
+  """Tests for the IOC match processor."""
+
+  _module: ioc_match.IOCMatchProcessor  # pyrefly: ignore[bad-override-mutable-attribute]
+
+  def setUp(self):
+    self._InitModule(ioc_match.IOCMatchProcessor)
+    super().setUp()
+    self._module.SetUp(max_workers=2)
+    self._directory = tempfile.TemporaryDirectory()
+
+    indicators_path = os.path.join(self._directory.name, 'indicators.txt')
+    with open(indicators_path, 'w', encoding='utf-8') as indicators_file:
+      indicators_file.write(
+          f'# Known bad\n192.168.1.10\n\n{_SHA256}\nevil.example.com\n'
+          'C:\\Windows\\Temp\\evil.exe\nBösewicht.de\n')
+    self._UpstreamStoreContainer(containers.ThreatIntelligence(
+        name='APT-TEST', indicator=None, path=indicators_path))
+    self._UpstreamStoreContainer(containers.ThreatIntelligence(
+        name='OTHER', indicator='EVIL.example.com', path=''))
+
+  def tearDown(self):
+    self._directory.cleanup()
+    super().tearDown()
+
+  def testProcessFile(self):
+    """Tests emitting the matching events of a JSONL file."""
+    logs_path = os.path.join(self._directory.name, 'logs.jsonl')
+    with open(logs_path, 'w', encoding='utf-8') as logs_file:
+      logs_file.writelines(json.dumps(event) + '\n' for event in _EVENTS)
+    self._UpstreamStoreContainer(containers.File(name='logs', path=logs_path))
+    self._UpstreamStoreContainer(containers.File(
+        name='ignored', path=os.path.join(self._directory.name, 'x.plaso')))
+
+    with mock.patch.object(ioc_match, 'CHUNK_SIZE', 2):
+      self._ProcessModule()
+    self._AssertNoErrors()
+
+    output = [
+        c for c in self._module.GetContainers(containers.File)
+        if c.name == 'logs_ioc_matches']
+    self.assertEqual(len(output), 1)
+    with open(output[0].path, 'r', encoding='utf-8') as output_file:
+      events = [json.loads(line) for line in output_file]
+    os.remove(output[0].path)
+
+    self.assertEqual(
+        [event['message'] for event in events],
+        [_EVENTS[0]['message'], _EVENTS[2]['message'],
+         _EVENTS[4]['message'], _EVENTS[6]['message'],
+         _EVENTS[7]['message']])
+    self.assertEqual(
+        events[0]['ioc_matches'],
+        [{'indicator': '192.168.1.10', 'threat': 'APT-TEST'}])
+    self.assertEqual(
+        events[1]['ioc_matches'],
+        [{'indicator': 'evil.example.com', 'threat': 'APT-TEST'},
+         {'indicator': 'evil.example.com', 'threat': 'OTHER'}])
+    # Matched on the decoded values, not on their escaped JSON encoding.
+    self.assertEqual(
+        events[3]['ioc_matches'],
+        [{'indicator': r'c:\windows\temp\evil.exe', 'threat': 'APT-TEST'}])
+    self.assertEqual(
+        events[4]['ioc_matches'],
+        [{'indicator': 'bösewicht.de', 'threat': 'APT-TEST'}])
+
+  def testProcessDataFrame(self):
+    """Tests emitting the matching rows of a data frame."""
+    data_frame = pd.DataFrame(_EVENTS)
+    data_frame['id'] = range(len(_EVENTS))
+    self._UpstreamStoreContainer(containers.DataFrame(
+        data_frame=data_frame, description='Logs', name='logs'))
+
+    with mock.patch.object(ioc_match, 'CHUNK_SIZE', 4):
+      self._ProcessModule()
+    self._AssertNoErrors()
+
+    output = [
+        c for c in self._module.GetContainers(containers.DataFrame)
+        if c.name == 'logs_ioc_matches']
+    self.assertEqual(len(output), 1)
+    matching = output[0].data_frame
+    self.assertEqual(list(matching['id']), [0, 2, 4, 6, 7])
+    self.assertEqual(
+        matching.iloc[2]['ioc_matches'],
+        [{'indicator': _SHA256, 'threat': 'APT-TEST'}])
+
+
+if __name__ == '__main__':
+  unittest.main()
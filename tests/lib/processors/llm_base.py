@@ -99,6 +99,9 @@ class DataFrameLLMProcessorTest(modules_test_base.ModuleTestBase):
     self.assertEqual(self._module.task, 'test_task')
     self.assertEqual(self._module.model_name, 'test_model')
     self.assertEqual(self._module.columns_to_process, ['a', 'b', 'c'])
+    self.assertEqual(
+        self._container_manager.GetRequiredColumns('upstream'),
+        {'a', 'b', 'c'})
 
   def testProcess(self):
     """Tests the Process method."""
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the VMPoolRelease module."""
+
+import unittest
+
+import mock
+
+from dftimewolf.lib import errors
+from dftimewolf.lib import vm_pool
+from dftimewolf.lib.processors import vm_pool_release
+from tests.lib import modules_test_base
+
+
+class VMPoolReleaseTest(modules_test_base.ModuleTestBase):
+  """Tests for the VMPoolRelease module."""
+
+  _module: vm_pool_release.VMPoolRelease  # pyrefly: ignore[bad-override-mutable-attribute]
+
+  def setUp(self):
+    self._InitModule(vm_pool_release.VMPoolRelease)
+    super().setUp()
+
+  @mock.patch('dftimewolf.lib.vm_pool.GCEPoolBackend')
+  def testProcess(self, mock_backend):
+    """Tests returning the VMs leased for an incident to the pool."""
+    mock_backend.return_value.ListVms.return_value = [
+        vm_pool.PooledVM('vm-1', {
+            vm_pool.STATE_LABEL: vm_pool.STATE_LEASED,
+            vm_pool.LEASE_LABEL: 'incident-42'}),
+        vm_pool.PooledVM('vm-2', {
+            vm_pool.STATE_LABEL: vm_pool.STATE_LEASED,
+            vm_pool.LEASE_LABEL: 'incident-43'}),
+    ]
+    mock_backend.return_value.UpdateLabels.return_value = True
+    self._module.SetUp(
+        'gcp', 'incident-42', 'us-central1-f', project_name='test-project')
+    self._ProcessModule()
+    self._AssertNoErrors()
+
+    mock_backend.assert_called_once_with('test-project', 'us-central1-f')
+    mock_backend.return_value.DetachDisks.assert_called_once()
+    self.assertEqual(
+        mock_backend.return_value.DetachDisks.call_args[0][0].name, 'vm-1')
+    mock_backend.return_value.DeleteVm.assert_not_called()
+    mock_backend.return_value.CreateVm.assert_not_called()
+
+  @mock.patch('dftimewolf.lib.vm_pool.GCEPoolBackend')
+  def testProcessReplenish(self, mock_backend):
+    """Tests replenishing the pool once the VMs are released."""
+    mock_backend.return_value.ListVms.return_value = [
+        vm_pool.PooledVM('vm-1', {
+            vm_pool.STATE_LABEL: vm_pool.STATE_LEASED,
+            vm_pool.LEASE_LABEL: 'incident-42'}),
+    ]
+    mock_backend.return_value.UpdateLabels.return_value = True
+    mock_backend.return_value.CreateVm.side_effect = vm_pool.PooledVM
+    self._module.SetUp(
+        'gcp', 'incident-42', 'us-central1-f', project_name='test-project',
+        pool_size=2)
+    self._ProcessModule()
+    self._AssertNoErrors()
+
+    # vm-1 is free again, so a single VM is missing.
+    self.assertEqual(mock_backend.return_value.CreateVm.call_count, 1)
+
+  def testSetUpErrors(self):
+    """Tests that an unknown platform or a missing location is an error."""
+    with self.assertRaises(errors.DFTimewolfError):
+      self._module.SetUp('oci', 'incident-42', 'us-central1-f')
+    with self.assertRaises(errors.DFTimewolfError):
+      self._module.SetUp('gcp', 'incident-42', 'us-central1-f')
+    with self.assertRaises(errors.DFTimewolfError):
+      self._module.SetUp('aws', 'incident-42', 'us-east-1a')
+    with self.assertRaises(errors.DFTimewolfError):
+      self._module.SetUp('azure', 'incident-42', 'eastus')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the Yara scan processor."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from dftimewolf.lib.containers import containers
+from dftimewolf.lib.processors import yara_scan
+from tests.lib import modules_test_base
+
+
+current_dir = os.path.dirname(os.path.realpath(__file__))
+samples_dir = os.path.join(current_dir, 'test_data', 'yara_samples')
+
+
+@unittest.skipIf(not yara_scan.HAS_YARA, 'Missing yara-python dependency.')
+class YaraScanProcessorTest(modules_test_base.ModuleTestBase):
+  """Tests for the Yara scan processor."""
+
+  _module: yara_scan.YaraScanProcessor  # pyrefly: ignore[bad-override-mutable-attribute]
+
+  def setUp(self):
+    self._InitModule(yara_scan.YaraScanProcessor)
+    super().setUp()
+    self._cache_directory = tempfile.TemporaryDirectory()
+    self._module.SetUp(
+        max_workers=2, cache_directory=self._cache_directory.name)
+
+    with open(os.path.join(current_dir, 'test_data', 'yara_rules.yar'),
+              'r', encoding='utf-8') as rules_file:
+      self._UpstreamStoreContainer(containers.YaraRule(
+          name='yara_rules.yar', rule_text=rules_file.read()))
+
+  def tearDown(self):
+    self._cache_directory.cleanup()
+    super().tearDown()
+
+  def testProcess(self):
+    """Tests scanning File and Directory containers."""
+    self._UpstreamStoreContainer(containers.File(
+        name='marker.txt', path=os.path.join(samples_dir, 'marker.txt')))
+    self._UpstreamStoreContainer(containers.Directory(
+        name='nested', path=os.path.join(samples_dir, 'nested')))
+
+    self._ProcessModule()
+    self._AssertNoErrors()
+
+    data_frames = self._module.GetContainers(containers.DataFrame)
+    self.assertEqual(len(data_frames), 1)
+    results = data_frames[0].data_frame
+    matches = sorted(
+        (os.path.relpath(path, samples_dir), rule)
+        for path, rule in zip(results['path'], results['rule']))
+    self.assertEqual(matches, [
+        ('marker.txt', 'dftimewolf_test_marker'),
+        ('nested/both.bin', 'dftimewolf_test_marker'),
+        ('nested/both.bin', 'dftimewolf_test_mz'),
+    ])
+    marker = results[
+        results['path'] == os.path.join(samples_dir, 'marker.txt')].iloc[0]
+    self.assertEqual(marker['tags'], 'test')
+    self.assertEqual(marker['strings'], '$marker@10')
+
+    reports = self._module.GetContainers(containers.Report)
+    self.assertEqual(len(reports), 1)
+    self.assertIn('3 matches in 2 of 3 files', reports[0].text)
+
+  def testCompiledRulesCache(self):
+    """Tests that compiled rules are reused for identical rule sets."""
+    self._UpstreamStoreContainer(containers.Directory(
+        name='samples', path=samples_dir))
+
+    self._ProcessModule()
+    cached = sorted(os.listdir(self._cache_directory.name))
+    self.assertEqual(len(cached), 2)
+
+    with mock.patch.object(yara_scan.yara, 'compile') as mock_compile:
+      self._ProcessModule()
+      mock_compile.assert_not_called()
+    self.assertEqual(sorted(os.listdir(self._cache_directory.name)), cached)
+
+  def testCompiledRulesCacheCorrupted(self):
+    """Tests that corrupted cached rules are compiled again."""
+    self._UpstreamStoreContainer(containers.File(
+        name='marker.txt', path=os.path.join(samples_dir, 'marker.txt')))
+    self._ProcessModule()
+    self._module.GetContainers(containers.DataFrame, pop=True)
+    compiled_rules_path = os.path.join(
+        self._cache_directory.name,
+        next(name for name in os.listdir(self._cache_directory.name)
+             if name.endswith('.yarc')))
+    with open(compiled_rules_path, 'wb') as compiled_rules_file:
+      compiled_rules_file.write(b'not compiled rules')
+
+    with mock.patch.object(
+        yara_scan.yara, 'compile', wraps=yara_scan.yara.compile) as mock_compile:
+      self._ProcessModule()
+      mock_compile.assert_called_once()
+    self._AssertNoErrors()
+    results = self._module.GetContainers(containers.DataFrame)[0].data_frame
+    self.assertEqual(list(results['rule']), ['dftimewolf_test_marker'])
+
+
+if __name__ == '__main__':
+  unittest.main()
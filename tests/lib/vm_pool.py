@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests the analysis VM pool."""
+
+import datetime
+import time
+import unittest
+from typing import Any
+from unittest import mock
+
+from azure.core import exceptions as az_exceptions
+from botocore import exceptions as boto_exceptions
+
+from dftimewolf.lib import vm_pool
+
+
+class FakePoolBackend(vm_pool.PoolBackend):
+  """An in-memory pool backend."""
+
+  def __init__(self) -> None:
+    self.vms: dict[str, dict[str, str]] = {}
+    self.disks: dict[str, list[str]] = {}
+    self.created: list[str] = []
+    self.deleted: list[str] = []
+
+  def ListVms(self, labels: dict[str, str]) -> list[vm_pool.PooledVM]:
+    return [
+        vm_pool.PooledVM(name=name, labels=dict(vm_labels), instance=name)
+        for name, vm_labels in self.vms.items()
+        if all(vm_labels.get(key) == value for key, value in labels.items())]
+
+  def CreateVm(self, name: str, labels: dict[str, str]) -> vm_pool.PooledVM:
+    self.vms[name] = dict(labels)
+    self.disks[name] = []
+    self.created.append(name)
+    return vm_pool.PooledVM(name=name, labels=dict(labels), instance=name)
+
+  def UpdateLabels(self,
+                   vm: vm_pool.PooledVM,
+                   labels: dict[str, str],
+                   expected: dict[str, str]) -> bool:
+    current = self.vms[vm.name]
+    if any(current.get(key, '') != value for key, value in expected.items()):
+      return False
+    current.update(labels)
+    return True
+
+  def DetachDisks(self, vm: vm_pool.PooledVM) -> None:
+    self.disks[vm.name] = []
+
+  def DeleteVm(self, vm: vm_pool.PooledVM) -> None:
+    del self.vms[vm.name]
+    self.deleted.append(vm.name)
+
+  def AddVm(self, name: str, **labels: Any) -> None:
+    """Adds a VM of the default pool."""
+    self.vms[name] = dict(
+        {vm_pool.POOL_LABEL: vm_pool.DEFAULT_POOL_NAME}, **labels)
+    self.disks[name] = ['evidence']
+
+
+class VMPoolTest(unittest.TestCase):
+  """Tests for the VMPool class."""
+
+  def setUp(self):
+    self.backend = FakePoolBackend()
+    self.pool = vm_pool.VMPool(self.backend, 2)
+
+  def testLeaseFreeVm(self):
+    """Tests that a free VM is leased instead of starting one."""
+    self.backend.AddVm('vm-1', **{vm_pool.STATE_LABEL: vm_pool.STATE_LEASED})
+    self.backend.AddVm('vm-2', **{vm_pool.STATE_LABEL: vm_pool.STATE_FREE})
+
+    vm = self.pool.Lease('Incident 42')
+
+    self.assertEqual(vm.name, 'vm-2')
+    self.assertEqual(self.backend.created, [])
+    labels = self.backend.vms['vm-2']
+    self.assertEqual(labels[vm_pool.STATE_LABEL], vm_pool.STATE_LEASED)
+    self.assertEqual(labels[vm_pool.LEASE_LABEL], 'incident-42')
+    self.assertGreater(int(labels[vm_pool.EXPIRES_LABEL]), time.time())
+
+  def testLeaseStartsVm(self):
+    """Tests that a VM is started when the pool has no free VM."""
+    vm = self.pool.Lease('incident')
+
+    self.assertEqual(self.backend.created, [vm.name])
+    self.assertTrue(vm.name.startswith(vm_pool.DEFAULT_POOL_NAME))
+    self.assertEqual(vm.state, vm_pool.STATE_LEASED)
+
+  def testLeaseConflict(self):
+    """Tests that a VM leased by another run in the meantime is skipped."""
+    self.backend.AddVm('vm-1', **{vm_pool.STATE_LABEL: vm_pool.STATE_FREE})
+    self.backend.AddVm('vm-2', **{vm_pool.STATE_LABEL: vm_pool.STATE_FREE})
+    update_labels = self.backend.UpdateLabels
+
+    def _LeasedByOtherRun(vm, labels, expected):
+      if vm.name == 'vm-1':
+        self.backend.vms['vm-1'][vm_pool.STATE_LABEL] = vm_pool.STATE_LEASED
+      return update_labels(vm, labels, expected)
+
+    with mock.patch.object(
+        self.backend, 'UpdateLabels', side_effect=_LeasedByOtherRun):
+      self.assertEqual(self.pool.Lease('incident').name, 'vm-2')
+
+  def testRelease(self):
+    """Tests returning and recycling leased VMs."""
+    self.backend.AddVm('vm-1', **{
+        vm_pool.STATE_LABEL: vm_pool.STATE_LEASED,
+        vm_pool.LEASE_LABEL: 'incident'})
+    self.backend.AddVm('vm-2', **{vm_pool.STATE_LABEL: vm_pool.STATE_LEASED})
+
+    self.pool.Release('vm-1')
+    self.assertEqual(self.backend.disks['vm-1'], [])
+    self.assertEqual(
+        self.backend.vms['vm-1'][vm_pool.STATE_LABEL], vm_pool.STATE_FREE)
+
+    self.pool.Release('vm-2', recycle=True)
+    self.assertEqual(self.backend.deleted, ['vm-2'])
+
+    with self.assertRaises(ValueError):
+      self.pool.Release('vm-3')
+
+  def testReleaseLease(self):
+    """Tests returning all the VMs leased for an incident."""
+    for name in ('vm-1', 'vm-2'):
+      self.backend.AddVm(name, **{
+          vm_pool.STATE_LABEL: vm_pool.STATE_LEASED,
+          vm_pool.LEASE_LABEL: 'incident-42'})
+    self.backend.AddVm('vm-3', **{
+        vm_pool.STATE_LABEL: vm_pool.STATE_LEASED,
+        vm_pool.LEASE_LABEL: 'other-incident'})
+
+    self.assertEqual(self.pool.ReleaseLease('Incident 42'), ['vm-1', 'vm-2'])
+    for name in ('vm-1', 'vm-2'):
+      self.assertEqual(self.backend.disks[name], [])
+      self.assertEqual(
+          self.backend.vms[name][vm_pool.STATE_LABEL], vm_pool.STATE_FREE)
+    self.assertEqual(self.backend.disks['vm-3'], ['evidence'])
+
+    self.assertEqual(
+        self.pool.ReleaseLease('other-incident', recycle=True), ['vm-3'])
+    self.assertEqual(self.backend.deleted, ['vm-3'])
+    self.assertEqual(self.pool.ReleaseLease('incident-42'), [])
+
+  def testExpiredLease(self):
+    """Tests that expired leases are returned to the pool."""
+    self.backend.AddVm('vm-1', **{
+        vm_pool.STATE_LABEL: vm_pool.STATE_LEASED,
+        vm_pool.LEASE_LABEL: 'old-incident',
+        vm_pool.EXPIRES_LABEL: str(int(time.time()) - 1)})
+
+    vm = self.pool.Lease('incident')
+
+    self.assertEqual(vm.name, 'vm-1')
+    self.assertEqual(self.backend.disks['vm-1'], [])
+    self.assertEqual(self.backend.vms['vm-1'][vm_pool.LEASE_LABEL], 'incident')
+
+  def testReplenish(self):
+    """Tests starting free VMs up to the pool size."""
+    self.backend.AddVm('vm-1', **{vm_pool.STATE_LABEL: vm_pool.STATE_FREE})
+    self.backend.AddVm('vm-2', **{vm_pool.STATE_LABEL: vm_pool.STATE_LEASED})
+
+    self.assertEqual(len(self.pool.Replenish()), 1)
+
+    self.assertEqual(len(self.backend.created), 1)
+    self.assertEqual(
+        self.backend.vms[self.backend.created[0]][vm_pool.STATE_LABEL],
+        vm_pool.STATE_FREE)
+    self.assertEqual(self.pool.Replenish(), [])
+
+  def testReplenishDeletesSurplus(self):
+    """Tests deleting the free VMs above the pool size."""
+    for name in ('vm-1', 'vm-2', 'vm-3', 'vm-4'):
+      self.backend.AddVm(name, **{vm_pool.STATE_LABEL: vm_pool.STATE_FREE})
+    self.backend.AddVm('vm-5', **{vm_pool.STATE_LABEL: vm_pool.STATE_LEASED})
+
+    self.assertEqual(self.pool.Replenish(), [])
+
+    self.assertEqual(self.backend.created, [])
+    self.assertEqual(self.backend.deleted, ['vm-3', 'vm-4'])
+    self.assertEqual(sorted(self.backend.vms), ['vm-1', 'vm-2', 'vm-5'])
+
+
+class AWSPoolBackendTest(unittest.TestCase):
+  """Tests the leases of the EC2 pool backend."""
+
+  def setUp(self):
+    patcher = mock.patch(
+        'libcloudforensics.providers.aws.internal.account.AWSAccount')
+    mock_account = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.s3 = mock.Mock()
+    self.ec2 = mock.Mock()
+    mock_account.return_value.ClientApi.side_effect = (
+        lambda service: self.s3 if service == 's3' else self.ec2)
+    self.ec2.get_paginator.return_value.paginate.return_value = [
+        {'Reservations': [{'Instances': [{
+            'InstanceId': 'i-1',
+            'Tags': [{'Key': vm_pool.STATE_LABEL,
+                      'Value': vm_pool.STATE_FREE}]}]}]}]
+    self.backend = vm_pool.AWSPoolBackend(
+        'us-east-1a', 'profile', 'lock-bucket')
+    self.vm = vm_pool.PooledVM('vm-1', {}, instance=mock.Mock(instance_id='i-1'))
+
+  def _HoldLock(self, age: datetime.timedelta) -> None:
+    """Makes the lock object of the VM exist, created age ago."""
+    self.s3.put_object.side_effect = [
+        boto_exceptions.ClientError(
+            {'Error': {'Code': 'PreconditionFailed'}}, 'PutObject'),
+        {}]
+    self.s3.head_object.return_value = {
+        'ETag': '"etag"',
+        'LastModified': datetime.datetime.now(datetime.timezone.utc) - age}
+
+  def testUpdateLabels(self):
+    """Tests updating the tags while holding the lock object."""
+    leased = {vm_pool.STATE_LABEL: vm_pool.STATE_LEASED}
+    self.assertTrue(self.backend.UpdateLabels(
+        self.vm, leased, {vm_pool.STATE_LABEL: vm_pool.STATE_FREE}))
+
+    self.s3.put_object.assert_called_once_with(
+        Bucket='lock-bucket', Key='dftw-pool-locks/i-1', Body=b'',
+        IfNoneMatch='*')
+    self.ec2.create_tags.assert_called_once_with(
+        Resources=['i-1'],
+        Tags=[{'Key': vm_pool.STATE_LABEL, 'Value': vm_pool.STATE_LEASED}])
+    self.s3.delete_object.assert_called_once_with(
+        Bucket='lock-bucket', Key='dftw-pool-locks/i-1')
+
+  def testUpdateLabelsUnexpected(self):
+    """Tests that unexpected tags release the lock without updating."""
+    self.assertFalse(self.backend.UpdateLabels(
+        self.vm, {vm_pool.STATE_LABEL: vm_pool.STATE_LEASED},
+        {vm_pool.STATE_LABEL: vm_pool.STATE_LEASED}))
+    self.ec2.create_tags.assert_not_called()
+    self.s3.delete_object.assert_called_once()
+
+  def testUpdateLabelsLocked(self):
+    """Tests that a VM locked by another run is not updated."""
+    self._HoldLock(datetime.timedelta(seconds=10))
+    self.assertFalse(self.backend.UpdateLabels(
+        self.vm, {vm_pool.STATE_LABEL: vm_pool.STATE_LEASED},
+        {vm_pool.STATE_LABEL: vm_pool.STATE_FREE}))
+    self.ec2.create_tags.assert_not_called()
+    self.s3.delete_object.assert_not_called()
+
+  def testUpdateLabelsStaleLock(self):
+    """Tests that a lock left over by a crashed run is taken over."""
+    self._HoldLock(datetime.timedelta(hours=1))
+    self.assertTrue(self.backend.UpdateLabels(
+        self.vm, {vm_pool.STATE_LABEL: vm_pool.STATE_LEASED},
+        {vm_pool.STATE_LABEL: vm_pool.STATE_FREE}))
+    self.assertEqual(self.s3.put_object.call_count, 2)
+    self.assertEqual(self.s3.delete_object.call_args_list, [
+        mock.call(Bucket='lock-bucket', Key='dftw-pool-locks/i-1',
+                  IfMatch='"etag"'),
+        mock.call(Bucket='lock-bucket', Key='dftw-pool-locks/i-1')])
+    self.ec2.create_tags.assert_called_once()
+
+  def testNoLockBucket(self):
+    """Tests that pooling AWS VMs requires a lock bucket."""
+    with self.assertRaises(ValueError):
+      vm_pool.AWSPoolBackend('us-east-1a', 'profile', '')
+
+
+class AzurePoolBackendTest(unittest.TestCase):
+  """Tests the leases of the Azure pool backend."""
+
+  def setUp(self):
+    patcher = mock.patch(
+        'libcloudforensics.providers.azure.internal.account.AZAccount')
+    mock_account = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.vms = (
+        mock_account.return_value.compute.compute_client.virtual_machines)
+    self.vms.get.return_value = mock.Mock(
+        etag='"etag"', tags={vm_pool.STATE_LABEL: vm_pool.STATE_FREE})
+    self.backend = vm_pool.AzurePoolBackend('rg', 'eastus', 'profile')
+    self.vm = vm_pool.PooledVM('vm-1', {})
+
+  def testUpdateLabels(self):
+    """Tests that the tags are updated conditionally on the VM ETag."""
+    self.assertTrue(self.backend.UpdateLabels(
+        self.vm, {vm_pool.LEASE_LABEL: 'incident-42'},
+        {vm_pool.STATE_LABEL: vm_pool.STATE_FREE}))
+    self.vms.begin_update.assert_called_once_with(
+        'rg', 'vm-1',
+        {'tags': {vm_pool.STATE_LABEL: vm_pool.STATE_FREE,
+                  vm_pool.LEASE_LABEL: 'incident-42'}},
+        if_match='"etag"')
+
+  def testUpdateLabelsConflict(self):
+    """Tests that a VM updated by another run in the meantime is lost."""
+    error = az_exceptions.HttpResponseError('Precondition failed')
+    error.status_code = 412
+    self.vms.begin_update.side_effect = error
+    self.assertFalse(self.backend.UpdateLabels(
+        self.vm, {vm_pool.STATE_LABEL: vm_pool.STATE_LEASED},
+        {vm_pool.STATE_LABEL: vm_pool.STATE_FREE}))
+
+  def testUpdateLabelsUnexpected(self):
+    """Tests that unexpected tags are not updated."""
+    self.assertFalse(self.backend.UpdateLabels(
+        self.vm, {vm_pool.STATE_LABEL: vm_pool.STATE_FREE},
+        {vm_pool.STATE_LABEL: vm_pool.STATE_LEASED}))
+    self.vms.begin_update.assert_not_called()
+
+
+if __name__ == '__main__':
+  unittest.main()